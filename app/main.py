@@ -2,9 +2,12 @@ import uvicorn
 import os
 from fastapi import FastAPI, HTTPException
 from app.schema import TaskPayload
+from app.services.observability import instrument_app
 
 SERVICE_TYPE = os.environ.get("SERVICE_TYPE", "dispatcher")
 app = FastAPI(title=f"TbD Engine V3 - {SERVICE_TYPE.upper()} Service")
+# GET /metrics (stage + request latency histograms, in-flight gauges) and traceparent handling, all roles
+instrument_app(app)
 
 if SERVICE_TYPE == "worker":
     try:
@@ -14,6 +17,23 @@ if SERVICE_TYPE == "worker":
         print(f"CRITICAL: Failed to import WorkerService. Check dependencies. {e}")
         worker = None
 
+    from app.services import executors
+    loop_monitor = executors.LoopLagMonitor()
+
+    @app.on_event("startup")
+    async def start_executors():
+        # Spawn the CPU pool before the first task arrives, and watch the loop for blocking calls
+        import asyncio
+        asyncio.get_event_loop().run_in_executor(None, executors.warm_up)
+        loop_monitor.start()
+
+    @app.on_event("shutdown")
+    async def stop_executors():
+        loop_monitor.stop()
+        executors.shutdown()
+
+    from app.services.admission import AdmissionRejected
+
     @app.post("/")
     async def pubsub_trigger(data: dict):
         if not worker:
@@ -22,13 +42,31 @@ if SERVICE_TYPE == "worker":
             # UPDATED: Await the worker
             await worker.process_pubsub_message(data)
             return {"status": "Processing initiated"}, 200
+        except AdmissionRejected as e:
+            # Instance full: nack (any non-2xx). Pub/Sub redelivers after the subscription's retry backoff,
+            # possibly to another instance; Retry-After is informational for other callers
+            print(f"ADMISSION: Deferring task ({e})")
+            raise HTTPException(status_code=429, detail=f"Deferred: {e}",
+                                headers={"Retry-After": str(e.retry_after)})
         except Exception as e:
             print(f"Worker processing failed: {e}")
             raise HTTPException(status_code=500, detail=f"Worker failure: {e}")
 
 elif SERVICE_TYPE == "dispatcher":
+    from fastapi.middleware.cors import CORSMiddleware
+    from app.schema import UploadRequest, UploadComplete
     from app.services.dispatcher import DispatcherService
+    from app.services.uploads import UploadService
     dispatcher = DispatcherService()
+    uploads = UploadService(dispatcher)
+
+    # Browser clients call /uploads and /tasks cross-origin (the Streamlit upload widget)
+    app.add_middleware(
+        CORSMiddleware,
+        allow_origins=os.environ.get("CORS_ALLOW_ORIGINS", "*").split(","),
+        allow_methods=["GET", "POST"],
+        allow_headers=["*"],
+    )
 
     @app.post("/submit", status_code=202)
     async def submit_video_task(payload: TaskPayload):
@@ -38,5 +76,99 @@ elif SERVICE_TYPE == "dispatcher":
         except Exception as e:
             raise HTTPException(status_code=500, detail=f"Dispatch failed: {e}")
 
+    @app.post("/uploads", status_code=201)
+    def create_upload(request: UploadRequest):
+        # Resumable-upload URLs, one per part; the client uploads straight to GCS
+        try:
+            return uploads.create_upload(request)
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"Upload setup failed: {e}")
+
+    @app.post("/uploads/{task_id}/complete", status_code=202)
+    def complete_upload(task_id: str, completion: UploadComplete):
+        try:
+            result = uploads.complete_upload(task_id, completion)
+        except LookupError as e:
+            raise HTTPException(status_code=404, detail=str(e))
+        except ValueError as e:
+            raise HTTPException(status_code=409, detail=str(e))
+        return {"status": "Task accepted and queued", **result}
+
+    from app.services.tasks import TASK_EVENTS_TOKEN
+
+    @app.post("/task-events")
+    def task_event(data: dict, token: str = ""):
+        # Push subscription on tbd-task-status (worker phase updates); sync: the store call blocks (Firestore)
+        if TASK_EVENTS_TOKEN and token != TASK_EVENTS_TOKEN:
+            raise HTTPException(status_code=403, detail="Invalid token")
+        try:
+            return dispatcher.tracker.handle_pubsub_push(data)
+        except (KeyError, ValueError) as e:
+            print(f"TASK STATUS: Dropping invalid message: {e}")
+            return {"applied": False, "error": str(e)}
+
+    @app.get("/tasks/{task_id}")
+    def get_task(task_id: str):
+        record = dispatcher.tracker.store.get(task_id)
+        if record is None:
+            raise HTTPException(status_code=404, detail=f"Unknown task {task_id}")
+        return record
+
+    @app.get("/tasks/{task_id}/events")
+    async def task_events(task_id: str):
+        from fastapi.responses import StreamingResponse
+        return StreamingResponse(dispatcher.tracker.stream(task_id), media_type="text/event-stream",
+                                 headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+elif SERVICE_TYPE == "indexer":
+    from typing import Optional
+    from app.services.index import IndexerService, INDEX_BACKFILL_BUCKET
+    indexer = IndexerService()
+
+    @app.on_event("startup")
+    async def backfill_index():
+        # Fresh instance with an empty local index: rebuild it from the output bucket once
+        if INDEX_BACKFILL_BUCKET and len(indexer.index) == 0:
+            import asyncio
+            asyncio.get_event_loop().run_in_executor(None, indexer.reindex_bucket, INDEX_BACKFILL_BUCKET)
+
+    @app.post("/")
+    def index_update(data: dict):
+        try:
+            return indexer.handle_pubsub_push(data)
+        except (KeyError, ValueError) as e:
+            # Malformed record: ACK (2xx) so Pub/Sub does not redeliver it forever
+            print(f"INDEX: Dropping invalid message: {e}")
+            return {"indexed": False, "error": str(e)}
+
+    @app.get("/pathways")
+    def list_pathways(vertical: Optional[str] = None, compliance_tag: Optional[str] = None,
+                      action_type: Optional[str] = None, title: Optional[str] = None,
+                      min_duration: Optional[float] = None, max_duration: Optional[float] = None,
+                      min_nodes: Optional[int] = None, limit: int = 50, offset: int = 0):
+        return indexer.index.query(vertical, compliance_tag, action_type, title,
+                                   min_duration, max_duration, min_nodes, limit, offset)
+
+    @app.get("/pathways/{task_id}")
+    def get_pathway(task_id: str):
+        record = indexer.index.get(task_id)
+        if record is None:
+            raise HTTPException(status_code=404, detail=f"Pathway {task_id} not indexed")
+        return record
+
+    @app.get("/pathways/{task_id}/similar")
+    def similar_pathways(task_id: str, k: int = 10):
+        # "Find similar workflows": nearest neighbours by temporal context vector
+        results = indexer.similar(task_id, max(1, min(k, 100)))
+        if results is None:
+            raise HTTPException(status_code=404, detail=f"No vector indexed for {task_id}")
+        return {"task_id": task_id, "mode": indexer.vectors.mode, "items": results}
+
+    @app.post("/reindex", status_code=202)
+    async def reindex(bucket: str, prefix: str = ""):
+        import asyncio
+        asyncio.get_event_loop().run_in_executor(None, indexer.reindex_bucket, bucket, prefix)
+        return {"status": "Reindex started", "bucket": bucket, "prefix": prefix}
+
 if __name__ == "__main__":
     uvicorn.run(app, host="0.0.0.0", port=8080)
\ No newline at end of file
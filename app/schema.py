@@ -15,6 +15,18 @@ class TaskPayload(BaseModel):
     output_bucket: str = Field(..., description="GCS bucket for results")
     config: Dict[str, Any] = Field(default_factory=dict, description="Config params")
 
+class UploadRequest(BaseModel):
+    filename: str = Field(..., description="Client-side file name, e.g. demo.mp4")
+    size: int = Field(..., gt=0, description="File size in bytes")
+    content_type: str = Field("video/mp4", description="MIME type the parts are uploaded with")
+    task_id: Optional[str] = Field(None, description="Reuse a client-generated task ID")
+    parts: Optional[int] = Field(None, ge=1, le=32, description="Parallel parts (default: by size)")
+
+class UploadComplete(BaseModel):
+    client_id: str = Field(..., description="Identifier for the client")
+    output_bucket: str = Field(..., description="GCS bucket for results")
+    config: Dict[str, Any] = Field(default_factory=dict, description="Config params")
+
 # --- V6 Node Object (PAD Schema v0.5) ---
 
 class ActionNode(BaseModel):
@@ -40,9 +52,22 @@ class ActionNode(BaseModel):
     # --- V6 NEW FIELDS (Fixed Missing Field Error) ---
     temporal_context_vector: List[float] = Field(default_factory=list, description="The V4 LSTM output vector (512D)")
     telemetry_context: Optional[TelemetryContext] = Field(default=None, description="IoT Context")
+    keyframe_hash: Optional[str] = Field(None, description="dHash of the step's keyframe (incremental regeneration)")
+    degraded: List[str] = Field(default_factory=list, description="Fallbacks applied to this node, e.g. detector_circuit_open")
     
     next_node_id: Optional[str] = Field(None, description="Next node ID")
 
+# --- V6 Node Images ---
+
+class SpriteSheet(BaseModel):
+    uri: str = Field(..., description="gs://bucket/<task_id>/sprites.webp.bin (WebP images, concatenated)")
+    format: str = Field("webp-concat", description="Images are independent WebP files laid end to end")
+    size: int = Field(0, description="Sheet size in bytes")
+    images: Dict[str, Dict[str, List[int]]] = Field(
+        default_factory=dict,
+        description="node id -> {thumb, crop} -> [offset, length, width, height]; fetch with a Range read"
+    )
+
 # --- V6 Root Object ---
 
 class Pathway(BaseModel):
@@ -58,4 +83,5 @@ class Pathway(BaseModel):
     target_vertical: str = Field("manufacturing", description="Domain of the task")
     compliance_tag: str = Field("AS9100", description="Mandatory compliance tag")
     
-    nodes: List[ActionNode] = Field(..., description="List of action nodes")
\ No newline at end of file
+    nodes: List[ActionNode] = Field(..., description="List of action nodes")
+    sprite_sheet: Optional[SpriteSheet] = Field(None, description="Node thumbnails and ui_region crops")
\ No newline at end of file
@@ -0,0 +1,186 @@
+# app/services/admission.py
+# V6: Admission control for concurrent tasks on one worker instance.
+# A task is mostly waiting on STT and Gemini, so one instance runs several at once. Before a task
+# starts, its memory is estimated from the video's size and duration and reserved against the
+# instance's budget. The task is refused (-> 429, a Pub/Sub nack, redelivered with the subscription's
+# backoff) when the instance is full, memory is short, or the services it would call first already
+# have a queue. Calls to each downstream service go through a per-service limiter, so concurrent
+# tasks share a fixed number of in-flight calls rather than multiplying them.
+
+import os
+import asyncio
+import contextlib
+from typing import Dict, Optional
+from app.services.observability import Counter, Gauge
+
+MB = 1024 * 1024
+MAX_CONCURRENT_TASKS = int(os.environ.get("MAX_CONCURRENT_TASKS", "4"))
+
+def _read_cgroup(*paths: str) -> Optional[int]:
+    """First readable cgroup memory file (v2, then v1), in bytes. None outside a limited cgroup."""
+    for path in paths:
+        try:
+            with open(path) as f:
+                value = f.read().strip()
+        except OSError:
+            continue
+        # v2 writes "max" for no limit; v1 a huge number
+        return int(value) if value.isdigit() and int(value) < 2 ** 60 else None
+    return None
+
+def memory_limit_bytes() -> Optional[int]:
+    return _read_cgroup("/sys/fs/cgroup/memory.max", "/sys/fs/cgroup/memory/memory.limit_in_bytes")
+
+def memory_current_bytes() -> Optional[int]:
+    return _read_cgroup("/sys/fs/cgroup/memory.current", "/sys/fs/cgroup/memory/memory.usage_in_bytes")
+
+_limit = memory_limit_bytes()
+# Reservable memory for tasks. The rest covers the worker itself (Python, clients, the CPU pool processes)
+MEMORY_BUDGET_MB = float(os.environ.get("MEMORY_BUDGET_MB", str(int(_limit * 0.8 / MB) if _limit else 3276)))
+# Refuse a task when actual usage plus its estimate would pass this fraction of the cgroup limit
+MEMORY_HIGH_WATERMARK = 0.9
+
+# Per-task estimate. /tmp is in-memory on Cloud Run, so the downloaded video counts in full.
+TASK_BASE_MB = float(os.environ.get("TASK_BASE_MB", "256"))      # Decode buffers, Gemini/STT responses, NodeStore, export
+MB_PER_VIDEO_MINUTE = 4.0       # Extracted mp3 (~1.5 MB/min), transcript, per-step nodes
+ASSUMED_VIDEO_MBITPS = 8.0      # Duration guess from size alone, until the video is downloaded
+
+# Services a task calls right after admission: when their queue is already full, a new task would only wait
+ADMISSION_GATES = ("stt", "gemini")
+ADMISSION_RETRY_AFTER_S = int(os.environ.get("ADMISSION_RETRY_AFTER_S", "30"))
+
+# Concurrent calls from this instance per downstream service (0 = unlimited); DOWNSTREAM_LIMIT_<SERVICE> overrides
+DOWNSTREAM_LIMITS = {
+    service: int(os.environ.get(f"DOWNSTREAM_LIMIT_{service.upper()}", str(default)))
+    for service, default in (("stt", 4), ("gemini", 4), ("detector", 8), ("encoder", 4))
+}
+
+TASKS_IN_FLIGHT = Gauge("tbd_admission_tasks_in_flight", "Tasks admitted and running on this instance.")
+RESERVED_MB = Gauge("tbd_admission_reserved_megabytes", "Estimated memory reserved by running tasks.")
+REJECTIONS = Counter("tbd_admission_rejections_total", "Tasks refused (nacked) by admission control.", ["reason"])
+DOWNSTREAM_IN_FLIGHT = Gauge("tbd_downstream_in_flight", "Calls in flight per downstream service.", ["service"])
+DOWNSTREAM_WAITING = Gauge("tbd_downstream_waiting", "Calls queued for a downstream slot.", ["service"])
+
+def estimate_task_mb(video_bytes: int, duration_s: Optional[float] = None) -> float:
+    """Peak memory of one task. Without a duration (not downloaded yet) it is guessed from the size."""
+    if duration_s is None:
+        duration_s = video_bytes * 8 / (ASSUMED_VIDEO_MBITPS * 1e6)
+    return TASK_BASE_MB + video_bytes / MB + duration_s / 60 * MB_PER_VIDEO_MINUTE
+
+class AdmissionRejected(Exception):
+    """The instance cannot take the task now. The caller nacks it; Pub/Sub redelivers later."""
+
+    def __init__(self, reason: str, detail: str, retry_after: int = ADMISSION_RETRY_AFTER_S):
+        super().__init__(f"{reason}: {detail}")
+        self.reason = reason
+        self.retry_after = retry_after
+
+# --- Downstream limits ---
+
+class DownstreamLimiter:
+    """At most `limit` concurrent calls to one service; callers beyond that wait their turn."""
+
+    def __init__(self, service: str, limit: int):
+        self.service = service
+        self.limit = limit
+        self.in_flight = 0
+        self.waiting = 0
+        self.semaphore = asyncio.Semaphore(limit) if limit > 0 else None
+
+    def saturated(self) -> bool:
+        return self.semaphore is not None and self.waiting >= self.limit
+
+    @contextlib.asynccontextmanager
+    async def slot(self):
+        if self.semaphore is not None:
+            self.waiting += 1
+            DOWNSTREAM_WAITING.inc(service=self.service)
+            try:
+                await self.semaphore.acquire()
+            finally:
+                self.waiting -= 1
+                DOWNSTREAM_WAITING.dec(service=self.service)
+        self.in_flight += 1
+        DOWNSTREAM_IN_FLIGHT.inc(service=self.service)
+        try:
+            yield
+        finally:
+            self.in_flight -= 1
+            DOWNSTREAM_IN_FLIGHT.dec(service=self.service)
+            if self.semaphore is not None:
+                self.semaphore.release()
+
+LIMITERS: Dict[str, DownstreamLimiter] = {service: DownstreamLimiter(service, limit)
+                                          for service, limit in DOWNSTREAM_LIMITS.items()}
+
+def downstream(service: str):
+    """`async with downstream("gemini"):` around one call to that service."""
+    return LIMITERS[service].slot()
+
+# --- Task admission ---
+
+class Reservation:
+    """A running task's share of the memory budget. Released once, when the task ends."""
+
+    def __init__(self, controller: "AdmissionController", task_id: str, mb: float):
+        self.controller = controller
+        self.task_id = task_id
+        self.mb = mb
+
+    def resize(self, mb: float):
+        """Replaces the estimate (e.g. with the real duration once downloaded). Never refused: the task already runs."""
+        self.controller.reserved_mb += mb - self.mb
+        RESERVED_MB.inc(mb - self.mb)
+        self.mb = mb
+
+    def release(self):
+        if self.controller.tasks.pop(self.task_id, None) is None:
+            return
+        self.controller.reserved_mb -= self.mb
+        RESERVED_MB.dec(self.mb)
+        TASKS_IN_FLIGHT.dec()
+
+class AdmissionController:
+    """Decides, on the event loop, whether this instance takes one more task (no await between check and reserve)."""
+
+    def __init__(self, max_tasks: int = MAX_CONCURRENT_TASKS, budget_mb: float = MEMORY_BUDGET_MB):
+        self.max_tasks = max_tasks
+        self.budget_mb = budget_mb
+        self.tasks: Dict[str, Reservation] = {}
+        self.reserved_mb = 0.0
+
+    def _check(self, task_id: str, estimate_mb: float):
+        if task_id in self.tasks:
+            # Redelivered while still running (push ack deadline < task time): retry after this run settles it
+            raise AdmissionRejected("duplicate", f"task {task_id} is already running here")
+        if not self.tasks:
+            return  # An idle instance takes anything, or an oversized video could never run
+        if len(self.tasks) >= self.max_tasks:
+            raise AdmissionRejected("concurrency", f"{len(self.tasks)}/{self.max_tasks} tasks running")
+        if self.reserved_mb + estimate_mb > self.budget_mb:
+            raise AdmissionRejected("memory_budget", f"{self.reserved_mb:.0f} MB reserved + {estimate_mb:.0f} MB "
+                                                     f"> {self.budget_mb:.0f} MB budget")
+        limit, current = memory_limit_bytes(), memory_current_bytes()
+        if limit and current and current + estimate_mb * MB > limit * MEMORY_HIGH_WATERMARK:
+            raise AdmissionRejected("memory_pressure", f"{current / MB:.0f} MB in use + {estimate_mb:.0f} MB "
+                                                       f"> {MEMORY_HIGH_WATERMARK:.0%} of {limit / MB:.0f} MB")
+        for service in ADMISSION_GATES:
+            if LIMITERS[service].saturated():
+                raise AdmissionRejected("downstream", f"{LIMITERS[service].waiting} calls already queued for {service}")
+
+    def admit(self, task_id: str, estimate_mb: float) -> Reservation:
+        """Reserves estimate_mb for the task, or raises AdmissionRejected."""
+        try:
+            self._check(task_id, estimate_mb)
+        except AdmissionRejected as e:
+            REJECTIONS.inc(reason=e.reason)
+            raise
+        reservation = self.tasks[task_id] = Reservation(self, task_id, estimate_mb)
+        self.reserved_mb += estimate_mb
+        RESERVED_MB.inc(estimate_mb)
+        TASKS_IN_FLIGHT.inc()
+        return reservation
+
+    def stats(self) -> Dict[str, float]:
+        return {"tasks": len(self.tasks), "max_tasks": self.max_tasks,
+                "reserved_mb": round(self.reserved_mb, 1), "budget_mb": self.budget_mb}
@@ -0,0 +1,293 @@
+# app/services/columnar.py
+# V6: Columnar (Parquet) export of pathways for analytics.
+# Two Hive-partitioned tables (target_vertical=<v>/created_date=<yyyy-mm-dd>/):
+#   pathways/  one row per pathway (header fields, metadata as a JSON string)
+#   nodes/     one row per ActionNode, with the 512-D temporal vector as a fixed-size float32 list
+# Readers pick columns and skip the vectors entirely, instead of parsing every float of pathway.json.
+# The worker writes one file per task (PATHWAY_EXPORT_PARQUET=1); scripts/export_parquet.py converts
+# existing pathway.json files in bulk, streaming through ParquetExporter.
+
+import os
+import json
+import uuid
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+from urllib.parse import quote
+import numpy as np
+import pyarrow as pa
+import pyarrow.fs as pafs
+import pyarrow.parquet as pq
+from app.services.nodestore import NodeStore, VECTOR_DIM
+
+# Worker export mode: also write the task's rows under <output bucket>/<PARQUET_PREFIX>/
+PATHWAY_EXPORT_PARQUET = os.environ.get("PATHWAY_EXPORT_PARQUET", "0") == "1"
+PARQUET_PREFIX = os.environ.get("PARQUET_PREFIX", "parquet")
+PARQUET_COMPRESSION = "zstd"
+# Nodes buffered per partition before a row group is written (~2 KB of vector each)
+ROW_GROUP_NODES = int(os.environ.get("PARQUET_ROW_GROUP_NODES", "16384"))
+# Partition files open at once during a bulk export; the least recently used is closed beyond this
+MAX_OPEN_PARTITIONS = 64
+PARTITION_KEYS = ("target_vertical", "created_date")
+
+PATHWAY_SCHEMA = pa.schema([
+    ("task_id", pa.string()),
+    ("pathway_id", pa.string()),
+    ("uri", pa.string()),
+    ("title", pa.string()),
+    ("author_id", pa.string()),
+    ("source_video", pa.string()),
+    ("created_at", pa.string()),
+    ("total_duration_sec", pa.float64()),
+    ("node_count", pa.int32()),
+    ("compliance_tag", pa.string()),
+    ("metadata", pa.string()),  # JSON
+    ("sprite_sheet_uri", pa.string()),
+])
+
+NODE_SCHEMA = pa.schema([
+    ("task_id", pa.string()),
+    ("pathway_id", pa.string()),
+    ("node_index", pa.int32()),
+    ("node_id", pa.string()),
+    ("timestamp_start", pa.float64()),
+    ("timestamp_end", pa.float64()),
+    ("duration_sec", pa.float64()),
+    ("action_type", pa.dictionary(pa.int32(), pa.string())),
+    ("description", pa.string()),
+    ("semantic_description", pa.string()),
+    ("ui_element_text", pa.string()),
+    ("ui_region", pa.list_(pa.int32(), 4)),
+    ("confidence", pa.float64()),
+    ("active_region_confidence", pa.float64()),
+    ("temporal_context_vector", pa.list_(pa.float32(), VECTOR_DIM)),  # Null when the node has none
+    ("telemetry_sensor_id", pa.string()),
+    ("telemetry_machine_state", pa.string()),
+    ("telemetry_ambient_temp_c", pa.float64()),
+    ("keyframe_hash", pa.string()),
+    ("degraded", pa.list_(pa.string())),
+    ("next_node_id", pa.string()),
+])
+
+def partition(pathway: Dict[str, Any]) -> Tuple[str, str]:
+    """(target_vertical, created_date) of a pathway (header dict or parsed pathway.json)."""
+    metadata = pathway.get("metadata") or {}
+    # The worker writes the vertical into metadata; the top-level field is the schema default
+    vertical = metadata.get("target_vertical", pathway.get("target_vertical")) or "unknown"
+    created_date = (pathway.get("created_at") or "")[:10] or "unknown"
+    return vertical, created_date
+
+def partition_path(key: Tuple[str, str]) -> str:
+    return "/".join(f"{name}={quote(str(value), safe='')}" for name, value in zip(PARTITION_KEYS, key))
+
+class PathwayColumns:
+    """Row buffers for the two tables. Filled from parsed pathway.json (add) or straight from a NodeStore (add_store)."""
+
+    def __init__(self):
+        self.pathways: Dict[str, List[Any]] = {name: [] for name in PATHWAY_SCHEMA.names}
+        self.nodes: Dict[str, List[Any]] = {name: [] for name in NODE_SCHEMA.names if name != "temporal_context_vector"}
+        self.vectors: List[Optional[np.ndarray]] = []
+        self.skipped_vectors = 0  # Vectors whose length is not VECTOR_DIM (stored as null)
+
+    def __len__(self) -> int:
+        return len(self.vectors)
+
+    def _add_header(self, pathway: Dict[str, Any], task_id: str, uri: str, node_count: int):
+        row = self.pathways
+        row["task_id"].append(task_id)
+        row["pathway_id"].append(pathway["pathway_id"])
+        row["uri"].append(uri)
+        for name in ("title", "author_id", "source_video", "created_at"):
+            row[name].append(pathway.get(name))
+        row["total_duration_sec"].append(float(pathway.get("total_duration_sec", 0.0)))
+        row["node_count"].append(node_count)
+        metadata = pathway.get("metadata") or {}
+        row["compliance_tag"].append(metadata.get("compliance_tag", pathway.get("compliance_tag")))
+        row["metadata"].append(json.dumps(metadata, separators=(",", ":")))
+        row["sprite_sheet_uri"].append((pathway.get("sprite_sheet") or {}).get("uri"))
+
+    def _vector(self, vector) -> Optional[np.ndarray]:
+        if vector is None or not len(vector):
+            return None
+        if len(vector) != VECTOR_DIM:
+            self.skipped_vectors += 1
+            return None
+        return np.asarray(vector, dtype=np.float32)
+
+    def add(self, pathway: Dict[str, Any], task_id: str, uri: str):
+        """One parsed pathway.json."""
+        nodes = pathway.get("nodes", [])
+        self._add_header(pathway, task_id, uri, len(nodes))
+        columns = self.nodes
+        for i, node in enumerate(nodes):
+            columns["task_id"].append(task_id)
+            columns["pathway_id"].append(pathway["pathway_id"])
+            columns["node_index"].append(i)
+            columns["node_id"].append(node["id"])
+            columns["timestamp_start"].append(node["timestamp_start"])
+            columns["timestamp_end"].append(node["timestamp_end"])
+            columns["duration_sec"].append(node["timestamp_end"] - node["timestamp_start"])
+            columns["action_type"].append(node.get("action_type", "click"))
+            columns["description"].append(node["description"])
+            columns["semantic_description"].append(node.get("semantic_description"))
+            columns["ui_element_text"].append(node["ui_element_text"])
+            columns["ui_region"].append(node["ui_region"])
+            columns["confidence"].append(node["confidence"])
+            columns["active_region_confidence"].append(node.get("active_region_confidence", 0.0))
+            telemetry = node.get("telemetry_context") or {}
+            columns["telemetry_sensor_id"].append(telemetry.get("sensor_id"))
+            columns["telemetry_machine_state"].append(telemetry.get("machine_state"))
+            columns["telemetry_ambient_temp_c"].append(telemetry.get("ambient_temp_c"))
+            columns["keyframe_hash"].append(node.get("keyframe_hash"))
+            columns["degraded"].append(node.get("degraded") or [])
+            columns["next_node_id"].append(node.get("next_node_id"))
+            self.vectors.append(self._vector(node.get("temporal_context_vector")))
+
+    def add_store(self, store: NodeStore, header: Dict[str, Any], task_id: str, uri: str):
+        """The worker's NodeStore, column by column (no per-node dicts, vectors copied from the shared matrix)."""
+        n = len(store)
+        self._add_header(header, task_id, uri, n)
+        columns = self.nodes
+        timestamps = store.timestamps[:n]
+        columns["task_id"].extend([task_id] * n)
+        columns["pathway_id"].extend([header["pathway_id"]] * n)
+        columns["node_index"].extend(range(n))
+        columns["node_id"].extend(store.node_id(i) for i in range(n))
+        columns["timestamp_start"].extend(timestamps[:, 0].tolist())
+        columns["timestamp_end"].extend(timestamps[:, 1].tolist())
+        columns["duration_sec"].extend((timestamps[:, 1] - timestamps[:, 0]).tolist())
+        columns["action_type"].extend(store.action_types)
+        columns["description"].extend(store.descriptions)
+        columns["semantic_description"].extend(store.semantic_descriptions)
+        columns["ui_element_text"].extend(store.ui_texts)
+        columns["ui_region"].extend(store.regions[:n].tolist())
+        columns["confidence"].extend(store.confidence[:n].tolist())
+        columns["active_region_confidence"].extend(store.active_region_confidence[:n].tolist())
+        has_telemetry = store.has_telemetry[:n].tolist()
+        temps = store.telemetry_temp[:n].tolist()
+        columns["telemetry_sensor_id"].extend(s if t else None for s, t in zip(store.telemetry_sensor, has_telemetry))
+        columns["telemetry_machine_state"].extend(s if t else None for s, t in zip(store.telemetry_state, has_telemetry))
+        columns["telemetry_ambient_temp_c"].extend(v if t else None for v, t in zip(temps, has_telemetry))
+        columns["keyframe_hash"].extend(store.keyframe_hashes)
+        columns["degraded"].extend(list(markers) for markers in store.degraded)
+        columns["next_node_id"].extend(store.node_id(i + 1) if i + 1 < n else None for i in range(n))
+        rows = store.vector_rows[:n].tolist()
+        vectors = store.vectors if store.vectors.shape[1] == VECTOR_DIM else None
+        if vectors is None and len(store.vectors):
+            self.skipped_vectors += n
+        self.vectors.extend(vectors[row] if row >= 0 and vectors is not None else None for row in rows)
+
+    def _vector_array(self) -> pa.FixedSizeListArray:
+        present = np.array([v is not None for v in self.vectors], dtype=bool)
+        values = np.zeros((len(self.vectors), VECTOR_DIM), dtype=np.float32)
+        if present.any():
+            values[present] = np.stack([v for v in self.vectors if v is not None])
+        return pa.FixedSizeListArray.from_arrays(pa.array(values.reshape(-1)), VECTOR_DIM, mask=pa.array(~present))
+
+    def tables(self) -> Tuple[pa.Table, pa.Table]:
+        """(pathways, nodes) tables of everything buffered."""
+        pathways = pa.Table.from_pydict(self.pathways, schema=PATHWAY_SCHEMA)
+        arrays = [pa.array(self.nodes[field.name], type=field.type) if field.name != "temporal_context_vector"
+                  else self._vector_array() for field in NODE_SCHEMA]
+        return pathways, pa.Table.from_arrays(arrays, schema=NODE_SCHEMA)
+
+def parquet_bytes(table: pa.Table) -> bytes:
+    """One in-memory Parquet file (the worker uploads it with the storage client, like pathway.json)."""
+    sink = pa.BufferOutputStream()
+    pq.write_table(table, sink, compression=PARQUET_COMPRESSION)
+    return sink.getvalue().to_pybytes()
+
+def export_task(output_bucket, task_id: str, store: NodeStore, header: Dict[str, Any], uri: str) -> List[str]:
+    """Worker export mode: the task's pathway and node rows as two files in the partitioned dataset."""
+    columns = PathwayColumns()
+    columns.add_store(store, header, task_id, uri)
+    directory = partition_path(partition(header))
+    names = []
+    for table_name, table in zip(("pathways", "nodes"), columns.tables()):
+        name = f"{PARQUET_PREFIX}/{table_name}/{directory}/{quote(task_id, safe='')}.parquet"
+        output_bucket.blob(name).upload_from_string(parquet_bytes(table), content_type="application/vnd.apache.parquet")
+        names.append(name)
+    return names
+
+class _Partition:
+    """Buffered rows and open writers for one partition directory."""
+
+    def __init__(self, key: Tuple[str, str]):
+        self.key = key
+        self.columns = PathwayColumns()
+        self.writers: Dict[str, pq.ParquetWriter] = {}
+
+class ParquetExporter:
+    """
+    Streaming bulk export: pathways are added one at a time, each partition's rows go out as a row group
+    every row_group_nodes nodes, so memory stays bounded by the open partitions, not by the corpus.
+    root is a local directory or a gs:// URI (pyarrow filesystem).
+    """
+
+    def __init__(self, root: str, row_group_nodes: int = ROW_GROUP_NODES, max_open: int = MAX_OPEN_PARTITIONS):
+        if "://" not in root:
+            root = os.path.abspath(root)
+        self.fs, self.base = pafs.FileSystem.from_uri(root)
+        self.row_group_nodes = row_group_nodes
+        self.max_open = max_open
+        self.run_id = uuid.uuid4().hex[:8]  # Part files of separate runs never overwrite each other
+        self.partitions: "OrderedDict[Tuple[str, str], _Partition]" = OrderedDict()
+        self.stats = {"pathways": 0, "nodes": 0, "row_groups": 0, "files": 0, "skipped_vectors": 0}
+
+    def _partition(self, key: Tuple[str, str]) -> _Partition:
+        part = self.partitions.get(key)
+        if part is None:
+            part = self.partitions[key] = _Partition(key)
+            while len(self.partitions) > self.max_open:
+                self._close(self.partitions.popitem(last=False)[1])
+        self.partitions.move_to_end(key)
+        return part
+
+    def _flush(self, part: _Partition):
+        if not len(part.columns.pathways["task_id"]):
+            return
+        for table_name, table in zip(("pathways", "nodes"), part.columns.tables()):
+            writer = part.writers.get(table_name)
+            if writer is None:
+                directory = f"{self.base}/{table_name}/{partition_path(part.key)}"
+                self.fs.create_dir(directory)
+                path = f"{directory}/part-{self.run_id}-{self.stats['files']:05d}.parquet"
+                writer = part.writers[table_name] = pq.ParquetWriter(
+                    path, table.schema, filesystem=self.fs, compression=PARQUET_COMPRESSION)
+                self.stats["files"] += 1
+            writer.write_table(table, row_group_size=max(table.num_rows, 1))
+        self.stats["row_groups"] += 1
+        self.stats["skipped_vectors"] += part.columns.skipped_vectors
+        part.columns = PathwayColumns()
+
+    def _close(self, part: _Partition):
+        self._flush(part)
+        for writer in part.writers.values():
+            writer.close()
+
+    def add(self, pathway: Dict[str, Any], task_id: str, uri: str):
+        part = self._partition(partition(pathway))
+        part.columns.add(pathway, task_id, uri)
+        self.stats["pathways"] += 1
+        self.stats["nodes"] += len(pathway.get("nodes", []))
+        if len(part.columns) >= self.row_group_nodes:
+            self._flush(part)
+
+    def close(self) -> Dict[str, int]:
+        while self.partitions:
+            self._close(self.partitions.popitem(last=False)[1])
+        return self.stats
+
+    def __enter__(self) -> "ParquetExporter":
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+def read_nodes(root: str, columns: Optional[Iterable[str]] = None, **kwargs) -> pa.Table:
+    """The nodes table of an export (local directory or gs:// URI), partition columns included."""
+    import pyarrow.dataset as ds
+    if "://" not in root:
+        root = os.path.abspath(root)
+    fs, base = pafs.FileSystem.from_uri(root)
+    dataset = ds.dataset(f"{base}/nodes", filesystem=fs, format="parquet", partitioning="hive")
+    return dataset.to_table(columns=list(columns) if columns is not None else None, **kwargs)
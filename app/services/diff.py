@@ -0,0 +1,144 @@
+# app/services/diff.py
+# V6: Incremental regeneration for re-recorded SOPs.
+# Steps of the new recording are aligned to the prior pathway's nodes by keyframe similarity;
+# aligned, unchanged steps reuse the prior node's refinement instead of calling Service D again.
+
+import os
+import cv2
+import numpy as np
+from typing import List, Optional, Tuple, Dict, Any
+from app.schema import Pathway, ActionNode
+
+# Two keyframes whose 64-bit dHashes differ in at most this many bits show the same screen
+KEYFRAME_MATCH_BITS = int(os.environ.get("KEYFRAME_MATCH_BITS", "10"))
+# Alignment cost of an inserted/deleted step. Any keyframe match (<= KEYFRAME_MATCH_BITS / 64)
+# costs less than the two gaps it replaces.
+GAP_COST = 0.5
+
+# (prior node index | None, new step index | None)
+Alignment = List[Tuple[Optional[int], Optional[int]]]
+
+def keyframe_hash(frame: cv2.typing.MatLike) -> Optional[str]:
+    """64-bit difference hash (dHash) of a frame, as 16 hex chars. Robust to re-encoding and small shifts."""
+    if frame is None: return None
+    gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY) if frame.ndim == 3 else frame
+    small = cv2.resize(gray, (9, 8), interpolation=cv2.INTER_AREA)
+    bits = np.packbits((small[:, 1:] > small[:, :-1]).ravel())
+    return bits.tobytes().hex()
+
+def hamming(a: Optional[str], b: Optional[str]) -> int:
+    if not a or not b: return 64
+    return bin(int(a, 16) ^ int(b, 16)).count("1")
+
+def align_steps(prior_hashes: List[Optional[str]], new_hashes: List[Optional[str]]) -> Alignment:
+    """
+    Global (Needleman-Wunsch) alignment of two keyframe timelines.
+    Matching costs the normalized Hamming distance, and only within KEYFRAME_MATCH_BITS;
+    everything else is an insertion or deletion. Order is preserved, so a re-recording
+    with one step added in the middle keeps every other step aligned.
+    """
+    n, m = len(prior_hashes), len(new_hashes)
+    cost = np.zeros((n + 1, m + 1), dtype=np.float64)
+    cost[:, 0] = np.arange(n + 1) * GAP_COST
+    cost[0, :] = np.arange(m + 1) * GAP_COST
+
+    for i in range(1, n + 1):
+        for j in range(1, m + 1):
+            best = min(cost[i - 1, j], cost[i, j - 1]) + GAP_COST
+            distance = hamming(prior_hashes[i - 1], new_hashes[j - 1])
+            if distance <= KEYFRAME_MATCH_BITS:
+                best = min(best, cost[i - 1, j - 1] + distance / 64.0)
+            cost[i, j] = best
+
+    # Backtrack from the bottom-right corner
+    alignment: Alignment = []
+    i, j = n, m
+    while i > 0 or j > 0:
+        if i > 0 and j > 0:
+            distance = hamming(prior_hashes[i - 1], new_hashes[j - 1])
+            if distance <= KEYFRAME_MATCH_BITS and np.isclose(cost[i, j], cost[i - 1, j - 1] + distance / 64.0):
+                alignment.append((i - 1, j - 1))
+                i, j = i - 1, j - 1
+                continue
+        if i > 0 and np.isclose(cost[i, j], cost[i - 1, j] + GAP_COST):
+            alignment.append((i - 1, None))
+            i -= 1
+        else:
+            alignment.append((None, j - 1))
+            j -= 1
+
+    alignment.reverse()
+    return alignment
+
+def _normalize(text: Optional[str]) -> str:
+    return " ".join((text or "").lower().split())
+
+def same_target(prior: ActionNode, target_text: str, action_type: str) -> bool:
+    """An aligned step is unchanged if it acts on the same element the same way."""
+    return _normalize(prior.ui_element_text) == _normalize(target_text) and prior.action_type == action_type
+
+def reusable_nodes(prior: Pathway, new_hashes: List[Optional[str]], new_steps: List[Dict[str, Any]]) -> Dict[int, ActionNode]:
+    """New step index -> prior node whose refinement (region, OCR text, confidences) can be reused."""
+    alignment = align_steps([node.keyframe_hash for node in prior.nodes], new_hashes)
+    reuse = {}
+    for old_i, new_j in alignment:
+        if old_i is None or new_j is None: continue
+        # The region was a fallback last time (detector down, unreadable frame): refine again
+        if any(not marker.startswith("encoder_") for marker in prior.nodes[old_i].degraded): continue
+        step = new_steps[new_j]
+        if same_target(prior.nodes[old_i], step.get('target_text', "Unlabeled"), step.get('action_type', 'click')):
+            reuse[new_j] = prior.nodes[old_i]
+    return reuse
+
+def _edges(pathway: Pathway) -> List[Tuple[str, str]]:
+    return [(node.id, node.next_node_id) for node in pathway.nodes if node.next_node_id]
+
+def diff_pathways(prior: Pathway, new: Pathway) -> Dict[str, Any]:
+    """
+    Structural diff of two pathways: node changes (matched through keyframe alignment) and
+    edge changes (prior edges are mapped onto new node IDs before comparing).
+    """
+    alignment = align_steps([n.keyframe_hash for n in prior.nodes], [n.keyframe_hash for n in new.nodes])
+    id_map = {}
+    nodes = {"unchanged": [], "modified": [], "added": [], "removed": []}
+
+    for old_i, new_j in alignment:
+        if old_i is None:
+            nodes["added"].append({"id": new.nodes[new_j].id})
+            continue
+        old_node = prior.nodes[old_i]
+        if new_j is None:
+            nodes["removed"].append({"id": old_node.id})
+            continue
+
+        new_node = new.nodes[new_j]
+        id_map[old_node.id] = new_node.id
+        changed = [
+            field for field in ("ui_element_text", "action_type", "ui_region", "description")
+            if getattr(old_node, field) != getattr(new_node, field)
+        ]
+        entry = {"prior_id": old_node.id, "id": new_node.id,
+                 "keyframe_distance": hamming(old_node.keyframe_hash, new_node.keyframe_hash)}
+        if changed:
+            nodes["modified"].append({**entry, "changed_fields": changed})
+        else:
+            nodes["unchanged"].append(entry)
+
+    prior_edges = {(id_map.get(a, f"prior:{a}"), id_map.get(b, f"prior:{b}")) for a, b in _edges(prior)}
+    new_edges = set(_edges(new))
+    edges = {
+        "added": [{"from": a, "to": b} for a, b in sorted(new_edges - prior_edges)],
+        "removed": [{"from": a, "to": b} for a, b in sorted(prior_edges - new_edges)],
+    }
+
+    return {
+        "prior_pathway_id": prior.pathway_id,
+        "pathway_id": new.pathway_id,
+        "summary": {
+            **{f"nodes_{k}": len(v) for k, v in nodes.items()},
+            **{f"edges_{k}": len(v) for k, v in edges.items()},
+            "sequence_unchanged": not (nodes["modified"] or nodes["added"] or nodes["removed"]),
+        },
+        "nodes": nodes,
+        "edges": edges,
+    }
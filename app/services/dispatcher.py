@@ -1,14 +1,16 @@
 import uuid
 import os
-import json
 from google.cloud import pubsub_v1
 from app.schema import TaskPayload
+from app.services.tasks import TaskTracker, status_event
+from app.services.observability import current_trace_id
 
 PUBSUB_TOPIC = "tb-d-ingest-tasks"
 PROJECT_ID = os.environ.get("GCP_PROJECT_ID", "local-dev-project")
 
 class DispatcherService:
-    def __init__(self):
+    def __init__(self, tracker: TaskTracker = None):
+        self.tracker = tracker or TaskTracker()
         try:
             self.publisher = pubsub_v1.PublisherClient()
             self.topic_path = self.publisher.topic_path (PROJECT_ID, PUBSUB_TOPIC)
@@ -20,13 +22,15 @@ class DispatcherService:
         if not payload.task_id:
             payload.task_id = str(uuid.uuid4())
         
-        # V5 FR-02: Generate unique trace_id
-        trace_id = str(uuid.uuid4())
+        # V5 FR-02: Generate unique trace_id (or continue the caller's, when it sent a traceparent)
+        trace_id = current_trace_id() or str(uuid.uuid4())
         
         print(f"Dispatching Task ID: {payload.task_id}, Trace ID: {trace_id}")
+        # Recorded before publishing, so the worker's first event is always newer
+        self.tracker.record(status_event(payload.task_id, "queued", trace_id=trace_id))
         
         if self.publisher:
-            data = json.dumps(payload.model_dump()).encode("utf-8")
+            data = payload.model_dump_json().encode("utf-8")  # Already validated on the way in
             
             # V5 FR-02: Publish with trace_id attribute
             future = self.publisher.publish(
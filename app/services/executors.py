@@ -0,0 +1,160 @@
+# app/services/executors.py
+# V6: Executor layer for the async worker.
+# The event loop only schedules: CPU-bound frame work (app/services/frames.py) runs in a process pool
+# sized to the instance's vCPUs, and blocking I/O (GCS, ffmpeg, HTTP to Services C/D, Pydantic
+# export) in a bounded thread pool. Frames come back from the process pool through a fixed set of
+# shared-memory slots instead of being pickled. LoopLagMonitor measures how late the loop wakes up,
+# to show it stays responsive under load (tbd_event_loop_lag_seconds on /metrics).
+
+import os
+import time
+import asyncio
+import contextvars
+import functools
+import multiprocessing
+from collections import deque
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from multiprocessing import shared_memory
+from typing import Optional, Dict, Any
+import numpy as np
+from app.services.frames import FRAME_SHAPE
+from app.services.observability import Histogram
+
+# process (default) | thread. Threads still overlap (OpenCV releases the GIL) and skip the pool's startup.
+CPU_EXECUTOR = os.environ.get("CPU_EXECUTOR", "process")
+CPU_WORKERS = int(os.environ.get("CPU_WORKERS", str(os.cpu_count() or 2)))
+IO_WORKERS = int(os.environ.get("IO_WORKERS", "16"))
+# Shared-memory letterboxed frames in flight (extracted, not yet sent to Service D), across all tasks
+FRAME_SLOTS = int(os.environ.get("FRAME_SLOTS", str(CPU_WORKERS * 4)))
+LOOP_LAG_INTERVAL_S = 0.1
+# A wake-up this late means something blocked the loop; logged
+LOOP_LAG_WARN_S = float(os.environ.get("LOOP_LAG_WARN_MS", "250")) / 1000
+
+LOOP_LAG_SECONDS = Histogram("tbd_event_loop_lag_seconds", "How late the event loop ran a timer (blocked loop).",
+                             buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0))
+
+_cpu_pool: Optional[Executor] = None
+_io_pool: Optional[ThreadPoolExecutor] = None
+_frame_slots: Optional["SharedFrames"] = None
+
+def _init_cpu_process():
+    import cv2
+    cv2.setNumThreads(1)  # One OpenCV thread per process: the pool already uses every vCPU
+
+def cpu_pool() -> Executor:
+    global _cpu_pool
+    if _cpu_pool is None:
+        if CPU_EXECUTOR == "process":
+            # spawn, not fork: the worker holds gRPC/HTTP client threads that must not be forked
+            _cpu_pool = ProcessPoolExecutor(CPU_WORKERS, mp_context=multiprocessing.get_context("spawn"),
+                                            initializer=_init_cpu_process)
+        else:
+            _cpu_pool = ThreadPoolExecutor(CPU_WORKERS, thread_name_prefix="tbd-cpu")
+    return _cpu_pool
+
+def io_pool() -> ThreadPoolExecutor:
+    global _io_pool
+    if _io_pool is None:
+        _io_pool = ThreadPoolExecutor(IO_WORKERS, thread_name_prefix="tbd-io")
+    return _io_pool
+
+async def run_cpu(fn, *args, **kwargs):
+    """fn(*args) in the CPU pool. fn and its arguments must pickle (module-level function, plain data)."""
+    return await asyncio.get_running_loop().run_in_executor(cpu_pool(), functools.partial(fn, *args, **kwargs))
+
+async def run_io(fn, *args, **kwargs):
+    """fn(*args) in the I/O thread pool, with the caller's context (trace, profiling flags)."""
+    context = contextvars.copy_context()
+    return await asyncio.get_running_loop().run_in_executor(io_pool(), functools.partial(context.run, fn, *args, **kwargs))
+
+def warm_up():
+    """Starts every pool process now (spawn + imports take ~1s each) rather than on the first task."""
+    pool = cpu_pool()
+    if isinstance(pool, ProcessPoolExecutor):
+        for future in [pool.submit(time.sleep, 0.05) for _ in range(CPU_WORKERS)]:
+            future.result()
+
+def shutdown():
+    global _cpu_pool, _io_pool, _frame_slots
+    if _cpu_pool: _cpu_pool.shutdown(wait=False, cancel_futures=True)
+    if _io_pool: _io_pool.shutdown(wait=False, cancel_futures=True)
+    if _frame_slots: _frame_slots.close()
+    _cpu_pool = _io_pool = _frame_slots = None
+
+# --- Shared-memory frames ---
+
+class FrameSlot:
+    def __init__(self, segment: shared_memory.SharedMemory):
+        self.segment = segment
+        self.name = segment.name
+        self.array = np.ndarray(FRAME_SHAPE, dtype=np.uint8, buffer=segment.buf)
+
+class SharedFrames:
+    """A fixed pool of FRAME_SHAPE uint8 buffers in shared memory. Pool processes write, the worker reads."""
+
+    def __init__(self, slots: int = FRAME_SLOTS):
+        nbytes = int(np.prod(FRAME_SHAPE))
+        self.slots = [FrameSlot(shared_memory.SharedMemory(create=True, size=nbytes)) for _ in range(slots)]
+        self.free: Optional[asyncio.Queue] = None
+
+    async def acquire(self) -> FrameSlot:
+        """Waits for a free slot: backpressure on frame extraction when Service D falls behind."""
+        if self.free is None:
+            self.free = asyncio.Queue()
+            for slot in self.slots: self.free.put_nowait(slot)
+        return await self.free.get()
+
+    def release(self, slot: FrameSlot):
+        self.free.put_nowait(slot)
+
+    def close(self):
+        for slot in self.slots:
+            del slot.array
+            slot.segment.close()
+            slot.segment.unlink()
+        self.slots = []
+
+def frame_slots() -> SharedFrames:
+    global _frame_slots
+    if _frame_slots is None:
+        _frame_slots = SharedFrames()
+    return _frame_slots
+
+# --- Event loop lag ---
+
+class LoopLagMonitor:
+    """Sleeps interval_s in a loop and records how much later than that it woke up."""
+
+    def __init__(self, interval_s: float = LOOP_LAG_INTERVAL_S, warn_s: float = LOOP_LAG_WARN_S):
+        self.interval_s = interval_s
+        self.warn_s = warn_s
+        self.lags = deque(maxlen=100_000)
+        self.task: Optional[asyncio.Task] = None
+
+    def start(self) -> "LoopLagMonitor":
+        self.task = asyncio.get_running_loop().create_task(self._run())
+        return self
+
+    def stop(self):
+        if self.task: self.task.cancel()
+
+    def reset(self):
+        self.lags.clear()
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            start = loop.time()
+            await asyncio.sleep(self.interval_s)
+            lag = max(0.0, loop.time() - start - self.interval_s)
+            self.lags.append(lag)
+            LOOP_LAG_SECONDS.observe(lag)
+            if lag > self.warn_s:
+                print(f"LOOP LAG WARNING: event loop blocked for {lag * 1000:.0f}ms")
+
+    def stats(self) -> Dict[str, Any]:
+        if not self.lags:
+            return {"samples": 0}
+        lags = np.array(self.lags) * 1000
+        return {"samples": len(lags), "p50_ms": round(float(np.percentile(lags, 50)), 2),
+                "p99_ms": round(float(np.percentile(lags, 99)), 2), "max_ms": round(float(lags.max()), 2)}
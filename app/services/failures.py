@@ -0,0 +1,152 @@
+# app/services/failures.py
+# V6: Failure handling for worker tasks.
+# A failed task used to be nacked every time, so a video that can never succeed (corrupt file, Gemini
+# refusal, missing input) was redelivered over and over, each time paying for download, STT and Gemini.
+# - classify() tells permanent failures (same input -> same failure) from transient ones.
+# - A permanent failure, or a transient one that keeps happening (MAX_TASK_ATTEMPTS failed runs, or
+#   MAX_DELIVERY_ATTEMPTS deliveries from the push envelope), is acked and published to the dead-letter
+#   topic with a diagnostic record instead of being retried.
+# - TaskCheckpoints keeps the results of the expensive stages under <output bucket>/<task_id>/_checkpoints/,
+#   so a retry after a transient failure resumes after the last stage that succeeded.
+
+import os
+import time
+import traceback
+from typing import Any, Dict, Optional, Tuple
+from app.services.observability import Counter
+from app.services.serialization import dumps, loads
+
+DEAD_LETTER_TOPIC_NAME = os.environ.get("DEAD_LETTER_TOPIC", "tbd-dead-letter")
+# Failed runs of one task (counted in its checkpoint manifest) before it is dead-lettered
+MAX_TASK_ATTEMPTS = int(os.environ.get("MAX_TASK_ATTEMPTS", "3"))
+# Deliveries read from the push envelope (deliveryAttempt, set when the subscription has a dead-letter
+# policy). Admission deferrals count too, so this is well above MAX_TASK_ATTEMPTS and below the
+# subscription's --max-delivery-attempts, where Pub/Sub forwards the raw message itself.
+MAX_DELIVERY_ATTEMPTS = int(os.environ.get("MAX_DELIVERY_ATTEMPTS", "20"))
+CHECKPOINT_DIR = "_checkpoints"
+CHECKPOINT_MANIFEST = "manifest.json"
+
+# 4xx answers that will not change on retry; 408/429 and 401/403 (configuration) are retried
+PERMANENT_STATUS = {400, 404, 405, 410, 411, 413, 414, 415, 422}
+
+FAILURES = Counter("tbd_task_failures_total", "Failed task runs, by stage and classification.", ["stage", "kind"])
+DEAD_LETTERED = Counter("tbd_dead_lettered_total", "Tasks acked and published to the dead-letter topic.", ["reason"])
+RESUMES = Counter("tbd_checkpoint_resumes_total", "Stages skipped on a retry thanks to a checkpoint.", ["stage"])
+
+class PermanentFailure(Exception):
+    """The task cannot succeed on this input: dead-letter it instead of retrying."""
+
+    def __init__(self, stage: str, reason: str, detail: str = ""):
+        super().__init__(f"{stage} {reason}{': ' + detail if detail else ''}")
+        self.stage = stage
+        self.reason = reason
+
+def _status_code(exc: Exception) -> Optional[int]:
+    """HTTP status of a google.api_core / requests error, if it carries one."""
+    response = getattr(exc, "response", None)
+    code = getattr(response, "status_code", None) if response is not None else getattr(exc, "code", None)
+    return code if isinstance(code, int) and 100 <= code < 600 else None
+
+def classify(exc: Exception) -> Tuple[bool, str]:
+    """
+    (permanent, reason). Only PermanentFailure and PERMANENT_STATUS answers are permanent; everything
+    else (bugs, decode errors on a proxy's error page, configuration) goes through MAX_TASK_ATTEMPTS.
+    """
+    if isinstance(exc, PermanentFailure):
+        return True, exc.reason
+    status = _status_code(exc)
+    if status is not None:
+        return status in PERMANENT_STATUS, f"http_{status}"
+    return False, type(exc).__name__
+
+def delivery_attempt(envelope: Dict[str, Any]) -> Optional[int]:
+    """The push envelope's deliveryAttempt (None when the subscription has no dead-letter policy)."""
+    attempt = envelope.get("deliveryAttempt")
+    return int(attempt) if attempt is not None else None
+
+def dead_letter_record(task_id: str, trace_id: str, payload: Dict[str, Any], stage: str, reason: str,
+                       permanent: bool, error: Optional[BaseException], attempt: Optional[int],
+                       checkpoints: Optional["TaskCheckpoints"] = None) -> Dict[str, Any]:
+    """What an operator needs to triage (and replay) the task, published to DEAD_LETTER_TOPIC_NAME."""
+    manifest = checkpoints.manifest if checkpoints is not None else {}
+    return {
+        "task_id": task_id,
+        "trace_id": trace_id,
+        "stage": stage,
+        "reason": reason,
+        "classification": "permanent" if permanent else "retries_exhausted",
+        "error_type": type(error).__name__ if error is not None else None,
+        "error": str(error)[:2000] if error is not None else None,
+        "traceback": "".join(traceback.format_exception(type(error), error, error.__traceback__))[-4000:] if error is not None else None,
+        "delivery_attempt": attempt,
+        "failed_runs": len(manifest.get("failures", [])),
+        "failures": manifest.get("failures", []),
+        "checkpoints": sorted(manifest.get("stages", {})),
+        "payload": payload,  # Resubmit to POST /submit once fixed; the checkpoints are kept for it
+        "worker_revision": os.environ.get("K_REVISION", "local"),
+        "ts": time.time(),
+    }
+
+class TaskCheckpoints:
+    """
+    Stage results of one task in its output bucket. The manifest lists the saved stages and the
+    failed runs; it is tied to the input video, so a task ID reused for another video starts clean.
+    Blocking (storage client): call through run_io.
+    """
+
+    def __init__(self, bucket, task_id: str, gcs_uri: str):
+        self.bucket = bucket
+        self.task_id = task_id
+        self.gcs_uri = gcs_uri
+        self.manifest: Dict[str, Any] = {"gcs_uri": gcs_uri, "stages": {}, "failures": []}
+
+    def _name(self, leaf: str) -> str:
+        return f"{self.task_id}/{CHECKPOINT_DIR}/{leaf}"
+
+    def _write_manifest(self):
+        self.bucket.blob(self._name(CHECKPOINT_MANIFEST)).upload_from_string(dumps(self.manifest), content_type="application/json")
+
+    def load(self) -> "TaskCheckpoints":
+        blob = self.bucket.get_blob(self._name(CHECKPOINT_MANIFEST))
+        if blob is not None:
+            manifest = loads(blob.download_as_bytes())
+            if manifest.get("gcs_uri") == self.gcs_uri:
+                self.manifest = manifest
+        return self
+
+    @property
+    def failed_runs(self) -> int:
+        return len(self.manifest["failures"])
+
+    def has(self, stage: str) -> bool:
+        return stage in self.manifest["stages"]
+
+    def save(self, stage: str, data: bytes, **meta):
+        name = self._name(stage)
+        self.bucket.blob(name).upload_from_string(data, content_type="application/octet-stream")
+        self.manifest["stages"][stage] = {"blob": name, "size": len(data), "at": time.time(), **meta}
+        self._write_manifest()
+
+    def get(self, stage: str) -> Optional[Tuple[bytes, Dict[str, Any]]]:
+        """(data, meta) of a saved stage, or None (never saved, or the blob is gone)."""
+        entry = self.manifest["stages"].get(stage)
+        if entry is None:
+            return None
+        blob = self.bucket.get_blob(entry["blob"])
+        if blob is None:
+            return None
+        RESUMES.inc(stage=stage)
+        return blob.download_as_bytes(), entry
+
+    def record_failure(self, stage: str, reason: str, permanent: bool, error: BaseException, attempt: Optional[int]):
+        self.manifest["failures"].append({"stage": stage, "reason": reason, "permanent": permanent,
+                                          "error": str(error)[:500], "delivery_attempt": attempt, "at": time.time()})
+        self._write_manifest()
+
+    def clear(self):
+        """After success: the stage results are not needed any more."""
+        for entry in self.manifest["stages"].values():
+            blob = self.bucket.get_blob(entry["blob"])
+            if blob is not None: blob.delete()
+        blob = self.bucket.get_blob(self._name(CHECKPOINT_MANIFEST))
+        if blob is not None: blob.delete()
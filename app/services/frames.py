@@ -0,0 +1,169 @@
+# app/services/frames.py
+# V6: CPU-bound frame work (decode, keyframe hash, letterbox, JPEG/WebP encode), run in the executor
+# layer's process pool. Jobs take the video's path; each pool process keeps its captures open between
+# jobs. Letterboxed frames are written into a shared-memory slot owned by the worker
+# (executors.SharedFrames), so only slot names, sizes and hashes cross the process boundary.
+# Imports stay light (cv2, numpy): pool processes are spawned and import this module on their own.
+
+import os
+import cv2
+import numpy as np
+from collections import OrderedDict
+from multiprocessing import shared_memory
+from typing import List, Optional, Tuple, Dict
+from app.services.diff import keyframe_hash
+
+# Service D model input size. Frames are letterboxed to this on our side so the
+# detector receives exactly what the model consumes.
+DETECTOR_INPUT_DIM = 640
+LETTERBOX_PAD_VALUE = 114
+# Service D letterboxes full frames with INTER_LINEAR (detector_app/main.py preprocess_image): the same
+# here, so a client-letterboxed frame (raw or jpeg transport) is the input the model was evaluated on
+LETTERBOX_INTERPOLATION = cv2.INTER_LINEAR
+FRAME_SHAPE = (DETECTOR_INPUT_DIM, DETECTOR_INPUT_DIM, 3)
+# Open captures per pool process (a task's jobs mostly hit the same video, in timestamp order)
+CAPTURE_CACHE_SIZE = 2
+
+# Node images for the pathway's sprite sheet (app/services/sprites.py)
+THUMBNAIL_WIDTH = int(os.environ.get("THUMBNAIL_WIDTH", "320"))
+CROP_MAX_DIM = 320
+CROP_MARGIN = 0.15          # Context around ui_region, as a fraction of its size per side
+WEBP_QUALITY = int(os.environ.get("WEBP_QUALITY", "70"))
+
+# (webp bytes, width, height)
+NodeImage = Tuple[bytes, int, int]
+
+_captures: "OrderedDict[Tuple[str, int], cv2.VideoCapture]" = OrderedDict()
+_segments: Dict[str, shared_memory.SharedMemory] = {}
+
+def get_frame_at_time(cap: cv2.VideoCapture, timestamp: float) -> cv2.typing.MatLike:
+    """Extracts a frame at a specific timestamp for coordinate refinement."""
+    max_duration = cap.get(cv2.CAP_PROP_FRAME_COUNT) / cap.get(cv2.CAP_PROP_FPS)
+    safe_timestamp = min(timestamp, max_duration - 0.1)
+
+    fps = cap.get(cv2.CAP_PROP_FPS)
+    frame_no = int(safe_timestamp * fps)
+
+    cap.set(cv2.CAP_PROP_POS_FRAMES, frame_no)
+    ret, frame = cap.read()
+
+    if not ret:
+        # Fallback: Try reading the 2nd to last frame
+        total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        cap.set(cv2.CAP_PROP_POS_FRAMES, total_frames - 2)
+        ret, frame = cap.read()
+        if not ret: return None
+
+    return frame
+
+def letterbox_frame(frame: cv2.typing.MatLike, dim: int = DETECTOR_INPUT_DIM, out: Optional[np.ndarray] = None) -> np.ndarray:
+    """Resizes a frame into a dim x dim canvas, preserving aspect ratio (YOLO letterbox). Writes into out if given."""
+    orig_h, orig_w = frame.shape[:2]
+    scale = min(dim / orig_w, dim / orig_h)
+    new_w, new_h = int(round(orig_w * scale)), int(round(orig_h * scale))
+    pad_x, pad_y = (dim - new_w) // 2, (dim - new_h) // 2
+
+    canvas = out if out is not None else np.empty((dim, dim, 3), dtype=np.uint8)
+    canvas.fill(LETTERBOX_PAD_VALUE)
+    canvas[pad_y:pad_y + new_h, pad_x:pad_x + new_w] = cv2.resize(
+        frame, (new_w, new_h), interpolation=LETTERBOX_INTERPOLATION
+    )
+    return canvas
+
+def video_duration(video_path: str) -> float:
+    """Seconds, from the container's frame count and rate (0.0 if unreadable)."""
+    cap = cv2.VideoCapture(video_path)
+    try:
+        fps = cap.get(cv2.CAP_PROP_FPS)
+        return cap.get(cv2.CAP_PROP_FRAME_COUNT) / fps if fps else 0.0
+    finally:
+        cap.release()
+
+def _capture(video_path: str) -> cv2.VideoCapture:
+    """This process's open capture of video_path. Keyed by inode: a reused temp path is a new video."""
+    for key in [key for key in _captures if not os.path.exists(key[0])]:
+        _captures.pop(key).release()  # The worker deleted the task's video
+    key = (video_path, os.stat(video_path).st_ino)
+    cap = _captures.get(key)
+    if cap is None:
+        cap = _captures[key] = cv2.VideoCapture(video_path)
+        while len(_captures) > CAPTURE_CACHE_SIZE:
+            _captures.popitem(last=False)[1].release()
+    _captures.move_to_end(key)
+    return cap
+
+def _segment(name: str) -> shared_memory.SharedMemory:
+    """
+    Attaches to a worker-owned slot once per process. Spawned pool processes share the worker's
+    resource tracker, so the segment stays registered once and is unlinked by the worker alone.
+    """
+    segment = _segments.get(name)
+    if segment is None:
+        segment = _segments[name] = shared_memory.SharedMemory(name=name)
+    return segment
+
+def frame_hashes(video_path: str, timestamps: List[float]) -> List[Optional[str]]:
+    """keyframe_hash of the frame at each timestamp (one decode pass, in timestamp order)."""
+    cap = _capture(video_path)
+    return [keyframe_hash(get_frame_at_time(cap, t)) for t in timestamps]
+
+def _webp(image: np.ndarray) -> Optional[NodeImage]:
+    success, buffer = cv2.imencode('.webp', image, [cv2.IMWRITE_WEBP_QUALITY, WEBP_QUALITY])
+    return (buffer.tobytes(), image.shape[1], image.shape[0]) if success else None
+
+def thumbnail(frame: np.ndarray, width: int = THUMBNAIL_WIDTH) -> Optional[NodeImage]:
+    orig_h, orig_w = frame.shape[:2]
+    height = max(1, int(round(orig_h * width / orig_w)))
+    return _webp(cv2.resize(frame, (width, height), interpolation=cv2.INTER_AREA))
+
+def keyframes(video_path: str, timestamps: List[float]) -> List[Tuple[Optional[str], Optional[NodeImage]]]:
+    """frame_hashes plus a WebP thumbnail of each frame, from the same decode."""
+    cap = _capture(video_path)
+    results = []
+    for t in timestamps:
+        frame = get_frame_at_time(cap, t)
+        results.append((keyframe_hash(frame), thumbnail(frame) if frame is not None else None))
+    return results
+
+def prepare_detector_frame(video_path: str, timestamp: float, slot_name: str,
+                           jpeg: bool = False) -> Optional[Tuple[int, int, Optional[bytes]]]:
+    """
+    Decodes the frame at timestamp and letterboxes it into the shared-memory slot.
+    Returns (orig_w, orig_h, jpeg bytes if requested), or None if no frame could be read.
+    """
+    frame = get_frame_at_time(_capture(video_path), timestamp)
+    if frame is None: return None
+    orig_h, orig_w = frame.shape[:2]
+    canvas = np.ndarray(FRAME_SHAPE, dtype=np.uint8, buffer=_segment(slot_name).buf)
+    letterbox_frame(frame, out=canvas)
+    encoded = None
+    if jpeg:
+        success, buffer = cv2.imencode('.jpg', canvas)
+        encoded = buffer.tobytes() if success else None
+    return orig_w, orig_h, encoded
+
+def node_crop(slot_name: str, orig_w: int, orig_h: int, ui_region: List[int],
+              dim: int = DETECTOR_INPUT_DIM) -> Optional[NodeImage]:
+    """
+    WebP of ui_region (original-frame [x, y, w, h]) plus a margin, cut from the letterboxed frame still
+    in the slot: exactly what Service D saw, at its input resolution. None for an empty region.
+    """
+    x, y, w, h = ui_region
+    if w <= 0 or h <= 0: return None
+    scale = min(dim / orig_w, dim / orig_h)
+    pad_x = (dim - int(round(orig_w * scale))) // 2
+    pad_y = (dim - int(round(orig_h * scale))) // 2
+    margin_x, margin_y = w * CROP_MARGIN, h * CROP_MARGIN
+    x0 = max(0, int((x - margin_x) * scale) + pad_x)
+    y0 = max(0, int((y - margin_y) * scale) + pad_y)
+    x1 = min(dim, int(np.ceil((x + w + margin_x) * scale)) + pad_x)
+    y1 = min(dim, int(np.ceil((y + h + margin_y) * scale)) + pad_y)
+    if x1 - x0 < 2 or y1 - y0 < 2: return None
+    canvas = np.ndarray(FRAME_SHAPE, dtype=np.uint8, buffer=_segment(slot_name).buf)
+    crop = canvas[y0:y1, x0:x1]
+    longest = max(crop.shape[:2])
+    if longest > CROP_MAX_DIM:
+        factor = CROP_MAX_DIM / longest
+        crop = cv2.resize(crop, (max(1, int(crop.shape[1] * factor)), max(1, int(crop.shape[0] * factor))),
+                          interpolation=cv2.INTER_AREA)
+    return _webp(np.ascontiguousarray(crop))
@@ -1,6 +1,7 @@
 import os
 import json
 import vertexai
+from app.services.failures import PermanentFailure
 from vertexai.generative_models import GenerativeModel, Part
 
 # Configuration
@@ -55,10 +56,19 @@ async def analyze_video_native(video_gcs_uri: str, audio_transcript: str) -> lis
 
     try:
         response = await model.generate_content_async([video_part, prompt])
-        raw_text = response.text.strip()
-        steps = json.loads(raw_text)
-        return steps
-
     except Exception as e:
+        # API errors propagate: the worker retries transient ones (429/5xx) and dead-letters the rest
         print(f"V5 Native Video Analysis Failed: {e}")
-        return []
\ No newline at end of file
+        raise
+
+    try:
+        # response.text raises ValueError when the answer was blocked (no text part)
+        raw_text = response.text.strip()
+        steps = json.loads(raw_text)
+    except ValueError as e:
+        # Deterministic at temperature 0: the same video gets the same answer on every retry
+        print(f"V5 Native Video Analysis Refused/Unparseable: {e}")
+        raise PermanentFailure("gemini", "refused", str(e)[:300])
+    if not isinstance(steps, list):
+        raise PermanentFailure("gemini", "unexpected_response", f"expected a JSON array, got {type(steps).__name__}")
+    return steps
\ No newline at end of file
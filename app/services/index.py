@@ -0,0 +1,221 @@
+# app/services/index.py
+# V6: Pathway artifact index (Service E, SERVICE_TYPE=indexer).
+# A compact SQLite catalogue of pathway metadata, updated incrementally from the worker's
+# index-update messages, so listing/lookup never scans the output bucket.
+
+import os
+import time
+import base64
+import sqlite3
+import threading
+from typing import List, Dict, Any, Optional
+from app.services.serialization import loads
+
+INDEX_DB_PATH = os.environ.get("INDEX_DB_PATH", "/tmp/tbd_pathway_index.db")
+# Output bucket to backfill from when the index starts empty (e.g. a fresh Cloud Run instance)
+INDEX_BACKFILL_BUCKET = os.environ.get("INDEX_BACKFILL_BUCKET", "")
+INDEX_TOPIC_NAME = "tbd-pathway-index"
+PATHWAY_BLOB_SUFFIX = "/pathway.json"
+MAX_PAGE_SIZE = 500
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS pathways (
+    task_id TEXT PRIMARY KEY,
+    pathway_id TEXT NOT NULL,
+    uri TEXT NOT NULL,
+    title TEXT NOT NULL,
+    source_video TEXT,
+    author_id TEXT,
+    created_at TEXT,
+    total_duration_sec REAL NOT NULL,
+    node_count INTEGER NOT NULL,
+    target_vertical TEXT,
+    compliance_tag TEXT,
+    indexed_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS pathway_actions (
+    task_id TEXT NOT NULL REFERENCES pathways(task_id) ON DELETE CASCADE,
+    action_type TEXT NOT NULL,
+    count INTEGER NOT NULL,
+    PRIMARY KEY (task_id, action_type)
+);
+CREATE INDEX IF NOT EXISTS idx_pathways_vertical ON pathways(target_vertical, compliance_tag);
+CREATE INDEX IF NOT EXISTS idx_pathways_duration ON pathways(total_duration_sec);
+CREATE INDEX IF NOT EXISTS idx_pathways_indexed_at ON pathways(indexed_at);
+CREATE INDEX IF NOT EXISTS idx_actions_type ON pathway_actions(action_type, task_id);
+"""
+
+def pathway_vector(pathway: Dict[str, Any]) -> Optional[List[float]]:
+    """The pathway's temporal context vector (sequence-level: every node carries the same one)."""
+    for node in pathway.get("nodes", []):
+        if node.get("temporal_context_vector"):
+            return node["temporal_context_vector"]
+    return None
+
+def summarize_pathway(pathway: Dict[str, Any], task_id: str, uri: str) -> Dict[str, Any]:
+    """Index record for one pathway (a Pathway.model_dump() or the parsed pathway.json)."""
+    metadata = pathway.get("metadata") or {}
+    action_counts: Dict[str, int] = {}
+    for node in pathway.get("nodes", []):
+        action_type = node.get("action_type", "click")
+        action_counts[action_type] = action_counts.get(action_type, 0) + 1
+    return {
+        "task_id": task_id,
+        "pathway_id": pathway["pathway_id"],
+        "uri": uri,
+        "title": pathway.get("title", ""),
+        "source_video": pathway.get("source_video"),
+        "author_id": pathway.get("author_id"),
+        "created_at": pathway.get("created_at"),
+        "total_duration_sec": float(pathway.get("total_duration_sec", 0.0)),
+        "node_count": len(pathway.get("nodes", [])),
+        # The worker writes these into metadata; the top-level fields are the schema defaults
+        "target_vertical": metadata.get("target_vertical", pathway.get("target_vertical")),
+        "compliance_tag": metadata.get("compliance_tag", pathway.get("compliance_tag")),
+        "action_types": action_counts,
+    }
+
+class PathwayIndex:
+    """SQLite-backed index. One connection shared under a lock (FastAPI runs sync endpoints in a threadpool)."""
+
+    def __init__(self, path: str = INDEX_DB_PATH):
+        self.path = path
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("PRAGMA foreign_keys=ON")
+        self.conn.executescript(SCHEMA)
+
+    def __len__(self) -> int:
+        with self.lock:
+            return self.conn.execute("SELECT COUNT(*) FROM pathways").fetchone()[0]
+
+    def upsert(self, record: Dict[str, Any]):
+        self.upsert_many([record])
+
+    def upsert_many(self, records: List[Dict[str, Any]]):
+        """Insert or replace; one transaction for the whole batch."""
+        now = time.time()
+        rows = [(r["task_id"], r["pathway_id"], r["uri"], r["title"], r["source_video"], r["author_id"],
+                 r["created_at"], r["total_duration_sec"], r["node_count"], r["target_vertical"],
+                 r["compliance_tag"], now) for r in records]
+        actions = [(r["task_id"], a, c) for r in records for a, c in r["action_types"].items()]
+        with self.lock, self.conn:
+            self.conn.executemany("DELETE FROM pathway_actions WHERE task_id = ?", [(r["task_id"],) for r in records])
+            self.conn.executemany("INSERT OR REPLACE INTO pathways VALUES (?,?,?,?,?,?,?,?,?,?,?,?)", rows)
+            self.conn.executemany("INSERT INTO pathway_actions VALUES (?,?,?)", actions)
+
+    def delete(self, task_id: str) -> bool:
+        with self.lock, self.conn:
+            return self.conn.execute("DELETE FROM pathways WHERE task_id = ?", (task_id,)).rowcount > 0
+
+    def _attach_actions(self, rows: List[sqlite3.Row]) -> List[Dict[str, Any]]:
+        records = [dict(row) for row in rows]
+        if not records: return records
+        by_id = {r["task_id"]: r for r in records}
+        for r in records: r["action_types"] = {}
+        placeholders = ",".join("?" * len(by_id))
+        for task_id, action_type, count in self.conn.execute(
+            f"SELECT task_id, action_type, count FROM pathway_actions WHERE task_id IN ({placeholders})", list(by_id)
+        ):
+            by_id[task_id]["action_types"][action_type] = count
+        return records
+
+    def get(self, task_id: str) -> Optional[Dict[str, Any]]:
+        with self.lock:
+            rows = self.conn.execute("SELECT * FROM pathways WHERE task_id = ?", (task_id,)).fetchall()
+            records = self._attach_actions(rows)
+        return records[0] if records else None
+
+    def query(self, vertical: Optional[str] = None, compliance_tag: Optional[str] = None,
+              action_type: Optional[str] = None, title: Optional[str] = None,
+              min_duration: Optional[float] = None, max_duration: Optional[float] = None,
+              min_nodes: Optional[int] = None, limit: int = 50, offset: int = 0) -> Dict[str, Any]:
+        """Filtered listing, newest first. Every filter is an indexed column or a join on one."""
+        clauses, params = [], []
+        if vertical is not None: clauses.append("p.target_vertical = ?"); params.append(vertical)
+        if compliance_tag is not None: clauses.append("p.compliance_tag = ?"); params.append(compliance_tag)
+        if min_duration is not None: clauses.append("p.total_duration_sec >= ?"); params.append(min_duration)
+        if max_duration is not None: clauses.append("p.total_duration_sec <= ?"); params.append(max_duration)
+        if min_nodes is not None: clauses.append("p.node_count >= ?"); params.append(min_nodes)
+        if title:
+            # Substring match: the user's %, _ and \ are literal characters, not wildcards
+            escaped = title.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+            clauses.append("p.title LIKE ? ESCAPE '\\'"); params.append(f"%{escaped}%")
+        if action_type is not None:
+            clauses.append("EXISTS (SELECT 1 FROM pathway_actions a WHERE a.task_id = p.task_id AND a.action_type = ?)")
+            params.append(action_type)
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        limit = max(1, min(limit, MAX_PAGE_SIZE))
+
+        with self.lock:
+            total = self.conn.execute(f"SELECT COUNT(*) FROM pathways p {where}", params).fetchone()[0]
+            rows = self.conn.execute(
+                f"SELECT p.* FROM pathways p {where} ORDER BY p.indexed_at DESC, p.task_id LIMIT ? OFFSET ?",
+                params + [limit, offset]
+            ).fetchall()
+            records = self._attach_actions(rows)
+        return {"total": total, "limit": limit, "offset": offset, "items": records}
+
+# --- Service E: Indexer ---
+
+class IndexerService:
+    def __init__(self, index: Optional[PathwayIndex] = None, vectors=None):
+        from app.services.vectors import VectorSearchService
+        self.index = index or PathwayIndex()
+        self.vectors = vectors or VectorSearchService()
+        self._storage_client = None
+
+    @property
+    def storage_client(self):
+        if self._storage_client is None:
+            from google.cloud import storage
+            self._storage_client = storage.Client()
+        return self._storage_client
+
+    def handle_pubsub_push(self, envelope: dict) -> Dict[str, Any]:
+        """Push subscription on INDEX_TOPIC_NAME: data is the worker's summarize_pathway() record (+ vector)."""
+        record = loads(base64.b64decode(envelope['message']['data']))
+        vector = record.pop("temporal_context_vector", None)
+        self.index.upsert(record)
+        if vector:
+            self.vectors.add(record["task_id"], vector)
+        return {"task_id": record["task_id"], "indexed": True, "vector": bool(vector)}
+
+    def similar(self, task_id: str, k: int = 10) -> Optional[List[Dict[str, Any]]]:
+        """Pathways whose temporal context vectors are closest to task_id's, with their index records."""
+        matches = self.vectors.similar_to(task_id, k)
+        if matches is None: return None
+        results = []
+        for match_id, score in matches:
+            record = self.index.get(match_id)
+            if record is None: continue  # vector outlived its metadata (deleted pathway)
+            results.append({**record, "similarity": round(score, 6)})
+        return results
+
+    def reindex_bucket(self, bucket_name: str, prefix: str = "", batch_size: int = 200) -> int:
+        """Backfill: scans the bucket once for */pathway.json and upserts in batches."""
+        batch, total = [], 0
+        for blob in self.storage_client.list_blobs(bucket_name, prefix=prefix or None):
+            if not blob.name.endswith(PATHWAY_BLOB_SUFFIX): continue
+            try:
+                pathway = loads(blob.download_as_bytes())
+                task_id = blob.name[:-len(PATHWAY_BLOB_SUFFIX)]
+                batch.append(summarize_pathway(pathway, task_id, f"gs://{bucket_name}/{blob.name}"))
+                vector = pathway_vector(pathway)
+                if vector:
+                    self.vectors.add(task_id, vector)
+            except Exception as e:
+                print(f"INDEX WARNING: Skipping {blob.name}: {e}")
+                continue
+            if len(batch) >= batch_size:
+                self.index.upsert_many(batch)
+                total += len(batch)
+                batch = []
+        if batch:
+            self.index.upsert_many(batch)
+            total += len(batch)
+        print(f"Reindexed {total} pathways from gs://{bucket_name}/{prefix}")
+        return total
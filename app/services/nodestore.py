@@ -0,0 +1,255 @@
+# app/services/nodestore.py
+# V6: Columnar node store for the pipeline hot path.
+# Nodes live in parallel arrays while the worker builds and enriches them; the Pydantic
+# Pathway / ActionNode objects are created once, at export.
+
+import numpy as np
+from typing import List, Optional, Dict, Any
+from app.schema import Pathway, ActionNode, TelemetryContext
+
+VECTOR_DIM = 512  # Service C output (LSTM_512_V6_REBUILD)
+
+class NodeStore:
+    """
+    Parallel arrays, one row per ActionNode (row i -> "node_{i+1}", linked in order).
+    Temporal vectors are rows of one shared float32 matrix: a sequence-level vector is stored
+    once and referenced by every node instead of being copied into 512-float lists per node.
+    """
+    __slots__ = (
+        "header", "size",
+        "timestamps", "regions", "confidence", "active_region_confidence",
+        "descriptions", "semantic_descriptions", "action_types", "ui_texts", "keyframe_hashes", "degraded",
+        "vectors", "vector_rows",
+        "telemetry_sensor", "telemetry_state", "telemetry_temp", "has_telemetry",
+        "sprites",
+    )
+
+    def __init__(self, capacity: int = 0, header: Optional[Dict[str, Any]] = None):
+        capacity = max(capacity, 1)
+        self.header = header or {}  # Pathway-level fields (pathway_id, title, ...)
+        self.size = 0
+
+        # Numeric columns (preallocated, grown by doubling)
+        self.timestamps = np.zeros((capacity, 2), dtype=np.float64)  # start, end
+        self.regions = np.zeros((capacity, 4), dtype=np.int32)  # x, y, w, h
+        self.confidence = np.zeros(capacity, dtype=np.float64)
+        self.active_region_confidence = np.zeros(capacity, dtype=np.float64)
+
+        # Text columns
+        self.descriptions: List[str] = []
+        self.semantic_descriptions: List[Optional[str]] = []
+        self.action_types: List[str] = []
+        self.ui_texts: List[str] = []
+        self.keyframe_hashes: List[Optional[str]] = []
+        self.degraded: List[List[str]] = []  # Fallback markers per node (resilience.degraded)
+
+        # Shared vector matrix; vector_rows[i] == -1 -> node has no vector yet
+        self.vectors = np.zeros((0, VECTOR_DIM), dtype=np.float32)
+        self.vector_rows = np.full(capacity, -1, dtype=np.int32)
+
+        # Telemetry (FR-04) as columns
+        self.telemetry_sensor: List[str] = []
+        self.telemetry_state: List[str] = []
+        self.telemetry_temp = np.zeros(capacity, dtype=np.float64)
+        self.has_telemetry = np.zeros(capacity, dtype=bool)
+
+        # Node thumbnails / crops collected by the pipeline (sprites.SpriteSheetBuilder), uploaded by the worker
+        self.sprites = None
+
+    def __len__(self) -> int:
+        return self.size
+
+    def _grow(self):
+        capacity = len(self.confidence) * 2
+        self.timestamps = np.resize(self.timestamps, (capacity, 2))
+        self.regions = np.resize(self.regions, (capacity, 4))
+        self.confidence = np.resize(self.confidence, capacity)
+        self.active_region_confidence = np.resize(self.active_region_confidence, capacity)
+        self.telemetry_temp = np.resize(self.telemetry_temp, capacity)
+        self.has_telemetry = np.resize(self.has_telemetry, capacity)
+        vector_rows = np.full(capacity, -1, dtype=np.int32)
+        vector_rows[:self.size] = self.vector_rows[:self.size]
+        self.vector_rows = vector_rows
+
+    def append(self, timestamp_start: float, timestamp_end: float, description: str, ui_element_text: str,
+               ui_region: List[int], confidence: float, active_region_confidence: float = 0.0,
+               action_type: str = "click", semantic_description: Optional[str] = None,
+               keyframe_hash: Optional[str] = None, degraded: Optional[List[str]] = None) -> int:
+        """Adds one node and returns its row."""
+        if self.size == len(self.confidence):
+            self._grow()
+        i = self.size
+        self.timestamps[i] = (timestamp_start, timestamp_end)
+        self.regions[i] = ui_region
+        self.confidence[i] = confidence
+        self.active_region_confidence[i] = active_region_confidence
+        self.vector_rows[i] = -1
+        self.has_telemetry[i] = False
+
+        self.descriptions.append(description)
+        self.semantic_descriptions.append(semantic_description)
+        self.action_types.append(action_type)
+        self.ui_texts.append(ui_element_text)
+        self.keyframe_hashes.append(keyframe_hash)
+        self.degraded.append(list(degraded or []))
+        self.telemetry_sensor.append("")
+        self.telemetry_state.append("")
+        self.size += 1
+        return i
+
+    def node_id(self, i: int) -> str:
+        return f"node_{i+1}"
+
+    # --- Enrichment (worker) ---
+
+    def set_vector(self, vector, rows: Optional[np.ndarray] = None):
+        """Stores one vector and points the given rows (default: all nodes) at it."""
+        vector = np.asarray(vector, dtype=np.float32).reshape(1, -1)
+        if vector.shape[1] != self.vectors.shape[1]:
+            if len(self.vectors): raise ValueError(f"Vector dim {vector.shape[1]} != {self.vectors.shape[1]}")
+            self.vectors = np.zeros((0, vector.shape[1]), dtype=np.float32)
+        self.vectors = np.concatenate([self.vectors, vector])
+        target = slice(0, self.size) if rows is None else rows
+        self.vector_rows[target] = len(self.vectors) - 1
+
+    def set_telemetry(self, telemetry: TelemetryContext, rows: Optional[np.ndarray] = None):
+        """Assigns one telemetry sample to the given rows (default: all nodes)."""
+        indices = range(self.size) if rows is None else np.arange(self.size)[rows]
+        for i in indices:
+            self.telemetry_sensor[i] = telemetry.sensor_id
+            self.telemetry_state[i] = telemetry.machine_state
+        target = slice(0, self.size) if rows is None else rows
+        self.telemetry_temp[target] = telemetry.ambient_temp_c
+        self.has_telemetry[target] = True
+
+    def mark_degraded(self, marker: str, rows: Optional[List[int]] = None):
+        """Records a fallback on the given rows (default: all nodes)."""
+        for i in range(self.size) if rows is None else rows:
+            if marker not in self.degraded[i]:
+                self.degraded[i].append(marker)
+
+    def assign_telemetry(self, sensor_id: str, states: List[str], state_codes: np.ndarray, temps: np.ndarray):
+        """Per-node telemetry from a vectorized join (one entry per node, in row order)."""
+        n = self.size
+        self.telemetry_sensor[:n] = [sensor_id] * n
+        self.telemetry_state[:n] = [states[k] for k in state_codes.tolist()]
+        self.telemetry_temp[:n] = temps
+        self.has_telemetry[:n] = True
+
+    # --- Export ---
+
+    def to_pathway(self, **overrides) -> Pathway:
+        """
+        The one conversion to the Pydantic schema. The columns are already typed, so nodes are
+        constructed without re-validation; only the Pathway-level fields are validated.
+        """
+        n = self.size
+        timestamps = self.timestamps[:n].tolist()
+        regions = self.regions[:n].tolist()
+        confidence = self.confidence[:n].tolist()
+        active = self.active_region_confidence[:n].tolist()
+        temps = self.telemetry_temp[:n].tolist()
+        # Each distinct vector / telemetry sample is converted once and shared by its nodes
+        vector_lists = {}
+        telemetry_objects = {}
+
+        nodes = []
+        for i in range(n):
+            row = int(self.vector_rows[i])
+            if row >= 0 and row not in vector_lists:
+                vector_lists[row] = self.vectors[row].tolist()
+
+            telemetry = None
+            if self.has_telemetry[i]:
+                key = (self.telemetry_sensor[i], self.telemetry_state[i], temps[i])
+                telemetry = telemetry_objects.get(key)
+                if telemetry is None:
+                    telemetry = TelemetryContext.model_construct(sensor_id=key[0], machine_state=key[1], ambient_temp_c=key[2])
+                    telemetry_objects[key] = telemetry
+
+            nodes.append(ActionNode.model_construct(
+                id=self.node_id(i),
+                timestamp_start=timestamps[i][0],
+                timestamp_end=timestamps[i][1],
+                description=self.descriptions[i],
+                semantic_description=self.semantic_descriptions[i],
+                action_type=self.action_types[i],
+                ui_element_text=self.ui_texts[i],
+                ui_region=regions[i],
+                confidence=confidence[i],
+                active_region_confidence=active[i],
+                temporal_context_vector=vector_lists.get(row, []),
+                telemetry_context=telemetry,
+                keyframe_hash=self.keyframe_hashes[i],
+                degraded=self.degraded[i],
+                next_node_id=self.node_id(i + 1) if i + 1 < n else None,
+            ))
+
+        return Pathway.model_validate({**self.header, **overrides, "nodes": nodes})
+
+    def to_dict(self, header: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Same layout (and key order) as Pathway.model_dump(), built from the columns: the serializer
+        gets plain dicts and one shared list per distinct vector. header is the exported Pathway's
+        model_dump(exclude={"nodes"}), so fields set after to_pathway (metadata, sprite_sheet) are kept.
+        """
+        n = self.size
+        timestamps = self.timestamps[:n].tolist()
+        regions = self.regions[:n].tolist()
+        confidence = self.confidence[:n].tolist()
+        active = self.active_region_confidence[:n].tolist()
+        temps = self.telemetry_temp[:n].tolist()
+        vector_lists = {}
+        empty: List[float] = []
+
+        nodes = []
+        for i in range(n):
+            row = int(self.vector_rows[i])
+            if row >= 0 and row not in vector_lists:
+                vector_lists[row] = self.vectors[row].tolist()
+            telemetry = None
+            if self.has_telemetry[i]:
+                telemetry = {"sensor_id": self.telemetry_sensor[i], "machine_state": self.telemetry_state[i],
+                             "ambient_temp_c": temps[i]}
+            nodes.append({
+                "id": self.node_id(i),
+                "timestamp_start": timestamps[i][0],
+                "timestamp_end": timestamps[i][1],
+                "description": self.descriptions[i],
+                "semantic_description": self.semantic_descriptions[i],
+                "action_type": self.action_types[i],
+                "ui_element_text": self.ui_texts[i],
+                "ui_region": regions[i],
+                "confidence": confidence[i],
+                "active_region_confidence": active[i],
+                "temporal_context_vector": vector_lists.get(row, empty),
+                "telemetry_context": telemetry,
+                "keyframe_hash": self.keyframe_hashes[i],
+                "degraded": self.degraded[i],
+                "next_node_id": self.node_id(i + 1) if i + 1 < n else None,
+            })
+        return {name: nodes if name == "nodes" else header[name] for name in Pathway.model_fields}
+
+    @classmethod
+    def from_pathway(cls, pathway: Pathway) -> "NodeStore":
+        """Loads an exported pathway back into columns; identical node vectors share one matrix row."""
+        store = cls(len(pathway.nodes), pathway.model_dump(exclude={"nodes"}))
+        rows_by_vector: Dict[bytes, int] = {}
+        vectors = []
+        for node in pathway.nodes:
+            i = store.append(
+                node.timestamp_start, node.timestamp_end, node.description, node.ui_element_text,
+                node.ui_region, node.confidence, node.active_region_confidence, node.action_type,
+                node.semantic_description, node.keyframe_hash, node.degraded,
+            )
+            if node.temporal_context_vector:
+                vector = np.asarray(node.temporal_context_vector, dtype=np.float32)
+                row = rows_by_vector.setdefault(vector.tobytes(), len(vectors))
+                if row == len(vectors):
+                    vectors.append(vector)
+                store.vector_rows[i] = row
+            if node.telemetry_context:
+                store.set_telemetry(node.telemetry_context, rows=np.array([i]))
+        if vectors:
+            store.vectors = np.stack(vectors)
+        return store
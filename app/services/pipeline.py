@@ -4,18 +4,37 @@ import time
 import cv2
 import asyncio
 import json
-import base64
 import requests
-from typing import List, Tuple
-from app.schema import Pathway, ActionNode
+import numpy as np
+from typing import List, Tuple, Optional, Callable
+from app.schema import Pathway
 from app.services.genai import analyze_video_native
 from app.services.ocr import run_ocr
+from app.services.diff import reusable_nodes
+from app.services.nodestore import NodeStore
+from app.services.frames import frame_hashes, keyframes, prepare_detector_frame, node_crop, NodeImage
+from app.services.sprites import SpriteSheetBuilder, NODE_SPRITES
+from app.services.executors import run_cpu, run_io, frame_slots, CPU_WORKERS
+from app.services.admission import downstream
+from app.services.resilience import resilient, degraded, ServiceUnavailable
+from app.services.observability import span, trace_headers
+from app.services.profiler import profile_headers
 from google.oauth2 import id_token
 from google.auth.transport.requests import Request
 
 # --- CONFIGURATION ---
-# INCREASED TIMEOUT: 5s -> 30s to handle Cloud Run Cold Starts
-OBJECT_DETECTOR_TIMEOUT = 30.0
+# Per-call timeout ceiling. Cold starts (why this was once 30s) are now absorbed by the
+# /readyz wait below; once warm, calls time out at a multiple of Service D's recent p99 (resilience.py).
+OBJECT_DETECTOR_TIMEOUT = float(os.environ.get("OBJECT_DETECTOR_TIMEOUT", "10.0"))
+# How long to wait for a cold Service C/D instance to report ready before routing around it
+SERVICE_READY_TIMEOUT = float(os.environ.get("SERVICE_READY_TIMEOUT", "60.0"))
+READY_POLL_INTERVAL = 1.0
+
+# "jpeg" -> multipart JPEG, no base64 (tens of KB per frame, encoded in the CPU pool);
+# "raw" -> the 1.2 MB uint8 tensor as octet-stream (no encode/decode, for a detector on a fast link)
+DETECTOR_TRANSPORT = os.environ.get("DETECTOR_TRANSPORT", "jpeg")
+# Frames extracted ahead of the detector call in flight, so decoding overlaps the HTTP round trip
+FRAME_PREFETCH = 2
 
 def _get_auth_token(audience: str) -> str:
     """Generates an authenticated token for the target Cloud Run service."""
@@ -28,121 +47,281 @@ def _get_auth_token(audience: str) -> str:
         print(f"AUTH ERROR: {e}")
         return ""
 
-def _get_frame_at_time(cap: cv2.VideoCapture, timestamp: float) -> cv2.typing.MatLike:
-    """Extracts a frame at a specific timestamp for coordinate refinement."""
-    max_duration = cap.get(cv2.CAP_PROP_FRAME_COUNT) / cap.get(cv2.CAP_PROP_FPS)
-    safe_timestamp = min(timestamp, max_duration - 0.1)
-    
-    fps = cap.get(cv2.CAP_PROP_FPS)
-    frame_no = int(safe_timestamp * fps)
-    
-    cap.set(cv2.CAP_PROP_POS_FRAMES, frame_no)
-    ret, frame = cap.read()
-    
-    if not ret:
-        # Fallback: Try reading the 2nd to last frame
-        total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
-        cap.set(cv2.CAP_PROP_POS_FRAMES, total_frames - 2)
-        ret, frame = cap.read()
-        if not ret: return None
-        
-    return frame
+async def wait_until_ready(service_url: str, timeout: float = SERVICE_READY_TIMEOUT) -> bool:
+    """
+    Polls a model service's /readyz until its model is warm.
+    False means the service is down, failed to load, or still cold: route around it for this task.
+    """
+    if not service_url: return False
 
-async def _call_object_detector(frame: cv2.typing.MatLike, target_text: str, detector_url: str) -> Tuple[List[int], float]:
-    """FR-07: Calls Service D securely for pixel-accurate coordinate prediction."""
-    if frame is None: return [0,0,0,0], 0.0
-    
-    token = _get_auth_token(detector_url)
-    headers = {"Authorization": f"Bearer {token}", "Content-Type": "application/json"}
-    
-    success, buffer = cv2.imencode('.jpg', frame)
-    frame_base64 = base64.b64encode(buffer).decode('utf-8')
-    
-    payload = {"frame_base64": frame_base64, "target_text": target_text}
-    
-    try:
-        loop = asyncio.get_event_loop()
-        response = await loop.run_in_executor(
-            None,
-            lambda: requests.post(
-                f"{detector_url}/detect_coordinates", 
-                headers=headers, 
-                json=payload, 
-                timeout=OBJECT_DETECTOR_TIMEOUT # Updated Timeout
+    headers = {"Authorization": f"Bearer {_get_auth_token(service_url)}"}
+    deadline = time.time() + timeout
+
+    while True:
+        try:
+            response = await run_io(
+                lambda: requests.get(f"{service_url}/readyz", headers=headers, timeout=5)
             )
+            if response.status_code == 200: return True
+            if response.status_code == 404: return True # Older service without /readyz
+            if response.json().get("state") == "failed":
+                print(f"WARNING: {service_url} reports its model failed to load.")
+                return False
+        except Exception as e:
+            print(f"Readiness probe failed for {service_url}: {e}")
+
+        if time.time() >= deadline:
+            print(f"WARNING: {service_url} not ready after {timeout:.0f}s.")
+            return False
+        await asyncio.sleep(READY_POLL_INTERVAL)
+
+def _post_frame(detector_url: str, letterboxed: np.ndarray, orig_w: int, orig_h: int, target_text: str, headers: dict,
+                jpeg: Optional[bytes] = None, timeout: float = OBJECT_DETECTOR_TIMEOUT) -> requests.Response:
+    """Sends the letterboxed frame as a compact binary body (no JSON/base64). jpeg: already encoded by the CPU pool."""
+    params = {"orig_w": orig_w, "orig_h": orig_h, "target_text": target_text}
+
+    if DETECTOR_TRANSPORT == "jpeg":
+        if jpeg is None:
+            success, buffer = cv2.imencode('.jpg', letterboxed)
+            jpeg = buffer.tobytes()
+        return requests.post(
+            f"{detector_url}/detect_coordinates_file",
+            headers=headers,
+            data=params,
+            files={"frame": ("frame.jpg", jpeg, "image/jpeg")},
+            timeout=timeout
         )
+
+    headers = {**headers, "Content-Type": "application/octet-stream"}
+    return requests.post(
+        f"{detector_url}/detect_coordinates_raw",
+        headers=headers,
+        params=params,
+        data=letterboxed.tobytes(),
+        timeout=timeout
+    )
+
+async def _call_object_detector(letterboxed: np.ndarray, orig_w: int, orig_h: int, target_text: str, detector_url: str,
+                                jpeg: Optional[bytes] = None) -> Tuple[List[int], float, Optional[str]]:
+    """
+    FR-07: Calls Service D securely for pixel-accurate coordinate prediction (frame already letterboxed).
+    Returns (ui_region, confidence, degraded marker). The marker is set when the call fell back to an empty region.
+    """
+    with span("detector", target_text=target_text, transport=DETECTOR_TRANSPORT) as call:
+        token = _get_auth_token(detector_url)
+        # traceparent: Service D logs this request under the task's trace (and profiles it, if the task is)
+        headers = {"Authorization": f"Bearer {token}", **trace_headers(), **profile_headers()}
         
-        if response.status_code == 200:
-            result = response.json()
-            return result.get('ui_region', [0,0,0,0]), result.get('confidence', 0.0)
-        else:
-            print(f"Detector Error {response.status_code}: {response.text}")
-            return [0,0,0,0], 0.0
+        try:
+            # The body is built in the I/O thread (a 640x640 uint8 tensor is far smaller than a full-res JPEG).
+            # Adaptive timeout, retries and hedging: resilience.py (the frame is read-only, so attempts can overlap)
+            async with downstream("detector"):
+                response = await resilient("detector", OBJECT_DETECTOR_TIMEOUT).call(
+                    lambda timeout: _post_frame(detector_url, letterboxed, orig_w, orig_h, target_text, headers, jpeg, timeout)
+                )
+            call.set(status=response.status_code)
             
+            if response.status_code == 200:
+                result = response.json()
+                return result.get('ui_region', [0,0,0,0]), result.get('confidence', 0.0), None
+            else:
+                print(f"Detector Error {response.status_code}: {response.text}")
+                return [0,0,0,0], 0.0, degraded("detector", "rejected")
+
+        except ServiceUnavailable as e:
+            print(f"WARNING: Object Detector unavailable: {e}")
+            call.set(error=str(e))
+            return [0, 0, 0, 0], 0.0, degraded("detector", e.reason)
+        except Exception as e:
+            print(f"WARNING: Object Detector call failed: {e}")
+            call.set(error=str(e))
+            return [0, 0, 0, 0], 0.0, degraded("detector", "error")
+
+def _video_info(local_video_path: str) -> Tuple[float, float]:
+    cap = cv2.VideoCapture(local_video_path)
+    try:
+        return cap.get(cv2.CAP_PROP_FPS), cap.get(cv2.CAP_PROP_FRAME_COUNT)
+    finally:
+        cap.release()
+
+async def _keyframe_hashes(local_video_path: str, timestamps: List[float],
+                           thumbnails: bool = False) -> Tuple[List[Optional[str]], List[Optional[NodeImage]]]:
+    """
+    keyframe_hash (and WebP thumbnail, if asked) per timestamp, decoded in parallel across the CPU pool
+    (one contiguous chunk per process).
+    """
+    if not timestamps: return [], []
+    size = -(-len(timestamps) // CPU_WORKERS)
+    chunks = [timestamps[i:i + size] for i in range(0, len(timestamps), size)]
+    job = keyframes if thumbnails else frame_hashes
+    results = [item for chunk in await asyncio.gather(*(run_cpu(job, local_video_path, chunk) for chunk in chunks))
+               for item in chunk]
+    if thumbnails:
+        return [h for h, _ in results], [thumb for _, thumb in results]
+    return results, [None] * len(results)
+
+async def _node_crop(slot, orig_w: int, orig_h: int, ui_region: List[int]) -> Optional[NodeImage]:
+    """The node's ui_region crop for the sprite sheet, from the frame still in its slot. Never fails the task."""
+    try:
+        return await run_cpu(node_crop, slot.name, orig_w, orig_h, ui_region)
     except Exception as e:
-        print(f"WARNING: Object Detector call failed: {e}")
-        return [0, 0, 0, 0], 0.0
+        print(f"SPRITE WARNING: Could not crop {ui_region}: {e}")
+        return None
+
+async def _prepare_frame(local_video_path: str, timestamp: float):
+    """
+    Decodes and letterboxes the step's frame in the CPU pool, into a shared-memory slot.
+    Returns (slot, (orig_w, orig_h, jpeg) | None); the caller releases the slot.
+    """
+    slots = frame_slots()
+    slot = await slots.acquire()
+    try:
+        with span("frame_extraction", timestamp=timestamp):
+            prepared = await run_cpu(prepare_detector_frame, local_video_path, timestamp, slot.name,
+                                     DETECTOR_TRANSPORT == "jpeg")
+        return slot, prepared
+    except BaseException:
+        slots.release(slot)
+        raise
 
 # --- Main V6 Pipeline ---
-async def build_pathway(local_video_path: str, gcs_video_uri: str, audio_transcript: str, object_detector_url: str) -> Pathway:
+async def build_node_store(local_video_path: str, gcs_video_uri: str, audio_transcript: str, object_detector_url: str,
+                           prior_pathway: Optional[Pathway] = None,
+                           on_phase: Optional[Callable[..., None]] = None) -> NodeStore:
+    """
+    Builds the pathway's nodes as a columnar NodeStore; the worker enriches it in place and exports once.
+    prior_pathway: the pathway of an earlier recording of the same SOP. Steps whose keyframe and
+    target match a prior node reuse that node's refinement; only changed steps go to Service D.
+    on_phase(phase, **detail): progress callback ("analyzing", "refining").
+    """
+    on_phase = on_phase or (lambda phase, **detail: None)
     print(f"Starting 'Native Insight' Pipeline for: {os.path.basename(local_video_path)}")
-    start_time = time.time()
 
     # 1. Semantic Analysis (Gemini)
     print("Phase 1: Semantic Analysis (Gemini)...")
+    on_phase("analyzing")
     # Note: Ensure app/services/genai.py is present and correct
-    ai_steps = await analyze_video_native(gcs_video_uri, audio_transcript)
+    # Waits for one of the instance's Gemini slots when concurrent tasks already use them all
+    async with downstream("gemini"):
+        with span("gemini") as call:
+            ai_steps = await analyze_video_native(gcs_video_uri, audio_transcript)
+            call.set(steps=len(ai_steps))
     print(f"Gemini identified {len(ai_steps)} steps.")
 
+    fps, total_frames = await run_io(_video_info, local_video_path)
+    total_duration_sec = total_frames / fps if fps else 0
+
+    # Keyframe fingerprints: stored on every node so the next re-recording can be diffed against this one
+    # The same decode pass writes each step's thumbnail into the pathway's sprite sheet
+    timestamps = [float(step.get('timestamp', 0.0)) for step in ai_steps]
+    sprites = SpriteSheetBuilder() if NODE_SPRITES else None
+    with span("keyframe_hash", steps=len(timestamps)):
+        if fps:
+            hashes, thumbnails = await _keyframe_hashes(local_video_path, timestamps, thumbnails=sprites is not None)
+        else:
+            hashes, thumbnails = [None] * len(ai_steps), [None] * len(ai_steps)
+    if sprites is not None:
+        for i, thumb in enumerate(thumbnails):
+            sprites.add(i, "thumb", thumb)
+    reuse = reusable_nodes(prior_pathway, hashes, ai_steps) if prior_pathway else {}
+    if prior_pathway:
+        print(f"Incremental: reusing {len(reuse)}/{len(ai_steps)} nodes of pathway {prior_pathway.pathway_id}.")
+
     # 2. Coordinate Refinement (YOLO)
     print("Phase 2: Coordinate Refinement (YOLO)...")
-    cap = cv2.VideoCapture(local_video_path)
-    fps = cap.get(cv2.CAP_PROP_FPS)
-    total_frames = cap.get(cv2.CAP_PROP_FRAME_COUNT)
-    total_duration_sec = total_frames / fps if fps else 0
-    
-    final_nodes = []
+    on_phase("refining", steps=len(ai_steps), done=0)
+    store = NodeStore(len(ai_steps))
+
+    # Route around a cold/failed detector once, instead of timing out on every node
+    needs_refinement = len(reuse) < len(ai_steps)
+    detector_ready = needs_refinement and await wait_until_ready(object_detector_url)
+    if needs_refinement and not detector_ready:
+        print("WARNING: Object Detector not ready. Skipping coordinate refinement for this task.")
     
-    for i, step in enumerate(ai_steps):
-        timestamp = float(step.get('timestamp', 0.0))
-        target_text = step.get('target_text', "Unlabeled")
-        
-        # Extract frame and call detector
-        frame = _get_frame_at_time(cap, timestamp)
-        ui_region, confidence = await _call_object_detector(frame, target_text, object_detector_url)
-        
-        node = ActionNode(
-            id=f"node_{i+1}",
-            timestamp_start=timestamp,
-            timestamp_end=timestamp + 1.0, # Default duration
-            description=step.get('description', 'No description'),
-            semantic_description=step.get('description', 'No description'),
-            ui_element_text=target_text,
-            ui_region=ui_region,
-            confidence=confidence,
-            active_region_confidence=confidence,
-            action_type=step.get('action_type', 'click'),
-            # Next node ID logic
-            next_node_id=f"node_{i+2}" if i + 1 < len(ai_steps) else None
-        )
-        final_nodes.append(node)
-        
-    cap.release()
-
-    # 3. Assembly
-    pathway = Pathway(
-        pathway_id=str(uuid.uuid4()),
-        title=f"Native Insight: {os.path.basename(local_video_path)}",
-        author_id="tbd-v6-engine",
-        source_video=os.path.basename(local_video_path),
-        created_at=time.strftime('%Y-%m-%dT%H:%M:%S%z'),
-        total_duration_sec=total_duration_sec,
-        nodes=final_nodes,
-        metadata={
+    # Frames are extracted in the CPU pool up to FRAME_PREFETCH steps ahead of the detector call in flight
+    refine = [i for i in range(len(ai_steps)) if i not in reuse] if detector_ready else []
+    prefetched = {}
+    refined = 0
+
+    def prefetch(position: int):
+        for k in refine[position:position + FRAME_PREFETCH]:
+            if k not in prefetched:
+                prefetched[k] = asyncio.ensure_future(_prepare_frame(local_video_path, timestamps[k]))
+
+    try:
+        for i, step in enumerate(ai_steps):
+            timestamp = timestamps[i]
+            target_text = step.get('target_text', "Unlabeled")
+            prior_node = reuse.get(i)
+            fallback = None
+            
+            # Unchanged step: keep the prior refinement. Otherwise extract frame and call detector.
+            if prior_node:
+                ui_region, confidence = prior_node.ui_region, prior_node.confidence
+            elif detector_ready:
+                prefetch(refined)
+                refined += 1
+                slot, prepared = await prefetched.pop(i)
+                try:
+                    if prepared is None:
+                        ui_region, confidence, fallback = [0, 0, 0, 0], 0.0, "frame_unreadable"
+                    else:
+                        orig_w, orig_h, jpeg = prepared
+                        ui_region, confidence, fallback = await _call_object_detector(
+                            slot.array, orig_w, orig_h, target_text, object_detector_url, jpeg)
+                        if sprites is not None and not fallback:
+                            sprites.add(i, "crop", await _node_crop(slot, orig_w, orig_h, ui_region))
+                finally:
+                    frame_slots().release(slot)
+            else:
+                ui_region, confidence = [0, 0, 0, 0], 0.0
+                if needs_refinement:
+                    fallback = degraded("detector", "not_ready")
+            
+            store.append(
+                timestamp_start=timestamp,
+                timestamp_end=timestamp + 1.0, # Default duration
+                description=step.get('description', 'No description'),
+                semantic_description=step.get('description', 'No description'),
+                ui_element_text=prior_node.ui_element_text if prior_node else target_text,
+                ui_region=ui_region,
+                confidence=confidence,
+                active_region_confidence=prior_node.active_region_confidence if prior_node else confidence,
+                action_type=step.get('action_type', 'click'),
+                keyframe_hash=hashes[i],
+                degraded=[fallback] if fallback else None,
+            )
+            on_phase("refining", steps=len(ai_steps), done=i + 1)
+    finally:
+        # Failed mid-way: let extractions still running finish before their slots are reused
+        for pending in prefetched.values():
+            try:
+                frame_slots().release((await pending)[0])
+            except Exception:
+                pass  # _prepare_frame released its slot
+
+    # 3. Assembly (Pathway-level fields; nodes are linked in order at export)
+    store.header = {
+        "pathway_id": str(uuid.uuid4()),
+        "title": f"Native Insight: {os.path.basename(local_video_path)}",
+        "author_id": "tbd-v6-engine",
+        "source_video": os.path.basename(local_video_path),
+        "created_at": time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        "total_duration_sec": total_duration_sec,
+        "metadata": {
             "target_vertical": "manufacturing",
             "compliance_tag": "AS9100"
         }
-    )
+    }
     
-    print(f"Pipeline complete in {time.time() - start_time:.2f}s")
-    return pathway
\ No newline at end of file
+    store.sprites = sprites
+
+    # Stage timings: the gemini / keyframe_hash / frame_extraction / detector spans (GET /metrics)
+    print(f"Pipeline complete: {len(store)} nodes, {len(reuse)} reused.")
+    return store
+
+async def build_pathway(local_video_path: str, gcs_video_uri: str, audio_transcript: str, object_detector_url: str,
+                        prior_pathway: Optional[Pathway] = None) -> Pathway:
+    """build_node_store + export, for callers that want the Pydantic Pathway directly."""
+    store = await build_node_store(local_video_path, gcs_video_uri, audio_transcript, object_detector_url, prior_pathway)
+    return store.to_pathway()
@@ -0,0 +1,173 @@
+# app/services/profiler.py
+# V6: Opt-in sampling profiler for one task.
+# A daemon thread snapshots every thread's Python stack (sys._current_frames) at a fixed interval and
+# counts identical stacks. Nothing runs unless a task asks for it (config.profile, or PROFILE_TASKS=1),
+# so the disabled cost is one dict lookup per task. Output is speedscope JSON (open at
+# https://www.speedscope.app) or collapsed stacks (flamegraph.pl, inferno), uploaded next to pathway.json.
+
+import os
+import sys
+import json
+import time
+import threading
+import contextlib
+import contextvars
+from collections import Counter
+from typing import Dict, List, Tuple, Optional, Any
+
+# Profile every task on this instance (otherwise per task: config.profile = true | "speedscope" | "collapsed")
+PROFILE_TASKS = os.environ.get("PROFILE_TASKS", "0") == "1"
+PROFILE_FORMAT = os.environ.get("PROFILE_FORMAT", "speedscope")
+PROFILE_INTERVAL_S = float(os.environ.get("PROFILE_INTERVAL_MS", "10")) / 1000
+PROFILE_MAX_DEPTH = 128
+# Sent with Service C/D calls of a profiled task; they then sample while serving it (keyed by trace id)
+PROFILE_HEADER = "X-TbD-Profile"
+PROFILE_FORMATS = {"speedscope": "speedscope.json", "collapsed": "collapsed.txt"}
+
+# Leaf frames of a thread that is parked, not running Python: event loop in select, idle pool workers
+IDLE_LEAVES = {
+    ("selectors.py", "select"),
+    ("threading.py", "wait"),
+    ("thread.py", "_worker"),
+    ("queue.py", "get"),
+}
+
+_task_profiled: contextvars.ContextVar[bool] = contextvars.ContextVar("tbd_profiled", default=False)
+
+def requested_format(config: Dict[str, Any]) -> Optional[str]:
+    """The profile format a task asked for, or None when it should not be profiled."""
+    choice = config.get("profile", PROFILE_TASKS)
+    if not choice:
+        return None
+    return choice if choice in PROFILE_FORMATS else PROFILE_FORMAT
+
+def profile_filename(fmt: str, source: str = "") -> str:
+    """profile.speedscope.json for the worker, profile_detector.speedscope.json for Service D..."""
+    return f"profile{'_' + source if source else ''}.{PROFILE_FORMATS[fmt]}"
+
+def profile_headers() -> Dict[str, str]:
+    """Headers for a downstream model call: ask it to profile too, when this task is profiled."""
+    return {PROFILE_HEADER: "1"} if _task_profiled.get() else {}
+
+class SamplingProfiler:
+    """Counts Python stacks of all other threads every interval_s while started (restartable: samples add up)."""
+
+    def __init__(self, interval_s: float = PROFILE_INTERVAL_S):
+        self.interval_s = interval_s
+        self.samples: Counter = Counter()     # (thread name, frame, frame, ...) root -> leaf
+        self.idle_samples = 0
+        self.started_at = 0.0
+        self.duration_s = 0.0
+        self._labels: Dict[Any, str] = {}
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> "SamplingProfiler":
+        self.started_at = time.time()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="tbd-profiler", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> "SamplingProfiler":
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+        self.duration_s += time.time() - self.started_at
+        return self
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+        return False
+
+    def _run(self):
+        while not self._stop.wait(self.interval_s):
+            self.sample()
+
+    def _label(self, code) -> str:
+        label = self._labels.get(code)
+        if label is None:
+            label = f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})".replace(";", ",")
+            self._labels[code] = label
+        return label
+
+    def sample(self):
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        me = threading.get_ident()
+        for ident, frame in sys._current_frames().items():
+            if ident == me:
+                continue
+            code = frame.f_code
+            if (os.path.basename(code.co_filename), code.co_name) in IDLE_LEAVES:
+                self.idle_samples += 1
+                continue
+            stack = []
+            while frame is not None and len(stack) < PROFILE_MAX_DEPTH:
+                stack.append(self._label(frame.f_code))
+                frame = frame.f_back
+            stack.append(names.get(ident, f"thread-{ident}"))
+            self.samples[tuple(reversed(stack))] += 1
+
+    # --- Output ---
+
+    def collapsed(self) -> str:
+        """Brendan Gregg's folded format: `thread;outer;...;leaf <samples>` per line."""
+        lines = [f"{';'.join(stack)} {count}" for stack, count in Counter(dict(self.samples)).most_common()]
+        return "\n".join(lines) + "\n"
+
+    def speedscope(self, name: str = "tbd") -> Dict[str, Any]:
+        """speedscope file format: one sampled profile per thread, weights in seconds."""
+        frames: List[Dict[str, Any]] = []
+        frame_index: Dict[str, int] = {}
+        by_thread: Dict[str, Tuple[List[List[int]], List[float]]] = {}
+        for stack, count in Counter(dict(self.samples)).most_common():
+            indices = []
+            for label in stack[1:]:
+                if label not in frame_index:
+                    frame_index[label] = len(frames)
+                    function, _, location = label.rpartition(" (")
+                    file, _, line = location.rstrip(")").rpartition(":")
+                    frames.append({"name": function, "file": file, "line": int(line)})
+                indices.append(frame_index[label])
+            stacks, weights = by_thread.setdefault(stack[0], ([], []))
+            stacks.append(indices)
+            weights.append(round(count * self.interval_s, 6))
+
+        profiles = [{
+            "type": "sampled", "name": thread, "unit": "seconds",
+            "startValue": 0, "endValue": round(sum(weights), 6),
+            "samples": stacks, "weights": weights,
+        } for thread, (stacks, weights) in by_thread.items()]
+        return {
+            "$schema": "https://www.speedscope.app/file-format-schema.json",
+            "name": name,
+            "exporter": "tbd-profiler",
+            "activeProfileIndex": 0,
+            "shared": {"frames": frames},
+            "profiles": profiles,
+        }
+
+    def render(self, fmt: str, name: str = "tbd") -> str:
+        return json.dumps(self.speedscope(name)) if fmt == "speedscope" else self.collapsed()
+
+    def summary(self) -> Dict[str, Any]:
+        return {"samples": sum(dict(self.samples).values()), "idle_samples": self.idle_samples,
+                "interval_ms": self.interval_s * 1000, "duration_s": round(self.duration_s, 3)}
+
+@contextlib.contextmanager
+def profiled_task(fmt: Optional[str]):
+    """Samples while one task runs and marks its downstream calls for profiling. Yields None when fmt is None."""
+    if not fmt:
+        yield None
+        return
+    profiler = SamplingProfiler()
+    token = _task_profiled.set(True)
+    profiler.start()
+    try:
+        yield profiler
+    finally:
+        profiler.stop()
+        _task_profiled.reset(token)
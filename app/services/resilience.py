@@ -0,0 +1,250 @@
+# app/services/resilience.py
+# V6: Resilient calls to the model services (Service C encoder, Service D detector).
+# Each service gets one ResilientService per worker instance, shared by all tasks:
+# - Timeouts follow the service's recent latency (a multiple of p99), capped by the configured timeout,
+#   so a degraded service costs seconds per call instead of the full timeout.
+# - Failed attempts (connection errors, timeouts, 5xx, 429) are retried with jittered exponential backoff.
+# - An attempt still running after the service's p95 is hedged: a second identical request is sent and
+#   the first good response wins (both calls are idempotent).
+# - A circuit breaker opens after consecutive failures. While it is open, calls fail at once with
+#   ServiceUnavailable, and the caller records a result marked degraded instead of waiting.
+
+import os
+import time
+import random
+import asyncio
+from collections import deque
+from typing import Callable, Dict, Optional
+import numpy as np
+import requests
+from app.services.executors import run_io
+from app.services.observability import Counter, Gauge
+
+# Timeout = p99 x multiplier, within [DOWNSTREAM_MIN_TIMEOUT, the service's configured timeout]
+TIMEOUT_P99_MULTIPLIER = float(os.environ.get("TIMEOUT_P99_MULTIPLIER", "3.0"))
+DOWNSTREAM_MIN_TIMEOUT = float(os.environ.get("DOWNSTREAM_MIN_TIMEOUT", "2.0"))
+LATENCY_WINDOW = 200            # Recent successful calls per service
+LATENCY_MIN_SAMPLES = 20        # Fewer than this: configured timeout, no hedging
+
+DOWNSTREAM_RETRIES = int(os.environ.get("DOWNSTREAM_RETRIES", "2"))
+RETRY_BASE_S = 0.2
+RETRY_MAX_S = 2.0
+HEDGE_REQUESTS = os.environ.get("HEDGE_REQUESTS", "1") == "1"
+# Hedges per call, at most (token bucket): a slow service is not sent double its load
+HEDGE_BUDGET = 0.1
+HEDGE_BURST = 10.0
+
+BREAKER_FAILURES = int(os.environ.get("BREAKER_FAILURES", "5"))       # Consecutive failed calls -> open
+BREAKER_COOLDOWN_S = float(os.environ.get("BREAKER_COOLDOWN_S", "30"))  # Open -> one probe call (half-open)
+
+RETRYABLE_STATUS = {408, 429, 500, 502, 503, 504}
+CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+_STATE_VALUES = {CLOSED: 0, OPEN: 1, HALF_OPEN: 2}
+
+ATTEMPTS = Counter("tbd_downstream_attempts_total", "Requests sent to a model service, by outcome.", ["service", "outcome"])
+HEDGES = Counter("tbd_downstream_hedges_total", "Hedged (duplicate) requests sent after the service's p95.", ["service"])
+DEGRADED = Counter("tbd_degraded_results_total", "Calls that fell back to a degraded result.", ["service", "reason"])
+BREAKER_STATE = Gauge("tbd_circuit_state", "Circuit breaker per service (0 closed, 1 open, 2 half-open).", ["service"])
+
+class ServiceUnavailable(Exception):
+    """The call did not succeed: circuit open, or every attempt failed. The caller degrades."""
+
+    def __init__(self, service: str, reason: str, detail: str = ""):
+        super().__init__(f"{service} {reason}{': ' + detail if detail else ''}")
+        self.service = service
+        self.reason = reason
+
+class LatencyTracker:
+    """Latencies of recent successful calls -> adaptive timeout and hedge delay."""
+
+    def __init__(self, max_timeout: float, window: int = LATENCY_WINDOW):
+        self.max_timeout = max_timeout
+        self.samples = deque(maxlen=window)
+
+    def observe(self, seconds: float):
+        self.samples.append(seconds)
+
+    def percentile(self, q: float) -> Optional[float]:
+        if len(self.samples) < LATENCY_MIN_SAMPLES:
+            return None
+        return float(np.percentile(self.samples, q))
+
+    def timeout(self) -> float:
+        p99 = self.percentile(99)
+        if p99 is None:
+            return self.max_timeout
+        return min(self.max_timeout, max(DOWNSTREAM_MIN_TIMEOUT, p99 * TIMEOUT_P99_MULTIPLIER))
+
+    def hedge_delay(self) -> Optional[float]:
+        return self.percentile(95)
+
+class CircuitBreaker:
+    def __init__(self, service: str, failures: int = BREAKER_FAILURES, cooldown_s: float = BREAKER_COOLDOWN_S):
+        self.service = service
+        self.threshold = failures
+        self.cooldown_s = cooldown_s
+        self.failures = 0
+        self.opened_at = 0.0
+        self.probing = False
+        self.state = CLOSED
+        BREAKER_STATE.set(0, service=service)
+
+    def _set(self, state: str):
+        if state != self.state:
+            print(f"CIRCUIT {self.service}: {self.state} -> {state}")
+        self.state = state
+        BREAKER_STATE.set(_STATE_VALUES[state], service=self.service)
+
+    def allow(self) -> bool:
+        """Whether a call may go out now. Half-open lets a single probe through."""
+        if self.state == OPEN and time.monotonic() - self.opened_at >= self.cooldown_s:
+            self._set(HALF_OPEN)
+        if self.state == HALF_OPEN:
+            if self.probing:
+                return False
+            self.probing = True
+            return True
+        return self.state == CLOSED
+
+    def record_success(self):
+        self.failures = 0
+        self.probing = False
+        self._set(CLOSED)
+
+    def record_failure(self):
+        self.failures += 1
+        self.probing = False
+        if self.state == HALF_OPEN or self.failures >= self.threshold:
+            self.opened_at = time.monotonic()
+            self._set(OPEN)
+
+    def release_probe(self):
+        """The probe ended without an outcome (cancelled): the next call may probe again."""
+        self.probing = False
+
+def _discard(attempt: asyncio.Future):
+    if not attempt.cancelled():
+        attempt.exception()  # Retrieved, so asyncio doesn't log it
+
+class ResilientService:
+    """Adaptive timeout, retries, hedging and a circuit breaker around one model service's HTTP calls."""
+
+    def __init__(self, name: str, max_timeout: float, retries: int = DOWNSTREAM_RETRIES, hedge: bool = HEDGE_REQUESTS):
+        self.name = name
+        self.retries = retries
+        self.hedge = hedge
+        self.latency = LatencyTracker(max_timeout)
+        self.breaker = CircuitBreaker(name)
+        self.hedge_tokens = HEDGE_BURST
+
+    def available(self) -> bool:
+        """False while the circuit is open (no call would be sent)."""
+        return self.breaker.state != OPEN or time.monotonic() - self.breaker.opened_at >= self.breaker.cooldown_s
+
+    def _send(self, send: Callable[[float], requests.Response], timeout: float) -> requests.Response:
+        # Checked again when an I/O thread picks the attempt up: attempts queued behind an outage are dropped
+        if self.breaker.state == OPEN:
+            raise ServiceUnavailable(self.name, "circuit_open")
+        return send(timeout)
+
+    async def _attempt(self, send: Callable[[float], requests.Response], timeout: float) -> requests.Response:
+        start = time.perf_counter()
+        try:
+            response = await run_io(self._send, send, timeout)
+        except ServiceUnavailable:
+            raise
+        except requests.Timeout:
+            ATTEMPTS.inc(service=self.name, outcome="timeout")
+            raise
+        except Exception:
+            ATTEMPTS.inc(service=self.name, outcome="error")
+            raise
+        retryable = response.status_code in RETRYABLE_STATUS
+        ATTEMPTS.inc(service=self.name, outcome=f"{response.status_code // 100}xx")
+        if not retryable:
+            self.latency.observe(time.perf_counter() - start)
+        return response
+
+    async def _hedged(self, send: Callable[[float], requests.Response]) -> requests.Response:
+        """One attempt, plus a second one if the first outlasts p95. The first good response wins."""
+        timeout = self.latency.timeout()
+        first = asyncio.ensure_future(self._attempt(send, timeout))
+        self.hedge_tokens = min(HEDGE_BURST, self.hedge_tokens + HEDGE_BUDGET)
+        delay = self.latency.hedge_delay() if self.hedge else None
+        if delay is None:
+            return await first
+        done, _ = await asyncio.wait({first}, timeout=delay)
+        if done or self.hedge_tokens < 1 or self.breaker.state != CLOSED:
+            return await first
+
+        self.hedge_tokens -= 1
+        HEDGES.inc(service=self.name)
+        attempts = [first, asyncio.ensure_future(self._attempt(send, timeout))]
+        pending = set(attempts)
+        while True:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            # Both may land in the same round: a good one wins over a 5xx/exception regardless of set order
+            winner = next((attempt for attempt in done if attempt.exception() is None
+                           and attempt.result().status_code not in RETRYABLE_STATUS), None)
+            if winner is None and not pending:
+                winner = next(iter(done))  # Both attempts failed: surface one of the failures
+            if winner is not None:
+                # The loser's thread finishes on its own; its result is dropped
+                for other in attempts: other.add_done_callback(_discard)
+                return winner.result()
+
+    async def call(self, send: Callable[[float], requests.Response]) -> requests.Response:
+        """
+        send(timeout) performs one blocking request (run in the I/O pool). Returns the first response
+        that is not retryable (2xx, or a 4xx the caller should handle), else raises ServiceUnavailable.
+        """
+        if not self.breaker.allow():
+            raise ServiceUnavailable(self.name, "circuit_open")
+        probe = self.breaker.state == HALF_OPEN  # This call holds the single half-open probe
+        failure = ""
+        try:
+            for attempt in range(self.retries + 1):
+                try:
+                    response = await self._hedged(send)  # ServiceUnavailable (opened meanwhile) propagates
+                    if response.status_code not in RETRYABLE_STATUS:
+                        self.breaker.record_success()
+                        return response
+                    failure = f"HTTP {response.status_code}"
+                except requests.RequestException as e:
+                    failure = f"{type(e).__name__}: {e}"
+                self.breaker.record_failure()
+                if attempt == self.retries or not self.breaker.allow():
+                    break
+                # Full jitter: concurrent tasks retrying the same outage don't come back in lockstep
+                await asyncio.sleep(random.uniform(0, min(RETRY_MAX_S, RETRY_BASE_S * 2 ** attempt)))
+        except ServiceUnavailable:
+            raise
+        except Exception:
+            if probe and self.breaker.probing:
+                self.breaker.record_failure()  # Any other error on the probe counts as a failed probe
+            raise
+        finally:
+            # CancelledError (hedge loser, client gone) is neither success nor failure: just free the probe
+            if probe and self.breaker.probing and self.breaker.state == HALF_OPEN:
+                self.breaker.release_probe()
+        raise ServiceUnavailable(self.name, "circuit_open" if self.breaker.state == OPEN else "failed", failure)
+
+    def stats(self) -> Dict[str, object]:
+        p50, p95 = self.latency.percentile(50), self.latency.percentile(95)
+        return {"state": self.breaker.state, "timeout_s": round(self.latency.timeout(), 3),
+                "p50_ms": round(p50 * 1000, 1) if p50 is not None else None,
+                "p95_ms": round(p95 * 1000, 1) if p95 is not None else None}
+
+SERVICES: Dict[str, ResilientService] = {}
+
+def resilient(name: str, max_timeout: float) -> ResilientService:
+    """The instance's ResilientService for a model service (created on first use)."""
+    service = SERVICES.get(name)
+    if service is None:
+        service = SERVICES[name] = ResilientService(name, max_timeout)
+    return service
+
+def degraded(service: str, reason: str) -> str:
+    """Counts one degraded result; returns the marker stored on the affected nodes."""
+    DEGRADED.inc(service=service, reason=reason)
+    return f"{service}_{reason}"
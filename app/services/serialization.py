@@ -0,0 +1,68 @@
+# app/services/serialization.py
+# V6: Fast-path JSON for data the engine produced itself.
+# Pub/Sub messages, status events, index records, manifests and pathway artifacts are encoded and
+# decoded with orjson (stdlib json if it is not installed). Models rebuilt from our own artifacts
+# (the worker's node_store checkpoint) skip validation: construct() calls model_construct down the
+# nested models. Input from outside the engine (HTTP bodies, Gemini output, the pathway behind a
+# client's prior_pathway_uri) and the Pub/Sub task payload are still validated: that is where a
+# malformed message should fail, not deep in the pipeline.
+
+import json
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Tuple, Type, TypeVar, Union, get_args, get_origin
+from pydantic import BaseModel
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+JSON_BACKEND = "orjson" if orjson is not None else "json"
+Model = TypeVar("Model", bound=BaseModel)
+
+def dumps(obj: Any, indent: bool = False, default=None) -> bytes:
+    """
+    UTF-8 JSON. indent=True matches model_dump_json(indent=2) / json.dumps(indent=2, ensure_ascii=False);
+    compact output has no spaces.
+    """
+    if orjson is not None:
+        option = orjson.OPT_SERIALIZE_NUMPY | (orjson.OPT_INDENT_2 if indent else 0)
+        return orjson.dumps(obj, default=default, option=option)
+    return json.dumps(obj, indent=2 if indent else None, separators=None if indent else (",", ":"),
+                      ensure_ascii=False, default=default).encode("utf-8")
+
+def loads(data: Union[bytes, str]) -> Any:
+    return orjson.loads(data) if orjson is not None else json.loads(data)
+
+def _model(annotation) -> Optional[Type[BaseModel]]:
+    return annotation if isinstance(annotation, type) and issubclass(annotation, BaseModel) else None
+
+@lru_cache(maxsize=None)
+def _nested_fields(model_cls: Type[BaseModel]) -> Tuple[Tuple[str, Type[BaseModel], bool], ...]:
+    """(field name, model class, is_list) for each field holding a model, an Optional model or a list of models."""
+    nested = []
+    for name, field in model_cls.model_fields.items():
+        annotation, is_list = field.annotation, False
+        if get_origin(annotation) is Union:
+            annotation = next((arg for arg in get_args(annotation) if arg is not type(None)), annotation)
+        if get_origin(annotation) in (list, List):
+            annotation, is_list = get_args(annotation)[0], True
+        if _model(annotation) is not None:
+            nested.append((name, annotation, is_list))
+    return tuple(nested)
+
+def construct(model_cls: Type[Model], data: Dict[str, Any]) -> Model:
+    """
+    The model from trusted data (our own serialized output) without validation. Nested model fields
+    are constructed too; missing fields take their defaults, unknown keys are dropped.
+    """
+    values = dict(data)
+    for name, nested_cls, is_list in _nested_fields(model_cls):
+        value = values.get(name)
+        if value is None:
+            continue
+        if is_list:
+            values[name] = [construct(nested_cls, item) if isinstance(item, dict) else item for item in value]
+        elif isinstance(value, dict):
+            values[name] = construct(nested_cls, value)
+    return model_cls.model_construct(**values)
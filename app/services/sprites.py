@@ -0,0 +1,61 @@
+# app/services/sprites.py
+# V6: Per-pathway sprite sheet of node images.
+# While the pipeline holds each step's frame it encodes a WebP thumbnail (keyframe pass) and a crop of
+# the node's ui_region (right after Service D answers, from the letterboxed frame). The images are
+# concatenated into one object, <task_id>/sprites.webp.bin, uploaded in a single request. The offset
+# index goes into pathway.json (Pathway.sprite_sheet), so a viewer fetches any image with one HTTP
+# Range read, or the whole sheet at once, instead of seeking the source video again.
+
+import os
+from typing import Dict, List, Optional, Tuple
+from app.schema import SpriteSheet
+from app.services.frames import NodeImage
+
+NODE_SPRITES = os.environ.get("NODE_SPRITES", "1") == "1"
+SPRITE_SHEET_NAME = "sprites.webp.bin"
+SPRITE_KINDS = ("thumb", "crop")
+
+class SpriteSheetBuilder:
+    """Collects node images by row; build() lays them out node by node (thumb, then crop)."""
+
+    def __init__(self):
+        self.images: Dict[int, Dict[str, NodeImage]] = {}
+
+    def __len__(self) -> int:
+        return sum(len(kinds) for kinds in self.images.values())
+
+    @classmethod
+    def from_sheet(cls, data: bytes, images: Dict[str, Dict[str, List[int]]], node_ids: List[str]) -> "SpriteSheetBuilder":
+        """The inverse of build() (a task resumed from its checkpoint)."""
+        builder, rows = cls(), {node_id: row for row, node_id in enumerate(node_ids)}
+        for node_id, kinds in images.items():
+            for kind, (offset, length, width, height) in kinds.items():
+                builder.add(rows[node_id], kind, (data[offset:offset + length], width, height))
+        return builder
+
+    def add(self, row: int, kind: str, image: Optional[NodeImage]):
+        if image is not None:
+            self.images.setdefault(row, {})[kind] = image
+
+    def build(self, node_ids: List[str]) -> Tuple[bytes, Dict[str, Dict[str, List[int]]]]:
+        """(sheet bytes, index: node id -> kind -> [offset, length, width, height])."""
+        chunks, index, offset = [], {}, 0
+        for row in sorted(self.images):
+            if row >= len(node_ids): continue
+            entry = index[node_ids[row]] = {}
+            for kind in SPRITE_KINDS:
+                image = self.images[row].get(kind)
+                if image is None: continue
+                data, width, height = image
+                entry[kind] = [offset, len(data), width, height]
+                chunks.append(data)
+                offset += len(data)
+        return b"".join(chunks), index
+
+def upload_sprite_sheet(output_bucket, task_id: str, builder: SpriteSheetBuilder, node_ids: List[str]) -> Optional[SpriteSheet]:
+    """One upload for every node image; returns the reference stored on the Pathway (None if there are none)."""
+    if not len(builder): return None
+    data, index = builder.build(node_ids)
+    name = f"{task_id}/{SPRITE_SHEET_NAME}"
+    output_bucket.blob(name).upload_from_string(data, content_type="application/octet-stream")
+    return SpriteSheet(uri=f"gs://{output_bucket.name}/{name}", size=len(data), images=index)
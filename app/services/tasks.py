@@ -0,0 +1,248 @@
+# app/services/tasks.py
+# V6: Task status tracking.
+# The worker publishes a status event at each phase to TASK_STATUS_TOPIC_NAME; the dispatcher
+# receives them on a push subscription, keeps the latest state per task and streams changes to
+# clients (GET /tasks/{id}/events, server-sent events). No GCS polling for progress.
+# The state lives in SQLite on the instance (TASK_STORE=sqlite, local runs) or in Firestore
+# (TASK_STORE=firestore, deployed): shared by every dispatcher instance and kept across restarts.
+
+import os
+import time
+import base64
+import sqlite3
+import asyncio
+import threading
+from typing import Dict, Any, Optional, Set
+from app.services.serialization import dumps, loads
+from app.services.executors import run_io
+
+TASK_STATUS_TOPIC_NAME = "tbd-task-status"
+TASK_STORE = os.environ.get("TASK_STORE", "sqlite")  # sqlite | firestore
+TASK_DB_PATH = os.environ.get("TASK_DB_PATH", "/tmp/tbd_tasks.db")
+TASK_COLLECTION = os.environ.get("TASK_COLLECTION", "tbd-tasks")
+# The dispatcher is public; the push subscription's URL carries ?token=<TASK_EVENTS_TOKEN> when set
+TASK_EVENTS_TOKEN = os.environ.get("TASK_EVENTS_TOKEN", "")
+
+# In order. "failed" can follow any phase; a redelivered task starts over at "downloading".
+PHASES = ["queued", "downloading", "transcribing", "analyzing", "refining", "enriching", "uploaded"]
+TERMINAL_PHASES = {"uploaded", "failed"}
+# Progress updates within one phase (e.g. refining node 7/40) are published at most this often
+PROGRESS_INTERVAL_S = 1.0
+SSE_KEEPALIVE_S = 15.0
+# Shared store: a stream re-reads the task this often, for events pushed to another instance
+TASK_STREAM_POLL_S = float(os.environ.get("TASK_STREAM_POLL_S", "1.0"))
+
+def status_event(task_id: str, phase: str, **detail) -> Dict[str, Any]:
+    if phase not in PHASES and phase != "failed":
+        raise ValueError(f"Unknown task phase: {phase}")
+    progress = None
+    if phase in PHASES:
+        step = PHASES.index(phase)
+        if detail.get("steps"):  # in-phase progress, e.g. refining 7/40 nodes
+            step += min(detail.get("done", 0) / detail["steps"], 1.0)
+        progress = min(step / (len(PHASES) - 1), 1.0)
+    return {"task_id": task_id, "phase": phase, "progress": progress, "detail": detail, "ts": time.time()}
+
+# --- Worker side ---
+
+class TaskStatusPublisher:
+    """Fire-and-forget status events; a failed publish never fails the task."""
+
+    def __init__(self, publisher, project_id: str):
+        self.publisher = publisher
+        self.topic_path = publisher.topic_path(project_id, TASK_STATUS_TOPIC_NAME) if publisher else None
+        self._last: Dict[str, tuple] = {}  # task_id -> (phase, published_at)
+
+    def publish(self, task_id: str, phase: str, trace_id: str = "no-trace", **detail):
+        last_phase, last_at = self._last.get(task_id, (None, 0.0))
+        if phase == last_phase and phase not in TERMINAL_PHASES and time.time() - last_at < PROGRESS_INTERVAL_S:
+            return  # throttle in-phase progress
+        event = status_event(task_id, phase, **detail)
+        self._last[task_id] = (phase, event["ts"])
+        if phase in TERMINAL_PHASES:
+            self._last.pop(task_id, None)
+        print(f"Task {task_id}: {phase} {detail or ''}")
+        if not self.publisher: return
+        try:
+            self.publisher.publish(self.topic_path, dumps(event), trace_id=trace_id, task_id=task_id)
+        except Exception as e:
+            print(f"STATUS PUBLISH WARNING: {e}")
+
+# --- Dispatcher side ---
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS tasks (
+    task_id TEXT PRIMARY KEY,
+    phase TEXT NOT NULL,
+    progress REAL,
+    detail TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_tasks_updated_at ON tasks(updated_at);
+"""
+
+class TaskStore:
+    """Latest state per task (SQLite, one connection under a lock, like PathwayIndex)."""
+    shared = False  # Only this instance sees the state
+
+    def __init__(self, path: str = TASK_DB_PATH):
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(SCHEMA)
+
+    def apply(self, event: Dict[str, Any]) -> bool:
+        """
+        Stores the event unless a newer one is already stored (Pub/Sub does not preserve order).
+        Returns True if the task's state changed.
+        """
+        with self.lock, self.conn:
+            cursor = self.conn.execute(
+                """INSERT INTO tasks VALUES (:task_id, :phase, :progress, :detail, :ts, :ts)
+                   ON CONFLICT(task_id) DO UPDATE SET phase = excluded.phase, progress = excluded.progress,
+                       detail = excluded.detail, updated_at = excluded.updated_at
+                   WHERE excluded.updated_at >= tasks.updated_at""",
+                {**event, "detail": dumps(event.get("detail") or {}).decode("utf-8")},
+            )
+            return cursor.rowcount > 0
+
+    def get(self, task_id: str) -> Optional[Dict[str, Any]]:
+        with self.lock:
+            row = self.conn.execute("SELECT * FROM tasks WHERE task_id = ?", (task_id,)).fetchone()
+        if row is None: return None
+        record = dict(row)
+        record["detail"] = loads(record["detail"])
+        return record
+
+class FirestoreTaskStore:
+    """
+    Latest state per task in Firestore (one document per task in TASK_COLLECTION), same records as
+    TaskStore. The newer-event check runs in a transaction, since several instances apply events.
+    """
+    shared = True
+
+    def __init__(self, collection: str = TASK_COLLECTION, client=None):
+        from google.cloud import firestore
+        self.firestore = firestore
+        self.client = client or firestore.Client()
+        self.collection = self.client.collection(collection)
+
+    def apply(self, event: Dict[str, Any]) -> bool:
+        """Stores the event unless a newer one is already stored. Returns True if the task's state changed."""
+        ref = self.collection.document(event["task_id"])
+
+        @self.firestore.transactional
+        def _apply(transaction) -> bool:
+            snapshot = ref.get(transaction=transaction)
+            current = snapshot.to_dict() if snapshot.exists else None
+            if current is not None and current["updated_at"] > event["ts"]:
+                return False
+            transaction.set(ref, {
+                "task_id": event["task_id"], "phase": event["phase"], "progress": event.get("progress"),
+                "detail": dumps(event.get("detail") or {}).decode("utf-8"),
+                "created_at": current["created_at"] if current is not None else event["ts"],
+                "updated_at": event["ts"],
+            })
+            return True
+
+        return _apply(self.client.transaction())
+
+    def get(self, task_id: str) -> Optional[Dict[str, Any]]:
+        snapshot = self.collection.document(task_id).get()
+        if not snapshot.exists: return None
+        record = snapshot.to_dict()
+        record["detail"] = loads(record["detail"])
+        return record
+
+def task_store():
+    """The store selected by TASK_STORE."""
+    if TASK_STORE == "firestore":
+        return FirestoreTaskStore()
+    if TASK_STORE != "sqlite":
+        raise ValueError(f"Unknown TASK_STORE '{TASK_STORE}'. Choose from ['firestore', 'sqlite']")
+    return TaskStore()
+
+class TaskEventBroker:
+    """
+    In-process fan-out of state changes to open event streams (one asyncio.Queue per subscriber).
+    publish() may be called from a threadpool thread (sync endpoints): the queues are only touched
+    on the event loop that owns them.
+    """
+
+    def __init__(self):
+        self.subscribers: Dict[str, Set[asyncio.Queue]] = {}
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def subscribe(self, task_id: str) -> asyncio.Queue:
+        self.loop = asyncio.get_running_loop()
+        queue = asyncio.Queue()
+        self.subscribers.setdefault(task_id, set()).add(queue)
+        return queue
+
+    def unsubscribe(self, task_id: str, queue: asyncio.Queue):
+        queues = self.subscribers.get(task_id, set())
+        queues.discard(queue)
+        if not queues:
+            self.subscribers.pop(task_id, None)
+
+    def publish(self, record: Dict[str, Any]):
+        if self.loop is None or self.loop.is_closed(): return  # Nobody has subscribed yet
+        try:
+            on_loop = asyncio.get_running_loop() is self.loop
+        except RuntimeError:
+            on_loop = False
+        if on_loop:
+            self._deliver(record)
+        else:
+            self.loop.call_soon_threadsafe(self._deliver, record)
+
+    def _deliver(self, record: Dict[str, Any]):
+        for queue in list(self.subscribers.get(record["task_id"], ())):
+            queue.put_nowait(record)
+
+class TaskTracker:
+    def __init__(self, store=None):
+        self.store = store or task_store()
+        self.broker = TaskEventBroker()
+
+    def record(self, event: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """Applies one event; notifies subscribers if it changed the task. Safe from any thread."""
+        if not self.store.apply(event): return None
+        record = self.store.get(event["task_id"])
+        self.broker.publish(record)
+        return record
+
+    def handle_pubsub_push(self, envelope: dict) -> Dict[str, Any]:
+        event = loads(base64.b64decode(envelope['message']['data']))
+        return {"task_id": event["task_id"], "applied": self.record(event) is not None}
+
+    async def stream(self, task_id: str):
+        """
+        SSE body: the current state, then every change until the task is uploaded or failed.
+        Changes applied on this instance arrive through the broker; with a shared store, the ones
+        pushed to another instance are picked up by re-reading the task every TASK_STREAM_POLL_S.
+        """
+        queue = self.broker.subscribe(task_id)
+        wait = TASK_STREAM_POLL_S if self.store.shared else SSE_KEEPALIVE_S
+        try:
+            record = await run_io(self.store.get, task_id)
+            sent_at, idle = None, 0.0
+            while True:
+                if record is not None and record["updated_at"] != sent_at:
+                    yield f"event: status\ndata: {dumps(record).decode('utf-8')}\n\n"
+                    sent_at, idle = record["updated_at"], 0.0
+                    if record["phase"] in TERMINAL_PHASES:
+                        return
+                try:
+                    record = await asyncio.wait_for(queue.get(), timeout=wait)
+                except asyncio.TimeoutError:
+                    record = await run_io(self.store.get, task_id) if self.store.shared else None
+                    idle += wait
+                    if idle >= SSE_KEEPALIVE_S:
+                        idle = 0.0
+                        yield ": keepalive\n\n"  # keeps proxies from closing an idle stream
+        finally:
+            self.broker.unsubscribe(task_id, queue)
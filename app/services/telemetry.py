@@ -0,0 +1,136 @@
+# app/services/telemetry.py
+# V6 FR-04: Time-aligned IoT telemetry.
+# One bulk request per task fetches the sensor's time-series for the video's window; every node is
+# then joined to its sample with a vectorized binary search (no per-node I/O).
+
+import os
+import zlib
+import asyncio
+import requests
+import numpy as np
+from typing import List, Optional, Dict, Any
+
+TELEMETRY_API_URL = os.environ.get("TELEMETRY_API_URL", "http://manufacturing-iot-hub/v1/telemetry") # FR-04: Mock IoT Endpoint
+TELEMETRY_SENSOR_ID = os.environ.get("TELEMETRY_SENSOR_ID", "DED-Robot-Arm-01")
+# "fake" -> in-process FakeTelemetryHub (no network), "http" -> TELEMETRY_API_URL
+TELEMETRY_SOURCE = os.environ.get("TELEMETRY_SOURCE", "fake")
+# nearest -> closest sample, interpolate -> linear temperature between the two neighbours
+TELEMETRY_JOIN_MODE = os.environ.get("TELEMETRY_JOIN_MODE", "interpolate")
+# Extra seconds fetched on both sides of the video, so edge nodes still have neighbours
+TELEMETRY_WINDOW_PAD_S = 5.0
+TELEMETRY_TIMEOUT = 10
+
+class TelemetryBuffer:
+    """
+    One sensor's samples as sorted parallel arrays. machine_state is stored as codes into `states`.
+    """
+    __slots__ = ("sensor_id", "times", "temps", "state_codes", "states")
+
+    def __init__(self, sensor_id: str, times: np.ndarray, temps: np.ndarray, state_codes: np.ndarray, states: List[str]):
+        order = np.argsort(times, kind="stable")
+        self.sensor_id = sensor_id
+        self.times = np.asarray(times, dtype=np.float64)[order]
+        self.temps = np.asarray(temps, dtype=np.float64)[order]
+        self.state_codes = np.asarray(state_codes, dtype=np.int32)[order]
+        self.states = states
+
+    @classmethod
+    def from_samples(cls, sensor_id: str, samples: List[Dict[str, Any]]) -> "TelemetryBuffer":
+        """samples: [{"t": epoch_s, "machine_state": str, "ambient_temp_c": float}, ...] in any order."""
+        codes: Dict[str, int] = {}
+        state_codes = np.empty(len(samples), dtype=np.int32)
+        for i, sample in enumerate(samples):
+            state_codes[i] = codes.setdefault(sample["machine_state"], len(codes))
+        times = np.fromiter((s["t"] for s in samples), dtype=np.float64, count=len(samples))
+        temps = np.fromiter((s["ambient_temp_c"] for s in samples), dtype=np.float64, count=len(samples))
+        return cls(sensor_id, times, temps, state_codes, list(codes))
+
+    def __len__(self) -> int:
+        return len(self.times)
+
+    def sample_at(self, query_times: np.ndarray, mode: str = TELEMETRY_JOIN_MODE):
+        """
+        Vectorized join: (temps, state_codes) for every query time.
+        States are categorical and always come from the nearest sample; temperatures are
+        interpolated between the neighbours in "interpolate" mode. Times outside the buffer clamp to its ends.
+        """
+        query_times = np.asarray(query_times, dtype=np.float64)
+        if not len(self.times):
+            raise ValueError(f"No telemetry samples for {self.sensor_id}")
+
+        # Neighbours left <= t <= right (equal at the ends, or for a single sample)
+        right = np.searchsorted(self.times, query_times, side="left").clip(0, len(self.times) - 1)
+        left = np.where(self.times[right] > query_times, right - 1, right).clip(0)
+        t_left, t_right = self.times[left], self.times[right]
+        nearest = np.where(np.abs(query_times - t_left) <= np.abs(t_right - query_times), left, right)
+
+        if mode == "interpolate":
+            span = np.where(t_right > t_left, t_right - t_left, 1.0)
+            weight = np.clip((query_times - t_left) / span, 0.0, 1.0)
+            temps = self.temps[left] + (self.temps[right] - self.temps[left]) * weight
+        else:
+            temps = self.temps[nearest]
+        return temps, self.state_codes[nearest]
+
+# --- Sources ---
+
+class FakeTelemetryHub:
+    """
+    Deterministic stand-in for the IoT hub: a 1 Hz series per sensor with a slow temperature
+    drift and a machine-state cycle. Same answer for the same (sensor, window).
+    """
+    STATES = ["IDLE", "HEATING", "ACTIVE_PRINTING", "COOLDOWN"]
+
+    def __init__(self, sample_hz: float = 1.0, state_period_s: float = 120.0):
+        self.sample_hz = sample_hz
+        self.state_period_s = state_period_s
+
+    def fetch(self, sensor_id: str, start: float, end: float) -> List[Dict[str, Any]]:
+        times = np.arange(np.floor(start * self.sample_hz), np.ceil(end * self.sample_hz) + 1) / self.sample_hz
+        phase = (zlib.crc32(sensor_id.encode()) % 1000) / 1000.0
+        temps = 24.5 + 2.0 * np.sin(times / 600.0 + phase * np.pi)
+        state_idx = ((times // self.state_period_s).astype(np.int64)) % len(self.STATES)
+        return [
+            {"t": float(t), "machine_state": self.STATES[k], "ambient_temp_c": round(float(c), 3)}
+            for t, k, c in zip(times, state_idx, temps)
+        ]
+
+def _fetch_http(sensor_id: str, start: float, end: float, headers: dict) -> List[Dict[str, Any]]:
+    response = requests.get(
+        TELEMETRY_API_URL,
+        params={"sensor_id": sensor_id, "start": start, "end": end},
+        headers=headers,
+        timeout=TELEMETRY_TIMEOUT,
+    )
+    response.raise_for_status()
+    return response.json().get("samples", [])
+
+_fake_hub = FakeTelemetryHub()
+
+async def fetch_telemetry_window(sensor_id: str, start: float, end: float, headers: Optional[dict] = None) -> TelemetryBuffer:
+    """FR-04: One bulk request for the sensor's samples in [start - pad, end + pad] (epoch seconds)."""
+    start, end = start - TELEMETRY_WINDOW_PAD_S, end + TELEMETRY_WINDOW_PAD_S
+    loop = asyncio.get_event_loop()
+    if TELEMETRY_SOURCE == "http":
+        samples = await loop.run_in_executor(None, lambda: _fetch_http(sensor_id, start, end, headers or {}))
+    else:
+        samples = _fake_hub.fetch(sensor_id, start, end)
+    print(f"Telemetry: {len(samples)} samples for {sensor_id} in [{start:.0f}, {end:.0f}]")
+    return TelemetryBuffer.from_samples(sensor_id, samples)
+
+def create_fake_hub_app(hub: Optional[FakeTelemetryHub] = None):
+    """HTTP fake of the IoT hub (GET /v1/telemetry), for running the worker with TELEMETRY_SOURCE=http locally."""
+    from fastapi import FastAPI
+    hub = hub or FakeTelemetryHub()
+    app = FastAPI(title="TbD Fake IoT Hub")
+
+    @app.get("/v1/telemetry")
+    def telemetry(sensor_id: str, start: float, end: float):
+        return {"sensor_id": sensor_id, "samples": hub.fetch(sensor_id, start, end)}
+
+    return app
+
+if __name__ == "__main__":
+    # python -m app.services.telemetry  ->  fake hub on :8090 (TELEMETRY_API_URL=http://localhost:8090/v1/telemetry)
+    import uvicorn
+    uvicorn.run(create_fake_hub_app(), host="0.0.0.0", port=int(os.environ.get("PORT", "8090")))
@@ -0,0 +1,148 @@
+# app/services/uploads.py
+# V6: Direct client-to-GCS uploads (Service A).
+# The dispatcher hands out one resumable-upload URL per part; clients upload the parts straight to
+# storage in parallel (the video never passes through the frontend or the dispatcher), then call
+# /uploads/{task_id}/complete, which composes the parts into one object and submits the TaskPayload.
+# STORAGE_EMULATOR_HOST (e.g. fake-gcs-server) switches to unsigned emulator URLs for local testing.
+
+import os
+import math
+import time
+import uuid
+import datetime
+from urllib.parse import quote
+from typing import Dict, Any, List, Optional
+from google.cloud import storage
+from app.schema import TaskPayload, UploadRequest, UploadComplete
+from app.services.serialization import dumps, loads
+
+PROJECT_ID = os.environ.get("GCP_PROJECT_ID", "local-dev-project")
+UPLOAD_BUCKET = os.environ.get("UPLOAD_BUCKET", f"tbd-input-{PROJECT_ID}")
+STORAGE_EMULATOR_HOST = os.environ.get("STORAGE_EMULATOR_HOST", "")
+UPLOAD_URL_TTL_S = 3600
+# Target part size; GCS resumable chunks must be multiples of 256 KiB (except the last)
+UPLOAD_PART_SIZE = int(os.environ.get("UPLOAD_PART_SIZE", str(32 * 1024 * 1024)))
+UPLOAD_CHUNK_ALIGN = 256 * 1024
+MAX_UPLOAD_PARTS = 32  # one compose request takes at most 32 sources
+MANIFEST_NAME = "upload.json"
+
+def plan_parts(size: int, parts: Optional[int] = None, part_size: int = UPLOAD_PART_SIZE) -> List[Dict[str, int]]:
+    """Splits [0, size) into at most MAX_UPLOAD_PARTS 256 KiB-aligned byte ranges."""
+    count = parts or math.ceil(size / part_size)
+    count = max(1, min(count, MAX_UPLOAD_PARTS))
+    aligned = math.ceil(math.ceil(size / count) / UPLOAD_CHUNK_ALIGN) * UPLOAD_CHUNK_ALIGN
+    ranges = []
+    for offset in range(0, size, aligned):
+        ranges.append({"index": len(ranges), "offset": offset, "size": min(aligned, size - offset)})
+    return ranges
+
+def _safe_filename(filename: str) -> str:
+    name = os.path.basename(filename.replace("\\", "/")).strip() or "video.mp4"
+    return "".join(c if c.isalnum() or c in "._-" else "_" for c in name)
+
+class UploadService:
+    def __init__(self, dispatcher, bucket_name: str = UPLOAD_BUCKET):
+        self.dispatcher = dispatcher
+        self.bucket_name = bucket_name
+        self._storage_client = None
+        self._credentials = None
+
+    @property
+    def storage_client(self):
+        if self._storage_client is None:
+            if STORAGE_EMULATOR_HOST:
+                from google.auth.credentials import AnonymousCredentials
+                self._storage_client = storage.Client(project=PROJECT_ID, credentials=AnonymousCredentials())
+            else:
+                self._storage_client = storage.Client()
+        return self._storage_client
+
+    @property
+    def bucket(self):
+        return self.storage_client.bucket(self.bucket_name)
+
+    def _resumable_start(self, object_name: str, content_type: str) -> Dict[str, Any]:
+        """The request that opens a resumable session; its Location header is the session URI for the chunk PUTs."""
+        if STORAGE_EMULATOR_HOST:
+            # Emulators take the JSON API's unauthenticated resumable upload directly
+            url = (f"{STORAGE_EMULATOR_HOST.rstrip('/')}/upload/storage/v1/b/{self.bucket_name}/o"
+                   f"?uploadType=resumable&name={quote(object_name, safe='')}")
+            return {"method": "POST", "url": url, "headers": {"X-Upload-Content-Type": content_type}}
+
+        # Cloud Run credentials cannot sign locally: sign through IAM with the service account's token
+        import google.auth
+        from google.auth.transport.requests import Request
+        if self._credentials is None:
+            self._credentials, _ = google.auth.default()
+        credentials = self._credentials
+        if not credentials.valid:
+            credentials.refresh(Request())
+        url = self.bucket.blob(object_name).generate_signed_url(
+            version="v4",
+            expiration=datetime.timedelta(seconds=UPLOAD_URL_TTL_S),
+            method="RESUMABLE",
+            content_type=content_type,
+            service_account_email=getattr(credentials, "service_account_email", None),
+            access_token=credentials.token,
+        )
+        return {"method": "POST", "url": url, "headers": {"x-goog-resumable": "start", "Content-Type": content_type}}
+
+    def create_upload(self, request: UploadRequest) -> Dict[str, Any]:
+        task_id = request.task_id or str(uuid.uuid4())
+        object_name = f"{task_id}/{_safe_filename(request.filename)}"
+        ranges = plan_parts(request.size, request.parts)
+        # A single part is uploaded as the final object; several are composed on completion
+        for part in ranges:
+            part["object"] = object_name if len(ranges) == 1 else f"{task_id}/parts/{part['index']:02d}"
+
+        manifest = {
+            "task_id": task_id,
+            "object": object_name,
+            "size": request.size,
+            "content_type": request.content_type,
+            "parts": [{"object": p["object"], "size": p["size"]} for p in ranges],
+            "created_at": time.time(),
+        }
+        # The manifest lives next to the upload, so completion needs no dispatcher-side state
+        self.bucket.blob(f"{task_id}/{MANIFEST_NAME}").upload_from_string(dumps(manifest), content_type="application/json")
+
+        print(f"Upload {task_id}: {request.size} bytes in {len(ranges)} part(s) -> gs://{self.bucket_name}/{object_name}")
+        return {
+            "task_id": task_id,
+            "gcs_uri": f"gs://{self.bucket_name}/{object_name}",
+            "chunk_align": UPLOAD_CHUNK_ALIGN,
+            "expires_in": UPLOAD_URL_TTL_S,
+            "parts": [{**p, "start": self._resumable_start(p["object"], request.content_type)} for p in ranges],
+            "complete_url": f"/uploads/{task_id}/complete",
+        }
+
+    def complete_upload(self, task_id: str, completion: UploadComplete) -> Dict[str, Any]:
+        """Checks every part, composes them into the final object, cleans up and submits the task."""
+        bucket = self.bucket
+        manifest_blob = bucket.blob(f"{task_id}/{MANIFEST_NAME}")
+        if not manifest_blob.exists():
+            raise LookupError(f"No pending upload for task {task_id}")
+        manifest = loads(manifest_blob.download_as_bytes())
+
+        missing = []
+        for part in manifest["parts"]:
+            blob = bucket.get_blob(part["object"])
+            if blob is None or blob.size != part["size"]:
+                missing.append({"object": part["object"], "expected": part["size"], "found": blob.size if blob else None})
+        if missing:
+            raise ValueError(f"Upload {task_id} is incomplete: {missing}")
+
+        final = bucket.blob(manifest["object"])
+        if len(manifest["parts"]) > 1:
+            final.content_type = manifest["content_type"]
+            sources = [bucket.blob(part["object"]) for part in manifest["parts"]]
+            final.compose(sources)
+            for source in sources:
+                source.delete()
+        manifest_blob.delete()
+
+        gcs_uri = f"gs://{self.bucket_name}/{manifest['object']}"
+        payload = TaskPayload(task_id=task_id, client_id=completion.client_id, gcs_uri=gcs_uri,
+                              output_bucket=completion.output_bucket, config=completion.config)
+        self.dispatcher.submit_task(payload)
+        return {"task_id": task_id, "gcs_uri": gcs_uri, "size": manifest["size"]}
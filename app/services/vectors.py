@@ -0,0 +1,375 @@
+# app/services/vectors.py
+# V6: Nearest-neighbour search over temporal context vectors ("find similar workflows").
+# One 512-D vector per pathway (Service C's sequence-level vector), persisted as memory-mapped arrays.
+#   flat  -> exact cosine search, batched matrix products over the memmap (baseline)
+#   ivfpq -> inverted lists + product quantization (ADC), with exact re-ranking of the shortlist
+
+import os
+import json
+import threading
+import numpy as np
+from typing import List, Tuple, Optional, Dict
+
+VECTOR_INDEX_DIR = os.environ.get("VECTOR_INDEX_DIR", "/tmp/tbd_vector_index")
+# flat | ivfpq
+VECTOR_INDEX_MODE = os.environ.get("VECTOR_INDEX_MODE", "flat")
+VECTOR_DIM = 512
+# Rows scored per matrix product; bounds the temporary score matrix for large indexes
+SEARCH_CHUNK_ROWS = 65536
+INITIAL_CAPACITY = 1024
+
+# IVF-PQ defaults: nlist ~ 4*sqrt(n), 32 sub-quantizers of 16 dims, 256 codes each (1 byte)
+IVF_NPROBE = int(os.environ.get("IVF_NPROBE", "16"))
+PQ_SUBQUANTIZERS = 32
+PQ_CODES = 256
+RERANK_FACTOR = 4  # exact re-scoring of k * RERANK_FACTOR ADC candidates
+KMEANS_ITERATIONS = 10
+TRAIN_SAMPLE = 100_000  # coarse quantizer
+PQ_TRAIN_SAMPLE = 32_768  # 128 points per sub-codeword is plenty for 256 codes
+
+Results = List[List[Tuple[str, float]]]
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    vectors = np.atleast_2d(np.asarray(vectors, dtype=np.float32))
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+def _write_json_atomic(path: str, data: dict):
+    tmp = f"{path}.tmp"
+    with open(tmp, "w") as f:
+        json.dump(data, f)
+    os.replace(tmp, path)
+
+class FlatVectorIndex:
+    """
+    Append-only store on disk (directory):
+      vectors.f32 - (capacity, dim) float32 memmap of L2-normalized vectors
+      ids.txt     - one id per row
+      meta.json   - {"dim", "count"}; the committed row count
+    Re-adding an id appends a new row; the older row is masked out of searches.
+    """
+
+    def __init__(self, directory: str = VECTOR_INDEX_DIR, dim: int = VECTOR_DIM):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.lock = threading.Lock()
+        self.vectors_path = os.path.join(directory, "vectors.f32")
+        self.ids_path = os.path.join(directory, "ids.txt")
+        self.meta_path = os.path.join(directory, "meta.json")
+
+        meta = {"dim": dim, "count": 0}
+        if os.path.exists(self.meta_path):
+            with open(self.meta_path) as f:
+                meta = json.load(f)
+        self.dim = meta["dim"]
+        self.count = meta["count"]
+
+        # ids.txt may hold rows past the committed count after a crash: drop them
+        self.ids: List[str] = []
+        if os.path.exists(self.ids_path):
+            with open(self.ids_path) as f:
+                self.ids = f.read().splitlines()[:self.count]
+        with open(self.ids_path, "w") as f:
+            f.write("".join(f"{i}\n" for i in self.ids))
+
+        self.row_of: Dict[str, int] = {}
+        self.live = np.zeros(max(self.count, INITIAL_CAPACITY), dtype=bool)
+        for row, vector_id in enumerate(self.ids):
+            if vector_id in self.row_of:
+                self.live[self.row_of[vector_id]] = False
+            self.row_of[vector_id] = row
+            self.live[row] = True
+
+        capacity = max(INITIAL_CAPACITY, self.count)
+        if os.path.exists(self.vectors_path):
+            capacity = max(capacity, os.path.getsize(self.vectors_path) // (4 * self.dim))
+        self._open(capacity)
+
+    def _open(self, capacity: int):
+        if not os.path.exists(self.vectors_path) or os.path.getsize(self.vectors_path) < capacity * self.dim * 4:
+            with open(self.vectors_path, "ab") as f:
+                f.truncate(capacity * self.dim * 4)
+        self.matrix = np.memmap(self.vectors_path, dtype=np.float32, mode="r+", shape=(capacity, self.dim))
+        if len(self.live) < capacity:
+            self.live = np.concatenate([self.live, np.zeros(capacity - len(self.live), dtype=bool)])
+
+    def __len__(self) -> int:
+        return len(self.row_of)
+
+    def add(self, ids: List[str], vectors: np.ndarray) -> np.ndarray:
+        """Appends (or replaces) vectors; returns their rows. Durable once it returns."""
+        vectors = _normalize(vectors)
+        if vectors.shape != (len(ids), self.dim):
+            raise ValueError(f"Expected {len(ids)} x {self.dim} vectors, got {vectors.shape}")
+        with self.lock:
+            start, end = self.count, self.count + len(ids)
+            if end > self.matrix.shape[0]:
+                self.matrix.flush()
+                self._open(max(end, self.matrix.shape[0] * 2))
+            self.matrix[start:end] = vectors
+            self.matrix.flush()
+            with open(self.ids_path, "a") as f:
+                f.write("".join(f"{i}\n" for i in ids))
+
+            for offset, vector_id in enumerate(ids):
+                if vector_id in self.row_of:
+                    self.live[self.row_of[vector_id]] = False
+                self.row_of[vector_id] = start + offset
+                self.live[start + offset] = True
+            self.ids.extend(ids)
+            self.count = end
+            _write_json_atomic(self.meta_path, {"dim": self.dim, "count": self.count})
+        return np.arange(start, end)
+
+    def vector(self, vector_id: str) -> Optional[np.ndarray]:
+        row = self.row_of.get(vector_id)
+        return None if row is None else np.array(self.matrix[row])
+
+    def score_rows(self, queries: np.ndarray, rows: np.ndarray) -> np.ndarray:
+        """Exact cosine scores of normalized queries against selected rows: (n_queries, len(rows))."""
+        return queries @ self.matrix[np.sort(rows)].T if len(rows) else np.zeros((len(queries), 0), dtype=np.float32)
+
+    def search(self, queries: np.ndarray, k: int = 10, exclude: Optional[List[str]] = None) -> Results:
+        """Exact top-k by cosine similarity, for a batch of queries (one matrix product per chunk)."""
+        queries = _normalize(queries)
+        n, k = self.count, max(1, k)
+        best_scores = np.full((len(queries), 0), -np.inf, dtype=np.float32)
+        best_rows = np.zeros((len(queries), 0), dtype=np.int64)
+        excluded = [self.row_of[i] for i in (exclude or []) if i in self.row_of]
+
+        for start in range(0, n, SEARCH_CHUNK_ROWS):
+            end = min(start + SEARCH_CHUNK_ROWS, n)
+            scores = queries @ self.matrix[start:end].T
+            dead = ~self.live[start:end]
+            dead[[r - start for r in excluded if start <= r < end]] = True
+            scores[:, dead] = -np.inf
+
+            # Merge this chunk's top-k with the running top-k
+            top = min(k, end - start)
+            part = np.argpartition(-scores, top - 1, axis=1)[:, :top]
+            best_scores = np.concatenate([best_scores, np.take_along_axis(scores, part, axis=1)], axis=1)
+            best_rows = np.concatenate([best_rows, part + start], axis=1)
+            if best_scores.shape[1] > k:
+                keep = np.argpartition(-best_scores, k - 1, axis=1)[:, :k]
+                best_scores = np.take_along_axis(best_scores, keep, axis=1)
+                best_rows = np.take_along_axis(best_rows, keep, axis=1)
+
+        return self._results(best_scores, best_rows)
+
+    def _results(self, scores: np.ndarray, rows: np.ndarray) -> Results:
+        order = np.argsort(-scores, axis=1)
+        results = []
+        for q in range(len(scores)):
+            results.append([
+                (self.ids[rows[q, j]], float(scores[q, j]))
+                for j in order[q] if np.isfinite(scores[q, j])
+            ])
+        return results
+
+# --- IVF-PQ ---
+
+def _kmeans(data: np.ndarray, k: int, iterations: int = KMEANS_ITERATIONS, seed: int = 0) -> np.ndarray:
+    """Lloyd's k-means (squared L2). Empty clusters are re-seeded from random points."""
+    rng = np.random.default_rng(seed)
+    k = min(k, len(data))
+    centroids = data[rng.choice(len(data), k, replace=False)].copy()
+    for _ in range(iterations):
+        assign = _nearest(data, centroids)
+        counts = np.bincount(assign, minlength=k)
+        empty = counts == 0
+        # Per-cluster sums: contiguous runs of the sorted assignment (much faster than np.add.at)
+        order = np.argsort(assign, kind="stable")
+        starts = np.concatenate([[0], np.cumsum(counts)[:-1]])[~empty]
+        centroids[~empty] = np.add.reduceat(data[order], starts, axis=0) / counts[~empty, None]
+        centroids[empty] = data[rng.choice(len(data), int(empty.sum()), replace=False)]
+    return centroids
+
+def _nearest(data: np.ndarray, centroids: np.ndarray, chunk: int = 16384) -> np.ndarray:
+    """Index of the nearest centroid for every row, in chunks (||x-c||^2 = ||c||^2 - 2x.c + const)."""
+    c_norms = np.sum(centroids ** 2, axis=1)
+    out = np.empty(len(data), dtype=np.int32)
+    for start in range(0, len(data), chunk):
+        block = data[start:start + chunk]
+        out[start:start + chunk] = np.argmin(c_norms - 2.0 * block @ centroids.T, axis=1)
+    return out
+
+class IVFPQIndex:
+    """
+    Approximate index over a FlatVectorIndex's rows (stored in <directory>/ivfpq/):
+      coarse.npy (nlist, dim), codebooks.npy (M, 256, dim/M), codes.u8 memmap (rows, M), lists.i32 memmap (rows,)
+    A row costs M bytes + 4 instead of dim * 4. Searches scan nprobe lists with ADC lookup tables,
+    then re-rank the best k * RERANK_FACTOR candidates exactly against the flat vectors.
+    """
+
+    def __init__(self, flat: FlatVectorIndex):
+        self.flat = flat
+        self.directory = os.path.join(flat.directory, "ivfpq")
+        self.coarse: Optional[np.ndarray] = None
+        self.codebooks: Optional[np.ndarray] = None
+        self.encoded = 0  # flat rows [0, encoded) have codes
+        if os.path.exists(os.path.join(self.directory, "meta.json")):
+            self._load()
+
+    @property
+    def trained(self) -> bool:
+        return self.coarse is not None
+
+    def train(self, nlist: Optional[int] = None, subquantizers: int = PQ_SUBQUANTIZERS, sample: int = TRAIN_SAMPLE):
+        """Fits the coarse quantizer and PQ codebooks on a sample of the flat vectors, then encodes every row."""
+        n = self.flat.count
+        if n < PQ_CODES:
+            raise ValueError(f"Need at least {PQ_CODES} vectors to train IVF-PQ, have {n}")
+        dim = self.flat.dim
+        if dim % subquantizers:
+            raise ValueError(f"dim {dim} is not divisible by {subquantizers} sub-quantizers")
+        nlist = nlist or max(1, int(4 * np.sqrt(n)))
+
+        rng = np.random.default_rng(0)
+        rows = np.sort(rng.choice(n, min(sample, n), replace=False))
+        data = np.asarray(self.flat.matrix[rows])
+
+        self.coarse = _kmeans(data, nlist)
+        residuals = data - self.coarse[_nearest(data, self.coarse)]
+        sub = dim // subquantizers
+        residuals = residuals[rng.permutation(len(residuals))[:PQ_TRAIN_SAMPLE]]
+        self.codebooks = np.stack([
+            _kmeans(np.ascontiguousarray(residuals[:, m * sub:(m + 1) * sub]), PQ_CODES, seed=m) for m in range(subquantizers)
+        ]).astype(np.float32)
+
+        os.makedirs(self.directory, exist_ok=True)
+        np.save(os.path.join(self.directory, "coarse.npy"), self.coarse)
+        np.save(os.path.join(self.directory, "codebooks.npy"), self.codebooks)
+        for name in ("codes.u8", "lists.i32"):
+            path = os.path.join(self.directory, name)
+            if os.path.exists(path): os.remove(path)
+        self.encoded = 0
+        self._open(max(n, INITIAL_CAPACITY))
+        self.sync()
+
+    def _open(self, capacity: int):
+        m = self.codebooks.shape[0]
+        for name, width in (("codes.u8", m), ("lists.i32", 4)):
+            path = os.path.join(self.directory, name)
+            if not os.path.exists(path) or os.path.getsize(path) < capacity * width:
+                with open(path, "ab") as f:
+                    f.truncate(capacity * width)
+        self.codes = np.memmap(os.path.join(self.directory, "codes.u8"), dtype=np.uint8, mode="r+", shape=(capacity, m))
+        self.lists = np.memmap(os.path.join(self.directory, "lists.i32"), dtype=np.int32, mode="r+", shape=(capacity,))
+
+    def _load(self):
+        with open(os.path.join(self.directory, "meta.json")) as f:
+            meta = json.load(f)
+        self.coarse = np.load(os.path.join(self.directory, "coarse.npy"))
+        self.codebooks = np.load(os.path.join(self.directory, "codebooks.npy"))
+        self.encoded = min(meta["encoded"], self.flat.count)
+        self._open(max(self.flat.count, INITIAL_CAPACITY))
+        self._build_lists()
+
+    def _encode(self, vectors: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        assign = _nearest(vectors, self.coarse)
+        residuals = vectors - self.coarse[assign]
+        m, _, sub = self.codebooks.shape
+        codes = np.empty((len(vectors), m), dtype=np.uint8)
+        for j in range(m):
+            codes[:, j] = _nearest(residuals[:, j * sub:(j + 1) * sub], self.codebooks[j])
+        return codes, assign
+
+    def sync(self, chunk: int = 65536):
+        """Encodes flat rows added since the last sync (new pathway uploads)."""
+        n = self.flat.count
+        if not self.trained or self.encoded >= n: return
+        if n > self.codes.shape[0]:
+            self.codes.flush(); self.lists.flush()
+            self._open(max(n, self.codes.shape[0] * 2))
+        for start in range(self.encoded, n, chunk):
+            end = min(start + chunk, n)
+            self.codes[start:end], self.lists[start:end] = self._encode(np.asarray(self.flat.matrix[start:end]))
+        self.codes.flush(); self.lists.flush()
+        self.encoded = n
+        _write_json_atomic(os.path.join(self.directory, "meta.json"), {"encoded": self.encoded})
+        self._build_lists()
+
+    def _build_lists(self):
+        """Inverted lists: rows grouped by coarse centroid (in memory, 4 bytes per row)."""
+        assign = np.asarray(self.lists[:self.encoded])
+        order = np.argsort(assign, kind="stable")
+        bounds = np.searchsorted(assign[order], np.arange(len(self.coarse) + 1))
+        self.inverted = [order[bounds[c]:bounds[c + 1]] for c in range(len(self.coarse))]
+
+    def search(self, queries: np.ndarray, k: int = 10, nprobe: int = IVF_NPROBE,
+               rerank: int = RERANK_FACTOR, exclude: Optional[List[str]] = None) -> Results:
+        queries = _normalize(queries)
+        m, _, sub = self.codebooks.shape
+        excluded = {self.flat.row_of[i] for i in (exclude or []) if i in self.flat.row_of}
+        all_scores, all_rows = [], []
+        shortlist = max(k, k * rerank)
+
+        # ||q - c - y||^2 = ||q - c||^2 + sum_m (||y_m||^2 - 2 q_m.y_m + 2 c_m.y_m) for sub-codes y_m:
+        # only the last term depends on the probed list c
+        codeword_norms = np.sum(self.codebooks ** 2, axis=2)  # (M, 256)
+        for query in queries:
+            coarse_dist = np.sum((self.coarse - query) ** 2, axis=1)
+            probe = np.argsort(coarse_dist)[:nprobe]
+            query_table = codeword_norms - 2.0 * np.einsum("ms,mks->mk", query.reshape(m, sub), self.codebooks)
+            cand_rows, cand_dist = [], []
+            for c in probe:
+                rows = self.inverted[c]
+                if not len(rows): continue
+                table = query_table + 2.0 * np.einsum("ms,mks->mk", self.coarse[c].reshape(m, sub), self.codebooks)
+                codes = self.codes[rows]
+                cand_dist.append(coarse_dist[c] + table[np.arange(m), codes].sum(axis=1))
+                cand_rows.append(rows)
+            if not cand_rows:
+                all_scores.append(np.full(0, -np.inf)); all_rows.append(np.zeros(0, dtype=np.int64))
+                continue
+
+            rows, dist = np.concatenate(cand_rows), np.concatenate(cand_dist)
+            keep = self.flat.live[rows] & ~np.isin(rows, list(excluded))
+            rows, dist = rows[keep], dist[keep]
+            if len(rows) > shortlist:
+                top = np.argpartition(dist, shortlist - 1)[:shortlist]
+                rows, dist = rows[top], dist[top]
+            # Row order for the re-rank gather (memmap locality); dist follows its rows
+            order = np.argsort(rows)
+            rows, dist = rows[order], dist[order]
+            exact = self.flat.matrix[rows] @ query if rerank else -dist
+            all_scores.append(exact); all_rows.append(rows)
+
+        width = max(k, max(len(s) for s in all_scores))
+        scores = np.full((len(queries), width), -np.inf, dtype=np.float32)
+        rows = np.zeros((len(queries), width), dtype=np.int64)
+        for q, (s, r) in enumerate(zip(all_scores, all_rows)):
+            scores[q, :len(s)], rows[q, :len(r)] = s, r
+        top = np.argsort(-scores, axis=1)[:, :k]
+        return self.flat._results(np.take_along_axis(scores, top, axis=1), np.take_along_axis(rows, top, axis=1))
+
+# --- Service E: find similar workflows ---
+
+class VectorSearchService:
+    """Flat index always; IVF-PQ on top when VECTOR_INDEX_MODE=ivfpq and the index is large enough to train."""
+    IVFPQ_MIN_VECTORS = 10_000
+
+    def __init__(self, directory: str = VECTOR_INDEX_DIR, mode: str = VECTOR_INDEX_MODE):
+        self.flat = FlatVectorIndex(directory)
+        self.mode = mode
+        self.ivfpq = IVFPQIndex(self.flat) if mode == "ivfpq" else None
+
+    def add(self, pathway_key: str, vector: List[float]):
+        if not vector: return
+        self.flat.add([pathway_key], np.asarray(vector, dtype=np.float32).reshape(1, -1))
+        if self.ivfpq is not None:
+            if self.ivfpq.trained:
+                self.ivfpq.sync()
+            elif len(self.flat) >= self.IVFPQ_MIN_VECTORS:
+                print(f"Training IVF-PQ on {len(self.flat)} vectors...")
+                self.ivfpq.train()
+
+    def search(self, vector: np.ndarray, k: int = 10, exclude: Optional[List[str]] = None) -> List[Tuple[str, float]]:
+        if self.ivfpq is not None and self.ivfpq.trained:
+            return self.ivfpq.search(vector, k, exclude=exclude)[0]
+        return self.flat.search(vector, k, exclude=exclude)[0]
+
+    def similar_to(self, pathway_key: str, k: int = 10) -> Optional[List[Tuple[str, float]]]:
+        vector = self.flat.vector(pathway_key)
+        if vector is None: return None
+        return self.search(vector, k, exclude=[pathway_key])
@@ -1,19 +1,35 @@
 import os
 import tempfile
 import base64
-import json
-import asyncio
+import collections
 import requests
 import time
+import numpy as np
 from urllib.parse import urlparse
 from google.cloud import storage, pubsub_v1, speech
 from google.auth.transport.requests import Request
 from google.oauth2 import id_token
-from typing import List, Dict, Any
+from typing import Optional
 
 # Import internal modules
 from app.schema import TaskPayload, Pathway, TelemetryContext
-from app.services.pipeline import build_pathway
+from app.services.pipeline import build_node_store, wait_until_ready
+from app.services.nodestore import NodeStore
+from app.services.telemetry import fetch_telemetry_window, TELEMETRY_API_URL, TELEMETRY_SENSOR_ID
+from app.services.diff import diff_pathways
+from app.services.index import summarize_pathway, INDEX_TOPIC_NAME
+from app.services.tasks import TaskStatusPublisher
+from app.services.observability import span, trace, trace_headers, current_trace_id
+from app.services.profiler import profiled_task, requested_format, profile_filename, profile_headers
+from app.services.executors import run_io
+from app.services.admission import AdmissionController, estimate_task_mb, downstream
+from app.services.frames import video_duration
+from app.services.resilience import resilient, degraded, ServiceUnavailable
+from app.services.sprites import upload_sprite_sheet, SpriteSheetBuilder
+from app.services.columnar import export_task, PATHWAY_EXPORT_PARQUET
+from app.services.serialization import dumps, loads, construct
+from app.services.failures import (PermanentFailure, TaskCheckpoints, classify, delivery_attempt, dead_letter_record,
+                                   FAILURES, DEAD_LETTERED, DEAD_LETTER_TOPIC_NAME, MAX_TASK_ATTEMPTS, MAX_DELIVERY_ATTEMPTS)
 import uuid
 
 # --- V6 Configuration Constants ---
@@ -25,12 +41,17 @@ TEMP_DIR = tempfile.gettempdir()
 TEMPORAL_ENCODER_URL = os.environ.get("TEMPORAL_ENCODER_URL", "")
 OBJECT_DETECTOR_URL = os.environ.get("OBJECT_DETECTOR_URL", "")
 MARKETPLACE_API_URL = "https://marketplace.freefuse.com/api/v1/register"
-TELEMETRY_API_URL = "http://manufacturing-iot-hub/v1/telemetry" # FR-04: Mock IoT Endpoint
+# Ceiling for one Service C call; once warm, calls time out at a multiple of its recent p99 (resilience.py)
+TEMPORAL_ENCODER_TIMEOUT = float(os.environ.get("TEMPORAL_ENCODER_TIMEOUT", "30.0"))
 
 # Pub/Sub & Storage
 AGENT_TOPIC_NAME = "pad-agent-tasks"
 AUDIO_STAGING_BUCKET = f"tbd-audio-staging-{PROJECT_ID}"
 
+# STT placeholders: the pipeline still runs on video alone, but they are never checkpointed
+TRANSCRIPT_MISSING = " [Audio Missing] "
+TRANSCRIPT_FAILED = " [Transcription Failed] "
+
 # In-Memory Idempotency (Production would use Redis)
 PROCESSED_TASKS = set()
 
@@ -61,10 +82,10 @@ def _extract_audio_track(video_path: str) -> str:
         with open(audio_path, 'wb') as f: f.write(b'')
     return audio_path
 
-def _upload_audio_to_gcs(local_path: str, task_id: str) -> str:
+def _upload_audio_to_gcs(local_path: str, task_id: str, storage_client=None) -> str:
     """Uploads mp3 to GCS for the Speech-to-Text API."""
     try:
-        storage_client = storage.Client()
+        storage_client = storage_client or storage.Client()
         bucket = storage_client.bucket(AUDIO_STAGING_BUCKET)
         blob_name = f"{task_id}/audio.mp3"
         blob = bucket.blob(blob_name)
@@ -76,7 +97,7 @@ def _upload_audio_to_gcs(local_path: str, task_id: str) -> str:
 
 async def _call_speech_to_text(gcs_uri: str) -> str:
     """FR-03: Calls Google Cloud Speech-to-Text API (Live)."""
-    if not gcs_uri: return " [Audio Missing] "
+    if not gcs_uri: return TRANSCRIPT_MISSING
     
     print(f"Transcribing audio from: {gcs_uri}")
     try:
@@ -99,7 +120,7 @@ async def _call_speech_to_text(gcs_uri: str) -> str:
         return transcript.strip()
     except Exception as e:
         print(f"STT ERROR: {e}")
-        return " [Transcription Failed] "
+        return TRANSCRIPT_FAILED
 
 async def _fetch_iot_telemetry() -> TelemetryContext:
     """FR-04: Fetches machine state from the IoT Hub."""
@@ -121,49 +142,187 @@ async def _fetch_iot_telemetry() -> TelemetryContext:
         print(f"IoT FETCH ERROR: {e}")
         return TelemetryContext()
 
-async def _enrich_with_temporal_context(pathway: Pathway):
-    """FR-01: Calls Service C (Temporal Encoder) to vectorize the workflow."""
+def _load_prior_pathway(storage_client, pathway_uri: str):
+    """Incremental mode: the pathway.json of an earlier recording. None -> full rebuild."""
+    if not pathway_uri: return None
+    try:
+        parsed = urlparse(pathway_uri)
+        blob = storage_client.bucket(parsed.netloc).blob(parsed.path.lstrip('/'))
+        # Client-supplied URI: validated, so a malformed or foreign pathway falls back to a full rebuild
+        prior = Pathway.model_validate_json(blob.download_as_bytes())
+        print(f"Loaded prior pathway {prior.pathway_id} ({len(prior.nodes)} nodes) from {pathway_uri}")
+        return prior
+    except Exception as e:
+        print(f"WARNING: Could not load prior pathway {pathway_uri}, rebuilding from scratch: {e}")
+        return None
+
+async def _apply_iot_telemetry(store: NodeStore, recording_started_at: float):
+    """FR-04: Per-node machine state at each step's wall-clock time, from one bulk fetch."""
+    if not len(store): return
+    step_times = recording_started_at + store.timestamps[:len(store), 0]
+    try:
+        token = _get_auth_token(TELEMETRY_API_URL)
+        buffer = await fetch_telemetry_window(
+            TELEMETRY_SENSOR_ID, float(step_times.min()), float(step_times.max()),
+            headers={"Authorization": f"Bearer {token}"}
+        )
+        temps, state_codes = buffer.sample_at(step_times)
+        store.assign_telemetry(buffer.sensor_id, buffer.states, state_codes, np.round(temps, 3))
+        print(f"Telemetry joined to {len(store)} nodes ({len(buffer)} samples).")
+    except Exception as e:
+        # Fall back to a single snapshot for every node (V6 baseline behaviour)
+        print(f"IoT WINDOW FETCH ERROR: {e}")
+        store.set_telemetry(await _fetch_iot_telemetry())
+
+async def _enrich_with_temporal_context(store: NodeStore):
+    """FR-01: Calls Service C (Temporal Encoder) to vectorize the workflow. On failure, nodes are marked degraded."""
     if not TEMPORAL_ENCODER_URL:
         print("WARNING: Temporal Encoder URL not set. Skipping vectorization.")
         return
 
+    if not await wait_until_ready(TEMPORAL_ENCODER_URL):
+        print("WARNING: Temporal Encoder not ready. Skipping vectorization.")
+        store.mark_degraded(degraded("encoder", "not_ready"))
+        return
+
     # 1. Extract text sequence from nodes
-    text_sequence = [node.description for node in pathway.nodes]
+    text_sequence = list(store.descriptions)
     
     # 2. Call Service C
     payload = {"sequence": text_sequence}
     token = _get_auth_token(TEMPORAL_ENCODER_URL)
-    headers = {"Authorization": f"Bearer {token}"}
     
     try:
         print(f"Calling Temporal Encoder at {TEMPORAL_ENCODER_URL}...")
-        loop = asyncio.get_event_loop()
-        response = await loop.run_in_executor(
-            None, 
-            lambda: requests.post(f"{TEMPORAL_ENCODER_URL}/encode_sequence", json=payload, headers=headers, timeout=30)
-        )
-        response.raise_for_status()
+        # Shares the instance's encoder slots with concurrent tasks (admission.DOWNSTREAM_LIMITS)
+        async with downstream("encoder"):
+            with span("encoding", steps=len(text_sequence)) as call:
+                # traceparent: Service C logs this request under the task's trace (and profiles it, if the task is)
+                headers = {"Authorization": f"Bearer {token}", **trace_headers(), **profile_headers()}
+                response = await resilient("encoder", TEMPORAL_ENCODER_TIMEOUT).call(
+                    lambda timeout: requests.post(f"{TEMPORAL_ENCODER_URL}/encode_sequence", json=payload, headers=headers, timeout=timeout)
+                )
+                call.set(status=response.status_code)
+                response.raise_for_status()
         data = response.json()
         
         # 3. Apply Vector to ALL nodes (Context is global for the pathway in V4 logic)
         # In V5/V6 advanced, we might do step-by-step encoding, but V4 baseline is sequence-level.
         vector = data.get("temporal_context_vector", [])
         
-        for node in pathway.nodes:
-            node.temporal_context_vector = vector
+        if vector:
+            store.set_vector(vector)
             
         print("Temporal Vector applied successfully.")
         
+    except ServiceUnavailable as e:
+        print(f"ENCODER UNAVAILABLE: {e}")
+        store.mark_degraded(degraded("encoder", e.reason))
     except Exception as e:
         print(f"ENCODER FAILURE: {e}")
-        # Fail open - do not crash the pipeline, just leave vectors empty
+        # Fail open - do not crash the pipeline, just leave vectors empty (and say so on the nodes)
+        store.mark_degraded(degraded("encoder", "error"))
+
+def _export(store: NodeStore, prior_pathway):
+    """NodeStore -> Pathway, plus the structural diff against the prior recording (or None)."""
+    pathway = store.to_pathway()
+    fallbacks = collections.Counter(marker for markers in store.degraded for marker in markers)
+    if fallbacks:
+        pathway.metadata["degraded"] = dict(fallbacks)  # Marker -> node count
+    return pathway, diff_pathways(prior_pathway, pathway) if prior_pathway else None
+
+def _upload_outputs(output_bucket, task_id: str, pathway: Pathway, diff, sprites=None, store: NodeStore = None) -> str:
+    if sprites is not None:
+        # All node images in one object (one request), referenced from pathway.json
+        try:
+            pathway.sprite_sheet = upload_sprite_sheet(output_bucket, task_id, sprites, [node.id for node in pathway.nodes])
+        except Exception as e:
+            print(f"SPRITE UPLOAD WARNING: {e}")  # The pathway is still complete without images
+    output_blob = f"{task_id}/pathway.json"
+    if store is not None:
+        # pathway's nodes are the store's rows: serialize straight from the columns (same bytes as model_dump_json)
+        data = dumps(store.to_dict(pathway.model_dump(exclude={"nodes"})), indent=True)
+    else:
+        data = pathway.model_dump_json(indent=2).encode("utf-8")
+    output_bucket.blob(output_blob).upload_from_string(data, content_type="application/json")
+    if diff:
+        output_bucket.blob(f"{task_id}/pathway_diff.json").upload_from_string(dumps(diff, indent=True), content_type="application/json")
+    return output_blob
+
+async def _checkpoint(fn, *args):
+    """Checkpoint I/O never fails the task: without it, a retry just redoes the stage."""
+    try:
+        return await run_io(fn, *args)
+    except Exception as e:
+        print(f"CHECKPOINT WARNING: {getattr(fn, '__name__', fn)}: {e}")
+        return None
+
+def _save_node_store(checkpoints: TaskCheckpoints, store: NodeStore):
+    """After the build stage: the nodes (pathway.json layout) and their sprite images."""
+    pathway = store.to_pathway()
+    if store.sprites is not None and len(store.sprites):
+        data, images = store.sprites.build([node.id for node in pathway.nodes])
+        checkpoints.save("sprites", data, images=images)
+    checkpoints.save("node_store", dumps(store.to_dict(pathway.model_dump(exclude={"nodes"}))))
+
+def _restore_node_store(checkpoints: TaskCheckpoints) -> Optional[NodeStore]:
+    saved = checkpoints.get("node_store")
+    if saved is None: return None
+    store = NodeStore.from_pathway(construct(Pathway, loads(saved[0])))
+    sprites = checkpoints.get("sprites") if checkpoints.has("sprites") else None
+    if sprites is not None:
+        store.sprites = SpriteSheetBuilder.from_sheet(sprites[0], sprites[1]["images"], [store.node_id(i) for i in range(len(store))])
+    return store
+
+async def _fetch_service_profile(service_url: str, trace_id: str, fmt: str) -> str:
+    """What Service C/D sampled while serving this task's requests ("" if it has none)."""
+    headers = {"Authorization": f"Bearer {_get_auth_token(service_url)}"}
+    response = await run_io(
+        lambda: requests.get(f"{service_url}/debug/profile/{trace_id}", params={"format": fmt}, headers=headers, timeout=30)
+    )
+    return response.text if response.status_code == 200 else ""
+
+async def _upload_profiles(storage_client, payload: TaskPayload, profiler, fmt: str):
+    """Worker profile, plus the model services' profiles of the same trace, under <output_bucket>/<task_id>/."""
+    bucket = storage_client.bucket(payload.output_bucket)
+    print(f"Profile: {profiler.summary()}")
+    try:
+        profiles = {"": profiler.render(fmt, name=f"tbd-worker {payload.task_id}")}
+        for source, url in (("detector", OBJECT_DETECTOR_URL), ("encoder", TEMPORAL_ENCODER_URL)):
+            if url:
+                try:
+                    profiles[source] = await _fetch_service_profile(url, current_trace_id(), fmt)
+                except Exception as e:
+                    print(f"PROFILE WARNING: Could not collect the {source} profile: {e}")
+        for source, body in profiles.items():
+            if not body: continue
+            name = f"{payload.task_id}/{profile_filename(fmt, source)}"
+            await run_io(bucket.blob(name).upload_from_string, body)
+            print(f"Profile uploaded to gs://{payload.output_bucket}/{name}")
+    except Exception as e:
+        print(f"PROFILE UPLOAD ERROR: {e}")
 
 # --- Main Worker Service ---
 
 class WorkerService:
-    def __init__(self):
-        self.storage_client = storage.Client()
-        self.publisher = pubsub_v1.PublisherClient()
+    def __init__(self, storage_client=None, publisher=None, admission=None):
+        # Clients are injectable so bench/ can run the full loop against local fakes
+        self.storage_client = storage_client or storage.Client()
+        self.publisher = publisher or pubsub_v1.PublisherClient()
+        self.status = TaskStatusPublisher(self.publisher, PROJECT_ID)
+        # Several tasks run at once on one instance; this decides whether one more fits
+        self.admission = admission or AdmissionController()
+
+    async def _admit(self, payload: TaskPayload):
+        """Reserves the task's estimated memory (video size, duration guessed from it). Raises AdmissionRejected."""
+        parsed = urlparse(payload.gcs_uri)
+        try:
+            blob = await run_io(self.storage_client.bucket(parsed.netloc).get_blob, parsed.path.lstrip('/'))
+            video_bytes = blob.size if blob is not None else 0
+        except Exception as e:
+            print(f"ADMISSION WARNING: Could not size {payload.gcs_uri}: {e}")
+            video_bytes = 0  # The download will report the real problem
+        return self.admission.admit(payload.task_id, estimate_task_mb(video_bytes))
 
     async def process_pubsub_message(self, pubsub_message_data: dict):
         """Main Orchestration Loop."""
@@ -171,10 +330,10 @@ class WorkerService:
         # 1. Parse Message
         try:
             message_data = base64.b64decode(pubsub_message_data['message']['data'])
-            payload_dict = json.loads(message_data.decode('utf-8'))
-            payload = TaskPayload.model_validate(payload_dict)
+            payload = TaskPayload.model_validate(loads(message_data))  # Still validated: the task's entry point
             task_id = payload.task_id
             trace_id = pubsub_message_data['message'].get('attributes', {}).get('trace_id', 'no-trace')
+            attempt = delivery_attempt(pubsub_message_data)
         except Exception as e:
             print(f"FATAL: Invalid Pub/Sub message: {e}")
             return # ACK to stop retry loop on bad data
@@ -186,63 +345,207 @@ class WorkerService:
             print(f"Skipping duplicate task {task_id}")
             return
 
-        # 3. Setup Local Paths
+        # Redelivered too often (runs that died before recording their failure, or endless deferrals): stop here
+        if attempt is not None and attempt > MAX_DELIVERY_ATTEMPTS:
+            await self._dead_letter(payload, trace_id, "delivery", "delivery_attempts_exhausted", False, None, attempt)
+            self.status.publish(task_id, "failed", trace_id, reason="delivery_attempts_exhausted", dead_lettered=True)
+            return
+
+        # 3. Admission: AdmissionRejected propagates to main.py, which nacks (429) for a later redelivery
+        reservation = await self._admit(payload)
+        print(f"Admitted task {task_id} ({reservation.mb:.0f} MB est.): {self.admission.stats()}")
+
+        # Every stage below is a span of the dispatcher's trace; the context follows the calls to Service C/D
+        try:
+            with trace(trace_id), span("task", task_id=task_id):
+                # Opt-in profiling (config.profile / PROFILE_TASKS): written next to pathway.json, even on failure
+                fmt = requested_format(payload.config)
+                try:
+                    with profiled_task(fmt) as profiler:
+                        await self._run_task(payload, trace_id, reservation, attempt)
+                finally:
+                    if profiler:
+                        await _upload_profiles(self.storage_client, payload, profiler, fmt)
+        finally:
+            reservation.release()
+
+    async def _run_task(self, payload: TaskPayload, trace_id: str, reservation=None, attempt: Optional[int] = None):
+        """
+        Download -> transcribe -> build -> enrich -> upload -> publish, inside the task's trace.
+        The transcript and the built nodes are checkpointed, so a retry resumes after them. A failed run is
+        either retried (raises -> nack) or dead-lettered (returns -> ack), see _task_failed.
+        """
+        task_id = payload.task_id
+        status = lambda phase, **detail: self.status.publish(task_id, phase, trace_id, **detail)
+
+        # Setup Local Paths
         input_bucket = urlparse(payload.gcs_uri).netloc
         input_blob_name = urlparse(payload.gcs_uri).path.lstrip('/')
         local_video_path = os.path.join(TEMP_DIR, f"{task_id}_video.mp4")
-        
+        output_bucket = self.storage_client.bucket(payload.output_bucket)
+        checkpoints = TaskCheckpoints(output_bucket, task_id, payload.gcs_uri)
+        stage = "checkpoint"
+
         try:
-            # 4. Download Video
-            print("Downloading video...")
-            bucket = self.storage_client.bucket(input_bucket)
-            blob = bucket.blob(input_blob_name)
-            blob.download_to_filename(local_video_path)
-
-            # 5. Audio Extraction & Transcription (FR-03)
-            print("Processing Audio...")
-            local_audio = _extract_audio_track(local_video_path)
-            audio_uri = _upload_audio_to_gcs(local_audio, task_id)
-            transcript = await _call_speech_to_text(audio_uri)
-            
-            # 6. Build Pathway (Gemini + Service D) (FR-02)
-            # This calls pipeline.py which calls Service D
-            print("Building Pathway (Visual + Spatial)...")
-            pathway = await build_pathway(
-                local_video_path=local_video_path,
-                gcs_video_uri=payload.gcs_uri,
-                audio_transcript=transcript,
-                object_detector_url=OBJECT_DETECTOR_URL
-            )
+            await _checkpoint(checkpoints.load)
+            if checkpoints.failed_runs:
+                print(f"Retrying task {task_id} after {checkpoints.failed_runs} failed run(s); "
+                      f"checkpoints: {sorted(checkpoints.manifest['stages']) or 'none'}")
+            # Re-recorded SOP: config.prior_pathway_uri enables incremental regeneration
+            stage = "prior_pathway"
+            prior_pathway = await run_io(_load_prior_pathway, self.storage_client, payload.config.get("prior_pathway_uri", ""))
+
+            # A retry after a later stage failed: the nodes are already built
+            stage = "resume"
+            store = await _checkpoint(_restore_node_store, checkpoints) if checkpoints.has("node_store") else None
+            if store is not None:
+                print(f"Resumed from checkpoint: {len(store)} nodes (download, STT, Gemini and Service D skipped).")
+            else:
+                # 4. Download Video
+                stage = "download"
+                print("Downloading video...")
+                status("downloading")
+                bucket = self.storage_client.bucket(input_bucket)
+                blob = bucket.blob(input_blob_name)
+                with span("download"):
+                    await run_io(blob.download_to_filename, local_video_path)
+                # Fail fast on a file no stage can read, before paying for STT and Gemini
+                stage = "probe"
+                duration_s = await run_io(video_duration, local_video_path)
+                if duration_s <= 0:
+                    raise PermanentFailure("probe", "unreadable_video",
+                                           f"{os.path.getsize(local_video_path)} bytes, no decodable frames")
+                if reservation:
+                    # Real duration now known: correct the estimate for the tasks admitted after this one
+                    reservation.resize(estimate_task_mb(os.path.getsize(local_video_path), duration_s))
+
+                # 5. Audio Extraction & Transcription (FR-03)
+                stage = "transcribe"
+                saved = await _checkpoint(checkpoints.get, "transcript") if checkpoints.has("transcript") else None
+                if saved is not None:
+                    transcript = saved[0].decode("utf-8")
+                    print("Transcript restored from checkpoint.")
+                else:
+                    print("Processing Audio...")
+                    status("transcribing")
+                    with span("audio_extraction"):
+                        local_audio = await run_io(_extract_audio_track, local_video_path)
+                    with span("audio_upload"):
+                        audio_uri = await run_io(_upload_audio_to_gcs, local_audio, task_id, self.storage_client)
+                    async with downstream("stt"):
+                        with span("stt"):
+                            transcript = await _call_speech_to_text(audio_uri)
+                    if transcript not in (TRANSCRIPT_MISSING, TRANSCRIPT_FAILED):
+                        await _checkpoint(checkpoints.save, "transcript", transcript.encode("utf-8"))
+
+                # 6. Build Pathway (Gemini + Service D) (FR-02)
+                # This calls pipeline.py which calls Service D
+                stage = "build"
+                print("Building Pathway (Visual + Spatial)...")
+                store = await build_node_store(
+                    local_video_path=local_video_path,
+                    gcs_video_uri=payload.gcs_uri,
+                    audio_transcript=transcript,
+                    object_detector_url=OBJECT_DETECTOR_URL,
+                    prior_pathway=prior_pathway,
+                    on_phase=status,
+                )
+                await _checkpoint(_save_node_store, checkpoints, store)
             
             # 7. Post-Processing: IoT & Temporal (FR-01, FR-04)
+            stage = "enrich"
             print("Enriching Data (IoT + Temporal)...")
-            telemetry = await _fetch_iot_telemetry()
-            
-            # Apply telemetry to all nodes
-            for node in pathway.nodes:
-                node.telemetry_context = telemetry
+            status("enriching", nodes=len(store))
+            # Video timestamps -> wall clock: config.recording_started_at (epoch s), else assume it just ended
+            duration = store.header.get("total_duration_sec", 0.0)
+            recording_started_at = float(payload.config.get("recording_started_at", time.time() - duration))
+            with span("telemetry", nodes=len(store)):
+                await _apply_iot_telemetry(store, recording_started_at)
             
             # Apply Temporal Vector (Service C)
-            await _enrich_with_temporal_context(pathway)
+            # Same step descriptions as the prior recording -> same sequence-level vector, no encoder call
+            prior_vector = prior_pathway.nodes[0].temporal_context_vector if prior_pathway and prior_pathway.nodes else []
+            if prior_vector and store.descriptions == [node.description for node in prior_pathway.nodes]:
+                store.set_vector(prior_vector)
+                print("Temporal Vector reused from prior pathway.")
+            else:
+                await _enrich_with_temporal_context(store)
+
+            # Single conversion to the PAD schema (Pydantic-heavy: off the event loop, like every blocking stage)
+            stage = "export"
+            with span("export", nodes=len(store)):
+                pathway, diff = await run_io(_export, store, prior_pathway)
+            if diff:
+                pathway.metadata["incremental"] = {"prior_pathway_id": prior_pathway.pathway_id, **diff["summary"]}
 
             # 8. Final Upload & Distribution
-            output_blob = f"{task_id}/pathway.json"
-            output_bucket = self.storage_client.bucket(payload.output_bucket)
-            output_bucket.blob(output_blob).upload_from_string(pathway.model_dump_json(indent=2))
+            stage = "upload"
+            with span("upload"):
+                output_blob = await run_io(_upload_outputs, output_bucket, task_id, pathway, diff, store.sprites, store)
             final_uri = f"gs://{payload.output_bucket}/{output_blob}"
+            if diff:
+                print(f"Pathway diff: {diff['summary']}")
             
             print(f"SUCCESS. Pathway uploaded to: {final_uri}")
+            if PATHWAY_EXPORT_PARQUET:
+                # Analytics copy in the partitioned Parquet dataset, straight from the columns
+                try:
+                    with span("parquet_export"):
+                        await run_io(export_task, output_bucket, task_id, store, pathway.model_dump(exclude={"nodes"}), final_uri)
+                except Exception as e:
+                    print(f"PARQUET EXPORT WARNING: {e}")  # scripts/export_parquet.py can backfill it
+            status("uploaded", pathway_uri=final_uri, nodes=len(pathway.nodes))
             
             # 9. Publish to Agent Topic (Execution Trigger)
+            stage = "publish"
             topic_path = self.publisher.topic_path(PROJECT_ID, AGENT_TOPIC_NAME)
             self.publisher.publish(topic_path, final_uri.encode("utf-8"), trace_id=trace_id)
 
+            # 10. Incremental index update (Service E): metadata plus the one sequence-level vector
+            index_view = {**pathway.model_dump(exclude={"nodes", "sprite_sheet"}), "nodes": [{"action_type": n.action_type} for n in pathway.nodes]}
+            index_record = summarize_pathway(index_view, task_id, final_uri)
+            if len(store.vectors):
+                index_record["temporal_context_vector"] = store.vectors[0].tolist()
+            try:
+                index_topic = self.publisher.topic_path(PROJECT_ID, INDEX_TOPIC_NAME)
+                self.publisher.publish(index_topic, dumps(index_record), trace_id=trace_id)
+            except Exception as e:
+                print(f"INDEX PUBLISH WARNING: {e}") # The pathway is uploaded; /reindex can catch up
+
             PROCESSED_TASKS.add(task_id)
+            if checkpoints.manifest["stages"] or checkpoints.failed_runs:
+                await _checkpoint(checkpoints.clear)
 
         except Exception as e:
-            print(f"WORKER FAILURE: {e}")
-            raise e # Nack message to retry
+            await self._task_failed(payload, trace_id, checkpoints, stage, e, attempt, status)
         finally:
             # Cleanup
             if os.path.exists(local_video_path): os.remove(local_video_path)
-            if 'local_audio' in locals() and os.path.exists(local_audio): os.remove(local_audio)
\ No newline at end of file
+            if 'local_audio' in locals() and os.path.exists(local_audio): os.remove(local_audio)
+
+    async def _task_failed(self, payload: TaskPayload, trace_id: str, checkpoints: TaskCheckpoints, stage: str,
+                           error: Exception, attempt: Optional[int], status):
+        """Transient, under MAX_TASK_ATTEMPTS failed runs: re-raise (nack, redelivered). Otherwise dead-letter (ack)."""
+        permanent, reason = classify(error)
+        if isinstance(error, PermanentFailure):
+            stage = error.stage
+        kind = "permanent" if permanent else "transient"
+        FAILURES.inc(stage=stage, kind=kind)
+        print(f"WORKER FAILURE [{stage}, {kind}: {reason}]: {error}")
+        await _checkpoint(checkpoints.record_failure, stage, reason, permanent, error, attempt)
+        if not permanent and checkpoints.failed_runs < MAX_TASK_ATTEMPTS:
+            status("failed", error=str(error), stage=stage, retrying=True, failed_runs=checkpoints.failed_runs)
+            raise error # Nack message to retry
+        await self._dead_letter(payload, trace_id, stage, reason, permanent, error, attempt, checkpoints)
+        status("failed", error=str(error), stage=stage, reason=reason, dead_lettered=True)
+
+    async def _dead_letter(self, payload: TaskPayload, trace_id: str, stage: str, reason: str, permanent: bool,
+                           error: Optional[Exception], attempt: Optional[int], checkpoints: Optional[TaskCheckpoints] = None):
+        """Publishes the diagnostic record; the caller then acks. Raises (-> nack) if it could not be published."""
+        record = dead_letter_record(payload.task_id, trace_id, payload.model_dump(), stage, reason, permanent,
+                                    error, attempt, checkpoints)
+        topic_path = self.publisher.topic_path(PROJECT_ID, DEAD_LETTER_TOPIC_NAME)
+        await run_io(lambda: self.publisher.publish(topic_path, dumps(record), trace_id=trace_id,
+                                                    task_id=payload.task_id, reason=reason).result(timeout=30))
+        DEAD_LETTERED.inc(reason=reason)  # Not in PROCESSED_TASKS: a replay with the same task_id must run
+        print(f"DEAD-LETTERED task {payload.task_id} ({record['classification']} at {stage}: {reason}) -> {DEAD_LETTER_TOPIC_NAME}")
@@ -0,0 +1,235 @@
+"""
+End-to-end worker benchmark, fully offline.
+Runs WorkerService.process_pubsub_message on synthetic videos with every external dependency
+replaced by a local stand-in (bench/fakes.py): filesystem GCS, recording Pub/Sub, canned
+STT/Gemini with configurable latency, and in-process Service C/D apps over real HTTP.
+
+Reports per-stage wall time, throughput, event-loop lag and peak RSS as JSON, so runs can be compared across commits:
+    python -m bench.e2e --durations 60 300 --steps 10 40 --tasks 4 --out bench_e2e.json
+    python -m bench.e2e ... --compare bench_e2e_baseline.json
+
+Needs the backend requirements (requirements.txt); ffmpeg is used for the audio stage when installed.
+"""
+import argparse
+import asyncio
+import base64
+import contextlib
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from typing import Dict, List, Any
+
+import numpy as np
+
+from bench.fakes import FakeStorageClient, FakePublisher, CannedResponder, ServiceThread, \
+    create_stub_encoder_app, create_stub_detector_app
+from bench.videos import make_video
+from app.services import executors
+from app.services.admission import AdmissionRejected
+
+INPUT_BUCKET = "bench-input"
+OUTPUT_BUCKET = "bench-output"
+
+class StageTimer:
+    """Wall time per stage. Wraps module functions (sync or async) or times blocks directly."""
+
+    def __init__(self):
+        self.samples: Dict[str, List[float]] = {}
+
+    @contextlib.contextmanager
+    def __call__(self, stage: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.samples.setdefault(stage, []).append(time.perf_counter() - start)
+
+    def wrap(self, owner, attr: str, stage: str):
+        original = getattr(owner, attr)
+        if asyncio.iscoroutinefunction(original):
+            async def timed(*args, **kwargs):
+                with self(stage):
+                    return await original(*args, **kwargs)
+        else:
+            def timed(*args, **kwargs):
+                with self(stage):
+                    return original(*args, **kwargs)
+        setattr(owner, attr, timed)
+
+    def reset(self):
+        self.samples = {}
+
+    def report(self) -> Dict[str, Dict[str, float]]:
+        out = {}
+        for stage, samples in sorted(self.samples.items()):
+            values = np.array(samples) * 1000
+            out[stage] = {"calls": len(values), "total_ms": round(float(values.sum()), 2),
+                          "mean_ms": round(float(values.mean()), 3), "p50_ms": round(float(np.percentile(values, 50)), 3),
+                          "p95_ms": round(float(np.percentile(values, 95)), 3)}
+        return out
+
+def _peak_rss_mb(who=resource.RUSAGE_SELF) -> float:
+    peak = resource.getrusage(who).ru_maxrss
+    return round(peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024, 1)  # bytes on macOS, KiB on Linux
+
+def _git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True).stdout.strip()
+    except OSError:
+        return ""
+
+def _envelope(task_id: str, gcs_uri: str) -> dict:
+    payload = {"task_id": task_id, "client_id": "bench", "gcs_uri": gcs_uri, "output_bucket": OUTPUT_BUCKET, "config": {}}
+    return {"message": {"data": base64.b64encode(json.dumps(payload).encode()).decode(), "attributes": {"trace_id": f"bench-{task_id}"}}}
+
+def instrument(timer: StageTimer, responder: CannedResponder):
+    """Points the worker at the fakes and wraps each stage with the timer."""
+    from app.services import worker, pipeline
+    from app.services.nodestore import NodeStore
+    worker._call_speech_to_text = responder.speech_to_text
+    pipeline.analyze_video_native = responder.analyze_video_native
+
+    timer.wrap(worker, "_extract_audio_track", "audio_extraction")
+    timer.wrap(worker, "_call_speech_to_text", "stt")
+    timer.wrap(pipeline, "analyze_video_native", "gemini")
+    timer.wrap(pipeline, "_keyframe_hashes", "keyframe_hash")
+    timer.wrap(pipeline, "_prepare_frame", "frame_extraction")
+    timer.wrap(pipeline, "_call_object_detector", "detector")
+    timer.wrap(worker, "_apply_iot_telemetry", "telemetry")
+    timer.wrap(worker, "_enrich_with_temporal_context", "encoder")
+    timer.wrap(NodeStore, "to_pathway", "export")
+    return worker
+
+async def run_config(worker_module, timer: StageTimer, responder: CannedResponder, loop_monitor,
+                     duration_s: float, steps: int, tasks: int, concurrency: int, args, workdir: str) -> Dict[str, Any]:
+    storage = FakeStorageClient(os.path.join(workdir, "gcs"), timer)
+    publisher = FakePublisher()
+
+    video = os.path.join(workdir, f"video_{int(duration_s)}s_{steps}.mp4")
+    script = make_video(video, duration_s, steps, fps=args.fps)
+
+    timer.reset()
+    loop_monitor.reset()
+    worker = worker_module.WorkerService(storage_client=storage, publisher=publisher)
+    semaphore = asyncio.Semaphore(concurrency)
+    deferred = 0
+
+    async def one_task():
+        nonlocal deferred
+        task_id = str(uuid.uuid4())
+        gcs_uri = f"gs://{INPUT_BUCKET}/{task_id}/video.mp4"
+        storage.put(gcs_uri, video)
+        responder.register(gcs_uri, script)
+        async with semaphore:
+            with timer("task_total"):  # Includes time spent deferred
+                while True:
+                    try:
+                        await worker.process_pubsub_message(_envelope(task_id, gcs_uri))
+                        break
+                    except AdmissionRejected:
+                        # Nacked: Pub/Sub would redeliver after its retry backoff
+                        deferred += 1
+                        await asyncio.sleep(args.redelivery_ms / 1000)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one_task() for _ in range(tasks)))
+    wall_s = time.perf_counter() - start
+
+    uploaded = sum(1 for m in publisher.messages if m["topic"].endswith(worker_module.AGENT_TOPIC_NAME))
+    return {
+        "duration_s": duration_s, "steps": steps, "tasks": tasks, "concurrency": concurrency,
+        "completed": uploaded,
+        "deferred": deferred,
+        "wall_s": round(wall_s, 3),
+        "tasks_per_min": round(uploaded / wall_s * 60, 2) if wall_s else None,
+        "stages": timer.report(),
+        "loop_lag": loop_monitor.stats(),
+    }
+
+async def main(args):
+    # Stub services are real HTTP servers, so transport and serialization costs are measured too
+    encoder_app = create_stub_encoder_app(args.encoder_latency_ms / 1000)
+    detector_app = create_stub_detector_app(args.detector_latency_ms / 1000)
+    with ServiceThread(encoder_app) as encoder, ServiceThread(detector_app) as detector, \
+            tempfile.TemporaryDirectory(prefix="tbd_bench_") as workdir:
+        timer = StageTimer()
+        responder = CannedResponder(args.stt_latency_ms / 1000, args.gemini_latency_ms / 1000)
+        worker = instrument(timer, responder)
+        worker.TEMPORAL_ENCODER_URL = encoder.url
+        worker.OBJECT_DETECTOR_URL = detector.url
+        # CPU pool up front, so process spawn time isn't billed to the first configuration
+        executors.warm_up()
+        loop_monitor = executors.LoopLagMonitor().start()
+
+        runs = []
+        for duration_s in args.durations:
+            for steps in args.steps:
+                run = await run_config(worker, timer, responder, loop_monitor, duration_s, steps, args.tasks, args.concurrency, args, workdir)
+                runs.append(run)
+                print(f"{duration_s:>6.0f}s video, {steps:>3} steps: {run['completed']}/{run['tasks']} tasks, "
+                      f"{run['tasks_per_min']} tasks/min, task p50 {run['stages']['task_total']['p50_ms']:.0f} ms, "
+                      f"loop lag p99 {run['loop_lag'].get('p99_ms')} ms", file=sys.stderr)
+        loop_monitor.stop()
+        executors.shutdown()
+
+    return {
+        "benchmark": "e2e_worker",
+        "commit": _git_commit(),
+        "python": platform.python_version(),
+        "started_at": time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        "latency_ms": {"stt": args.stt_latency_ms, "gemini": args.gemini_latency_ms,
+                       "encoder": args.encoder_latency_ms, "detector": args.detector_latency_ms},
+        "peak_rss_mb": _peak_rss_mb(),
+        "peak_rss_children_mb": _peak_rss_mb(resource.RUSAGE_CHILDREN),  # ffmpeg, CPU pool processes
+        "runs": runs,
+    }
+
+def compare(report: Dict[str, Any], baseline: Dict[str, Any]):
+    """Prints stage mean and throughput changes against a baseline report (matching configs only)."""
+    print(f"\nvs. baseline {baseline.get('commit') or '?'} -> {report.get('commit') or '?'}")
+    base_runs = {(r["duration_s"], r["steps"], r["concurrency"]): r for r in baseline["runs"]}
+    for run in report["runs"]:
+        base = base_runs.get((run["duration_s"], run["steps"], run["concurrency"]))
+        if not base: continue
+        print(f"{run['duration_s']:.0f}s / {run['steps']} steps: "
+              f"{base['tasks_per_min']} -> {run['tasks_per_min']} tasks/min")
+        for stage, stats in run["stages"].items():
+            before = base["stages"].get(stage)
+            if not before or not before["mean_ms"]: continue
+            change = (stats["mean_ms"] - before["mean_ms"]) / before["mean_ms"] * 100
+            print(f"    {stage:<18} {before['mean_ms']:>10.2f} -> {stats['mean_ms']:>10.2f} ms  ({change:+.1f}%)")
+        if base.get("loop_lag", {}).get("p99_ms") is not None:
+            print(f"    {'loop lag p99':<18} {base['loop_lag']['p99_ms']:>10.2f} -> {run['loop_lag'].get('p99_ms', 0):>10.2f} ms")
+    print(f"peak RSS {baseline.get('peak_rss_mb')} -> {report.get('peak_rss_mb')} MB")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--durations", type=float, nargs="+", default=[60.0], help="Synthetic video lengths (s)")
+    parser.add_argument("--steps", type=int, nargs="+", default=[10, 40], help="Steps per video")
+    parser.add_argument("--tasks", type=int, default=4, help="Tasks per configuration")
+    parser.add_argument("--concurrency", type=int, default=1, help="Tasks in flight at once")
+    parser.add_argument("--fps", type=int, default=10)
+    parser.add_argument("--redelivery-ms", type=float, default=1000.0, help="Delay before retrying a deferred task")
+    parser.add_argument("--stt-latency-ms", type=float, default=500.0)
+    parser.add_argument("--gemini-latency-ms", type=float, default=2000.0)
+    parser.add_argument("--encoder-latency-ms", type=float, default=50.0)
+    parser.add_argument("--detector-latency-ms", type=float, default=30.0)
+    parser.add_argument("--out", default=None, help="Write the JSON report here (default: stdout)")
+    parser.add_argument("--compare", default=None, help="Baseline JSON report to diff against")
+    args = parser.parse_args()
+
+    report = asyncio.run(main(args))
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(report, f, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+    if args.compare:
+        with open(args.compare) as f:
+            compare(report, json.load(f))
@@ -0,0 +1,297 @@
+"""
+Local stand-ins for every external service the worker talks to, for offline benchmarks:
+filesystem-backed GCS, a recording Pub/Sub publisher, canned Speech-to-Text / Gemini responders
+with configurable latency, and in-process Service C (encoder) / Service D (detector) apps with
+injectable faults (errors, slow tail, outages).
+"""
+import asyncio
+import json
+import os
+import random
+import shutil
+import socket
+import threading
+import time
+import zlib
+from concurrent.futures import Future
+from typing import Dict, List, Any, Optional, Callable, Tuple
+
+import numpy as np
+
+# --- Storage ---
+
+class FakeBlob:
+    def __init__(self, bucket: "FakeBucket", name: str):
+        self.bucket = bucket
+        self.name = name
+        self.content_type = None
+
+    @property
+    def path(self) -> str:
+        return os.path.join(self.bucket.root, self.name)
+
+    @property
+    def size(self) -> Optional[int]:
+        return os.path.getsize(self.path) if os.path.exists(self.path) else None
+
+    def _timed(self, stage: str):
+        return self.bucket.client.timer(stage)
+
+    def _prepare(self) -> str:
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        return self.path
+
+    def exists(self) -> bool:
+        return os.path.exists(self.path)
+
+    def reload(self):
+        if not self.exists():
+            raise FileNotFoundError(f"gs://{self.bucket.name}/{self.name}")
+
+    def upload_from_string(self, data, content_type: Optional[str] = None):
+        with self._timed("upload"):
+            with open(self._prepare(), "wb") as f:
+                f.write(data.encode("utf-8") if isinstance(data, str) else data)
+
+    def upload_from_filename(self, filename: str, content_type: Optional[str] = None):
+        # The worker only uploads files for the STT audio staging
+        with self._timed("audio_upload"):
+            shutil.copyfile(filename, self._prepare())
+
+    def download_to_filename(self, filename: str):
+        with self._timed("download"):
+            shutil.copyfile(self.path, filename)
+
+    def download_as_bytes(self) -> bytes:
+        with self._timed("download"):
+            with open(self.path, "rb") as f:
+                return f.read()
+
+    def download_as_text(self) -> str:
+        return self.download_as_bytes().decode("utf-8")
+
+    def compose(self, sources: List["FakeBlob"]):
+        with open(self._prepare(), "wb") as out:
+            for source in sources:
+                with open(source.path, "rb") as f:
+                    shutil.copyfileobj(f, out)
+
+    def delete(self):
+        os.remove(self.path)
+
+class FakeBucket:
+    def __init__(self, client: "FakeStorageClient", name: str):
+        self.client = client
+        self.name = name
+        self.root = os.path.join(client.root, name)
+
+    def blob(self, name: str) -> FakeBlob:
+        return FakeBlob(self, name)
+
+    def get_blob(self, name: str) -> Optional[FakeBlob]:
+        blob = self.blob(name)
+        return blob if blob.exists() else None
+
+class FakeStorageClient:
+    """google.cloud.storage.Client over a local directory: gs://bucket/name -> <root>/bucket/name."""
+
+    def __init__(self, root: str, timer: Optional[Callable] = None):
+        self.root = root
+        self.timer = timer or (lambda stage: _NullContext())
+
+    def bucket(self, name: str) -> FakeBucket:
+        return FakeBucket(self, name)
+
+    def list_blobs(self, bucket_name: str, prefix: Optional[str] = None):
+        bucket = self.bucket(bucket_name)
+        for directory, _, files in os.walk(bucket.root):
+            for filename in files:
+                name = os.path.relpath(os.path.join(directory, filename), bucket.root).replace(os.sep, "/")
+                if not prefix or name.startswith(prefix):
+                    yield bucket.blob(name)
+
+    def put(self, gcs_uri: str, local_path: str):
+        """Seeds an object (untimed: it stands in for the client's upload, not a worker stage)."""
+        bucket_name, name = gcs_uri[len("gs://"):].split("/", 1)
+        shutil.copyfile(local_path, self.bucket(bucket_name).blob(name)._prepare())
+
+class _NullContext:
+    def __enter__(self): return self
+    def __exit__(self, *exc): return False
+
+# --- Pub/Sub ---
+
+class FakePublisher:
+    """pubsub_v1.PublisherClient that records messages instead of sending them."""
+
+    def __init__(self):
+        self.messages: List[Dict[str, Any]] = []
+        self.lock = threading.Lock()
+
+    def topic_path(self, project_id: str, topic: str) -> str:
+        return f"projects/{project_id}/topics/{topic}"
+
+    def publish(self, topic: str, data: bytes, **attributes) -> Future:
+        with self.lock:
+            self.messages.append({"topic": topic, "data": data, "attributes": attributes})
+        future = Future()
+        future.set_result(str(len(self.messages)))
+        return future
+
+# --- Speech-to-Text & Gemini ---
+
+class CannedResponder:
+    """
+    Stands in for Speech-to-Text and Gemini: returns the script registered for a video after a
+    fixed latency. The synthetic video generator registers each video's ground-truth steps.
+    """
+
+    def __init__(self, stt_latency_s: float = 0.0, gemini_latency_s: float = 0.0):
+        self.stt_latency_s = stt_latency_s
+        self.gemini_latency_s = gemini_latency_s
+        self.steps: Dict[str, List[Dict[str, Any]]] = {}
+
+    def register(self, gcs_uri: str, steps: List[Dict[str, Any]]):
+        self.steps[gcs_uri] = steps
+
+    async def speech_to_text(self, gcs_uri: str) -> str:
+        await asyncio.sleep(self.stt_latency_s)
+        return "First I open the settings, then I change the configuration and save it."
+
+    async def analyze_video_native(self, video_gcs_uri: str, audio_transcript: str) -> list:
+        await asyncio.sleep(self.gemini_latency_s)
+        # Round-trip through JSON, as the real client parses Gemini's response text
+        return json.loads(json.dumps(self.steps.get(video_gcs_uri, [])))
+
+# --- Service C / Service D ---
+
+class FaultInjector:
+    """
+    Faults a stub model service applies to each request, changeable while it runs
+    (directly, or POST /_faults with the same fields as JSON):
+    error_rate -> 503, slow_rate -> extra slow_s before answering, down -> every request 503.
+    """
+
+    def __init__(self, error_rate: float = 0.0, slow_rate: float = 0.0, slow_s: float = 0.0,
+                 down: bool = False, seed: Optional[int] = None):
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.configure(error_rate=error_rate, slow_rate=slow_rate, slow_s=slow_s, down=down)
+
+    def configure(self, **faults):
+        for name in ("error_rate", "slow_rate", "slow_s", "down"):
+            if name in faults:
+                setattr(self, name, faults[name])
+
+    def draw(self) -> Tuple[Optional[int], float]:
+        """For one request: (HTTP status to fail with or None, extra delay in seconds)."""
+        with self.lock:
+            self.requests += 1
+            fail = self.down or self.rng.random() < self.error_rate
+            slow = self.rng.random() < self.slow_rate
+        return (503 if fail else None), (self.slow_s if slow and not fail else 0.0)
+
+def _fault_response(status: int):
+    from fastapi.responses import JSONResponse
+    return JSONResponse({"detail": "Injected fault"}, status_code=status)
+
+def _add_fault_routes(app, faults: FaultInjector):
+    from fastapi import Body
+
+    @app.post("/_faults")
+    def set_faults(config: dict = Body(...)):
+        faults.configure(**config)
+        return {"error_rate": faults.error_rate, "slow_rate": faults.slow_rate, "slow_s": faults.slow_s,
+                "down": faults.down, "requests": faults.requests}
+
+def create_stub_encoder_app(latency_s: float = 0.0, dim: int = 512, faults: Optional[FaultInjector] = None):
+    """Service C API (/readyz, /encode_sequence) returning a deterministic vector per sequence."""
+    from fastapi import FastAPI
+    app = FastAPI(title="TbD Stub Temporal Encoder")
+    faults = faults or FaultInjector()
+    app.state.faults = faults
+    _add_fault_routes(app, faults)
+
+    @app.get("/readyz")
+    def readyz():
+        return {"state": "ready"}
+
+    @app.post("/encode_sequence")
+    def encode_sequence(payload: dict):
+        status, delay_s = faults.draw()
+        time.sleep(delay_s)
+        if status:
+            return _fault_response(status)
+        time.sleep(latency_s)  # sync endpoint -> threadpool, like the real service's model call
+        rng = np.random.default_rng(zlib.crc32("\n".join(payload.get("sequence", [])).encode()))
+        vector = rng.standard_normal(dim).astype(np.float32)
+        return {"temporal_context_vector": (vector / np.linalg.norm(vector)).tolist(),
+                "temporal_encoding_method": "STUB"}
+
+    return app
+
+def create_stub_detector_app(latency_s: float = 0.0, faults: Optional[FaultInjector] = None):
+    """Service D API (/readyz, /detect_coordinates_raw, /detect_coordinates_file) with a fixed box."""
+    from fastapi import FastAPI, Request
+    app = FastAPI(title="TbD Stub Object Detector")
+    faults = faults or FaultInjector()
+    app.state.faults = faults
+    _add_fault_routes(app, faults)
+
+    def result(orig_w: int, orig_h: int):
+        time.sleep(latency_s)
+        return {"ui_region": [orig_w // 4, orig_h // 4, orig_w // 2, orig_h // 8], "confidence": 0.9}
+
+    @app.get("/readyz")
+    def readyz():
+        return {"state": "ready"}
+
+    @app.post("/detect_coordinates_raw")
+    async def detect_coordinates_raw(request: Request, orig_w: int, orig_h: int, target_text: str = "default"):
+        await request.body()
+        # Injected delays wait on the loop, so a hanging "outage" doesn't also exhaust the stub's threads
+        status, delay_s = faults.draw()
+        await asyncio.sleep(delay_s)
+        if status:
+            return _fault_response(status)
+        return await asyncio.get_event_loop().run_in_executor(None, result, orig_w, orig_h)
+
+    @app.post("/detect_coordinates_file")
+    async def detect_coordinates_file(request: Request):
+        form = await request.form()
+        status, delay_s = faults.draw()
+        await asyncio.sleep(delay_s)
+        if status:
+            return _fault_response(status)
+        return await asyncio.get_event_loop().run_in_executor(None, result, int(form["orig_w"]), int(form["orig_h"]))
+
+    return app
+
+class ServiceThread:
+    """Runs a FastAPI app with uvicorn on a free localhost port, in a daemon thread."""
+
+    def __init__(self, app):
+        import uvicorn
+        with socket.socket() as sock:
+            sock.bind(("127.0.0.1", 0))
+            self.port = sock.getsockname()[1]
+        self.server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=self.port, log_level="warning"))
+        self.thread = threading.Thread(target=self.server.run, daemon=True)
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.port}"
+
+    def __enter__(self) -> "ServiceThread":
+        self.thread.start()
+        deadline = time.time() + 10
+        while not self.server.started:
+            if time.time() > deadline: raise RuntimeError(f"Stub service on {self.url} did not start")
+            time.sleep(0.01)
+        return self
+
+    def __exit__(self, *exc):
+        self.server.should_exit = True
+        self.thread.join(timeout=5)
+        return False
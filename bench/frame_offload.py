@@ -0,0 +1,102 @@
+"""
+Frame work on the event loop vs. the executor layer (app/services/executors.py).
+Several concurrent "tasks" each hash keyframes and prepare detector frames for a synthetic video, with
+a fake detector round trip (asyncio.sleep) per step, while LoopLagMonitor measures how late the event
+loop wakes up. inline runs the OpenCV work directly on the loop, as the worker used to.
+
+    python -m bench.frame_offload --tasks 4 --steps 40 --detector-latency-ms 30
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import time
+
+import cv2
+
+from app.services import executors, frames
+from app.services.diff import keyframe_hash
+from bench.videos import make_video
+
+def _inline_hashes(video_path, timestamps):
+    cap = cv2.VideoCapture(video_path)
+    try:
+        return [keyframe_hash(frames.get_frame_at_time(cap, t)) for t in timestamps]
+    finally:
+        cap.release()
+
+def _inline_frame(video_path, timestamp):
+    cap = cv2.VideoCapture(video_path)
+    try:
+        frame = frames.get_frame_at_time(cap, timestamp)
+        return frames.letterbox_frame(frame).tobytes()
+    finally:
+        cap.release()
+
+async def one_task(mode: str, video_path: str, timestamps, detector_latency_s: float):
+    if mode == "inline":
+        _inline_hashes(video_path, timestamps)
+        for t in timestamps:
+            _inline_frame(video_path, t)
+            await asyncio.sleep(detector_latency_s)
+        return
+
+    size = -(-len(timestamps) // executors.CPU_WORKERS)
+    await asyncio.gather(*(executors.run_cpu(frames.frame_hashes, video_path, timestamps[i:i + size])
+                           for i in range(0, len(timestamps), size)))
+    slots = executors.frame_slots()
+    # Same one-ahead prefetch as build_node_store
+    async def prepare(t):
+        slot = await slots.acquire()
+        await executors.run_cpu(frames.prepare_detector_frame, video_path, t, slot.name)
+        return slot
+    pending = asyncio.ensure_future(prepare(timestamps[0]))
+    for i in range(len(timestamps)):
+        slot = await pending
+        if i + 1 < len(timestamps):
+            pending = asyncio.ensure_future(prepare(timestamps[i + 1]))
+        await executors.run_io(slot.array.tobytes)
+        await asyncio.sleep(detector_latency_s)
+        slots.release(slot)
+
+async def run_mode(mode: str, args, video_path: str, timestamps):
+    if mode != "inline":
+        executors.CPU_EXECUTOR = mode
+        executors.shutdown()
+        executors.warm_up()
+    monitor = executors.LoopLagMonitor(interval_s=0.01, warn_s=float("inf")).start()
+    start = time.perf_counter()
+    await asyncio.gather(*(one_task(mode, video_path, timestamps, args.detector_latency_ms / 1000)
+                           for _ in range(args.tasks)))
+    wall_s = time.perf_counter() - start
+    monitor.stop()
+    return {"mode": mode, "wall_s": round(wall_s, 3),
+            "steps_per_s": round(args.tasks * len(timestamps) / wall_s, 1), "loop_lag": monitor.stats()}
+
+async def main(args):
+    with tempfile.TemporaryDirectory(prefix="tbd_bench_") as workdir:
+        video_path = os.path.join(workdir, "video.mp4")
+        script = make_video(video_path, args.duration, args.steps, size=(1920, 1080), with_audio=False)
+        timestamps = [step["timestamp"] for step in script]
+        results = []
+        for mode in args.modes:
+            result = await run_mode(mode, args, video_path, timestamps)
+            results.append(result)
+            print(f"{mode:>8}: {result['wall_s']:.2f}s, {result['steps_per_s']} steps/s, "
+                  f"loop lag p99 {result['loop_lag'].get('p99_ms')} ms, max {result['loop_lag'].get('max_ms')} ms",
+                  file=sys.stderr)
+        executors.shutdown()
+    return {"benchmark": "frame_offload", "cpu_workers": executors.CPU_WORKERS, "tasks": args.tasks,
+            "steps": args.steps, "results": results}
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--modes", nargs="+", default=["inline", "thread", "process"])
+    parser.add_argument("--tasks", type=int, default=4, help="Concurrent tasks")
+    parser.add_argument("--steps", type=int, default=40)
+    parser.add_argument("--duration", type=float, default=120.0, help="Synthetic video length (s)")
+    parser.add_argument("--detector-latency-ms", type=float, default=30.0)
+    args = parser.parse_args()
+    print(json.dumps(asyncio.run(main(args)), indent=2))
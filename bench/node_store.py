@@ -0,0 +1,142 @@
+"""
+Pipeline node representation benchmark: per-step Pydantic ActionNodes (V6 baseline) vs. the columnar NodeStore.
+Times build (one node per Gemini step), enrich (telemetry + 512-D temporal vector on every node) and
+export (pathway.json bytes), reports peak traced memory, and checks both produce identical JSON.
+
+Usage (from the repo root):
+    python -m bench.node_store --nodes 100 1000 10000
+"""
+import argparse
+import json
+import time
+import tracemalloc
+import numpy as np
+
+from app.schema import Pathway, ActionNode, TelemetryContext
+from app.services.nodestore import NodeStore, VECTOR_DIM
+
+HEADER = {
+    "pathway_id": "bench-pathway",
+    "title": "Native Insight: bench.mp4",
+    "author_id": "tbd-v6-engine",
+    "source_video": "bench.mp4",
+    "created_at": "2025-01-01T00:00:00+0000",
+    "total_duration_sec": 0.0,
+    "metadata": {"target_vertical": "manufacturing", "compliance_tag": "AS9100"},
+}
+
+def make_steps(n: int, seed: int = 0) -> list:
+    """Gemini-style steps plus the detector result for each."""
+    rng = np.random.default_rng(seed)
+    return [{
+        "timestamp": float(i) * 1.5,
+        "description": f"User clicks control {i} in panel {i % 7}",
+        "target_text": f"Control {i}",
+        "action_type": ["click", "type", "drag", "scroll"][i % 4],
+        "ui_region": rng.integers(0, 1920, size=4).tolist(),
+        "confidence": float(rng.random()),
+        "keyframe_hash": f"{rng.integers(0, 2**63):016x}",
+    } for i in range(n)]
+
+def run_pydantic(steps: list, telemetry: TelemetryContext, vector: list) -> bytes:
+    """V6 baseline: ActionNode per step, Pathway assembled, then every node mutated by the worker."""
+    nodes = []
+    for i, step in enumerate(steps):
+        nodes.append(ActionNode(
+            id=f"node_{i+1}",
+            timestamp_start=step["timestamp"],
+            timestamp_end=step["timestamp"] + 1.0,
+            description=step["description"],
+            semantic_description=step["description"],
+            ui_element_text=step["target_text"],
+            ui_region=step["ui_region"],
+            confidence=step["confidence"],
+            active_region_confidence=step["confidence"],
+            action_type=step["action_type"],
+            keyframe_hash=step["keyframe_hash"],
+            next_node_id=f"node_{i+2}" if i + 1 < len(steps) else None
+        ))
+    pathway = Pathway(**HEADER, nodes=nodes)
+    timings["build"] = time.perf_counter()
+
+    for node in pathway.nodes:
+        node.telemetry_context = telemetry
+    for node in pathway.nodes:
+        node.temporal_context_vector = vector
+    timings["enrich"] = time.perf_counter()
+
+    return pathway.model_dump_json(indent=2).encode()
+
+def run_store(steps: list, telemetry: TelemetryContext, vector: list) -> bytes:
+    store = NodeStore(len(steps), dict(HEADER))
+    for step in steps:
+        store.append(
+            timestamp_start=step["timestamp"],
+            timestamp_end=step["timestamp"] + 1.0,
+            description=step["description"],
+            semantic_description=step["description"],
+            ui_element_text=step["target_text"],
+            ui_region=step["ui_region"],
+            confidence=step["confidence"],
+            active_region_confidence=step["confidence"],
+            action_type=step["action_type"],
+            keyframe_hash=step["keyframe_hash"],
+        )
+    timings["build"] = time.perf_counter()
+
+    store.set_telemetry(telemetry)
+    store.set_vector(vector)
+    timings["enrich"] = time.perf_counter()
+
+    return store.to_pathway().model_dump_json(indent=2).encode()
+
+timings = {}
+
+def measure(fn, steps, telemetry, vector, repeats: int) -> dict:
+    best = None
+    for _ in range(repeats):
+        start = time.perf_counter()
+        output = fn(steps, telemetry, vector)
+        end = time.perf_counter()
+        run = {
+            "build_ms": (timings["build"] - start) * 1000.0,
+            "enrich_ms": (timings["enrich"] - timings["build"]) * 1000.0,
+            "export_ms": (end - timings["enrich"]) * 1000.0,
+            "total_ms": (end - start) * 1000.0,
+        }
+        if best is None or run["total_ms"] < best["total_ms"]:
+            best = run
+
+    tracemalloc.start()
+    fn(steps, telemetry, vector)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return {**{k: round(v, 2) for k, v in best.items()}, "peak_mb": round(peak / 2**20, 2), "output": output}
+
+def main(node_counts: list, repeats: int, as_json: bool):
+    telemetry = TelemetryContext(sensor_id="DED-Robot-Arm-01", machine_state="ACTIVE_PRINTING", ambient_temp_c=24.5)
+    # Service C output: float32 values, as JSON floats
+    vector = np.random.default_rng(1).standard_normal(VECTOR_DIM).astype(np.float32).tolist()
+
+    for n in node_counts:
+        steps = make_steps(n)
+        results = {name: measure(fn, steps, telemetry, vector, repeats)
+                   for name, fn in [("pydantic", run_pydantic), ("node_store", run_store)]}
+        identical = results["pydantic"].pop("output") == results["node_store"].pop("output")
+
+        for name, r in results.items():
+            if as_json:
+                print(json.dumps({"nodes": n, "impl": name, **r, "identical_output": identical}))
+            else:
+                print(f"{n:>6} nodes | {name:<10} build {r['build_ms']:>8.1f}ms enrich {r['enrich_ms']:>7.1f}ms "
+                      f"export {r['export_ms']:>8.1f}ms total {r['total_ms']:>8.1f}ms | peak {r['peak_mb']:>7.1f}MB")
+        if not as_json:
+            print(f"{'':>6}         output identical: {identical}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--nodes", type=int, nargs="+", default=[100, 1000, 10000])
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--json", action="store_true")
+    args = parser.parse_args()
+    main(args.nodes, args.repeats, args.json)
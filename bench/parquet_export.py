@@ -0,0 +1,148 @@
+"""
+Analytics reads over a pathway corpus: pathway.json files vs. the Parquet export (app/services/columnar.py).
+Builds --pathways synthetic pathways (NodeStore export, 512-D vector and telemetry on every node, like
+the worker's), converts them with scripts/export_parquet.py, then times the same three queries on each:
+
+    actions      action-type distribution
+    durations    step duration mean / p50 / p95 per action type
+    confidence   confidence stats per target_vertical, plus all vectors as one (nodes, 512) matrix
+
+    python -m bench.parquet_export --pathways 1000 --nodes 40
+"""
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+from collections import Counter, defaultdict
+
+import numpy as np
+import pyarrow.compute as pc
+
+from app.schema import TelemetryContext
+from app.services.columnar import read_nodes
+from app.services.nodestore import NodeStore, VECTOR_DIM
+from bench.node_store import HEADER, make_steps
+from scripts.export_parquet import export
+
+VERTICALS = ["manufacturing", "healthcare", "it_support"]
+
+def make_corpus(root: str, pathways: int, nodes: int) -> int:
+    telemetry = TelemetryContext(sensor_id="DED-Robot-Arm-01", machine_state="ACTIVE_PRINTING", ambient_temp_c=24.5)
+    rng = np.random.default_rng(3)
+    size = 0
+    for p in range(pathways):
+        steps = make_steps(nodes, seed=p)
+        header = {**HEADER, "pathway_id": f"bench-{p}", "created_at": f"2025-01-{p % 7 + 1:02d}T00:00:00+0000",
+                  "metadata": {"target_vertical": VERTICALS[p % len(VERTICALS)], "compliance_tag": "AS9100"}}
+        store = NodeStore(nodes, header)
+        for step in steps:
+            store.append(step["timestamp"], step["timestamp"] + float(rng.uniform(0.5, 3.0)), step["description"],
+                         step["target_text"], step["ui_region"], step["confidence"], step["confidence"],
+                         step["action_type"], step["description"], step["keyframe_hash"])
+        store.set_telemetry(telemetry)
+        store.set_vector(rng.standard_normal(VECTOR_DIM).astype(np.float32))
+        data = store.to_pathway().model_dump_json(indent=2).encode()
+        os.makedirs(os.path.join(root, f"task-{p:06d}"))
+        with open(os.path.join(root, f"task-{p:06d}", "pathway.json"), "wb") as f:
+            f.write(data)
+        size += len(data)
+    return size
+
+def _json_pathways(root: str):
+    for task in sorted(os.listdir(root)):
+        with open(os.path.join(root, task, "pathway.json"), "rb") as f:
+            yield json.loads(f.read())
+
+def json_queries(root: str, query: str):
+    if query == "actions":
+        return Counter(node["action_type"] for pathway in _json_pathways(root) for node in pathway["nodes"])
+    if query == "durations":
+        durations = defaultdict(list)
+        for pathway in _json_pathways(root):
+            for node in pathway["nodes"]:
+                durations[node["action_type"]].append(node["timestamp_end"] - node["timestamp_start"])
+        return {k: (np.mean(v), np.percentile(v, 50), np.percentile(v, 95)) for k, v in durations.items()}
+    confidence, vectors = defaultdict(list), []
+    for pathway in _json_pathways(root):
+        vertical = pathway["metadata"]["target_vertical"]
+        for node in pathway["nodes"]:
+            confidence[vertical].append(node["confidence"])
+            vectors.append(node["temporal_context_vector"])
+    return {k: (np.mean(v), np.std(v)) for k, v in confidence.items()}, np.asarray(vectors, dtype=np.float32).shape
+
+def parquet_queries(root: str, query: str):
+    if query == "actions":
+        counts = pc.value_counts(read_nodes(root, ["action_type"])["action_type"].combine_chunks())
+        return Counter({row["values"]: row["counts"] for row in counts.to_pylist()})
+    if query == "durations":
+        table = read_nodes(root, ["action_type", "duration_sec"])
+        actions = np.asarray(table["action_type"].cast("string").to_numpy(zero_copy_only=False))
+        durations = table["duration_sec"].to_numpy()
+        return {k: (durations[actions == k].mean(), np.percentile(durations[actions == k], 50),
+                    np.percentile(durations[actions == k], 95)) for k in np.unique(actions)}
+    table = read_nodes(root, ["target_vertical", "confidence", "temporal_context_vector"])
+    verticals = np.asarray(table["target_vertical"].to_numpy(zero_copy_only=False)).astype(str)
+    confidence = table["confidence"].to_numpy()
+    flat = table["temporal_context_vector"].combine_chunks().flatten().to_numpy()
+    vectors = flat.reshape(-1, VECTOR_DIM)
+    return {k: (confidence[verticals == k].mean(), confidence[verticals == k].std())
+            for k in np.unique(verticals)}, vectors.shape
+
+def _canonical(value):
+    """Floats rounded (summation order differs), tuples as lists, numpy scalars as Python numbers."""
+    if isinstance(value, dict):
+        return {str(k): _canonical(v) for k, v in sorted(value.items())}
+    if isinstance(value, (list, tuple)):
+        return [_canonical(v) for v in value]
+    if isinstance(value, (float, np.floating)):
+        return round(float(value), 9)
+    return int(value) if isinstance(value, np.integer) else value
+
+def _same(a, b) -> bool:
+    return _canonical(a) == _canonical(b)
+
+def timed(fn, *args, repeats: int):
+    best, result = None, None
+    for _ in range(repeats):
+        start = time.perf_counter()
+        result = fn(*args)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+def _dir_size(root: str) -> int:
+    return sum(os.path.getsize(os.path.join(d, f)) for d, _, files in os.walk(root) for f in files)
+
+def main(args):
+    work = tempfile.mkdtemp(prefix="tbd_parquet_bench_")
+    try:
+        corpus, dataset = os.path.join(work, "json"), os.path.join(work, "parquet")
+        json_bytes = make_corpus(corpus, args.pathways, args.nodes)
+        start = time.perf_counter()
+        stats = export(corpus, dataset, workers=4)
+        export_s = time.perf_counter() - start
+
+        results = []
+        for query in ("actions", "durations", "confidence"):
+            json_s, json_result = timed(json_queries, corpus, query, repeats=args.repeats)
+            parquet_s, parquet_result = timed(parquet_queries, dataset, query, repeats=args.repeats)
+            results.append({"query": query, "json_s": round(json_s, 3), "parquet_s": round(parquet_s, 3),
+                            "speedup": round(json_s / parquet_s, 1), "identical": _same(json_result, parquet_result)})
+            print(f"{query:>10}: json {json_s:>7.3f}s  parquet {parquet_s:>7.3f}s  ({json_s / parquet_s:.1f}x)",
+                  file=sys.stderr)
+        return {"benchmark": "parquet_export", "pathways": args.pathways, "nodes_per_pathway": args.nodes,
+                "json_mb": round(json_bytes / 2**20, 1), "parquet_mb": round(_dir_size(dataset) / 2**20, 1),
+                "export_s": round(export_s, 2), "files": stats["files"], "results": results}
+    finally:
+        shutil.rmtree(work, ignore_errors=True)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pathways", type=int, default=1000)
+    parser.add_argument("--nodes", type=int, default=40, help="Nodes per pathway")
+    parser.add_argument("--repeats", type=int, default=3)
+    args = parser.parse_args()
+    print(json.dumps(main(args), indent=2))
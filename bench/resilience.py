@@ -0,0 +1,107 @@
+"""
+Service D calls through app/services/resilience.py against the stub detector with injected faults
+(bench/fakes.py FaultInjector), compared with the old single attempt at a fixed timeout ("fixed").
+Each scenario issues --calls detector requests at --rate calls/s (open loop, as steps keep arriving):
+
+    healthy   no faults
+    tail      --tail-rate of requests take --tail-s longer (hedging after p95)
+    errors    --error-rate of requests fail with 503 (jittered retries)
+    outage    the detector hangs for the middle third of the run, then recovers (circuit breaker)
+
+    python -m bench.resilience --calls 300 --rate 50 --out bench_resilience.json
+"""
+import argparse
+import asyncio
+import json
+import sys
+import time
+
+import numpy as np
+import requests
+
+from app.services import executors, resilience
+from bench.fakes import FaultInjector, ServiceThread, create_stub_detector_app
+
+FRAME = np.zeros((640, 640, 3), dtype=np.uint8).tobytes()
+
+def _post(url: str, timeout: float) -> requests.Response:
+    return requests.post(f"{url}/detect_coordinates_raw", params={"orig_w": 1920, "orig_h": 1080, "target_text": "Save"},
+                         headers={"Content-Type": "application/octet-stream"}, data=FRAME, timeout=timeout)
+
+def _service(mode: str, timeout: float, args) -> resilience.ResilientService:
+    if mode == "fixed":
+        service = resilience.ResilientService(f"bench_{mode}", timeout, retries=0, hedge=False)
+        service.breaker.threshold = float("inf")
+        service.latency.percentile = lambda q: None  # Always the configured timeout
+        return service
+    service = resilience.ResilientService(f"bench_{mode}", timeout)
+    service.breaker.cooldown_s = args.cooldown_s
+    return service
+
+async def run_scenario(scenario: str, mode: str, url: str, faults: FaultInjector, args):
+    faults.configure(error_rate=0.0, slow_rate=0.0, slow_s=0.0, down=False)
+    if scenario == "tail":
+        faults.configure(slow_rate=args.tail_rate, slow_s=args.tail_s)
+    elif scenario == "errors":
+        faults.configure(error_rate=args.error_rate)
+    service = _service(mode, args.timeout, args)
+    latencies, outcomes = [], {"ok": 0, "degraded": 0}
+    run_s = args.calls / args.rate
+
+    async def one_call(index: int):
+        await asyncio.sleep(index / args.rate)
+        if scenario == "outage":
+            # Requests arriving in the middle third of the run hang (longer than any timeout)
+            hanging = run_s / 3 <= index / args.rate < 2 * run_s / 3
+            faults.configure(slow_rate=1.0 if hanging else 0.0, slow_s=args.timeout * 2)
+        start = time.perf_counter()
+        try:
+            response = await service.call(lambda timeout: _post(url, timeout))
+            outcomes["ok" if response.status_code == 200 else "degraded"] += 1
+        except resilience.ServiceUnavailable:
+            outcomes["degraded"] += 1
+        latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one_call(i) for i in range(args.calls)))
+    wall_s = time.perf_counter() - start
+    values = np.array(latencies) * 1000
+    return {"scenario": scenario, "mode": mode, "wall_s": round(wall_s, 2), **outcomes,
+            "p50_ms": round(float(np.percentile(values, 50)), 1), "p95_ms": round(float(np.percentile(values, 95)), 1),
+            "p99_ms": round(float(np.percentile(values, 99)), 1), "max_ms": round(float(values.max()), 1),
+            "service": service.stats()}
+
+async def main(args):
+    faults = FaultInjector(seed=args.seed)
+    results = []
+    with ServiceThread(create_stub_detector_app(args.latency_ms / 1000, faults)) as detector:
+        for scenario in args.scenarios:
+            for mode in ("fixed", "resilient"):
+                result = await run_scenario(scenario, mode, detector.url, faults, args)
+                results.append(result)
+                print(f"{scenario:>8} {mode:>9}: ok {result['ok']:>4}, degraded {result['degraded']:>4}, "
+                      f"p50 {result['p50_ms']:>7.1f} ms, p99 {result['p99_ms']:>8.1f} ms, wall {result['wall_s']:>6.2f}s",
+                      file=sys.stderr)
+    executors.shutdown()
+    return {"benchmark": "resilience", "calls": args.calls, "rate": args.rate, "results": results}
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenarios", nargs="+", default=["healthy", "tail", "errors", "outage"])
+    parser.add_argument("--calls", type=int, default=300)
+    parser.add_argument("--rate", type=float, default=50.0, help="Calls issued per second")
+    parser.add_argument("--latency-ms", type=float, default=30.0, help="Stub detector latency")
+    parser.add_argument("--timeout", type=float, default=5.0, help="Configured (maximum) timeout, s")
+    parser.add_argument("--tail-rate", type=float, default=0.02)
+    parser.add_argument("--tail-s", type=float, default=1.0)
+    parser.add_argument("--error-rate", type=float, default=0.2)
+    parser.add_argument("--cooldown-s", type=float, default=1.0, help="Circuit breaker cooldown (scaled down from 30 s)")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--out", default=None, help="Write the JSON report here (default: stdout)")
+    args = parser.parse_args()
+    report = asyncio.run(main(args))
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(report, f, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
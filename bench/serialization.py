@@ -0,0 +1,104 @@
+"""
+JSON fast path (app/services/serialization.py) vs. the previous calls, on large pathways, with
+schema parity checks: each pair must produce identical bytes (encoders) or equal models (decoders).
+
+    pathway_encode   pathway.model_dump_json(indent=2)         vs dumps(store.to_dict(header), indent=True)
+    trusted_decode   Pathway.model_validate_json(bytes)        vs construct(Pathway, loads(bytes))  (checkpoint restore)
+    index_record     json.dumps(record).encode() (512-D vector) vs dumps(record)
+    diff_encode      json.dumps(diff, indent=2)                vs dumps(diff, indent=True)
+    task_payload     TaskPayload.model_validate(json.loads(..)) vs TaskPayload.model_validate(loads(..))
+
+    python -m bench.serialization --nodes 1000 5000
+"""
+import argparse
+import json
+import sys
+import time
+
+import numpy as np
+
+from app.schema import Pathway, TaskPayload, TelemetryContext
+from app.services import serialization
+from app.services.diff import diff_pathways
+from app.services.index import summarize_pathway
+from app.services.nodestore import NodeStore, VECTOR_DIM
+from app.services.serialization import construct, dumps, loads
+from bench.node_store import HEADER, make_steps
+
+def make_store(n: int) -> NodeStore:
+    store = NodeStore(n, dict(HEADER))
+    for step in make_steps(n):
+        store.append(step["timestamp"], step["timestamp"] + 1.0, step["description"], step["target_text"],
+                     step["ui_region"], step["confidence"], step["confidence"], step["action_type"],
+                     step["description"], step["keyframe_hash"])
+    store.set_telemetry(TelemetryContext(sensor_id="DED-Robot-Arm-01", machine_state="ACTIVE_PRINTING", ambient_temp_c=24.5))
+    store.set_vector(np.random.default_rng(1).standard_normal(VECTOR_DIM).astype(np.float32))
+    store.mark_degraded("detector_failed", rows=[0])
+    return store
+
+def timed(fn, repeats: int):
+    best, result = None, None
+    for _ in range(repeats):
+        start = time.perf_counter()
+        result = fn()
+        elapsed = (time.perf_counter() - start) * 1000.0
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+def cases(n: int):
+    store = make_store(n)
+    pathway = store.to_pathway()
+    pathway.metadata["degraded"] = {"detector_failed": 1}
+    header = pathway.model_dump(exclude={"nodes"})
+    data = pathway.model_dump_json(indent=2).encode("utf-8")
+
+    # A re-recording with every fifth step changed, for the diff artifact
+    changed = NodeStore.from_pathway(pathway)
+    changed.descriptions[::5] = [f"{d} (revised)" for d in changed.descriptions[::5]]
+    diff = diff_pathways(pathway, changed.to_pathway())
+
+    record = summarize_pathway(pathway.model_dump(exclude={"nodes"}) | {"nodes": [{"action_type": a} for a in store.action_types]},
+                               "bench-task", "gs://bench/bench-task/pathway.json")
+    record["temporal_context_vector"] = store.vectors[0].tolist()
+    payload = json.dumps({"task_id": "bench-task", "client_id": "bench", "gcs_uri": "gs://bench/in.mp4",
+                          "output_bucket": "bench-out", "config": {"prior_pathway_uri": "gs://bench/prior/pathway.json"}}).encode()
+
+    return [
+        ("pathway_encode", lambda: pathway.model_dump_json(indent=2).encode("utf-8"),
+         lambda: dumps(store.to_dict(header), indent=True), "bytes"),
+        ("trusted_decode", lambda: Pathway.model_validate_json(data), lambda: construct(Pathway, loads(data)), "model"),
+        ("index_record", lambda: json.dumps(record).encode("utf-8"), lambda: dumps(record), "json"),
+        ("diff_encode", lambda: json.dumps(diff, indent=2).encode("utf-8"), lambda: dumps(diff, indent=True), "json"),
+        ("task_payload", lambda: TaskPayload.model_validate(json.loads(payload.decode("utf-8"))),
+         lambda: TaskPayload.model_validate(loads(payload)), "model"),
+    ]
+
+def _parity(kind: str, baseline, fast) -> bool:
+    if kind == "bytes":
+        return baseline == fast
+    if kind == "model":
+        return baseline == fast and baseline.model_dump_json() == fast.model_dump_json()
+    return json.loads(baseline) == loads(fast)  # Same document (stdlib json escapes non-ASCII, orjson writes UTF-8)
+
+def main(node_counts, repeats: int):
+    results = []
+    for n in node_counts:
+        for name, baseline_fn, fast_fn, kind in cases(n):
+            baseline_ms, baseline = timed(baseline_fn, repeats)
+            fast_ms, fast = timed(fast_fn, repeats)
+            result = {"nodes": n, "case": name, "baseline_ms": round(baseline_ms, 3), "fast_ms": round(fast_ms, 3),
+                      "speedup": round(baseline_ms / fast_ms, 1), "parity": _parity(kind, baseline, fast)}
+            results.append(result)
+            print(f"{n:>6} nodes | {name:<14} baseline {baseline_ms:>9.2f}ms  fast {fast_ms:>9.2f}ms "
+                  f"({result['speedup']:>5.1f}x)  parity {result['parity']}", file=sys.stderr)
+    return {"benchmark": "serialization", "backend": serialization.JSON_BACKEND, "results": results}
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--nodes", type=int, nargs="+", default=[1000, 5000])
+    parser.add_argument("--repeats", type=int, default=3)
+    args = parser.parse_args()
+    report = main(args.nodes, args.repeats)
+    print(json.dumps(report, indent=2))
+    if not all(result["parity"] for result in report["results"]):
+        sys.exit(1)
@@ -0,0 +1,63 @@
+"""
+Telemetry join benchmark: one IoT request per node (what per-node state would cost with the V6 baseline)
+vs. one bulk window fetch + vectorized TelemetryBuffer join.
+The fake hub adds --latency-ms per request to stand in for the network round trip.
+
+Usage (from the repo root):
+    python -m bench.telemetry_join --nodes 100 1000 10000
+"""
+import argparse
+import json
+import time
+import numpy as np
+
+from app.services.nodestore import NodeStore
+from app.services.telemetry import FakeTelemetryHub, TelemetryBuffer, TELEMETRY_WINDOW_PAD_S
+
+START = 1_700_000_000.0
+
+def make_store(n: int, duration_s: float) -> NodeStore:
+    store = NodeStore(n)
+    for t in np.sort(np.random.default_rng(0).uniform(0, duration_s, n)):
+        store.append(float(t), float(t) + 1.0, "step", "target", [0, 0, 1, 1], 0.5)
+    return store
+
+def per_node(hub: FakeTelemetryHub, store: NodeStore, latency_s: float) -> float:
+    start = time.perf_counter()
+    for i in range(len(store)):
+        t = START + store.timestamps[i, 0]
+        time.sleep(latency_s)
+        sample = hub.fetch("DED-Robot-Arm-01", t, t)[0]
+        store.telemetry_state[i] = sample["machine_state"]
+        store.telemetry_temp[i] = sample["ambient_temp_c"]
+    return time.perf_counter() - start
+
+def bulk(hub: FakeTelemetryHub, store: NodeStore, latency_s: float) -> float:
+    start = time.perf_counter()
+    step_times = START + store.timestamps[:len(store), 0]
+    time.sleep(latency_s)
+    samples = hub.fetch("DED-Robot-Arm-01", step_times.min() - TELEMETRY_WINDOW_PAD_S, step_times.max() + TELEMETRY_WINDOW_PAD_S)
+    buffer = TelemetryBuffer.from_samples("DED-Robot-Arm-01", samples)
+    temps, codes = buffer.sample_at(step_times)
+    store.assign_telemetry(buffer.sensor_id, buffer.states, codes, temps)
+    return time.perf_counter() - start
+
+def main(node_counts: list, latency_ms: float, duration_s: float, as_json: bool):
+    hub = FakeTelemetryHub()
+    for n in node_counts:
+        store = make_store(n, duration_s)
+        results = {"per_node_s": per_node(hub, store, latency_ms / 1000.0), "bulk_s": bulk(hub, store, latency_ms / 1000.0)}
+        if as_json:
+            print(json.dumps({"nodes": n, "latency_ms": latency_ms, **{k: round(v, 4) for k, v in results.items()}}))
+        else:
+            print(f"{n:>6} nodes | per-node {results['per_node_s']:>8.3f}s | bulk {results['bulk_s'] * 1000:>7.2f}ms "
+                  f"| {results['per_node_s'] / results['bulk_s']:.0f}x")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--nodes", type=int, nargs="+", default=[100, 1000, 10000])
+    parser.add_argument("--latency-ms", type=float, default=1.0)
+    parser.add_argument("--duration-s", type=float, default=3600.0, help="Video length the steps are spread over")
+    parser.add_argument("--json", action="store_true")
+    args = parser.parse_args()
+    main(args.nodes, args.latency_ms, args.duration_s, args.json)
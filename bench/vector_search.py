@@ -0,0 +1,101 @@
+"""
+Vector search benchmark: exact flat search vs. IVF-PQ over synthetic 512-D temporal context vectors.
+Vectors are drawn around "workflow" centres (re-recordings of the same SOP are close), grouped
+into families (related SOPs in one vertical), so neighbours beyond the same workflow are meaningful;
+written to a memmap index in a temp directory, then queried with held-out perturbed vectors.
+Recall@k is measured against the flat index's exact answers.
+
+Usage (from the repo root):
+    python -m bench.vector_search --sizes 10000 100000 1000000
+    python -m bench.vector_search --sizes 100000 --nprobe 8 16 32 --json
+(1M x 512 float32 is 2 GB on disk; IVF-PQ training samples 100k of them.)
+"""
+import argparse
+import json
+import shutil
+import tempfile
+import time
+import numpy as np
+
+from app.services.vectors import FlatVectorIndex, IVFPQIndex, VECTOR_DIM
+
+def workflow_centres(rng: np.random.Generator, workflows: int, families: int) -> np.ndarray:
+    family = rng.standard_normal((families, VECTOR_DIM)).astype(np.float32)
+    return family[rng.integers(0, families, workflows)] + 0.7 * rng.standard_normal((workflows, VECTOR_DIM)).astype(np.float32)
+
+def synthetic(rng: np.random.Generator, centres: np.ndarray, n: int, noise: float) -> np.ndarray:
+    picks = rng.integers(0, len(centres), n)
+    return centres[picks] + noise * rng.standard_normal((n, centres.shape[1])).astype(np.float32)
+
+def build(directory: str, n: int, rng: np.random.Generator, centres: np.ndarray, noise: float, chunk: int = 50_000) -> float:
+    index = FlatVectorIndex(directory)
+    start = time.perf_counter()
+    for offset in range(0, n, chunk):
+        size = min(chunk, n - offset)
+        index.add([f"task-{offset + i}" for i in range(size)], synthetic(rng, centres, size, noise))
+    return time.perf_counter() - start
+
+def recall(truth, found) -> float:
+    hits = sum(len({i for i, _ in t} & {i for i, _ in f}) for t, f in zip(truth, found))
+    return hits / max(1, sum(len(t) for t in truth))
+
+def timed(fn, queries, batch: int):
+    """Mean per-query latency when queries are sent `batch` at a time."""
+    results = []
+    start = time.perf_counter()
+    for offset in range(0, len(queries), batch):
+        results.extend(fn(queries[offset:offset + batch]))
+    return results, (time.perf_counter() - start) / len(queries)
+
+def run(n: int, args) -> list:
+    rng = np.random.default_rng(0)
+    centres = workflow_centres(rng, max(1, n // args.per_workflow), args.families)
+    directory = tempfile.mkdtemp(prefix="tbd_vectors_")
+    rows = []
+    try:
+        build_s = build(directory, n, rng, centres, args.noise)
+        flat = FlatVectorIndex(directory)  # reopen from disk, as the indexer does on restart
+        queries = synthetic(rng, centres, args.queries, args.noise)
+
+        truth, single_s = timed(lambda q: flat.search(q, args.k), queries, 1)
+        _, batch_s = timed(lambda q: flat.search(q, args.k), queries, args.batch)
+        rows.append({"vectors": n, "mode": "flat", "build_s": round(build_s, 2), "recall": 1.0,
+                     "latency_ms": round(single_s * 1000, 3), "batched_latency_ms": round(batch_s * 1000, 3)})
+
+        ivf = IVFPQIndex(flat)
+        start = time.perf_counter()
+        ivf.train()
+        train_s = time.perf_counter() - start
+        for nprobe in args.nprobe:
+            for rerank in (0, args.rerank):
+                found, latency = timed(lambda q: ivf.search(q, args.k, nprobe=nprobe, rerank=rerank), queries, 1)
+                rows.append({"vectors": n, "mode": f"ivfpq nprobe={nprobe} rerank={rerank}", "build_s": round(train_s, 2),
+                             "recall": round(recall(truth, found), 4), "latency_ms": round(latency * 1000, 3),
+                             "batched_latency_ms": None})
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+    return rows
+
+def main(args):
+    for n in args.sizes:
+        for row in run(n, args):
+            if args.json:
+                print(json.dumps(row))
+            else:
+                batched = f"{row['batched_latency_ms']:>8.3f}ms" if row["batched_latency_ms"] is not None else " " * 10
+                print(f"{row['vectors']:>8} | {row['mode']:<28} | build/train {row['build_s']:>7.2f}s "
+                      f"| recall@{args.k} {row['recall']:.3f} | {row['latency_ms']:>8.3f}ms/query | batched {batched}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--batch", type=int, default=64, help="Queries per matrix product in the batched flat run")
+    parser.add_argument("--nprobe", type=int, nargs="+", default=[8, 32])
+    parser.add_argument("--rerank", type=int, default=4, help="Exact re-ranking of k * rerank ADC candidates")
+    parser.add_argument("--per-workflow", type=int, default=20, help="Recordings per synthetic workflow centre")
+    parser.add_argument("--families", type=int, default=200, help="Workflow families (clusters of related workflows)")
+    parser.add_argument("--noise", type=float, default=0.4)
+    parser.add_argument("--json", action="store_true")
+    main(parser.parse_args())
@@ -0,0 +1,57 @@
+"""
+Synthetic task videos for benchmarks: one distinct "screen" per step (a window with a labelled
+button at a different position), so keyframe hashes, frame seeks and detector calls behave like
+a real screen recording. Returns the ground-truth steps for the canned Gemini responder.
+"""
+import os
+import shutil
+import subprocess
+from typing import List, Dict, Any, Tuple
+
+import cv2
+import numpy as np
+
+ACTION_TYPES = ["click", "type", "scroll", "click", "navigation"]
+
+def make_video(path: str, duration_s: float, steps: int, fps: int = 10,
+               size: Tuple[int, int] = (1280, 720), with_audio: bool = True) -> List[Dict[str, Any]]:
+    width, height = size
+    rng = np.random.default_rng(steps * 1000 + int(duration_s))
+    step_times = np.linspace(0.5, max(duration_s - 0.5, 0.5), steps)
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*"mp4v"), fps, size)
+
+    script, frames = [], []
+    for i, t in enumerate(step_times):
+        frame = np.full((height, width, 3), 235, dtype=np.uint8)
+        x, y = int(rng.integers(40, width - 340)), int(rng.integers(80, height - 120))
+        colour = tuple(int(c) for c in rng.integers(40, 200, 3))
+        cv2.rectangle(frame, (0, 0), (width, 48), colour, -1)
+        cv2.rectangle(frame, (x, y), (x + 300, y + 60), (60, 60, 60), 2)
+        label = f"Button {i + 1}"
+        cv2.putText(frame, label, (x + 20, y + 40), cv2.FONT_HERSHEY_SIMPLEX, 1.0, (20, 20, 20), 2)
+        frames.append(frame)
+        script.append({
+            "timestamp": round(float(t), 2),
+            "action_type": ACTION_TYPES[i % len(ACTION_TYPES)],
+            "target_text": label,
+            "description": f"Step {i + 1}: the user selects '{label}' to continue the procedure.",
+        })
+
+    # Each screen is shown from its step time until the next step
+    bounds = np.concatenate([[0.0], (step_times[:-1] + step_times[1:]) / 2, [duration_s]])
+    for i, frame in enumerate(frames):
+        for _ in range(int(round((bounds[i + 1] - bounds[i]) * fps))):
+            writer.write(frame)
+    writer.release()
+
+    # A silent audio track makes the worker's ffmpeg extraction do real work (skipped without ffmpeg)
+    if with_audio and shutil.which("ffmpeg"):
+        muxed = f"{path}.audio.mp4"
+        result = subprocess.run(
+            ["ffmpeg", "-y", "-loglevel", "error", "-i", path, "-f", "lavfi", "-i", "anullsrc=r=16000:cl=mono",
+             "-shortest", "-c:v", "copy", "-c:a", "aac", muxed],
+            capture_output=True,
+        )
+        if result.returncode == 0:
+            os.replace(muxed, path)
+    return script
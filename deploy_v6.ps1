@@ -11,6 +11,7 @@ $WORKER_SERVICE = "tbd-worker"
 $DISPATCHER_SERVICE = "tbd-dispatcher"
 $ENCODER_SERVICE = "tbd-temporal-encoder"
 $DETECTOR_SERVICE = "tbd-object-detector"
+$INDEXER_SERVICE = "tbd-indexer"
 
 # Identity
 $WORKER_SA_EMAIL = "tbd-worker-sa@$PROJECT_ID.iam.gserviceaccount.com"
@@ -38,14 +39,36 @@ $IMAGE_URI = "$REGION-docker.pkg.dev/$PROJECT_ID/tbd-repo/$IMAGE_NAME`:$TAG"
 gcloud builds submit . --tag $IMAGE_URI
 
 # 3. Deploy Dispatcher (Service A)
+# Task status lives in Firestore (TASK_STORE=firestore): every instance serves /tasks/{id} and the SSE
+# stream, and the state survives restarts and redeploys. The dispatcher scales out like any stateless service.
+$TASK_STATUS_TOPIC = "tbd-task-status"
+$TASK_EVENTS_TOKEN = [guid]::NewGuid().ToString("N")
+$DISPATCHER_SA_EMAIL = "tbd-dispatcher-sa@$PROJECT_ID.iam.gserviceaccount.com"
+$INPUT_BUCKET = "tbd-input-$PROJECT_ID"  # Must match the frontend's gcp.input_bucket secret
+
+# Direct uploads: the dispatcher signs resumable URLs through IAM (signBlob on itself) and composes the parts;
+# browsers PUT to the bucket cross-origin and read the session's Location header
+gcloud iam service-accounts add-iam-policy-binding $DISPATCHER_SA_EMAIL `
+    --member="serviceAccount:$DISPATCHER_SA_EMAIL" --role="roles/iam.serviceAccountTokenCreator"
+gcloud storage buckets add-iam-policy-binding "gs://$INPUT_BUCKET" `
+    --member="serviceAccount:$DISPATCHER_SA_EMAIL" --role="roles/storage.objectAdmin"
+gcloud services enable firestore.googleapis.com
+gcloud firestore databases create --location=$REGION 2>$null  # (default) database, Native mode; no-op if it exists
+gcloud projects add-iam-policy-binding $PROJECT_ID `
+    --member="serviceAccount:$DISPATCHER_SA_EMAIL" --role="roles/datastore.user"
+'[{"origin": ["*"], "method": ["PUT", "POST"], "responseHeader": ["Content-Type", "Content-Range", "Range", "Location", "x-goog-resumable"], "maxAgeSeconds": 3600}]' | Out-File -Encoding ascii upload_cors.json
+gcloud storage buckets update "gs://$INPUT_BUCKET" --cors-file=upload_cors.json
+Remove-Item upload_cors.json
+
 Write-Host "`n--- Deploying Service A (Dispatcher) ---" -ForegroundColor Cyan
 gcloud run deploy $DISPATCHER_SERVICE `
     --image $IMAGE_URI `
     --region $REGION `
-    --service-account "tbd-dispatcher-sa@$PROJECT_ID.iam.gserviceaccount.com" `
+    --service-account $DISPATCHER_SA_EMAIL `
     --allow-unauthenticated `
     --memory 1Gi `
-    --set-env-vars "SERVICE_TYPE=dispatcher,GCP_PROJECT_ID=$PROJECT_ID"
+    --timeout 3600 `
+    --set-env-vars "SERVICE_TYPE=dispatcher,GCP_PROJECT_ID=$PROJECT_ID,TASK_EVENTS_TOKEN=$TASK_EVENTS_TOKEN,UPLOAD_BUCKET=$INPUT_BUCKET,TASK_STORE=firestore"
 
 # 4. Deploy Worker (Service B) - The Brain
 Write-Host "`n--- Deploying Service B (Worker) ---" -ForegroundColor Cyan
@@ -58,7 +81,8 @@ gcloud run deploy $WORKER_SERVICE `
     --memory 4Gi `
     --cpu 2 `
     --timeout 3600 `
-    --set-env-vars "SERVICE_TYPE=worker,GCP_PROJECT_ID=$PROJECT_ID,TEMPORAL_ENCODER_URL=$ENCODER_URL,OBJECT_DETECTOR_URL=$DETECTOR_URL"
+    --concurrency 6 `
+    --set-env-vars "SERVICE_TYPE=worker,GCP_PROJECT_ID=$PROJECT_ID,TEMPORAL_ENCODER_URL=$ENCODER_URL,OBJECT_DETECTOR_URL=$DETECTOR_URL,MAX_CONCURRENT_TASKS=4,MAX_TASK_ATTEMPTS=3,DEAD_LETTER_TOPIC=tbd-dead-letter"
 
 # 5. Setup Pub/Sub Trigger
 Write-Host "`n--- Linking Pub/Sub to Worker ---" -ForegroundColor Cyan
@@ -69,17 +93,63 @@ $SUB_SA = "tbd-sub-invoker@$PROJECT_ID.iam.gserviceaccount.com"
 # Allow Pub/Sub to invoke Worker
 gcloud run services add-iam-policy-binding $WORKER_SERVICE --region $REGION --member="serviceAccount:$SUB_SA" --role="roles/run.invoker"
 
+# Dead-letter topic: the worker publishes a diagnostic record there for tasks it gives up on (and acks them);
+# Pub/Sub forwards the raw message itself after --max-delivery-attempts (a worker that keeps crashing)
+$DEAD_LETTER_TOPIC = "tbd-dead-letter"
+gcloud pubsub topics create $DEAD_LETTER_TOPIC 2>$null
+gcloud pubsub subscriptions create tbd-dead-letter-sub --topic $DEAD_LETTER_TOPIC --message-retention-duration=7d 2>$null
+$PROJECT_NUMBER = gcloud projects describe $PROJECT_ID --format 'value(projectNumber)'
+$PUBSUB_AGENT = "service-$PROJECT_NUMBER@gcp-sa-pubsub.iam.gserviceaccount.com"
+gcloud pubsub topics add-iam-policy-binding $DEAD_LETTER_TOPIC --member="serviceAccount:$PUBSUB_AGENT" --role="roles/pubsub.publisher"
+gcloud pubsub subscriptions add-iam-policy-binding tbd-worker-sub --member="serviceAccount:$PUBSUB_AGENT" --role="roles/pubsub.subscriber"
+
 # Update Subscription
+# Deferred tasks (429 from admission control) are nacked and redelivered with this backoff.
+# The dead-letter policy also makes Pub/Sub send deliveryAttempt, which the worker caps at MAX_DELIVERY_ATTEMPTS (20).
 gcloud pubsub subscriptions update tbd-worker-sub `
     --push-endpoint=$WORKER_URL `
-    --push-auth-service-account=$SUB_SA
+    --push-auth-service-account=$SUB_SA `
+    --min-retry-delay=30s `
+    --max-retry-delay=600s `
+    --dead-letter-topic=$DEAD_LETTER_TOPIC `
+    --max-delivery-attempts=25
+
+# Worker phase updates -> dispatcher (token in the URL; the dispatcher allows unauthenticated calls)
+$DISPATCHER_URL = gcloud run services describe $DISPATCHER_SERVICE --region $REGION --format 'value(status.url)'
+gcloud pubsub topics create $TASK_STATUS_TOPIC 2>$null
+gcloud pubsub subscriptions create tbd-task-status-sub --topic $TASK_STATUS_TOPIC 2>$null
+gcloud pubsub subscriptions update tbd-task-status-sub `
+    --push-endpoint="$DISPATCHER_URL/task-events?token=$TASK_EVENTS_TOKEN"
+
+# 6. Deploy Indexer (Service E) - Pathway metadata index
+# Single instance: the SQLite index lives on the instance and is backfilled from the bucket on start.
+Write-Host "`n--- Deploying Service E (Indexer) ---" -ForegroundColor Cyan
+$INDEX_TOPIC = "tbd-pathway-index"
+$OUTPUT_BUCKET = "tbd-output-$PROJECT_ID"  # Must match the frontend's gcp.output_bucket secret
+gcloud run deploy $INDEXER_SERVICE `
+    --image $IMAGE_URI `
+    --region $REGION `
+    --service-account $WORKER_SA_EMAIL `
+    --no-allow-unauthenticated `
+    --memory 1Gi `
+    --min-instances 1 `
+    --max-instances 1 `
+    --set-env-vars "SERVICE_TYPE=indexer,GCP_PROJECT_ID=$PROJECT_ID,INDEX_BACKFILL_BUCKET=$OUTPUT_BUCKET"
+
+$INDEXER_URL = gcloud run services describe $INDEXER_SERVICE --region $REGION --format 'value(status.url)'
+gcloud run services add-iam-policy-binding $INDEXER_SERVICE --region $REGION --member="serviceAccount:$SUB_SA" --role="roles/run.invoker"
+gcloud pubsub topics create $INDEX_TOPIC 2>$null
+gcloud pubsub subscriptions create tbd-indexer-sub --topic $INDEX_TOPIC `
+    --push-endpoint=$INDEXER_URL `
+    --push-auth-service-account=$SUB_SA 2>$null
 
 Write-Host "`n========================================================" -ForegroundColor Green
 Write-Host "   V6 MASTER ACTIVATION COMPLETE"
 Write-Host "========================================================" -ForegroundColor Green
-Write-Host "Dispatcher : $(gcloud run services describe $DISPATCHER_SERVICE --region $REGION --format 'value(status.url)')"
+Write-Host "Dispatcher : $DISPATCHER_URL"
 Write-Host "Worker     : $WORKER_URL"
 Write-Host "Encoder    : $ENCODER_URL"
 Write-Host "Detector   : $DETECTOR_URL"
+Write-Host "Indexer    : $INDEXER_URL"
 Write-Host "Status     : FULLY INTEGRATED"
 Write-Host "========================================================" -ForegroundColor Green
\ No newline at end of file
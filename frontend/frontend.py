@@ -1,6 +1,6 @@
 import streamlit as st
+import streamlit.components.v1 as components
 import requests
-import time
 import uuid
 import json
 import os
@@ -78,87 +78,83 @@ else:
 # --- Main Workflow ---
 col1, col2 = st.columns(2)
 
+if 'task_id' not in st.session_state:
+    st.session_state.task_id = str(uuid.uuid4())
+task_id = st.session_state.task_id
+
 with col1:
-    st.subheader("1. Upload Video")
-    uploaded_file = st.file_uploader("Choose an MP4 video", type=["mp4"])
-
-    if uploaded_file:
-        if 'task_id' not in st.session_state:
-            st.session_state.task_id = str(uuid.uuid4())
-        
-        task_id = st.session_state.task_id
-        st.info(f"Session Task ID: {task_id}")
-
-        if st.button("Upload to GCS"):
-            try:
-                bucket = storage_client.bucket(INPUT_BUCKET_NAME)
-                blob_name = f"{task_id}/{uploaded_file.name}"
-                blob = bucket.blob(blob_name)
-                
-                with st.spinner("Uploading video to GCS..."):
-                    blob.upload_from_file(uploaded_file, content_type="video/mp4")
-                
-                gcs_uri = f"gs://{INPUT_BUCKET_NAME}/{blob_name}"
-                st.session_state.gcs_uri = gcs_uri
-                st.success(f"Uploaded to: {gcs_uri}")
-            except Exception as e:
-                st.error(f"Upload Failed: {e}")
+    st.subheader("1. Upload & Dispatch")
+    st.info(f"Session Task ID: {task_id}")
+    # The browser uploads the video in parallel parts straight to GCS (resumable URLs from the
+    # dispatcher) and submits the task when the parts are in; it never passes through Streamlit.
+    widget = open(os.path.join(os.path.dirname(__file__), "direct_upload.html")).read()
+    for key, value in {"dispatcher_url": DISPATCHER_URL.rstrip('/'), "task_id": task_id,
+                       "client_id": "streamlit-cloud-console", "output_bucket": OUTPUT_BUCKET_NAME}.items():
+        widget = widget.replace("{{" + key + "}}", value)
+    components.html(widget, height=140)
 
 with col2:
-    st.subheader("2. Dispatch Task")
-    if 'gcs_uri' in st.session_state:
-        st.write(f"**Target Video:** {st.session_state.gcs_uri}")
-        
-        if st.button("Submit to Dispatcher API"):
-            payload = {
-                "task_id": st.session_state.task_id,
-                "client_id": "streamlit-cloud-console",
-                "gcs_uri": st.session_state.gcs_uri,
-                "output_bucket": OUTPUT_BUCKET_NAME
-            }
-            
-            try:
-                with st.spinner("Contacting Dispatcher..."):
-                    # Strip any trailing slash from the URL just in case
-                    base_url = DISPATCHER_URL.rstrip('/')
-                    api_url = f"{base_url}/submit"
-                    response = requests.post(api_url, json=payload, timeout=10)
-                    
-                    if response.status_code == 202:
-                        st.success("Task Accepted (202)")
-                        st.json(response.json())
-                        st.session_state.job_running = True
-                    else:
-                        st.error(f"Error {response.status_code}: {response.text}")
-            except Exception as e:
-                st.error(f"API Request Failed: {e}")
+    st.subheader("2. Follow Task")
+    st.write("Once the upload widget reports the task as submitted, follow its progress here.")
+    if st.button("Follow Task"):
+        st.session_state.job_running = True
+    if st.button("New Task"):
+        for key in ("task_id", "job_running", "pathway_uri"):
+            st.session_state.pop(key, None)
+        st.rerun()
 
 # --- Results Section ---
 st.divider()
 st.subheader("3. Await Results")
 
+def stream_task_status(task_id):
+    """Yields status records from the dispatcher's server-sent event stream (ends at uploaded/failed)."""
+    url = f"{DISPATCHER_URL.rstrip('/')}/tasks/{task_id}/events"
+    # Read timeout > the server's 15 s keepalive, so a silent stream means a dead connection
+    with requests.get(url, stream=True, timeout=(10, 60)) as response:
+        response.raise_for_status()
+        for line in response.iter_lines(decode_unicode=True):
+            if line and line.startswith("data: "):
+                yield json.loads(line[len("data: "):])
+
+@st.cache_data
+def download_pathway(pathway_uri):
+    # One download, once the worker has reported the upload (cached across reruns)
+    bucket_name, blob_name = pathway_uri[len("gs://"):].split("/", 1)
+    return storage_client.bucket(bucket_name).blob(blob_name).download_as_text()
+
+def show_result(pathway_uri):
+    json_data = download_pathway(pathway_uri)
+    st.download_button("Download JSON", json_data, "pathway.json", "application/json")
+    with st.expander("View Raw JSON"):
+        st.code(json_data, language='json')
+
 if 'job_running' in st.session_state and st.session_state.job_running:
-    result_blob_name = f"{st.session_state.task_id}/pathway.json"
-    
-    if st.button("Check for Result Now"):
-        try:
-            bucket = storage_client.bucket(OUTPUT_BUCKET_NAME)
-            blob = bucket.blob(result_blob_name)
-            # exists() does a metadata check which might fail with Object Admin role
-            # Try reloading the blob instead
-            try:
-                blob.reload()
-                exists = True
-            except:
-                exists = False
-                
-            if exists:
-                st.success("Result Found!")
-                json_data = blob.download_as_text()
-                st.download_button("Download JSON", json_data, "pathway.json", "application/json")
-                with st.expander("View Raw JSON"):
-                    st.code(json_data, language='json')
-            else:
-                st.warning("Result not yet available. The Worker is likely still processing.")
-        except Exception as e:
-            st.error(f"Check Failed: {e}")
\ No newline at end of file
+    progress = st.progress(0.0, text="Waiting for the worker...")
+    record = None
+    try:
+        for record in stream_task_status(task_id):
+            detail = record.get("detail") or {}
+            text = record["phase"].capitalize()
+            if record["phase"] == "refining" and detail.get("steps"):
+                text += f" ({detail.get('done', 0)}/{detail['steps']} steps)"
+            progress.progress(record.get("progress") or 0.0, text=text)
+    except Exception as e:
+        st.warning(f"Live status unavailable ({e}).")
+        if st.button("Check Status"):
+            response = requests.get(f"{DISPATCHER_URL.rstrip('/')}/tasks/{task_id}", timeout=10)
+            record = response.json() if response.status_code == 200 else None
+            st.json(record or {"status": "unknown task"})
+
+    if record and record["phase"] == "uploaded":
+        st.success("Result Found!")
+        st.session_state.job_running = False
+        st.session_state.pathway_uri = record["detail"]["pathway_uri"]
+    elif record and record["phase"] == "failed":
+        st.error(f"Task failed: {record['detail'].get('error')}. Pub/Sub will retry it; reload to follow the retry.")
+
+if st.session_state.get('pathway_uri'):
+    try:
+        show_result(st.session_state.pathway_uri)
+    except Exception as e:
+        st.error(f"Download Failed: {e}")
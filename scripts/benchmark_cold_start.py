@@ -0,0 +1,113 @@
+"""
+Cold-start benchmark for the model services (Service C / Service D).
+Launches the service with uvicorn N times and measures time-to-live (/healthz),
+time-to-ready (/readyz) and the first real request, plus the service's own startup breakdown.
+
+Usage (from the repo root):
+    python scripts/benchmark_cold_start.py tbd-detector --runs 3
+    python scripts/benchmark_cold_start.py tbd-encoder --env INFERENCE_BACKEND=onnx
+"""
+import argparse
+import json
+import os
+import socket
+import subprocess
+import sys
+import time
+import numpy as np
+import requests
+
+SERVICES = {
+    "tbd-detector": {
+        "app": "detector_app.main:app",
+        "request": lambda base: requests.post(
+            f"{base}/detect_coordinates_raw",
+            params={"orig_w": 1920, "orig_h": 1080},
+            data=np.zeros((640, 640, 3), dtype=np.uint8).tobytes(),
+            headers={"Content-Type": "application/octet-stream"},
+            timeout=60,
+        ),
+    },
+    "tbd-encoder": {
+        "app": "encoder_app.main:app",
+        "request": lambda base: requests.post(
+            f"{base}/encode_sequence",
+            json={"sequence": ["User clicks File menu", "User selects Save As"]},
+            timeout=60,
+        ),
+    },
+}
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def _poll(url: str, deadline: float, interval: float = 0.05):
+    """Returns (seconds until 200, last response body) or (None, None) on timeout."""
+    while time.perf_counter() < deadline:
+        try:
+            response = requests.get(url, timeout=1)
+            if response.status_code == 200:
+                return time.perf_counter(), response.json()
+        except requests.RequestException:
+            pass
+        time.sleep(interval)
+    return None, None
+
+def run_once(service_dir: str, extra_env: dict, timeout: float) -> dict:
+    spec = SERVICES[os.path.basename(os.path.normpath(service_dir))]
+    port = _free_port()
+    base = f"http://127.0.0.1:{port}"
+    env = {**os.environ, **extra_env}
+
+    launched = time.perf_counter()
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", spec["app"], "--host", "127.0.0.1", "--port", str(port)],
+        cwd=service_dir, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    try:
+        deadline = launched + timeout
+        live_at, _ = _poll(f"{base}/healthz", deadline)
+        ready_at, ready_body = _poll(f"{base}/readyz", deadline)
+        if live_at is None or ready_at is None:
+            return {"error": f"service not ready within {timeout:.0f}s"}
+
+        request_start = time.perf_counter()
+        spec["request"](base).raise_for_status()
+        first_request_ms = (time.perf_counter() - request_start) * 1000.0
+
+        return {
+            "time_to_live_s": round(live_at - launched, 3),
+            "time_to_ready_s": round(ready_at - launched, 3),
+            "first_request_ms": round(first_request_ms, 2),
+            "backend": ready_body.get("backend"),
+            "variant": ready_body.get("variant"),
+            "startup": ready_body.get("startup", {}),
+        }
+    finally:
+        proc.terminate()
+        proc.wait(timeout=30)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("service_dir", help="tbd-detector or tbd-encoder")
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--timeout", type=float, default=300.0)
+    parser.add_argument("--env", action="append", default=[], help="KEY=VALUE passed to the service")
+    parser.add_argument("--json", action="store_true")
+    args = parser.parse_args()
+
+    extra_env = dict(item.split("=", 1) for item in args.env)
+    results = [run_once(args.service_dir, extra_env, args.timeout) for _ in range(args.runs)]
+
+    if args.json:
+        for r in results:
+            print(json.dumps({"service": args.service_dir, **extra_env, **r}))
+    else:
+        for i, r in enumerate(results, 1):
+            if "error" in r:
+                print(f"run {i}: FAILED ({r['error']})")
+                continue
+            print(f"run {i}: live {r['time_to_live_s']:.2f}s | ready {r['time_to_ready_s']:.2f}s | "
+                  f"first request {r['first_request_ms']:.0f}ms | {r['backend']}/{r['variant']} | {r['startup']}")
@@ -0,0 +1,121 @@
+"""
+Training-data pipeline benchmark for scripts/train_lstm.py.
+Compares the in-memory loader (load_and_preprocess_data) with the streaming tf.data pipeline on
+the same synthetic corpus: sequences/sec through one epoch of batches, and peak RSS. Each loader
+runs in its own subprocess so the peak-memory numbers are not polluted by the other.
+
+Usage (from the repo root):
+    python scripts/benchmark_training_data.py --sequences 200000
+    python scripts/benchmark_training_data.py --sequences 200000 --format tfrecord --json
+"""
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+SCRIPTS_DIR = os.path.dirname(os.path.abspath(__file__))
+VERBS = ["Click", "Select", "Open", "Type", "Right-click", "Drag", "Close", "Search for", "Enable", "Run"]
+OBJECTS = ["File menu", "Save button", "Desktop", "Start Menu", "Settings", "Control Panel", "sample tube",
+           "Background dropdown", "Network adapter", "template", "user account", "browser tab", "CMD"]
+
+def _memory_mb() -> dict:
+    """Current and peak RSS of this process (Linux /proc; falls back to ru_maxrss)."""
+    try:
+        with open("/proc/self/status") as f:
+            fields = dict(line.split(":", 1) for line in f if ":" in line)
+        return {"rss_mb": int(fields["VmRSS"].split()[0]) / 1024, "peak_rss_mb": int(fields["VmHWM"].split()[0]) / 1024}
+    except (OSError, KeyError):
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+        return {"rss_mb": peak, "peak_rss_mb": peak}
+
+def make_corpus(path: str, n_sequences: int, seed: int = 0):
+    """Synthetic action sequences shaped like build_training_dataset.py output (JSONL records, 3-20 steps)."""
+    rng = random.Random(seed)
+    with open(path, "w") as f:
+        for i in range(n_sequences):
+            steps = [f"{rng.choice(VERBS)} {rng.choice(OBJECTS)} {rng.randrange(500)}" for _ in range(rng.randint(3, 20))]
+            f.write(json.dumps({"domain": "bench", "checksum": str(i), "sequence": steps}) + "\n")
+
+def run_loader(loader: str, workdir: str, shard_glob: str):
+    """Child process: run one loader through a full epoch of batches and report throughput + memory."""
+    sys.path.insert(0, SCRIPTS_DIR)
+    os.chdir(workdir)  # both loaders write tokenizer.pickle to the cwd
+    import train_lstm
+    baseline = _memory_mb()  # TensorFlow itself, excluded from the delta
+
+    start = time.perf_counter()
+    n_sequences = 0
+    if loader == "legacy":
+        X, Y, _ = train_lstm.load_and_preprocess_data()
+        y_train = Y[:, -1]
+        for i in range(0, len(X), train_lstm.BATCH_SIZE):
+            batch_x, batch_y = X[i:i + train_lstm.BATCH_SIZE], y_train[i:i + train_lstm.BATCH_SIZE]
+            n_sequences += len(batch_x)
+    else:
+        paths = train_lstm.resolve_shards(shard_glob)
+        tokenizer = train_lstm.fit_tokenizer_streaming(paths)
+        for batch_x, batch_y in train_lstm.build_streaming_dataset(paths, tokenizer):
+            n_sequences += int(batch_x.shape[0])
+    elapsed = time.perf_counter() - start
+
+    peak = _memory_mb()["peak_rss_mb"]
+    print(json.dumps({
+        "sequences": n_sequences,
+        "seconds": round(elapsed, 2),
+        "sequences_per_s": round(n_sequences / elapsed, 1),
+        "peak_rss_mb": round(peak, 1),
+        "peak_over_runtime_mb": round(peak - baseline["rss_mb"], 1),
+    }))
+
+def main(n_sequences: int, n_shards: int, fmt: str, as_json: bool):
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        json_path = os.path.join(tmp, "v4_lstm_training_sequences.jsonl")
+        make_corpus(json_path, n_sequences)
+        shard_dir = os.path.join(tmp, "shards")
+        subprocess.run(
+            [sys.executable, os.path.join(SCRIPTS_DIR, "train_lstm.py"), "--write-shards", shard_dir,
+             "--num-shards", str(n_shards), "--format", fmt],
+            cwd=tmp, check=True, capture_output=True,
+        )
+        shard_glob = os.path.join(shard_dir, f"*.{fmt}")
+
+        for loader in ["legacy", "streaming"]:
+            proc = subprocess.run(
+                [sys.executable, __file__, "--child", loader, "--workdir", tmp, "--shard-glob", shard_glob],
+                capture_output=True, text=True,
+            )
+            if proc.returncode != 0:
+                results.append({"loader": loader, "error": proc.stderr.strip().splitlines()[-1:]})
+                continue
+            results.append({"loader": loader, "format": fmt, **json.loads(proc.stdout.strip().splitlines()[-1])})
+
+    for r in results:
+        if as_json:
+            print(json.dumps({"corpus_sequences": n_sequences, **r}))
+        elif "error" in r:
+            print(f"{r['loader']:<10} FAILED: {r['error']}")
+        else:
+            print(f"{r['loader']:<10} {r['sequences_per_s']:>10.0f} seq/s ({r['sequences']} in {r['seconds']:.1f}s) | "
+                  f"peak RSS {r['peak_rss_mb']:.0f}MB (+{r['peak_over_runtime_mb']:.0f}MB over TF)")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sequences", type=int, default=100000)
+    parser.add_argument("--num-shards", type=int, default=8)
+    parser.add_argument("--format", choices=["jsonl", "tfrecord"], default="jsonl")
+    parser.add_argument("--json", action="store_true")
+    parser.add_argument("--child", choices=["legacy", "streaming"], help=argparse.SUPPRESS)
+    parser.add_argument("--workdir", help=argparse.SUPPRESS)
+    parser.add_argument("--shard-glob", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_loader(args.child, args.workdir, args.shard_glob)
+    else:
+        main(args.sequences, args.num_shards, args.format, args.json)
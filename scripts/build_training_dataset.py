@@ -1,40 +1,43 @@
+import argparse
+import hashlib
 import json
 import os
+import random
 import time
-import vertexai
-from vertexai.generative_models import GenerativeModel, Part
-import asyncio 
-from typing import List, Dict, Any
+import asyncio
+from typing import List, Dict, Any, Optional, Set
 
 # --- Configuration ---
-PROJECT_ID = os.environ.get("GCP_PROJECT_ID", "tbd-v2") 
+PROJECT_ID = os.environ.get("GCP_PROJECT_ID", "tbd-v2")
 LOCATION = "us-central1"
-MODEL_NAME = "gemini-2.5-pro" 
-OUTPUT_FILE = "v4_lstm_training_sequences.json"
+MODEL_NAME = "gemini-2.5-pro"
+# Append-only, one {"domain", "checksum", "sequence"} record per line (train_lstm.py --shards reads it directly)
+OUTPUT_FILE = "v4_lstm_training_sequences.jsonl"
+# Pre-JSONL output; imported once when OUTPUT_FILE does not exist yet
+LEGACY_OUTPUT_FILE = "v4_lstm_training_sequences.json"
 TARGET_VOLUME = 1000
 SEQUENCES_PER_PROMPT = 20
 DOMAINS = ["Windows Troubleshooting", "Web App Configuration", "Medical Lab Procedure", "IT Support Workflow", "Desktop Publishing"]
+# Gemini calls in flight at once
+CONCURRENCY = int(os.environ.get("DATASET_CONCURRENCY", "8"))
+# Give up after this many consecutive prompts that add nothing new (API down, or the domains are exhausted)
+MAX_EMPTY_CYCLES = 25
+# Local stand-in for Gemini (no credentials, no cost): --fake or USE_FAKE_GEMINI=1
+USE_FAKE_GEMINI = os.environ.get("USE_FAKE_GEMINI", "0") == "1"
+FAKE_LATENCY_S = float(os.environ.get("FAKE_GEMINI_LATENCY_S", "0.5"))
 
-# Initialize Vertex AI
-try:
-    vertexai.init(project=PROJECT_ID, location=LOCATION)
-except Exception as e:
-    print(f"CRITICAL ERROR: Failed to initialize Vertex AI locally. Ensure 'gcloud auth application-default login' is run.")
-    print(e)
-    # The program will continue but API calls will fail if auth is missing.
-
-async def generate_sequences(model: GenerativeModel, sequence_count: int, domain: str) -> List[List[str]]:
+async def generate_sequences(model, sequence_count: int, domain: str) -> List[List[str]]:
     """
     Prompts Gemini to generate a list of structured procedural sequences.
     """
     prompt = f"""
     Generate {sequence_count} unique, realistic, step-by-step procedural action sequences for a user performing a task in the '{domain}' domain.
-    
+
     Each sequence must be a list of short strings (3-7 words each), where each string is a user action. The final output MUST be a single JSON object containing one key: "sequences", which holds a JSON array of these sequences.
-    
+
     Example: {{"sequences": [["Right click desktop", "Select Personalize", "Click Background"], ["Open Start Menu", "Search for CMD", "Run as administrator"], ...]}}
     """
-    
+
     try:
         response = await model.generate_content_async(
             contents=[prompt],
@@ -44,58 +47,219 @@ async def generate_sequences(model: GenerativeModel, sequence_count: int, domain
                 "response_mime_type": "application/json"
             }
         )
-        
+
         raw_text = response.text.strip()
         data = json.loads(raw_text)
         return data.get("sequences", [])
-        
+
     except Exception as e:
         # We now expect to see a real API error here if the connection fails
         print(f"--- API FAILED for {domain} with ERROR: {e} ---")
         return []
 
-# FIX: Renamed and made asynchronous
-async def main():
-    if os.path.exists(OUTPUT_FILE):
-        print(f"Appending to existing file: {OUTPUT_FILE}")
-        with open(OUTPUT_FILE, 'r') as f:
-            try:
-                f.seek(0)
-                all_sequences = json.load(f)
-            except (json.JSONDecodeError, EOFError):
-                all_sequences = []
-    else:
-        all_sequences = []
-
-    model = GenerativeModel(MODEL_NAME)
-    
-    cycles_needed = TARGET_VOLUME // SEQUENCES_PER_PROMPT
-    current_cycle = len(all_sequences) // SEQUENCES_PER_PROMPT
-    
-    print(f"Target: {TARGET_VOLUME} sequences. Starting at cycle {current_cycle} out of {cycles_needed}.")
-    
-    for i in range(current_cycle, cycles_needed):
-        domain = DOMAINS[i % len(DOMAINS)]
-        start_time = time.time()
-        
-        # FIX: Await the function call instead of running asyncio.run()
-        new_sequences = await generate_sequences(model, SEQUENCES_PER_PROMPT, domain)
-        
-        if new_sequences:
-            all_sequences.extend(new_sequences)
-            
+# --- Local Fake Model ---
+class _FakeResponse:
+    def __init__(self, text: str):
+        self.text = text
+
+class FakeGenerativeModel:
+    """Answers the generate_sequences prompt with random, well-formed sequences after FAKE_LATENCY_S."""
+    VERBS = ["Click", "Select", "Open", "Type", "Right-click", "Drag", "Close", "Search for", "Enable", "Verify"]
+    OBJECTS = ["File menu", "Save button", "Desktop", "Start Menu", "Settings", "Control Panel", "sample tube",
+               "Background dropdown", "Network adapter", "template", "user account", "browser tab", "CMD"]
+
+    def __init__(self, latency_s: float = FAKE_LATENCY_S, seed: int = 0):
+        self.latency_s = latency_s
+        self.rng = random.Random(seed)
+
+    async def generate_content_async(self, contents, generation_config=None):
+        await asyncio.sleep(self.latency_s)
+        sequences = [
+            [f"{self.rng.choice(self.VERBS)} {self.rng.choice(self.OBJECTS)} {self.rng.randrange(100)}"
+             for _ in range(self.rng.randint(3, 8))]
+            for _ in range(SEQUENCES_PER_PROMPT)
+        ]
+        return _FakeResponse(json.dumps({"sequences": sequences}))
+
+def make_model(fake: bool):
+    if fake:
+        print(f"Using FakeGenerativeModel ({FAKE_LATENCY_S}s per prompt).")
+        return FakeGenerativeModel()
+
+    import vertexai
+    from vertexai.generative_models import GenerativeModel
+    # Initialize Vertex AI
+    try:
+        vertexai.init(project=PROJECT_ID, location=LOCATION)
+    except Exception as e:
+        print(f"CRITICAL ERROR: Failed to initialize Vertex AI locally. Ensure 'gcloud auth application-default login' is run.")
+        print(e)
+        # The program will continue but API calls will fail if auth is missing.
+    return GenerativeModel(MODEL_NAME)
+
+# --- Records ---
+def sequence_checksum(sequence: List[str]) -> str:
+    canonical = json.dumps(sequence, ensure_ascii=False, separators=(",", ":"))
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()[:16]
+
+def dedup_key(sequence: List[str]) -> str:
+    """Sequences that differ only in case / whitespace count as duplicates."""
+    normalized = [" ".join(step.lower().split()) for step in sequence]
+    return hashlib.sha256("\x1f".join(normalized).encode("utf-8")).hexdigest()
+
+def _is_valid_sequence(sequence: Any) -> bool:
+    return isinstance(sequence, list) and len(sequence) > 0 and all(isinstance(s, str) and s.strip() for s in sequence)
+
+def make_record(sequence: List[str], domain: str) -> str:
+    record = {"domain": domain, "checksum": sequence_checksum(sequence), "sequence": sequence}
+    return json.dumps(record, ensure_ascii=False) + "\n"
+
+def _parse_record(line: bytes) -> Optional[List[str]]:
+    """The record's sequence, or None if the line is torn / corrupt."""
+    if not line.endswith(b"\n"):
+        return None
+    try:
+        record = json.loads(line)
+    except (UnicodeDecodeError, json.JSONDecodeError):
+        return None
+    if not isinstance(record, dict) or not _is_valid_sequence(record.get("sequence")):
+        return None
+    if record.get("checksum") != sequence_checksum(record["sequence"]):
+        return None
+    return record["sequence"]
+
+def recover(path: str) -> Set[str]:
+    """
+    Resume point: validates every record and truncates the file after the last good one,
+    dropping a line torn by a crash mid-write. Returns the dedup keys of the committed records.
+    """
+    seen: Set[str] = set()
+    if not os.path.exists(path):
+        return seen
+
+    committed = 0
+    with open(path, "rb") as f:
+        for line in f:
+            sequence = _parse_record(line)
+            if sequence is None:
+                break
+            seen.add(dedup_key(sequence))
+            committed += len(line)
+
+    if committed < os.path.getsize(path):
+        print(f"WARNING: Dropping {os.path.getsize(path) - committed} bytes after the last valid record in {path}")
+        with open(path, "r+b") as f:
+            f.truncate(committed)
+    return seen
+
+def import_legacy(legacy_path: str, path: str):
+    """One-time migration of the old single-JSON output into the JSONL file."""
+    with open(legacy_path, 'r') as f:
+        try:
+            sequences = json.load(f)
+        except (json.JSONDecodeError, EOFError):
+            sequences = []
+    seen = set()
+    with open(path, "w", encoding="utf-8") as out:
+        for sequence in sequences:
+            if _is_valid_sequence(sequence) and dedup_key(sequence) not in seen:
+                seen.add(dedup_key(sequence))
+                out.write(make_record(sequence, "legacy"))
+    print(f"Imported {len(seen)} sequences from {legacy_path}")
+
+# --- Generation ---
+class DatasetWriter:
+    """Single append-only sink shared by the generation workers (one event loop, so no locking needed)."""
+
+    def __init__(self, path: str, seen: Set[str], target: int):
+        self.path = path
+        self.seen = seen
+        self.target = target
+        self.empty_cycles = 0
+        self.next_cycle = 0
+        self.handle = open(path, "a", encoding="utf-8")
+
+    @property
+    def count(self) -> int:
+        return len(self.seen)
+
+    @property
+    def done(self) -> bool:
+        return self.count >= self.target or self.empty_cycles >= MAX_EMPTY_CYCLES
+
+    def commit(self, sequences: List[Any], domain: str) -> int:
+        """Appends the new, valid sequences and makes them durable before returning."""
+        lines = []
+        for sequence in sequences:
+            if self.count + len(lines) >= self.target:
+                break
+            if not _is_valid_sequence(sequence):
+                continue
+            key = dedup_key(sequence)
+            if key in self.seen:
+                continue
+            self.seen.add(key)
+            lines.append(make_record(sequence, domain))
+
+        if lines:
+            self.handle.write("".join(lines))
+            self.handle.flush()
+            os.fsync(self.handle.fileno())
+            self.empty_cycles = 0
+        else:
+            self.empty_cycles += 1
+        return len(lines)
+
+    def close(self):
+        self.handle.close()
+
+async def _worker(model, writer: DatasetWriter, semaphore: asyncio.Semaphore):
+    while not writer.done:
+        cycle = writer.next_cycle
+        writer.next_cycle += 1
+        domain = DOMAINS[cycle % len(DOMAINS)]
+
+        async with semaphore:
+            if writer.done:
+                return
+            start_time = time.time()
+            new_sequences = await generate_sequences(model, SEQUENCES_PER_PROMPT, domain)
+
+        added = writer.commit(new_sequences, domain)
         elapsed = time.time() - start_time
-        current_count = len(all_sequences)
-        
-        print(f"Cycle {i+1}/{cycles_needed} | Generated {len(new_sequences)} seqs in {elapsed:.2f}s | Total: {current_count}/{TARGET_VOLUME}")
-        
-        # Save progress after every cycle
-        with open(OUTPUT_FILE, 'w') as f:
-            json.dump(all_sequences, f, indent=2)
-
-    print("\n--- Data Generation Complete ---")
-    print(f"Final sequences saved to {OUTPUT_FILE}")
-    
+        print(f"Cycle {cycle + 1} [{domain}] | Generated {len(new_sequences)} seqs ({added} new) in {elapsed:.2f}s | Total: {writer.count}/{writer.target}")
+
+async def main(output_file: str = OUTPUT_FILE, target: int = TARGET_VOLUME, concurrency: int = CONCURRENCY, fake: bool = USE_FAKE_GEMINI):
+    if not os.path.exists(output_file) and os.path.exists(LEGACY_OUTPUT_FILE):
+        import_legacy(LEGACY_OUTPUT_FILE, output_file)
+
+    seen = recover(output_file)
+    if seen:
+        print(f"Resuming {output_file}: {len(seen)} committed sequences.")
+
+    model = make_model(fake)
+    writer = DatasetWriter(output_file, seen, target)
+    print(f"Target: {target} sequences. Starting at {writer.count}, {concurrency} prompts in flight.")
+
+    started = time.time()
+    semaphore = asyncio.Semaphore(concurrency)
+    try:
+        await asyncio.gather(*(_worker(model, writer, semaphore) for _ in range(concurrency)))
+    finally:
+        writer.close()
+
+    if writer.count < target:
+        print(f"\n--- Stopped after {MAX_EMPTY_CYCLES} prompts with no new sequences ({writer.count}/{target}) ---")
+    else:
+        print("\n--- Data Generation Complete ---")
+    print(f"{writer.count} sequences saved to {output_file} in {time.time() - started:.1f}s")
+
 if __name__ == "__main__":
-    # FIX: Call the async main function once
-    asyncio.run(main())
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Generate LSTM training sequences with Gemini.")
+    parser.add_argument("--output", default=OUTPUT_FILE)
+    parser.add_argument("--target", type=int, default=TARGET_VOLUME)
+    parser.add_argument("--concurrency", type=int, default=CONCURRENCY)
+    parser.add_argument("--fake", action="store_true", default=USE_FAKE_GEMINI, help="Use the local FakeGenerativeModel")
+    args = parser.parse_args()
+
+    asyncio.run(main(args.output, args.target, args.concurrency, args.fake))
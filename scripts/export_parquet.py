@@ -0,0 +1,91 @@
+"""
+Bulk conversion of pathway.json files to the partitioned Parquet dataset (app/services/columnar.py).
+Streams: pathways are listed, downloaded a few at a time and appended to per-partition writers, so
+memory stays flat however large the bucket is. Each run writes new part files; export into an
+empty prefix (or delete the old one) to avoid duplicate rows.
+
+Usage:
+    python -m scripts.export_parquet gs://tbd-output-bucket --out gs://tbd-analytics/pathways
+    python -m scripts.export_parquet ./pathways --out ./pathways_parquet     # local tree of <task_id>/pathway.json
+
+Reading it back (pyarrow / pandas / DuckDB all understand the Hive partitions):
+    pyarrow.dataset.dataset("pathways_parquet/nodes", format="parquet", partitioning="hive")
+"""
+import argparse
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Iterator, Tuple
+
+from app.services.columnar import ParquetExporter, ROW_GROUP_NODES
+from app.services.index import PATHWAY_BLOB_SUFFIX
+
+DOWNLOAD_WORKERS = int(os.environ.get("EXPORT_DOWNLOAD_WORKERS", "16"))
+
+def _gcs_sources(source: str) -> Iterator[Tuple[str, str, Callable[[], bytes]]]:
+    from google.cloud import storage
+    bucket_name, _, prefix = source[len("gs://"):].partition("/")
+    for blob in storage.Client().list_blobs(bucket_name, prefix=prefix or None):
+        if blob.name.endswith(PATHWAY_BLOB_SUFFIX):
+            yield blob.name[:-len(PATHWAY_BLOB_SUFFIX)], f"gs://{bucket_name}/{blob.name}", blob.download_as_bytes
+
+def _local_sources(source: str) -> Iterator[Tuple[str, str, Callable[[], bytes]]]:
+    def reader(path: str) -> Callable[[], bytes]:
+        def read() -> bytes:
+            with open(path, "rb") as f:
+                return f.read()
+        return read
+    for directory, _, files in os.walk(source):
+        if PATHWAY_BLOB_SUFFIX[1:] in files:
+            path = os.path.join(directory, PATHWAY_BLOB_SUFFIX[1:])
+            yield os.path.relpath(directory, source).replace(os.sep, "/"), path, reader(path)
+
+def sources(source: str) -> Iterator[Tuple[str, str, Callable[[], bytes]]]:
+    """(task_id, uri, read) per pathway.json under a gs:// prefix or a local directory."""
+    return _gcs_sources(source) if source.startswith("gs://") else _local_sources(source)
+
+def _download(item):
+    task_id, uri, read = item
+    try:
+        return task_id, uri, json.loads(read()), None
+    except Exception as e:
+        return task_id, uri, None, e
+
+def downloaded(items: Iterator, workers: int) -> Iterator:
+    """Parsed pathways in listing order, with at most 2 x workers downloads in flight."""
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        window = []
+        for item in items:
+            window.append(pool.submit(_download, item))
+            if len(window) >= workers * 2:
+                yield window.pop(0).result()
+        for future in window:
+            yield future.result()
+
+def export(source: str, out: str, workers: int = DOWNLOAD_WORKERS, row_group_nodes: int = ROW_GROUP_NODES) -> dict:
+    started = time.time()
+    failed = 0
+    with ParquetExporter(out, row_group_nodes=row_group_nodes) as exporter:
+        for task_id, uri, pathway, error in downloaded(sources(source), workers):
+            if error is not None:
+                failed += 1
+                print(f"EXPORT WARNING: Skipping {uri}: {error}")
+                continue
+            exporter.add(pathway, task_id, uri)
+            if exporter.stats["pathways"] % 1000 == 0:
+                print(f"{exporter.stats['pathways']} pathways, {exporter.stats['nodes']} nodes "
+                      f"({time.time() - started:.1f}s)")
+    stats = {**exporter.stats, "failed": failed, "seconds": round(time.time() - started, 2)}
+    print(f"Exported {stats['pathways']} pathways / {stats['nodes']} nodes to {out} in {stats['seconds']}s "
+          f"({stats['files']} files, {failed} failed)")
+    return stats
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("source", help="gs://bucket[/prefix] or a local directory of <task_id>/pathway.json")
+    parser.add_argument("--out", required=True, help="Dataset root: local directory or gs:// URI")
+    parser.add_argument("--workers", type=int, default=DOWNLOAD_WORKERS, help="Parallel downloads")
+    parser.add_argument("--row-group-nodes", type=int, default=ROW_GROUP_NODES)
+    args = parser.parse_args()
+    export(args.source, args.out, args.workers, args.row_group_nodes)
@@ -1,4 +1,7 @@
+import argparse
+import glob
 import json
+import pickle
 import numpy as np
 import tensorflow as tf
 from tensorflow.keras.preprocessing.text import Tokenizer
@@ -8,16 +11,28 @@ from tensorflow.keras.layers import Input, Embedding, LSTM, Dense
 import os # Included for os.path operations if needed
 
 # --- Configuration ---
-DATA_FILE = "v4_lstm_training_sequences.json"
+# build_training_dataset.py output: one {"domain", "checksum", "sequence"} record per line
+DATA_FILE = "v4_lstm_training_sequences.jsonl"
 MAX_SEQUENCE_LENGTH = 100
 EMBEDDING_DIM = 128
 LSTM_OUTPUT_DIM = 512 # As per TDD 3.1
 OUTPUT_MODEL_FILE = "lstm_model.h5"
+OOV_TOKEN = "<unk>"
+EPOCHS = 15
+BATCH_SIZE = 32
+
+# --- Streaming pipeline (sharded JSONL / TFRecord) ---
+# Sequences are padded to the smallest bucket that fits them instead of always to MAX_SEQUENCE_LENGTH - 1
+BUCKET_BOUNDARIES = [8, 16, 32, 64, MAX_SEQUENCE_LENGTH - 1]
+SHUFFLE_BUFFER = 10000  # examples held in memory for shuffling; bounds RAM regardless of corpus size
+VOCAB_FIT_CHUNK = 1000  # records per Tokenizer.fit_on_texts call while streaming the vocab pass
+# Keras Tokenizer default filters; the in-graph tokenizer must strip exactly the same characters
+TOKENIZER_FILTERS = '!"#$%&()*+,-./:;<=>?@[\\]^_`{|}~\t\n'
+TFRECORD_STEPS_FEATURE = "steps"
 
 def load_and_preprocess_data():
     """Loads sequences and tokenizes them."""
-    with open(DATA_FILE, 'r') as f:
-        data = json.load(f)
+    data = list(read_sequences(DATA_FILE))
     
     # Flatten the list of lists into a single list of actions
     all_actions = [step for sequence in data for step in sequence]
@@ -52,17 +67,15 @@ def load_and_preprocess_data():
     
     return X, Y, tokenizer
 
-def build_and_train_lstm(X, Y, tokenizer):
-    """Defines the LSTM architecture and performs the training run."""
-    vocab_size = len(tokenizer.word_index) + 1
-    
+def build_lstm_model(vocab_size: int, input_length=MAX_SEQUENCE_LENGTH - 1):
+    """Defines the LSTM architecture. input_length=None accepts the variable-length buckets of the streaming pipeline."""
     # 1. Define Model Architecture (LSTM)
-    input_layer = Input(shape=(MAX_SEQUENCE_LENGTH - 1,), name='input_sequence')
+    input_layer = Input(shape=(input_length,), name='input_sequence')
     
     embedding = Embedding(
         vocab_size, 
         EMBEDDING_DIM, 
-        input_length=MAX_SEQUENCE_LENGTH - 1
+        input_length=input_length
     )(input_layer)
     
     # LSTM layer: Fixed-size 512D output (Temporal Context Vector)
@@ -77,7 +90,7 @@ def build_and_train_lstm(X, Y, tokenizer):
     
     model = Model(inputs=input_layer, outputs=output_layer)
     
-    # 2. Compile and Train
+    # 2. Compile
     model.compile(
         optimizer='adam', 
         loss='sparse_categorical_crossentropy', 
@@ -85,6 +98,12 @@ def build_and_train_lstm(X, Y, tokenizer):
     )
     
     print(model.summary())
+    return model
+
+def build_and_train_lstm(X, Y, tokenizer):
+    """Defines the LSTM architecture and performs the training run."""
+    vocab_size = len(tokenizer.word_index) + 1
+    model = build_lstm_model(vocab_size)
     
     # Slice the data to fit memory constraints, using all 1000 sequences
     train_size = len(X) 
@@ -97,8 +116,8 @@ def build_and_train_lstm(X, Y, tokenizer):
     model.fit(
         X, 
         y_train, 
-        epochs=15, # <-- THE CHANGE
-        batch_size=32, 
+        epochs=EPOCHS, # <-- THE CHANGE
+        batch_size=BATCH_SIZE, 
         verbose=1
     )
     
@@ -107,6 +126,195 @@ def build_and_train_lstm(X, Y, tokenizer):
     print(f"\n? Model training complete. Weights saved to {OUTPUT_MODEL_FILE}")
     print(f"Ready to deploy Service C.")
 
+# --- Streaming Pipeline ---
+def _shard_format(path: str) -> str:
+    return "tfrecord" if path.endswith((".tfrecord", ".tfrec")) else "jsonl"
+
+def resolve_shards(pattern: str) -> list:
+    """Comma-separated globs -> sorted shard paths (all JSONL or all TFRecord)."""
+    paths = sorted(p for part in pattern.split(",") for p in glob.glob(part.strip()))
+    if not paths:
+        raise FileNotFoundError(f"No training shards match '{pattern}'")
+    formats = {_shard_format(p) for p in paths}
+    if len(formats) > 1:
+        raise ValueError(f"Mixed shard formats in '{pattern}': {sorted(formats)}")
+    return paths
+
+def _parse_steps_example(record):
+    features = tf.io.parse_single_example(
+        record, {TFRECORD_STEPS_FEATURE: tf.io.VarLenFeature(tf.string)}
+    )
+    return tf.sparse.to_dense(features[TFRECORD_STEPS_FEATURE], default_value="")
+
+def _jsonl_sequence(line: str) -> list:
+    """A JSONL shard line: a bare array of steps, or a build_training_dataset.py record with "sequence"."""
+    record = json.loads(line)
+    return record["sequence"] if isinstance(record, dict) else record
+
+def read_sequences(path: str):
+    """Yields the sequences of one JSONL file (records or bare arrays), one line at a time."""
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            if line.strip():
+                yield _jsonl_sequence(line)
+
+def iter_shard_sequences(paths: list):
+    """Yields one action sequence (list of step strings) at a time; never holds a whole shard."""
+    if _shard_format(paths[0]) == "tfrecord":
+        for steps in tf.data.TFRecordDataset(paths).map(_parse_steps_example).as_numpy_iterator():
+            yield [step.decode("utf-8") for step in steps]
+        return
+    for path in paths:
+        yield from read_sequences(path)
+
+def fit_tokenizer_streaming(paths: list) -> Tokenizer:
+    """Vocabulary pass over the shards. Only the word counts stay in memory."""
+    tokenizer = Tokenizer(num_words=None, oov_token=OOV_TOKEN, filters=TOKENIZER_FILTERS)
+    chunk = []
+    for sequence in iter_shard_sequences(paths):
+        chunk.extend(sequence)
+        if len(chunk) >= VOCAB_FIT_CHUNK:
+            tokenizer.fit_on_texts(chunk)
+            chunk = []
+    if chunk:
+        tokenizer.fit_on_texts(chunk)
+    return tokenizer
+
+def _token_lookup(tokenizer: Tokenizer):
+    """Returns a graph function: raw text -> int32 token IDs, identical to Keras texts_to_sequences (flattened)."""
+    words = list(tokenizer.word_index.keys())
+    ids = [tokenizer.word_index[w] for w in words]
+    table = tf.lookup.StaticHashTable(
+        tf.lookup.KeyValueTensorInitializer(tf.constant(words), tf.constant(ids, dtype=tf.int64)),
+        default_value=tokenizer.word_index[OOV_TOKEN],
+    )
+    # \x{..} escapes keep RE2 happy with the tab/newline/backslash members of the filter set
+    filter_pattern = "[" + "".join(f"\\x{{{ord(c):x}}}" for c in TOKENIZER_FILTERS) + "]"
+
+    def tokenize(text):
+        text = tf.strings.lower(text, encoding='utf-8')
+        text = tf.strings.regex_replace(text, filter_pattern, " ")
+        words = tf.strings.split(text, sep=" ")
+        words = tf.boolean_mask(words, tf.strings.length(words) > 0)
+        return tf.cast(table.lookup(words), tf.int32)
+
+    return tokenize
+
+def _raw_text_dataset(paths: list) -> tf.data.Dataset:
+    """One string per sequence, read from all shards in parallel."""
+    files = tf.data.Dataset.from_tensor_slices(paths).shuffle(len(paths))
+    if _shard_format(paths[0]) == "tfrecord":
+        records = files.interleave(tf.data.TFRecordDataset, num_parallel_calls=tf.data.AUTOTUNE, deterministic=False)
+        return records.map(
+            lambda r: tf.strings.reduce_join(_parse_steps_example(r), separator=" "),
+            num_parallel_calls=tf.data.AUTOTUNE, deterministic=False,
+        )
+    lines = files.interleave(tf.data.TextLineDataset, num_parallel_calls=tf.data.AUTOTUNE, deterministic=False)
+    lines = lines.filter(lambda line: tf.strings.length(tf.strings.strip(line)) > 0)
+
+    def sequence_text(line):
+        # Parsed with json (key order, nesting and escapes as written), steps joined like the TFRecord path
+        text = tf.py_function(lambda l: " ".join(_jsonl_sequence(l.numpy().decode("utf-8"))), [line], tf.string)
+        text.set_shape([])
+        return text
+
+    return lines.map(sequence_text, num_parallel_calls=tf.data.AUTOTUNE, deterministic=False)
+
+def build_streaming_dataset(paths: list, tokenizer: Tokenizer, batch_size: int = BATCH_SIZE,
+                            shuffle: bool = True) -> tf.data.Dataset:
+    """
+    (token_ids, next_token) batches streamed from the shards, bucketed by length.
+    Each example is the sequence's last MAX_SEQUENCE_LENGTH tokens: the prefix is the input and the
+    final token the target. Inputs are pre-padded only to their bucket width (8/16/32/64/99), not to the
+    full 99 Service C pads to at inference. The Embedding has no mask_zero, so the LSTM does see those
+    leading zeros: short sequences are trained with fewer padding steps than they are served with
+    (training/serving skew; the in-memory loader post-pads to the full width, which matches neither).
+    """
+    tokenize = _token_lookup(tokenizer)
+    boundaries = tf.constant(BUCKET_BOUNDARIES, dtype=tf.int32)
+
+    def to_example(ids):
+        ids = ids[-MAX_SEQUENCE_LENGTH:]
+        return ids[:-1], ids[-1]
+
+    def bucket_of(length):
+        return tf.reduce_sum(tf.cast(length > boundaries, tf.int64))
+
+    def pre_pad(x, y):
+        length = tf.shape(x)[0]
+        width = tf.gather(boundaries, bucket_of(length))
+        return tf.pad(x, [[width - length, 0]]), y
+
+    ds = _raw_text_dataset(paths)
+    if shuffle:
+        ds = ds.shuffle(SHUFFLE_BUFFER)
+    ds = ds.map(tokenize, num_parallel_calls=tf.data.AUTOTUNE, deterministic=False)
+    ds = ds.filter(lambda ids: tf.shape(ids)[0] >= 2)
+    ds = ds.map(to_example, num_parallel_calls=tf.data.AUTOTUNE, deterministic=False)
+    ds = ds.map(pre_pad, num_parallel_calls=tf.data.AUTOTUNE, deterministic=False)
+    ds = ds.group_by_window(
+        key_func=lambda x, y: bucket_of(tf.shape(x)[0]),
+        reduce_func=lambda key, window: window.batch(batch_size),
+        window_size=batch_size,
+    )
+    return ds.prefetch(tf.data.AUTOTUNE)
+
+def train_streaming(shard_pattern: str):
+    """Memory-bounded training run over sharded JSONL / TFRecord data."""
+    paths = resolve_shards(shard_pattern)
+    print(f"Streaming {len(paths)} {_shard_format(paths[0])} shard(s)")
+
+    tokenizer = fit_tokenizer_streaming(paths)
+    print(f"Total vocabulary size: {len(tokenizer.word_index)}")
+    with open('tokenizer.pickle', 'wb') as handle:
+        pickle.dump(tokenizer, handle, protocol=pickle.HIGHEST_PROTOCOL)
+    print("Tokenizer saved to tokenizer.pickle.")
+
+    model = build_lstm_model(len(tokenizer.word_index) + 1, input_length=None)
+    model.fit(build_streaming_dataset(paths, tokenizer), epochs=EPOCHS, verbose=1)
+
+    model.save(OUTPUT_MODEL_FILE)
+    print(f"\n? Model training complete. Weights saved to {OUTPUT_MODEL_FILE}")
+    print(f"Ready to deploy Service C.")
+
+def write_shards(corpus_path: str, out_dir: str, num_shards: int, fmt: str = "jsonl") -> list:
+    """One-off conversion of a JSONL corpus (DATA_FILE) into round-robin shards, streamed line by line."""
+    count = 0
+    os.makedirs(out_dir, exist_ok=True)
+    paths = [os.path.join(out_dir, f"sequences-{i:05d}-of-{num_shards:05d}.{fmt}") for i in range(num_shards)]
+
+    if fmt == "tfrecord":
+        writers = [tf.io.TFRecordWriter(p) for p in paths]
+        for i, sequence in enumerate(read_sequences(corpus_path)):
+            count += 1
+            steps = tf.train.BytesList(value=[step.encode("utf-8") for step in sequence])
+            example = tf.train.Example(features=tf.train.Features(feature={TFRECORD_STEPS_FEATURE: tf.train.Feature(bytes_list=steps)}))
+            writers[i % num_shards].write(example.SerializeToString())
+        for w in writers:
+            w.close()
+    else:
+        handles = [open(p, 'w', encoding='utf-8') for p in paths]
+        for i, sequence in enumerate(read_sequences(corpus_path)):
+            count += 1
+            handles[i % num_shards].write(json.dumps(sequence, ensure_ascii=False) + "\n")
+        for h in handles:
+            h.close()
+
+    print(f"Wrote {count} sequences to {num_shards} {fmt} shard(s) in {out_dir}")
+    return paths
+
 if __name__ == "__main__":
-    X, Y, tokenizer = load_and_preprocess_data()
-    build_and_train_lstm(X, Y, tokenizer)
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Train the Service C temporal encoder (LSTM).")
+    parser.add_argument("--shards", default="", help="Glob(s) of .jsonl / .tfrecord shards: stream instead of loading DATA_FILE")
+    parser.add_argument("--write-shards", metavar="OUT_DIR", help=f"Convert {DATA_FILE} into shards and exit")
+    parser.add_argument("--num-shards", type=int, default=8)
+    parser.add_argument("--format", choices=["jsonl", "tfrecord"], default="jsonl")
+    args = parser.parse_args()
+
+    if args.write_shards:
+        write_shards(DATA_FILE, args.write_shards, args.num_shards, args.format)
+    elif args.shards:
+        train_streaming(args.shards)
+    else:
+        X, Y, tokenizer = load_and_preprocess_data()
+        build_and_train_lstm(X, Y, tokenizer)
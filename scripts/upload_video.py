@@ -0,0 +1,96 @@
+"""
+Uploads a video straight to GCS through the dispatcher's resumable-upload URLs and submits the task.
+
+    1. POST /uploads                      -> one resumable start request per part
+    2. each part in parallel: start the session, PUT 8 MiB chunks (Content-Range); a failed chunk
+       is retried after asking the session how much it already has
+    3. POST /uploads/{task_id}/complete   -> parts composed, TaskPayload submitted
+
+Usage:
+    python scripts/upload_video.py demo.mp4 --dispatcher http://localhost:8000 --output-bucket tbd-output-local
+
+Local test against an emulator (no GCP project needed):
+    docker run -d -p 4443:4443 fsouza/fake-gcs-server -scheme http -public-host localhost:4443
+    curl -X POST http://localhost:4443/storage/v1/b -d '{"name": "tbd-input-local-dev-project"}'
+    STORAGE_EMULATOR_HOST=http://localhost:4443 SERVICE_TYPE=dispatcher uvicorn app.main:app --port 8000
+    python scripts/upload_video.py demo.mp4 --dispatcher http://localhost:8000
+"""
+import argparse
+import os
+import time
+import requests
+from concurrent.futures import ThreadPoolExecutor
+
+CHUNK_SIZE = 8 * 1024 * 1024  # multiple of 256 KiB
+MAX_RETRIES = 5
+
+def _committed_bytes(session_uri: str, size: int) -> int:
+    """Asks a resumable session how many bytes it has (308 + Range: bytes=0-N)."""
+    response = requests.put(session_uri, headers={"Content-Range": f"bytes */{size}"}, timeout=30)
+    if response.status_code in (200, 201):
+        return size
+    committed = response.headers.get("Range")
+    return int(committed.split("-")[1]) + 1 if committed else 0
+
+def upload_part(path: str, part: dict, chunk_size: int = CHUNK_SIZE) -> int:
+    start = part["start"]
+    response = requests.request(start["method"], start["url"], headers=start["headers"], timeout=30)
+    response.raise_for_status()
+    session_uri = response.headers["Location"]
+
+    size, offset, retries = part["size"], 0, 0
+    with open(path, "rb") as f:
+        while offset < size:
+            length = min(chunk_size, size - offset)
+            f.seek(part["offset"] + offset)
+            headers = {"Content-Range": f"bytes {offset}-{offset + length - 1}/{size}"}
+            try:
+                response = requests.put(session_uri, data=f.read(length), headers=headers, timeout=120)
+                if response.status_code == 308:
+                    # Partial commit is allowed: continue from what the session reports
+                    committed = response.headers.get("Range")
+                    offset = int(committed.split("-")[1]) + 1 if committed else 0
+                else:
+                    response.raise_for_status()
+                    offset += length
+                retries = 0
+            except requests.RequestException as e:
+                retries += 1
+                if retries > MAX_RETRIES: raise
+                print(f"Part {part['index']}: chunk at {offset} failed ({e}), resuming...")
+                time.sleep(2 ** retries)
+                offset = _committed_bytes(session_uri, size)
+    return size
+
+def upload(path: str, dispatcher: str, client_id: str, output_bucket: str, parts: int = None, task_id: str = None) -> dict:
+    dispatcher = dispatcher.rstrip("/")
+    size = os.path.getsize(path)
+    response = requests.post(f"{dispatcher}/uploads", json={
+        "filename": os.path.basename(path), "size": size, "content_type": "video/mp4", "parts": parts, "task_id": task_id,
+    }, timeout=30)
+    response.raise_for_status()
+    plan = response.json()
+    print(f"Task {plan['task_id']}: {size} bytes in {len(plan['parts'])} part(s)")
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=len(plan["parts"])) as pool:
+        uploaded = sum(pool.map(lambda part: upload_part(path, part), plan["parts"]))
+    elapsed = time.perf_counter() - start
+    print(f"Uploaded {uploaded} bytes in {elapsed:.1f}s ({uploaded / max(elapsed, 1e-9) / 1e6:.1f} MB/s)")
+
+    response = requests.post(f"{dispatcher}{plan['complete_url']}", json={
+        "client_id": client_id, "output_bucket": output_bucket,
+    }, timeout=120)
+    response.raise_for_status()
+    return response.json()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("video")
+    parser.add_argument("--dispatcher", default=os.environ.get("DISPATCHER_URL", "http://localhost:8000"))
+    parser.add_argument("--client-id", default="upload-cli")
+    parser.add_argument("--output-bucket", default="tbd-output-local-dev-project")
+    parser.add_argument("--parts", type=int, default=None, help="Parallel parts (default: dispatcher picks by size)")
+    parser.add_argument("--task-id", default=None)
+    args = parser.parse_args()
+    print(upload(args.video, args.dispatcher, args.client_id, args.output_bucket, args.parts, args.task_id))
@@ -0,0 +1,64 @@
+"""
+CPU latency benchmark for the Service D inference backends.
+Run from tbd-detector/:  python benchmark_backends.py --backends keras,tf_function,onnx
+"""
+import argparse
+import json
+import time
+import numpy as np
+
+from detector_app.backends import load_backend
+from detector_app.main import INPUT_DIM, MODEL_VARIANTS
+
+def benchmark(name: str, iterations: int, warmup: int, batch_size: int) -> dict:
+    load_start = time.perf_counter()
+    backend = load_backend(name, MODEL_VARIANTS["fp32"][name], INPUT_DIM)
+    load_sec = time.perf_counter() - load_start
+
+    batch = np.random.rand(batch_size, INPUT_DIM, INPUT_DIM, 3).astype(np.float32)
+    first_start = time.perf_counter()
+    backend.predict(batch)
+    first_call_sec = time.perf_counter() - first_start
+    for _ in range(warmup - 1):
+        backend.predict(batch)
+
+    latencies = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        backend.predict(batch)
+        latencies.append((time.perf_counter() - start) * 1000.0)
+
+    latencies = np.array(latencies)
+    return {
+        "backend": name,
+        "batch_size": batch_size,
+        "load_sec": round(load_sec, 3),
+        "first_call_ms": round(first_call_sec * 1000.0, 2),
+        "p50_ms": round(float(np.percentile(latencies, 50)), 2),
+        "p95_ms": round(float(np.percentile(latencies, 95)), 2),
+        "p99_ms": round(float(np.percentile(latencies, 99)), 2),
+        "mean_ms": round(float(latencies.mean()), 2),
+    }
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--backends", default="keras,tf_function,onnx")
+    parser.add_argument("--iterations", type=int, default=50)
+    parser.add_argument("--warmup", type=int, default=5)
+    parser.add_argument("--batch-size", type=int, default=1)
+    parser.add_argument("--json", action="store_true", help="Print one JSON object per backend")
+    args = parser.parse_args()
+
+    for name in args.backends.split(","):
+        try:
+            result = benchmark(name, args.iterations, max(args.warmup, 1), args.batch_size)
+        except Exception as e:
+            result = {"backend": name, "error": str(e)}
+
+        if args.json:
+            print(json.dumps(result))
+        elif "error" in result:
+            print(f"{name:<12} FAILED: {result['error']}")
+        else:
+            print(f"{name:<12} load {result['load_sec']:>7.2f}s | first {result['first_call_ms']:>8.1f}ms | "
+                  f"p50 {result['p50_ms']:>7.1f}ms | p95 {result['p95_ms']:>7.1f}ms | p99 {result['p99_ms']:>7.1f}ms")
@@ -1,6 +1,7 @@
 import os
 import sys
 import shutil
+import numpy as np
 import tensorflow as tf
 from ultralytics import YOLO
 from unittest.mock import MagicMock
@@ -10,6 +11,19 @@ MODEL_VERSION = "yolov8n.pt"
 ONNX_MODEL = "yolov8n.onnx"
 TF_MODEL_DIR = "yolov8n_saved_model"
 FINAL_MODEL_NAME = "model_yolo.h5"
+# Served directly by Service D when INFERENCE_BACKEND=onnx
+SERVED_ONNX_MODEL = "model_yolo.onnx"
+INPUT_DIM = 640
+# onnx2tf's bundled calibration images (RGB, 0-1); resized to INPUT_DIM for INT8 calibration
+CALIBRATION_DATA = "calibration_image_sample_data_20x128x128x3_float32.npy"
+
+# Quantized variants loaded by Service D via MODEL_VARIANT
+TFLITE_VARIANTS = {
+    "dynamic": "model_yolo_dynamic_range.tflite",
+    "fp16": "model_yolo_float16.tflite",
+    "int8": "model_yolo_int8.tflite",
+}
+ONNX_DYNAMIC_MODEL = "model_yolo_dynamic.onnx"
 
 # --- MOCKING FIX FOR WINDOWS ---
 # onnx2tf requires 'ai_edge_litert' which is not available on Windows.
@@ -21,6 +35,37 @@ sys.modules["ai_edge_litert.interpreter"] = MagicMock()
 # Now we can safely import onnx2tf
 import onnx2tf
 
+def _representative_dataset():
+    """Yields calibration frames shaped like the service input (1, 640, 640, 3) float32."""
+    samples = np.load(CALIBRATION_DATA)
+    for sample in samples:
+        frame = tf.image.resize(sample, (INPUT_DIM, INPUT_DIM)).numpy().astype(np.float32)
+        yield [np.expand_dims(frame, axis=0)]
+
+def build_quantized_variants(saved_model_dir: str):
+    """
+    Builds the dynamic-range / FP16 / INT8 TFLite variants straight from the SavedModel.
+    We use tf.lite here instead of onnx2tf's quantized outputs, which need the mocked ai_edge_litert.
+    """
+    for variant, output_path in TFLITE_VARIANTS.items():
+        print(f"--- Quantizing: {variant} -> {output_path} ---")
+        converter = tf.lite.TFLiteConverter.from_saved_model(saved_model_dir)
+        converter.optimizations = [tf.lite.Optimize.DEFAULT]
+
+        if variant == "fp16":
+            converter.target_spec.supported_types = [tf.float16]
+        elif variant == "int8":
+            # Integer weights + activations; I/O stays float32 so the service's preprocessing is unchanged
+            converter.representative_dataset = _representative_dataset
+            converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS_INT8, tf.lite.OpsSet.TFLITE_BUILTINS]
+
+        with open(output_path, "wb") as f:
+            f.write(converter.convert())
+
+    print(f"--- Quantizing: ONNX dynamic INT8 -> {ONNX_DYNAMIC_MODEL} ---")
+    from onnxruntime.quantization import quantize_dynamic, QuantType
+    quantize_dynamic(SERVED_ONNX_MODEL, ONNX_DYNAMIC_MODEL, weight_type=QuantType.QInt8)
+
 def build_model():
     print(f"--- 1. Loading YOLOv8 Model ({MODEL_VERSION}) ---")
     model = YOLO(MODEL_VERSION)
@@ -53,15 +98,23 @@ def build_model():
     # Save as the legacy HDF5 format required by Service D
     keras_model.save(FINAL_MODEL_NAME, save_format="h5")
     
-    # Cleanup intermediate files
+    # Keep the ONNX export for the ONNX Runtime backend
     if os.path.exists(ONNX_MODEL):
-        os.remove(ONNX_MODEL)
+        shutil.move(ONNX_MODEL, SERVED_ONNX_MODEL)
+
+    print("--- 5. Building Quantized Variants (dynamic / fp16 / int8) ---")
+    build_quantized_variants(TF_MODEL_DIR)
+
+    # Cleanup intermediate files
     if os.path.exists(TF_MODEL_DIR):
         shutil.rmtree(TF_MODEL_DIR)
 
     print(f"--- SUCCESS ---")
     print(f"Generated: {os.path.abspath(FINAL_MODEL_NAME)}")
-    print(f"Action: Move this file to your 'tbd-detector/' directory before deploying.")
+    print(f"Generated: {os.path.abspath(SERVED_ONNX_MODEL)}")
+    for output_path in [*TFLITE_VARIANTS.values(), ONNX_DYNAMIC_MODEL]:
+        print(f"Generated: {os.path.abspath(output_path)}")
+    print(f"Action: Move these files to your 'tbd-detector/' directory before deploying.")
 
 if __name__ == "__main__":
     build_model()
\ No newline at end of file
@@ -0,0 +1,130 @@
+import os
+import numpy as np
+
+# --- Configuration ---
+# Thread controls apply to whichever runtime is selected (0 = runtime default)
+INTRA_OP_THREADS = int(os.environ.get("INFERENCE_INTRA_OP_THREADS", "0"))
+INTER_OP_THREADS = int(os.environ.get("INFERENCE_INTER_OP_THREADS", "0"))
+
+def _first_output(outputs) -> np.ndarray:
+    """SavedModel signatures return {'output_0': tensor}; we only need the main tensor."""
+    if isinstance(outputs, dict):
+        outputs = list(outputs.values())[0]
+    return np.asarray(outputs)
+
+def _configure_tf_threads(tf):
+    if INTRA_OP_THREADS:
+        tf.config.threading.set_intra_op_parallelism_threads(INTRA_OP_THREADS)
+    if INTER_OP_THREADS:
+        tf.config.threading.set_inter_op_parallelism_threads(INTER_OP_THREADS)
+
+class KerasBackend:
+    """V6 baseline: TFSMLayer wrapped in Sequential, called through model.predict()."""
+    name = "keras"
+
+    def __init__(self, model_path: str, input_dim: int):
+        import tensorflow as tf
+        from tensorflow.keras.layers import TFSMLayer
+        _configure_tf_threads(tf)
+        layer = TFSMLayer(model_path, call_endpoint='serving_default')
+        self.model = tf.keras.Sequential([layer])
+
+    def predict(self, batch: np.ndarray) -> np.ndarray:
+        return _first_output(self.model.predict(batch, verbose=0))
+
+class TFFunctionBackend:
+    """
+    Calls the SavedModel signature through a tf.function with a fixed input signature.
+    Traced once at warmup; skips the data-adapter/callback setup of predict().
+    """
+    name = "tf_function"
+
+    def __init__(self, model_path: str, input_dim: int):
+        import tensorflow as tf
+        _configure_tf_threads(tf)
+        self._loaded = tf.saved_model.load(model_path)  # keeps the variables alive
+        serving = self._loaded.signatures['serving_default']
+        input_name = list(serving.structured_input_signature[1].keys())[0]
+
+        @tf.function(input_signature=[tf.TensorSpec([None, input_dim, input_dim, 3], tf.float32)])
+        def infer(batch):
+            return list(serving(**{input_name: batch}).values())[0]
+
+        self._infer = infer
+
+    def predict(self, batch: np.ndarray) -> np.ndarray:
+        return self._infer(batch).numpy()
+
+class OnnxBackend:
+    """ONNX Runtime on the CPU execution provider (no TensorFlow import at all)."""
+    name = "onnx"
+
+    def __init__(self, model_path: str, input_dim: int):
+        import onnxruntime as ort
+        options = ort.SessionOptions()
+        options.intra_op_num_threads = INTRA_OP_THREADS
+        options.inter_op_num_threads = INTER_OP_THREADS
+        options.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self.session = ort.InferenceSession(model_path, sess_options=options, providers=["CPUExecutionProvider"])
+
+        model_input = self.session.get_inputs()[0]
+        self.input_name = model_input.name
+        # The Ultralytics ONNX export is NCHW; the onnx2tf SavedModel is NHWC
+        self.channels_first = model_input.shape[1] == 3
+
+    def predict(self, batch: np.ndarray) -> np.ndarray:
+        if self.channels_first:
+            batch = np.ascontiguousarray(batch.transpose(0, 3, 1, 2))
+        return self.session.run(None, {self.input_name: batch})[0]
+
+class TFLiteBackend:
+    """
+    TFLite interpreter for the quantized variants (dynamic-range, FP16, INT8).
+    Integer-quantized inputs/outputs are (de)quantized here so callers always see float32.
+    """
+    name = "tflite"
+
+    def __init__(self, model_path: str, input_dim: int):
+        import tensorflow as tf
+        self.interpreter = tf.lite.Interpreter(model_path=model_path, num_threads=INTRA_OP_THREADS or None)
+        self.interpreter.allocate_tensors()
+        self.input_detail = self.interpreter.get_input_details()[0]
+        self.output_detail = self.interpreter.get_output_details()[0]
+
+    def _resize(self, batch_size: int):
+        self.interpreter.resize_tensor_input(self.input_detail['index'], [batch_size, *self.input_detail['shape'][1:]])
+        self.interpreter.allocate_tensors()
+        self.input_detail = self.interpreter.get_input_details()[0]
+        self.output_detail = self.interpreter.get_output_details()[0]
+
+    def predict(self, batch: np.ndarray) -> np.ndarray:
+        if batch.shape[0] != self.input_detail['shape'][0]:
+            self._resize(batch.shape[0])
+
+        input_dtype = self.input_detail['dtype']
+        if input_dtype != batch.dtype:
+            scale, zero_point = self.input_detail['quantization']
+            if scale:
+                batch = np.round(batch / scale + zero_point)
+            batch = batch.astype(input_dtype)
+        self.interpreter.set_tensor(self.input_detail['index'], batch)
+        self.interpreter.invoke()
+
+        output = self.interpreter.get_tensor(self.output_detail['index'])
+        scale, zero_point = self.output_detail['quantization']
+        if output.dtype != np.float32 and scale:
+            output = (output.astype(np.float32) - zero_point) * scale
+        return output
+
+BACKENDS = {
+    KerasBackend.name: KerasBackend,
+    TFFunctionBackend.name: TFFunctionBackend,
+    OnnxBackend.name: OnnxBackend,
+    TFLiteBackend.name: TFLiteBackend,
+}
+
+def load_backend(name: str, model_path: str, input_dim: int):
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown INFERENCE_BACKEND '{name}'. Choose from {sorted(BACKENDS)}")
+    return BACKENDS[name](model_path, input_dim)
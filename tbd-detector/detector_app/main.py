@@ -1,17 +1,39 @@
 import os
+import time
 import base64
+import asyncio
+import importlib
 import numpy as np
 import cv2
-import tensorflow as tf
-from tensorflow.keras.layers import TFSMLayer
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Request, UploadFile, File, Form
+from fastapi.responses import JSONResponse
 from pydantic import BaseModel
-from typing import List
+from typing import Dict, List, NamedTuple
+from detector_app.backends import load_backend
+from detector_app.observability import instrument_app, span, MODEL_INFERENCE_SECONDS
+from detector_app.profiler import instrument_profiling
 
 # --- Configuration ---
 INPUT_DIM = 640
 # This matches the folder name created in the Dockerfile
 MODEL_PATH = "model_yolo_dir" 
+ONNX_MODEL_PATH = os.environ.get("ONNX_MODEL_PATH", "model_yolo.onnx")
+# keras (V6 baseline) | tf_function | onnx | tflite
+INFERENCE_BACKEND = os.environ.get("INFERENCE_BACKEND", "tf_function")
+# fp32 | fp16 | dynamic | int8 (variants produced by build_yolo_model.py)
+MODEL_VARIANT = os.environ.get("MODEL_VARIANT", "fp32")
+# variant -> {backend: artifact}. The first entry is the fallback when the requested backend can't serve the variant.
+MODEL_VARIANTS = {
+    "fp32": {"tf_function": MODEL_PATH, "keras": MODEL_PATH, "onnx": ONNX_MODEL_PATH},
+    "fp16": {"tflite": "model_yolo_float16.tflite"},
+    "dynamic": {"tflite": "model_yolo_dynamic_range.tflite", "onnx": "model_yolo_dynamic.onnx"},
+    "int8": {"tflite": "model_yolo_int8.tflite"},
+}
+# Heavy runtime each backend pulls in; imported lazily (off the event loop) at startup
+RUNTIME_MODULES = {"keras": "tensorflow", "tf_function": "tensorflow", "tflite": "tensorflow", "onnx": "onnxruntime"}
+# Standard YOLO letterbox grey, as a normalized value
+LETTERBOX_FILL = 114.0 / 255.0
+NORM_SCALE = np.float32(1.0 / 255.0)
 
 # --- Data Models ---
 class FramePayload(BaseModel):
@@ -22,51 +44,133 @@ class DetectionResult(BaseModel):
     ui_region: List[int] # [x, y, w, h]
     confidence: float
 
+class Letterbox(NamedTuple):
+    scale: float
+    pad_x: int
+    pad_y: int
+    new_w: int
+    new_h: int
+
 # --- Global State ---
-model = None
+MODULE_LOADED_AT = time.perf_counter()
+backend = None
+# loading -> ready | failed. Exposed by /readyz so callers can route around cold instances.
+model_state = "loading"
+startup_timings: Dict[str, float] = {}
+# Reusable model input buffers, keyed by batch size. Endpoints are async and go
+# preprocess -> predict without awaiting in between, so requests never share one mid-flight.
+input_buffers: Dict[int, np.ndarray] = {}
 
 # --- Application Startup ---
 app = FastAPI(title="TbD V6 Object Detector")
+# GET /metrics, and requests carrying the worker's traceparent join the task's trace
+instrument_app(app)
+# Opt-in sampling of profiled tasks' requests (X-TbD-Profile), collected by the worker
+instrument_profiling(app)
 
-@app.on_event("startup")
-async def startup_event():
-    global model
+def load_model():
+    """Imports the runtime, loads and warms the model. Runs off the event loop so /healthz stays live."""
+    global backend, model_state
+    started = time.perf_counter()
     try:
-        print(f"--- Loading YOLOv8 SavedModel from {MODEL_PATH} ---")
-        # V6 Fix: Use TFSMLayer to load raw SavedModel folder
-        # 'serving_default' is the standard signature key for TF SavedModels
-        layer = TFSMLayer(MODEL_PATH, call_endpoint='serving_default')
-        
-        # Wrap in a Sequential model to restore the familiar .predict() API
-        model = tf.keras.Sequential([layer])
-        
-        # Warmup inference (Optional but good for Cloud Run cold starts)
-        dummy_input = np.zeros((1, INPUT_DIM, INPUT_DIM, 3), dtype=np.float32)
-        model.predict(dummy_input, verbose=0)
+        backend_name, model_path = resolve_model(INFERENCE_BACKEND, MODEL_VARIANT)
+        print(f"--- Loading YOLOv8 {MODEL_VARIANT} ({backend_name} backend) from {model_path} ---")
+
+        phase_start = time.perf_counter()
+        importlib.import_module(RUNTIME_MODULES[backend_name])
+        startup_timings["import_runtime_s"] = round(time.perf_counter() - phase_start, 3)
+
+        phase_start = time.perf_counter()
+        loaded = load_backend(backend_name, model_path, INPUT_DIM)
+        startup_timings["load_model_s"] = round(time.perf_counter() - phase_start, 3)
         
+        # Warmup inference (traces the tf.function / primes ORT) before we report ready
+        phase_start = time.perf_counter()
+        loaded.predict(get_input_buffer(1))
+        startup_timings["warmup_s"] = round(time.perf_counter() - phase_start, 3)
+
+        backend = loaded
+        model_state = "ready"
         print(f"✅ Model loaded and warmed up successfully.")
     except Exception as e:
         print(f"CRITICAL: Failed to load YOLO model: {e}")
-        model = None
+        model_state = "failed"
+    finally:
+        startup_timings["load_total_s"] = round(time.perf_counter() - started, 3)
+        print(f"Startup phases: {startup_timings}")
+
+@app.on_event("startup")
+async def startup_event():
+    startup_timings["server_start_s"] = round(time.perf_counter() - MODULE_LOADED_AT, 3)
+    asyncio.get_event_loop().run_in_executor(None, load_model)
 
 # --- Helper Functions ---
-def preprocess_image(frame: np.ndarray):
-    """Resizes image to 640x640 and normalizes to 0-1."""
-    resized = cv2.resize(frame, (INPUT_DIM, INPUT_DIM))
-    # Convert to float32 and normalize
-    normalized = resized.astype(np.float32) / 255.0
-    # Add batch dimension: (1, 640, 640, 3)
-    return np.expand_dims(normalized, axis=0)
-
-def process_yolo_output(predictions, orig_w: int, orig_h: int):
+def resolve_model(backend_name: str, variant: str):
+    """Maps (INFERENCE_BACKEND, MODEL_VARIANT) to the backend and artifact that will be loaded."""
+    if variant not in MODEL_VARIANTS:
+        raise ValueError(f"Unknown MODEL_VARIANT '{variant}'. Choose from {sorted(MODEL_VARIANTS)}")
+    artifacts = MODEL_VARIANTS[variant]
+    if backend_name not in artifacts:
+        fallback = next(iter(artifacts))
+        print(f"WARNING: {backend_name} cannot serve the {variant} variant; using {fallback}.")
+        backend_name = fallback
+    return backend_name, artifacts[backend_name]
+
+def letterbox_params(orig_w: int, orig_h: int) -> Letterbox:
+    """Scale and padding used to letterbox (orig_w, orig_h) into INPUT_DIM x INPUT_DIM."""
+    scale = min(INPUT_DIM / orig_w, INPUT_DIM / orig_h)
+    new_w, new_h = int(round(orig_w * scale)), int(round(orig_h * scale))
+    return Letterbox(scale, (INPUT_DIM - new_w) // 2, (INPUT_DIM - new_h) // 2, new_w, new_h)
+
+def get_input_buffer(batch_size: int = 1) -> np.ndarray:
+    """Returns the preallocated (batch, 640, 640, 3) float32 buffer for this batch size."""
+    buffer = input_buffers.get(batch_size)
+    if buffer is None:
+        buffer = np.empty((batch_size, INPUT_DIM, INPUT_DIM, 3), dtype=np.float32)
+        input_buffers[batch_size] = buffer
+    return buffer
+
+def _normalize_into(bgr: np.ndarray, out: np.ndarray):
+    """BGR->RGB and 0-1 scaling in a single pass, written straight into `out`."""
+    np.multiply(bgr[..., ::-1], NORM_SCALE, out=out, dtype=np.float32)
+
+def preprocess_image(frame: np.ndarray, batch_index: int = 0, batch_size: int = 1):
+    """
+    Letterboxes a BGR frame into slot `batch_index` of the reusable input buffer (RGB, 0-1).
+    Returns the whole batch buffer plus the letterbox geometry for coordinate mapping.
+    """
+    orig_h, orig_w = frame.shape[:2]
+    lb = letterbox_params(orig_w, orig_h)
+    buffer = get_input_buffer(batch_size)
+    slot = buffer[batch_index]
+
+    # Same interpolation as the worker's letterbox (app/services/frames.py LETTERBOX_INTERPOLATION)
+    resized = cv2.resize(frame, (lb.new_w, lb.new_h), interpolation=cv2.INTER_LINEAR)
+    bottom, right = lb.pad_y + lb.new_h, lb.pad_x + lb.new_w
+    _normalize_into(resized, slot[lb.pad_y:bottom, lb.pad_x:right])
+
+    # Only the padding bands need the fill value; the image region was just overwritten
+    slot[:lb.pad_y] = LETTERBOX_FILL
+    slot[bottom:] = LETTERBOX_FILL
+    slot[lb.pad_y:bottom, :lb.pad_x] = LETTERBOX_FILL
+    slot[lb.pad_y:bottom, right:] = LETTERBOX_FILL
+
+    return buffer, lb
+
+def preprocess_letterboxed(frame: np.ndarray, orig_w: int, orig_h: int, batch_index: int = 0, batch_size: int = 1):
+    """Same as preprocess_image for frames the client already letterboxed to INPUT_DIM."""
+    if frame.shape[:2] != (INPUT_DIM, INPUT_DIM):
+        raise ValueError(f"Expected a {INPUT_DIM}x{INPUT_DIM} letterboxed frame, got {frame.shape}")
+
+    buffer = get_input_buffer(batch_size)
+    _normalize_into(frame, buffer[batch_index])
+    return buffer, letterbox_params(orig_w, orig_h)
+
+def process_yolo_output(predictions, lb: Letterbox, orig_w: int, orig_h: int):
     """
     Parses raw YOLOv8 output tensor.
+    Boxes are mapped back through the letterbox: padding removed, then un-scaled.
     """
-    # TFSMLayer output is often a dictionary {'output_0': tensor}
-    if isinstance(predictions, dict):
-        # Extract the first value (the main output tensor)
-        predictions = list(predictions.values())[0]
-    
     # Predictions shape is (1, 84, 8400) -> 4 box coords + 80 classes
     # We need to transpose to (1, 8400, 84) to iterate over anchors
     output = predictions[0].T 
@@ -85,30 +189,102 @@ def process_yolo_output(predictions, orig_w: int, orig_h: int):
 
     # Map from 640x640 back to Original Resolution
     # Note: YOLOv8 outputs are relative to the *input* image size (640)
-    scale_x = orig_w / INPUT_DIM
-    scale_y = orig_h / INPUT_DIM
-
-    pixel_w = int(w * scale_x)
-    pixel_h = int(h * scale_y)
+    pixel_w = int(w / lb.scale)
+    pixel_h = int(h / lb.scale)
     
-    center_x = int(xc * scale_x)
-    center_y = int(yc * scale_y)
+    center_x = int((xc - lb.pad_x) / lb.scale)
+    center_y = int((yc - lb.pad_y) / lb.scale)
     
     pixel_x = int(center_x - (pixel_w / 2))
     pixel_y = int(center_y - (pixel_h / 2))
 
     # Clamp to image boundaries
-    pixel_x = max(0, pixel_x)
-    pixel_y = max(0, pixel_y)
+    pixel_x = min(max(0, pixel_x), orig_w)
+    pixel_y = min(max(0, pixel_y), orig_h)
+    pixel_w = min(pixel_w, orig_w - pixel_x)
+    pixel_h = min(pixel_h, orig_h - pixel_y)
 
     return [pixel_x, pixel_y, pixel_w, pixel_h], float(max_conf)
 
-# --- Endpoint ---
+def _require_ready() -> bool:
+    """503 while warming up, so callers retry elsewhere; False if the model failed to load."""
+    if model_state == "loading":
+        raise HTTPException(status_code=503, detail="Model is still warming up")
+    return backend is not None
+
+def _predict(input_tensor: np.ndarray) -> np.ndarray:
+    """backend.predict, timed into tbd_model_inference_seconds and logged as a span of the caller's trace."""
+    with span("inference", backend=backend.name, variant=MODEL_VARIANT), \
+            MODEL_INFERENCE_SECONDS.time(model="yolov8", backend=backend.name, variant=MODEL_VARIANT):
+        return backend.predict(input_tensor)
+
+def _detect_letterboxed(frame: np.ndarray, orig_w: int, orig_h: int) -> DetectionResult:
+    """Runs inference on a frame the client already letterboxed to INPUT_DIM."""
+    input_tensor, lb = preprocess_letterboxed(frame, orig_w, orig_h)
+    raw_preds = _predict(input_tensor)
+    ui_region, conf = process_yolo_output(raw_preds, lb, orig_w, orig_h)
+    return DetectionResult(ui_region=ui_region, confidence=conf)
+
+# --- Endpoints ---
+@app.get("/healthz")
+async def healthz():
+    """Liveness: the process is up and serving, model or not."""
+    return {"status": "alive"}
+
+@app.get("/readyz")
+async def readyz():
+    """Readiness: the model is loaded and warm. Includes the startup phase breakdown."""
+    body = {
+        "state": model_state,
+        "backend": backend.name if backend else INFERENCE_BACKEND,
+        "variant": MODEL_VARIANT,
+        "startup": startup_timings,
+    }
+    if model_state != "ready":
+        return JSONResponse(status_code=503, content=body)
+    return body
+
+@app.post("/detect_coordinates_raw", response_model=DetectionResult)
+async def detect_coordinates_raw(request: Request, orig_w: int, orig_h: int, target_text: str = "default"):
+    """Binary transport: body is a raw uint8 (INPUT_DIM, INPUT_DIM, 3) BGR tensor."""
+    if not _require_ready():
+        return DetectionResult(ui_region=[0,0,0,0], confidence=0.0)
+
+    try:
+        body = await request.body()
+        frame = np.frombuffer(body, np.uint8).reshape(INPUT_DIM, INPUT_DIM, 3)
+        return _detect_letterboxed(frame, orig_w, orig_h)
+
+    except Exception as e:
+        print(f"Inference Error: {e}")
+        return DetectionResult(ui_region=[0,0,0,0], confidence=0.0)
+
+@app.post("/detect_coordinates_file", response_model=DetectionResult)
+async def detect_coordinates_file(
+    frame: UploadFile = File(...),
+    orig_w: int = Form(...),
+    orig_h: int = Form(...),
+    target_text: str = Form("default")
+):
+    """Multipart transport: a letterboxed JPEG without the base64/JSON wrapping."""
+    if not _require_ready():
+        return DetectionResult(ui_region=[0,0,0,0], confidence=0.0)
+
+    try:
+        np_arr = np.frombuffer(await frame.read(), np.uint8)
+        decoded = cv2.imdecode(np_arr, cv2.IMREAD_COLOR)
+        if decoded is None:
+            raise ValueError("Image decode failed")
+        return _detect_letterboxed(decoded, orig_w, orig_h)
+
+    except Exception as e:
+        print(f"Inference Error: {e}")
+        return DetectionResult(ui_region=[0,0,0,0], confidence=0.0)
+
+# Legacy V6 transport (base64 JPEG in JSON), kept for older workers
 @app.post("/detect_coordinates", response_model=DetectionResult)
 async def detect_coordinates(payload: FramePayload):
-    global model
-    
-    if model is None:
+    if not _require_ready():
         return DetectionResult(ui_region=[0,0,0,0], confidence=0.0)
 
     try:
@@ -123,13 +299,13 @@ async def detect_coordinates(payload: FramePayload):
         orig_h, orig_w = frame.shape[:2]
 
         # 2. Preprocess
-        input_tensor = preprocess_image(frame)
+        input_tensor, lb = preprocess_image(frame)
         
         # 3. Inference
-        raw_preds = model.predict(input_tensor, verbose=0)
+        raw_preds = _predict(input_tensor)
         
         # 4. Post-Process & Map Coordinates
-        ui_region, conf = process_yolo_output(raw_preds, orig_w, orig_h)
+        ui_region, conf = process_yolo_output(raw_preds, lb, orig_w, orig_h)
 
         return DetectionResult(ui_region=ui_region, confidence=conf)
 
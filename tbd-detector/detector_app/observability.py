@@ -0,0 +1,296 @@
+# detector_app/observability.py
+# V6: Tracing and Prometheus metrics for Service D (a copy of the worker's app/services/observability.py:
+# this image ships on its own). The worker sends its current span as a W3C `traceparent` header; the
+# request joins that trace, so span lines logged here share the task's trace id. GET /metrics adds
+# tbd_model_inference_seconds to the request latency histograms and in-flight gauges.
+
+import os
+import json
+import time
+import uuid
+import bisect
+import hashlib
+import secrets
+import threading
+import contextlib
+import contextvars
+from typing import Dict, Any, Optional, Tuple, Sequence, NamedTuple
+
+PROJECT_ID = os.environ.get("GCP_PROJECT_ID", "tbd-v2")
+SERVICE_NAME = os.environ.get("K_SERVICE") or "tbd-detector"
+# One JSON log line per finished span; set TRACE_LOG_SPANS=0 to keep only the metrics
+TRACE_LOG_SPANS = os.environ.get("TRACE_LOG_SPANS", "1") == "1"
+METRICS_PATH = "/metrics"
+METRICS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Seconds
+STAGE_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0, 600.0)
+INFERENCE_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+
+# --- Metrics ---
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra: pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+def _format_value(value: float) -> str:
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help_text = help_text
+        self.labelnames = tuple(labelnames)
+        self.lock = threading.Lock()
+        self.values: Dict[Tuple[str, ...], Any] = {}
+        REGISTRY.append(self)
+
+    def _key(self, labels: Dict[str, Any]) -> Tuple[str, ...]:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} {self.kind}"]
+        with self.lock:
+            for key, value in sorted(self.values.items()):
+                lines.extend(self._samples(key, value))
+        return "\n".join(lines)
+
+    def _samples(self, key, value):
+        yield f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = self._key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0.0) + amount
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = self._key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0.0) + amount
+
+    def dec(self, amount: float = 1.0, **labels):
+        self.inc(-amount, **labels)
+
+    def set(self, value: float, **labels):
+        with self.lock:
+            self.values[self._key(labels)] = float(value)
+
+    @contextlib.contextmanager
+    def track(self, **labels):
+        self.inc(**labels)
+        try:
+            yield
+        finally:
+            self.dec(**labels)
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = STAGE_BUCKETS):
+        super().__init__(name, help_text, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)  # le is inclusive
+        with self.lock:
+            state = self.values.get(key)
+            if state is None:
+                # [per-bucket counts (non-cumulative, last slot is +Inf), sum, count]
+                state = self.values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][index] += 1
+            state[1] += value
+            state[2] += 1
+
+    @contextlib.contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def _samples(self, key, state):
+        counts, total, count = state
+        cumulative = 0
+        for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+            cumulative += bucket_count
+            le = 'le="+Inf"' if bound == float("inf") else f'le="{_format_value(bound)}"'
+            yield f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}"
+        yield f"{self.name}_sum{_format_labels(self.labelnames, key)} {_format_value(total)}"
+        yield f"{self.name}_count{_format_labels(self.labelnames, key)} {count}"
+
+REGISTRY: list = []
+
+def render_metrics() -> str:
+    return "\n".join(metric.render() for metric in REGISTRY) + "\n"
+
+STAGE_SECONDS = Histogram("tbd_stage_duration_seconds", "Wall time of one pipeline stage.", ["stage", "outcome"])
+STAGE_IN_FLIGHT = Gauge("tbd_stage_in_flight", "Pipeline stages currently running.", ["stage"])
+HTTP_SECONDS = Histogram("tbd_http_request_duration_seconds", "HTTP request latency (time to response headers).",
+                         ["method", "route", "status"])
+HTTP_IN_FLIGHT = Gauge("tbd_http_requests_in_flight", "HTTP requests currently being served.")
+MODEL_INFERENCE_SECONDS = Histogram("tbd_model_inference_seconds", "Model forward pass time.",
+                                    ["model", "backend", "variant"], INFERENCE_BUCKETS)
+
+# --- Trace context ---
+
+class SpanContext(NamedTuple):
+    trace_id: str       # 32 lowercase hex (W3C trace-id)
+    span_id: str        # 16 lowercase hex; "" for a bare trace with no span yet
+
+_current: contextvars.ContextVar[Optional[SpanContext]] = contextvars.ContextVar("tbd_span", default=None)
+
+def normalize_trace_id(value: Optional[str]) -> str:
+    """Maps the dispatcher's trace_id (a UUID) onto a W3C trace-id; anything else is hashed, missing -> new."""
+    if not value or value == "no-trace":
+        return secrets.token_hex(16)
+    value = value.strip().lower()
+    if len(value) == 32 and all(c in "0123456789abcdef" for c in value):
+        return value
+    try:
+        return uuid.UUID(value).hex
+    except ValueError:
+        return hashlib.md5(value.encode("utf-8")).hexdigest()
+
+def parse_traceparent(header: Optional[str]) -> Optional[SpanContext]:
+    """`00-<trace-id>-<parent-id>-<flags>` -> SpanContext, None if absent or malformed."""
+    parts = (header or "").strip().lower().split("-")
+    if len(parts) != 4 or len(parts[1]) != 32 or len(parts[2]) != 16:
+        return None
+    if parts[1] == "0" * 32 or parts[2] == "0" * 16:
+        return None
+    try:
+        int(parts[1], 16), int(parts[2], 16)
+    except ValueError:
+        return None
+    return SpanContext(parts[1], parts[2])
+
+def current_trace_id() -> Optional[str]:
+    context = _current.get()
+    return context.trace_id if context else None
+
+def trace_headers() -> Dict[str, str]:
+    """Headers that carry the current span to a downstream service (empty outside a trace)."""
+    context = _current.get()
+    if context is None:
+        return {}
+    span_id = context.span_id or secrets.token_hex(8)
+    return {"traceparent": f"00-{context.trace_id}-{span_id}-01"}
+
+@contextlib.contextmanager
+def trace(trace_id: Optional[str] = None, parent_span_id: str = ""):
+    """Makes trace_id the current trace (spans opened inside become its children)."""
+    token = _current.set(SpanContext(normalize_trace_id(trace_id), parent_span_id))
+    try:
+        yield _current.get()
+    finally:
+        _current.reset(token)
+
+class Span:
+    def __init__(self, stage: str, context: SpanContext, parent_span_id: str, attributes: Dict[str, Any]):
+        self.stage = stage
+        self.context = context
+        self.parent_span_id = parent_span_id
+        self.attributes = attributes
+
+    def set(self, **attributes):
+        """Adds attributes known only once the stage has run (node counts, status codes...)."""
+        self.attributes.update(attributes)
+
+def _log_span(span: Span, duration_s: float, outcome: str):
+    entry = {
+        "severity": "INFO" if outcome == "ok" else "WARNING",
+        "message": f"span {span.stage} {duration_s * 1000:.1f}ms {outcome}",
+        "service": SERVICE_NAME,
+        "span": span.stage,
+        "duration_ms": round(duration_s * 1000, 2),
+        "outcome": outcome,
+        "trace_id": span.context.trace_id,
+        "span_id": span.context.span_id,
+        "parent_span_id": span.parent_span_id,
+        **span.attributes,
+        "logging.googleapis.com/trace": f"projects/{PROJECT_ID}/traces/{span.context.trace_id}",
+        "logging.googleapis.com/spanId": span.context.span_id,
+    }
+    print(json.dumps(entry, default=str))
+
+@contextlib.contextmanager
+def span(stage: str, **attributes):
+    """
+    Times one stage: observed into tbd_stage_duration_seconds{stage, outcome} and logged as a JSON
+    line. Works in sync and async code (the context is a contextvar, so concurrent tasks don't mix).
+    Opened outside any trace, it starts a new one.
+    """
+    parent = _current.get()
+    context = SpanContext(parent.trace_id if parent else secrets.token_hex(16), secrets.token_hex(8))
+    current = Span(stage, context, parent.span_id if parent else "", attributes)
+    token = _current.set(context)
+    STAGE_IN_FLIGHT.inc(stage=stage)
+    outcome = "ok"
+    start = time.perf_counter()
+    try:
+        yield current
+    except BaseException as e:
+        outcome = "error"
+        current.attributes.setdefault("error", f"{type(e).__name__}: {e}")
+        raise
+    finally:
+        duration = time.perf_counter() - start
+        _current.reset(token)
+        STAGE_IN_FLIGHT.dec(stage=stage)
+        STAGE_SECONDS.observe(duration, stage=stage, outcome=outcome)
+        if TRACE_LOG_SPANS:
+            _log_span(current, duration, outcome)
+
+# --- FastAPI ---
+
+def _route_template(app, scope) -> str:
+    """The matched route's path template (/tasks/{task_id}), so labels don't grow with every id."""
+    from starlette.routing import Match
+    for route in app.router.routes:
+        match, _ = route.matches(scope)
+        if match == Match.FULL:
+            return getattr(route, "path", "other")
+    return "unmatched"
+
+def instrument_app(app):
+    """Request latency/in-flight metrics, incoming traceparent -> trace context, and GET /metrics."""
+    from fastapi import Request
+    from fastapi.responses import Response
+
+    @app.middleware("http")
+    async def observe_request(request: Request, call_next):
+        if request.url.path == METRICS_PATH:
+            return await call_next(request)
+        incoming = parse_traceparent(request.headers.get("traceparent"))
+        status = 500
+        start = time.perf_counter()
+        # Without an incoming traceparent, spans opened by the handler start their own trace
+        joined = trace(incoming.trace_id, incoming.span_id) if incoming else contextlib.nullcontext()
+        with HTTP_IN_FLIGHT.track(), joined:
+            try:
+                response = await call_next(request)
+                status = response.status_code
+                return response
+            finally:
+                HTTP_SECONDS.observe(time.perf_counter() - start, method=request.method,
+                                     route=_route_template(app, request.scope), status=status)
+
+    @app.get(METRICS_PATH, include_in_schema=False)
+    def metrics():
+        return Response(render_metrics(), media_type=METRICS_CONTENT_TYPE)
+
+    return app
@@ -0,0 +1,216 @@
+# detector_app/profiler.py
+# V6: Opt-in sampling profiler for Service D (the worker's app/services/profiler.py sampler; this image
+# ships on its own). Requests carrying X-TbD-Profile (sent by the worker for a profiled task), or every
+# request with PROFILE_REQUESTS=1, are sampled while in flight. Samples accumulate per trace id, and the
+# worker collects them from GET /debug/profile/{trace_id} to store next to the task's pathway.json.
+# Other requests only pay a header scan.
+
+import os
+import sys
+import json
+import time
+import threading
+import contextlib
+from collections import Counter, OrderedDict
+from typing import Dict, List, Tuple, Optional, Any
+
+PROFILE_REQUESTS = os.environ.get("PROFILE_REQUESTS", "0") == "1"
+PROFILE_INTERVAL_S = float(os.environ.get("PROFILE_INTERVAL_MS", "10")) / 1000
+PROFILE_MAX_DEPTH = 128
+PROFILE_HEADER = b"x-tbd-profile"
+PROFILE_MEDIA_TYPES = {"speedscope": "application/json", "collapsed": "text/plain"}
+# Profiles kept for collection; the oldest idle one is dropped beyond this
+PROFILE_KEEP_TRACES = 32
+
+# Leaf frames of a thread that is parked, not running Python: event loop in select, idle pool workers
+IDLE_LEAVES = {
+    ("selectors.py", "select"),
+    ("threading.py", "wait"),
+    ("thread.py", "_worker"),
+    ("queue.py", "get"),
+}
+
+class SamplingProfiler:
+    """Counts Python stacks of all other threads every interval_s while started (restartable: samples add up)."""
+
+    def __init__(self, interval_s: float = PROFILE_INTERVAL_S):
+        self.interval_s = interval_s
+        self.samples: Counter = Counter()     # (thread name, frame, frame, ...) root -> leaf
+        self.idle_samples = 0
+        self.started_at = 0.0
+        self.duration_s = 0.0
+        self._labels: Dict[Any, str] = {}
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> "SamplingProfiler":
+        self.started_at = time.time()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="tbd-profiler", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> "SamplingProfiler":
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+        self.duration_s += time.time() - self.started_at
+        return self
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+        return False
+
+    def _run(self):
+        while not self._stop.wait(self.interval_s):
+            self.sample()
+
+    def _label(self, code) -> str:
+        label = self._labels.get(code)
+        if label is None:
+            label = f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})".replace(";", ",")
+            self._labels[code] = label
+        return label
+
+    def sample(self):
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        me = threading.get_ident()
+        for ident, frame in sys._current_frames().items():
+            if ident == me:
+                continue
+            code = frame.f_code
+            if (os.path.basename(code.co_filename), code.co_name) in IDLE_LEAVES:
+                self.idle_samples += 1
+                continue
+            stack = []
+            while frame is not None and len(stack) < PROFILE_MAX_DEPTH:
+                stack.append(self._label(frame.f_code))
+                frame = frame.f_back
+            stack.append(names.get(ident, f"thread-{ident}"))
+            self.samples[tuple(reversed(stack))] += 1
+
+    # --- Output ---
+
+    def collapsed(self) -> str:
+        """Brendan Gregg's folded format: `thread;outer;...;leaf <samples>` per line."""
+        lines = [f"{';'.join(stack)} {count}" for stack, count in Counter(dict(self.samples)).most_common()]
+        return "\n".join(lines) + "\n"
+
+    def speedscope(self, name: str = "tbd") -> Dict[str, Any]:
+        """speedscope file format: one sampled profile per thread, weights in seconds."""
+        frames: List[Dict[str, Any]] = []
+        frame_index: Dict[str, int] = {}
+        by_thread: Dict[str, Tuple[List[List[int]], List[float]]] = {}
+        for stack, count in Counter(dict(self.samples)).most_common():
+            indices = []
+            for label in stack[1:]:
+                if label not in frame_index:
+                    frame_index[label] = len(frames)
+                    function, _, location = label.rpartition(" (")
+                    file, _, line = location.rstrip(")").rpartition(":")
+                    frames.append({"name": function, "file": file, "line": int(line)})
+                indices.append(frame_index[label])
+            stacks, weights = by_thread.setdefault(stack[0], ([], []))
+            stacks.append(indices)
+            weights.append(round(count * self.interval_s, 6))
+
+        profiles = [{
+            "type": "sampled", "name": thread, "unit": "seconds",
+            "startValue": 0, "endValue": round(sum(weights), 6),
+            "samples": stacks, "weights": weights,
+        } for thread, (stacks, weights) in by_thread.items()]
+        return {
+            "$schema": "https://www.speedscope.app/file-format-schema.json",
+            "name": name,
+            "exporter": "tbd-profiler",
+            "activeProfileIndex": 0,
+            "shared": {"frames": frames},
+            "profiles": profiles,
+        }
+
+    def render(self, fmt: str, name: str = "tbd") -> str:
+        return json.dumps(self.speedscope(name)) if fmt == "speedscope" else self.collapsed()
+
+    def summary(self) -> Dict[str, Any]:
+        return {"samples": sum(dict(self.samples).values()), "idle_samples": self.idle_samples,
+                "interval_ms": self.interval_s * 1000, "duration_s": round(self.duration_s, 3)}
+
+class TraceProfiles:
+    """
+    One SamplingProfiler per trace id, running while that trace has a request in flight.
+    Samplers see every thread, so requests of two traces profiled at the same time show up in both.
+    """
+
+    def __init__(self, keep: int = PROFILE_KEEP_TRACES):
+        self.keep = keep
+        self.lock = threading.Lock()
+        self.profiles: "OrderedDict[str, SamplingProfiler]" = OrderedDict()
+        self.active: Counter = Counter()
+
+    @contextlib.contextmanager
+    def attach(self, trace_id: str):
+        with self.lock:
+            profiler = self.profiles.get(trace_id)
+            if profiler is None:
+                profiler = self.profiles[trace_id] = SamplingProfiler()
+                for old in list(self.profiles):
+                    if len(self.profiles) <= self.keep: break
+                    if old not in self.active: del self.profiles[old]
+            self.profiles.move_to_end(trace_id)
+            self.active[trace_id] += 1
+            if self.active[trace_id] == 1:
+                profiler.start()
+        try:
+            yield profiler
+        finally:
+            with self.lock:
+                self.active[trace_id] -= 1
+                if not self.active[trace_id]:
+                    del self.active[trace_id]
+                    profiler.stop()
+
+    def get(self, trace_id: str) -> Optional[SamplingProfiler]:
+        with self.lock:
+            return self.profiles.get(trace_id)
+
+PROFILES = TraceProfiles()
+
+def _trace_id(headers) -> str:
+    """trace-id of a W3C traceparent header, "untraced" without one."""
+    for name, value in headers:
+        if name == b"traceparent":
+            parts = value.decode("latin-1").split("-")
+            if len(parts) == 4 and len(parts[1]) == 32:
+                return parts[1].lower()
+    return "untraced"
+
+class ProfileMiddleware:
+    """Plain ASGI middleware (no per-request overhead beyond the header check)."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not (PROFILE_REQUESTS or any(name == PROFILE_HEADER for name, _ in scope["headers"])):
+            return await self.app(scope, receive, send)
+        with PROFILES.attach(_trace_id(scope["headers"])):
+            await self.app(scope, receive, send)
+
+def instrument_profiling(app):
+    """Adds the profiling middleware and GET /debug/profile/{trace_id}?format=speedscope|collapsed."""
+    from fastapi import HTTPException
+    from fastapi.responses import Response
+
+    app.add_middleware(ProfileMiddleware)
+
+    @app.get("/debug/profile/{trace_id}", include_in_schema=False)
+    def get_profile(trace_id: str, format: str = "speedscope"):
+        profiler = PROFILES.get(trace_id)
+        if profiler is None or format not in PROFILE_MEDIA_TYPES:
+            raise HTTPException(status_code=404, detail=f"No {format} profile for trace {trace_id}")
+        return Response(profiler.render(format, name=f"{app.title} {trace_id}"), media_type=PROFILE_MEDIA_TYPES[format])
+
+    return app
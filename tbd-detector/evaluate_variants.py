@@ -0,0 +1,143 @@
+"""
+Accuracy-vs-latency report for the Service D model variants.
+Box IoU is measured against the fp32 baseline, next to p50/p99 latency and memory.
+Each variant runs in its own subprocess so its memory numbers are not polluted by the others.
+Run from tbd-detector/:  python evaluate_variants.py [--images path/to/frames]
+"""
+import argparse
+import glob
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import numpy as np
+import cv2
+
+from detector_app.backends import load_backend
+from detector_app.main import INPUT_DIM, MODEL_VARIANTS, preprocess_image, process_yolo_output
+
+CALIBRATION_DATA = "calibration_image_sample_data_20x128x128x3_float32.npy"
+# (variant, backend); the first entry is the accuracy baseline
+VARIANTS = [
+    ("fp32", "tf_function"),
+    ("fp32", "onnx"),
+    ("dynamic", "onnx"),
+    ("dynamic", "tflite"),
+    ("fp16", "tflite"),
+    ("int8", "tflite"),
+]
+
+def _memory_mb() -> dict:
+    """Current and peak RSS of this process (Linux /proc; falls back to ru_maxrss)."""
+    try:
+        with open("/proc/self/status") as f:
+            fields = dict(line.split(":", 1) for line in f if ":" in line)
+        return {"rss_mb": int(fields["VmRSS"].split()[0]) / 1024, "peak_rss_mb": int(fields["VmHWM"].split()[0]) / 1024}
+    except (OSError, KeyError):
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+        return {"rss_mb": peak, "peak_rss_mb": peak}
+
+def _load_frames(image_dir: str, limit: int) -> list:
+    """BGR evaluation frames: real screenshots if given, else upscaled calibration samples (16:9)."""
+    if image_dir:
+        paths = sorted(glob.glob(os.path.join(image_dir, "*.png")) + glob.glob(os.path.join(image_dir, "*.jpg")))
+        return [cv2.imread(p) for p in paths[:limit]]
+
+    samples = np.load(CALIBRATION_DATA)[:limit]
+    frames = []
+    for sample in samples:
+        bgr = (np.clip(sample, 0.0, 1.0) * 255).astype(np.uint8)[..., ::-1]
+        frames.append(cv2.resize(bgr, (1280, 720)))
+    return frames
+
+def _box_iou(a, b) -> float:
+    ax, ay, aw, ah = a
+    bx, by, bw, bh = b
+    inter_w = max(0.0, min(ax + aw, bx + bw) - max(ax, bx))
+    inter_h = max(0.0, min(ay + ah, by + bh) - max(ay, by))
+    inter = inter_w * inter_h
+    union = aw * ah + bw * bh - inter
+    return inter / union if union > 0 else 1.0
+
+def run_variant(variant: str, backend_name: str, image_dir: str, limit: int, out_path: str):
+    """Child process: load one variant, run every frame, save boxes + latencies."""
+    before = _memory_mb()
+    backend = load_backend(backend_name, MODEL_VARIANTS[variant][backend_name], INPUT_DIM)
+    loaded = _memory_mb()
+
+    frames = _load_frames(image_dir, limit)
+    backend.predict(preprocess_image(frames[0])[0])  # warmup
+
+    boxes, latencies = [], []
+    for frame in frames:
+        orig_h, orig_w = frame.shape[:2]
+        batch, lb = preprocess_image(frame)
+        start = time.perf_counter()
+        predictions = backend.predict(batch)
+        latencies.append((time.perf_counter() - start) * 1000.0)
+        ui_region, conf = process_yolo_output(predictions, lb, orig_w, orig_h)
+        boxes.append([*ui_region, conf])
+
+    np.savez(out_path, boxes=np.array(boxes, dtype=np.float64), latencies=np.array(latencies))
+    print(json.dumps({
+        "load_rss_mb": round(loaded["rss_mb"] - before["rss_mb"], 1),
+        "peak_rss_mb": round(_memory_mb()["peak_rss_mb"], 1),
+    }))
+
+def main(image_dir: str, limit: int, as_json: bool):
+    results, baseline = [], None
+    with tempfile.TemporaryDirectory() as tmp:
+        for variant, backend_name in VARIANTS:
+            out_path = os.path.join(tmp, f"{variant}_{backend_name}.npz")
+            cmd = [sys.executable, __file__, "--child", variant, backend_name, "--out", out_path, "--limit", str(limit)]
+            if image_dir:
+                cmd += ["--images", image_dir]
+            proc = subprocess.run(cmd, capture_output=True, text=True)
+            if proc.returncode != 0 or not os.path.exists(out_path):
+                results.append({"variant": variant, "backend": backend_name, "error": proc.stderr.strip().splitlines()[-1:]})
+                continue
+
+            memory = json.loads(proc.stdout.strip().splitlines()[-1])
+            data = np.load(out_path)
+            boxes, latencies = data["boxes"], data["latencies"]
+            if baseline is None:
+                baseline = boxes
+
+            ious = np.array([_box_iou(b[:4], ref[:4]) for b, ref in zip(boxes, baseline)])
+            results.append({
+                "variant": variant,
+                "backend": backend_name,
+                "mean_iou": round(float(ious.mean()), 4),
+                "min_iou": round(float(ious.min()), 4),
+                "mean_conf_delta": round(float(np.abs(boxes[:, 4] - baseline[:, 4]).mean()), 4),
+                "p50_ms": round(float(np.percentile(latencies, 50)), 2),
+                "p99_ms": round(float(np.percentile(latencies, 99)), 2),
+                **memory,
+            })
+
+    for r in results:
+        if as_json:
+            print(json.dumps(r))
+        elif "error" in r:
+            print(f"{r['variant']:<8} {r['backend']:<12} FAILED: {r['error']}")
+        else:
+            print(f"{r['variant']:<8} {r['backend']:<12} IoU mean {r['mean_iou']:.3f} min {r['min_iou']:.3f} | "
+                  f"p50 {r['p50_ms']:>7.1f}ms p99 {r['p99_ms']:>7.1f}ms | "
+                  f"load +{r['load_rss_mb']:.0f}MB peak {r['peak_rss_mb']:.0f}MB")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--images", default="", help="Directory of .png/.jpg frames (default: calibration samples)")
+    parser.add_argument("--limit", type=int, default=20)
+    parser.add_argument("--json", action="store_true")
+    parser.add_argument("--child", nargs=2, metavar=("VARIANT", "BACKEND"), help=argparse.SUPPRESS)
+    parser.add_argument("--out", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_variant(args.child[0], args.child[1], args.images, args.limit, args.out)
+    else:
+        main(args.images, args.limit, args.json)
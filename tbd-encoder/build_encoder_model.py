@@ -0,0 +1,91 @@
+import os
+import sys
+import numpy as np
+import tensorflow as tf
+
+# Reuse the service's rebuild logic so the exported graph is exactly what Service C serves
+from encoder_app.main import rebuild_encoder, MAX_SEQUENCE_LENGTH, VOCAB_SIZE_WEIGHTS, SAVED_MODEL_PATH
+
+# --- CONFIGURATION ---
+ONNX_MODEL_NAME = "encoder_model.onnx"
+ONNX_OPSET = 13
+CALIBRATION_SAMPLES = 200
+
+# Quantized variants loaded by Service C via MODEL_VARIANT
+TFLITE_VARIANTS = {
+    "dynamic": "encoder_model_dynamic_range.tflite",
+    "fp16": "encoder_model_float16.tflite",
+    "int8": "encoder_model_int8.tflite",
+}
+ONNX_DYNAMIC_MODEL = "encoder_model_dynamic.onnx"
+
+def _representative_dataset():
+    """Pre-padded token sequences of varying length, like the ones /encode_sequence builds."""
+    rng = np.random.default_rng(0)
+    seq_len = MAX_SEQUENCE_LENGTH - 1
+    for _ in range(CALIBRATION_SAMPLES):
+        token_ids = np.zeros((1, seq_len), dtype=np.int32)
+        n_tokens = rng.integers(5, seq_len + 1)
+        token_ids[0, seq_len - n_tokens:] = rng.integers(1, VOCAB_SIZE_WEIGHTS, size=n_tokens)
+        yield [token_ids]
+
+def build_quantized_variants(encoder):
+    for variant, output_path in TFLITE_VARIANTS.items():
+        print(f"--- Quantizing: {variant} -> {output_path} ---")
+        converter = tf.lite.TFLiteConverter.from_keras_model(encoder)
+        converter.optimizations = [tf.lite.Optimize.DEFAULT]
+        # The LSTM may lower to ops without a builtin kernel; fall back to TF ops rather than fail
+        converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS, tf.lite.OpsSet.SELECT_TF_OPS]
+
+        if variant == "fp16":
+            converter.target_spec.supported_types = [tf.float16]
+        elif variant == "int8":
+            converter.representative_dataset = _representative_dataset
+
+        with open(output_path, "wb") as f:
+            f.write(converter.convert())
+
+    print(f"--- Quantizing: ONNX dynamic INT8 -> {ONNX_DYNAMIC_MODEL} ---")
+    from onnxruntime.quantization import quantize_dynamic, QuantType
+    quantize_dynamic(ONNX_MODEL_NAME, ONNX_DYNAMIC_MODEL, weight_type=QuantType.QInt8)
+
+def export_saved_model(encoder):
+    """Pre-traced serving graph: Service C loads this instead of rebuilding + load_weights at startup."""
+    @tf.function(input_signature=[tf.TensorSpec((None, MAX_SEQUENCE_LENGTH - 1), tf.int32, name="input_sequence")])
+    def serve(input_sequence):
+        return {"temporal_context_vector": encoder(input_sequence, training=False)}
+
+    tf.saved_model.save(encoder, SAVED_MODEL_PATH, signatures={"serving_default": serve})
+
+def build_model(saved_model_only: bool = False):
+    print("--- 1. Rebuilding Temporal Encoder from lstm_model.h5 ---")
+    encoder = rebuild_encoder()
+
+    print(f"--- 2. Exporting pre-traced SavedModel ({SAVED_MODEL_PATH}) ---")
+    export_saved_model(encoder)
+    if saved_model_only:
+        print(f"Generated: {os.path.abspath(SAVED_MODEL_PATH)}")
+        return
+
+    import tf2onnx
+    print(f"--- 3. Exporting to ONNX ({ONNX_MODEL_NAME}, opset {ONNX_OPSET}) ---")
+    # Fixed sequence length, dynamic batch: matches the tf_function backend signature
+    input_signature = (tf.TensorSpec((None, MAX_SEQUENCE_LENGTH - 1), tf.int32, name="input_sequence"),)
+    tf2onnx.convert.from_keras(
+        encoder,
+        input_signature=input_signature,
+        opset=ONNX_OPSET,
+        output_path=ONNX_MODEL_NAME
+    )
+
+    print("--- 4. Building Quantized Variants (dynamic / fp16 / int8) ---")
+    build_quantized_variants(encoder)
+
+    print(f"--- SUCCESS ---")
+    for output_path in [SAVED_MODEL_PATH, ONNX_MODEL_NAME, *TFLITE_VARIANTS.values(), ONNX_DYNAMIC_MODEL]:
+        print(f"Generated: {os.path.abspath(output_path)}")
+    print(f"Action: Deploy with INFERENCE_BACKEND / MODEL_VARIANT to serve one of them.")
+
+if __name__ == "__main__":
+    # --saved-model-only: used by the Dockerfile to serialize the graph with the container's TF version
+    build_model(saved_model_only="--saved-model-only" in sys.argv)
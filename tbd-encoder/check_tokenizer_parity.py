@@ -0,0 +1,79 @@
+"""
+Parity check: FastTokenizer vs. Keras texts_to_sequences + pad_sequences(padding='pre', truncating='pre').
+Every sequence must produce bit-identical padded IDs; exits non-zero on the first mismatch.
+Checks the training corpus (../scripts/v4_lstm_training_sequences.jsonl) by default when it has been built.
+Run from tbd-encoder/:  python check_tokenizer_parity.py [--corpus path/to/corpus.jsonl]
+"""
+import argparse
+import os
+import pickle
+import sys
+import time
+import numpy as np
+from tensorflow.keras.preprocessing.sequence import pad_sequences
+
+from encoder_app.main import MAX_SEQUENCE_LENGTH, TOKENIZER_PATH
+from encoder_app.tokenizer import FastTokenizer, read_corpus
+
+# build_training_dataset.py output: the sequences Service C actually tokenizes
+TRAINING_CORPUS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "scripts", "v4_lstm_training_sequences.jsonl")
+# Fallback when the training corpus has not been built: the corpus create_tokenizer.py fits on
+DEFAULT_CORPUS = [
+    "User clicks File menu", "User selects Save As", "User types filename",
+    "User clicks Save button", "User right-clicks Desktop", "User selects Personalize",
+    "User clicks Background dropdown", "User selects Picture", "User selects Solid Color",
+    "User selects Slideshow", "User clicks Close button"
+]
+# Edge cases on top of the corpus: casing, filtered punctuation, tabs/newlines, OOV words, empty input
+EDGE_CASES = [
+    [],
+    [""],
+    ["User clicks File menu"],
+    ["USER CLICKS save BUTTON!!", "user\tselects\nPicture", "  spaced   out  "],
+    ["right-clicks Desktop (again)", "types 'filename.txt' & hits Enter"],
+    ["Ünïcödé wörds", "完全に未知の単語"],
+    ["User clicks File menu"] * 40,  # longer than MAX_SEQUENCE_LENGTH: pre-truncation
+]
+
+def _load_corpus(corpus_path: str) -> list:
+    if not corpus_path:
+        print(f"Training corpus not found at {TRAINING_CORPUS}; checking the create_tokenizer phrases only")
+        return [DEFAULT_CORPUS, DEFAULT_CORPUS[:3], DEFAULT_CORPUS[-2:]] + [[text] for text in DEFAULT_CORPUS]
+    print(f"Corpus: {corpus_path}")
+    return read_corpus(corpus_path)
+
+def main(corpus_path: str) -> int:
+    with open(TOKENIZER_PATH, 'rb') as handle:
+        keras_tokenizer = pickle.load(handle)
+    fast = FastTokenizer.from_keras(keras_tokenizer)
+    seq_len = MAX_SEQUENCE_LENGTH - 1
+
+    sequences = _load_corpus(corpus_path) + EDGE_CASES
+    out = np.zeros(seq_len, dtype=np.int32)
+    keras_s = fast_s = 0.0
+    for i, sequence in enumerate(sequences):
+        start = time.perf_counter()
+        flat = [t for ids in keras_tokenizer.texts_to_sequences(sequence) for t in ids]
+        expected = pad_sequences([flat], maxlen=seq_len, padding='pre', truncating='pre')[0]
+        keras_s += time.perf_counter() - start
+
+        start = time.perf_counter()
+        fast.encode_padded(sequence, out)
+        fast_s += time.perf_counter() - start
+
+        if not np.array_equal(expected, out):
+            print(f"MISMATCH at sequence {i}: {sequence!r}")
+            print(f"  keras: {expected.tolist()}")
+            print(f"  fast:  {out.tolist()}")
+            return 1
+
+    n = len(sequences)
+    print(f"OK: {n} sequences identical | keras {keras_s / n * 1e6:.1f}us/seq | fast {fast_s / n * 1e6:.1f}us/seq")
+    return 0
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--corpus", default=TRAINING_CORPUS if os.path.exists(TRAINING_CORPUS) else "",
+                        help="JSONL corpus (build_training_dataset.py records) or JSON list (default: the training corpus if built, else the create_tokenizer phrases)")
+    args = parser.parse_args()
+    sys.exit(main(args.corpus))
@@ -0,0 +1,135 @@
+import os
+import threading
+import numpy as np
+
+# --- Configuration ---
+# Thread controls apply to whichever runtime is selected (0 = runtime default)
+INTRA_OP_THREADS = int(os.environ.get("INFERENCE_INTRA_OP_THREADS", "0"))
+INTER_OP_THREADS = int(os.environ.get("INFERENCE_INTER_OP_THREADS", "0"))
+
+def _configure_tf_threads(tf):
+    if INTRA_OP_THREADS:
+        tf.config.threading.set_intra_op_parallelism_threads(INTRA_OP_THREADS)
+    if INTER_OP_THREADS:
+        tf.config.threading.set_inter_op_parallelism_threads(INTER_OP_THREADS)
+
+class KerasBackend:
+    """V6 baseline: encoder_model.predict() on the rebuilt Keras encoder."""
+    name = "keras"
+
+    def __init__(self, model_factory, model_path: str, seq_len: int):
+        import tensorflow as tf
+        _configure_tf_threads(tf)
+        self.model = model_factory()
+
+    def predict(self, token_ids: np.ndarray) -> np.ndarray:
+        return self.model.predict(token_ids, verbose=0)
+
+class TFFunctionBackend:
+    """
+    Calls the encoder through a tf.function with a fixed (None, seq_len) int32 signature.
+    Traced once at warmup; skips the data-adapter/callback setup of predict().
+    Loads the pre-serialized SavedModel if present, else rebuilds the Keras encoder.
+    """
+    name = "tf_function"
+
+    def __init__(self, model_factory, model_path: str, seq_len: int):
+        import tensorflow as tf
+        _configure_tf_threads(tf)
+
+        if os.path.isdir(model_path):
+            self.model = tf.saved_model.load(model_path)  # keeps the variables alive
+            serving = self.model.signatures['serving_default']
+            input_name = list(serving.structured_input_signature[1].keys())[0]
+            call = lambda token_ids: list(serving(**{input_name: token_ids}).values())[0]
+        else:
+            print(f"No SavedModel at {model_path}; rebuilding the Keras encoder.")
+            self.model = model_factory()
+            model = self.model
+            call = lambda token_ids: model(token_ids, training=False)
+
+        @tf.function(input_signature=[tf.TensorSpec([None, seq_len], tf.int32)])
+        def infer(token_ids):
+            return call(token_ids)
+
+        self._infer = infer
+
+    def predict(self, token_ids: np.ndarray) -> np.ndarray:
+        return self._infer(token_ids).numpy()
+
+class OnnxBackend:
+    """ONNX Runtime on the CPU execution provider. Skips the Keras rebuild entirely."""
+    name = "onnx"
+
+    def __init__(self, model_factory, model_path: str, seq_len: int):
+        import onnxruntime as ort
+        options = ort.SessionOptions()
+        options.intra_op_num_threads = INTRA_OP_THREADS
+        options.inter_op_num_threads = INTER_OP_THREADS
+        options.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self.session = ort.InferenceSession(model_path, sess_options=options, providers=["CPUExecutionProvider"])
+        self.input_name = self.session.get_inputs()[0].name
+
+    def predict(self, token_ids: np.ndarray) -> np.ndarray:
+        return self.session.run(None, {self.input_name: token_ids})[0]
+
+class TFLiteBackend:
+    """
+    TFLite interpreter for the quantized variants (dynamic-range, FP16, INT8).
+    Integer-quantized inputs/outputs are (de)quantized here so callers always see float32.
+    One interpreter per process, called from FastAPI's threadpool: resize -> set -> invoke -> get
+    run under a lock (the interpreter is stateful and not thread-safe).
+    """
+    name = "tflite"
+
+    def __init__(self, model_factory, model_path: str, seq_len: int):
+        import tensorflow as tf
+        self.interpreter = tf.lite.Interpreter(model_path=model_path, num_threads=INTRA_OP_THREADS or None)
+        self.interpreter.allocate_tensors()
+        self.input_detail = self.interpreter.get_input_details()[0]
+        self.output_detail = self.interpreter.get_output_details()[0]
+        self.lock = threading.Lock()
+
+    def _resize(self, batch_size: int):
+        self.interpreter.resize_tensor_input(self.input_detail['index'], [batch_size, *self.input_detail['shape'][1:]])
+        self.interpreter.allocate_tensors()
+        self.input_detail = self.interpreter.get_input_details()[0]
+        self.output_detail = self.interpreter.get_output_details()[0]
+
+    def predict(self, token_ids: np.ndarray) -> np.ndarray:
+        with self.lock:
+            if token_ids.shape[0] != self.input_detail['shape'][0]:
+                self._resize(token_ids.shape[0])
+
+            input_dtype = self.input_detail['dtype']
+            if input_dtype != token_ids.dtype:
+                scale, zero_point = self.input_detail['quantization']
+                if scale:
+                    token_ids = np.round(token_ids / scale + zero_point)
+                token_ids = token_ids.astype(input_dtype)
+            self.interpreter.set_tensor(self.input_detail['index'], token_ids)
+            self.interpreter.invoke()
+
+            output = self.interpreter.get_tensor(self.output_detail['index'])  # A copy: safe after release
+            output_detail = self.output_detail
+        scale, zero_point = output_detail['quantization']
+        if output.dtype != np.float32 and scale:
+            output = (output.astype(np.float32) - zero_point) * scale
+        return output
+
+BACKENDS = {
+    KerasBackend.name: KerasBackend,
+    TFFunctionBackend.name: TFFunctionBackend,
+    OnnxBackend.name: OnnxBackend,
+    TFLiteBackend.name: TFLiteBackend,
+}
+
+def load_backend(name: str, model_factory, model_path: str, seq_len: int):
+    """
+    `model_factory` builds the Keras encoder; only the keras/tf_function backends call it.
+    `model_path` is the serialized model the onnx/tflite backends load instead.
+    """
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown INFERENCE_BACKEND '{name}'. Choose from {sorted(BACKENDS)}")
+    return BACKENDS[name](model_factory, model_path, seq_len)
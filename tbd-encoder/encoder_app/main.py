@@ -1,20 +1,44 @@
 import os
+import time
 import pickle
+import asyncio
+import importlib
+import threading
 import numpy as np
-import tensorflow as tf
-from tensorflow.keras.models import Model, Sequential
-from tensorflow.keras.layers import Input, Embedding, LSTM, Dense
-from tensorflow.keras.preprocessing.sequence import pad_sequences
 from fastapi import FastAPI, HTTPException
+from fastapi.responses import JSONResponse
 from pydantic import BaseModel
-from typing import List
+from typing import Dict, List
+from encoder_app.backends import load_backend
+from encoder_app.tokenizer import FastTokenizer
+from encoder_app.observability import instrument_app, span, MODEL_INFERENCE_SECONDS
+from encoder_app.profiler import instrument_profiling
 
 # --- Configuration ---
 LSTM_UNITS = 512
 MAX_SEQUENCE_LENGTH = 100
 MODEL_PATH = "lstm_model.h5"
+# Standalone vocab (export_tokenizer_vocab.py); the Keras pickle is only a fallback
+VOCAB_PATH = "tokenizer_vocab.json"
 TOKENIZER_PATH = "tokenizer.pickle"
 ENCODING_METHOD = "LSTM_512_V6_REBUILD"
+ONNX_MODEL_PATH = os.environ.get("ONNX_MODEL_PATH", "encoder_model.onnx")
+# Pre-traced serving graph written by build_encoder_model.py (no rebuild + load_weights at startup)
+SAVED_MODEL_PATH = "encoder_saved_model"
+# keras (V6 baseline) | tf_function | onnx | tflite
+INFERENCE_BACKEND = os.environ.get("INFERENCE_BACKEND", "tf_function")
+# fp32 | fp16 | dynamic | int8 (variants produced by build_encoder_model.py)
+MODEL_VARIANT = os.environ.get("MODEL_VARIANT", "fp32")
+# variant -> {backend: artifact}. The first entry is the fallback when the requested backend can't serve the variant.
+# keras rebuilds from MODEL_PATH (.h5); tf_function does too if the SavedModel is missing.
+MODEL_VARIANTS = {
+    "fp32": {"tf_function": SAVED_MODEL_PATH, "keras": MODEL_PATH, "onnx": ONNX_MODEL_PATH},
+    "fp16": {"tflite": "encoder_model_float16.tflite"},
+    "dynamic": {"tflite": "encoder_model_dynamic_range.tflite", "onnx": "encoder_model_dynamic.onnx"},
+    "int8": {"tflite": "encoder_model_int8.tflite"},
+}
+# Heavy runtime each backend pulls in; imported lazily (off the event loop) at startup
+RUNTIME_MODULES = {"keras": "tensorflow", "tf_function": "tensorflow", "tflite": "tensorflow", "onnx": "onnxruntime"}
 
 # --- V6 FIX: Hardcoded Dimensions to match Pre-trained Weights ---
 # Based on error: "assigned value shape (2525, 128)"
@@ -30,83 +54,165 @@ class VectorOutput(BaseModel):
     temporal_encoding_method: str
 
 # --- Global State ---
+MODULE_LOADED_AT = time.perf_counter()
 tokenizer = None
-encoder_model = None
+backend = None
+# Per-thread padded (1, seq_len) int32 input: encode_sequence is sync, so it runs in FastAPI's threadpool
+token_buffers = threading.local()
+# loading -> ready | failed. Exposed by /readyz so callers can route around cold instances.
+model_state = "loading"
+startup_timings: Dict[str, float] = {}
 
 # --- V6: The Architecture Rebuild Logic ---
-def build_and_load_model():
-    global tokenizer, encoder_model
-    print("--- Starting V6 Model Rebuild (Hardcoded Dimensions) ---")
-
-    # 1. Load Tokenizer
-    try:
-        with open(TOKENIZER_PATH, 'rb') as handle:
-            tokenizer = pickle.load(handle)
-        print(f"Tokenizer loaded. Real Vocab Size: {len(tokenizer.word_index) + 1}")
-    except Exception as e:
-        print(f"FATAL: Could not load tokenizer. {e}")
-        return
+def rebuild_encoder():
+    """Rebuilds the training architecture, loads the .h5 weights and returns the LSTM encoder."""
+    from tensorflow.keras.models import Model, Sequential
+    from tensorflow.keras.layers import Input, Embedding, LSTM, Dense
 
-    # 2. Reconstruct the Architecture
     # CRITICAL FIX: We act as if the vocab size is 2525, even if the tokenizer is smaller.
     # This aligns the layer shape with the weight file.
-    try:
-        rebuilt_model = Sequential([
-            Input(shape=(MAX_SEQUENCE_LENGTH - 1,), name='input_sequence'),
-            Embedding(input_dim=VOCAB_SIZE_WEIGHTS, 
-                      output_dim=EMBEDDING_DIM_WEIGHTS, 
-                      name='embedding_layer'),
-            LSTM(LSTM_UNITS, return_sequences=False, name='temporal_context_encoder'),
-            # The dense layer must also match the vocab size of the weights
-            Dense(VOCAB_SIZE_WEIGHTS, activation='softmax', name='output_layer')
-        ])
-        
-        # 3. Load Weights
-        rebuilt_model.load_weights(MODEL_PATH)
-        print("Raw weights loaded successfully into rebuilt architecture.")
-
-        # 4. Extract the Encoder
-        encoder_model = Model(
-            inputs=rebuilt_model.inputs,
-            outputs=rebuilt_model.get_layer('temporal_context_encoder').output
-        )
-        print("Temporal Encoder Service (V6) is ready.")
+    rebuilt_model = Sequential([
+        Input(shape=(MAX_SEQUENCE_LENGTH - 1,), name='input_sequence'),
+        Embedding(input_dim=VOCAB_SIZE_WEIGHTS, 
+                  output_dim=EMBEDDING_DIM_WEIGHTS, 
+                  name='embedding_layer'),
+        LSTM(LSTM_UNITS, return_sequences=False, name='temporal_context_encoder'),
+        # The dense layer must also match the vocab size of the weights
+        Dense(VOCAB_SIZE_WEIGHTS, activation='softmax', name='output_layer')
+    ])
+    
+    rebuilt_model.load_weights(MODEL_PATH)
+    print("Raw weights loaded successfully into rebuilt architecture.")
+
+    # Extract the Encoder
+    return Model(
+        inputs=rebuilt_model.inputs,
+        outputs=rebuilt_model.get_layer('temporal_context_encoder').output
+    )
+
+def resolve_model(backend_name: str, variant: str):
+    """Maps (INFERENCE_BACKEND, MODEL_VARIANT) to the backend and artifact that will be loaded."""
+    if variant not in MODEL_VARIANTS:
+        raise ValueError(f"Unknown MODEL_VARIANT '{variant}'. Choose from {sorted(MODEL_VARIANTS)}")
+    artifacts = MODEL_VARIANTS[variant]
+    if backend_name not in artifacts:
+        fallback = next(iter(artifacts))
+        print(f"WARNING: {backend_name} cannot serve the {variant} variant; using {fallback}.")
+        backend_name = fallback
+    return backend_name, artifacts[backend_name]
 
-    except Exception as e:
-        print(f"FATAL: Model reconstruction failed: {e}")
-        encoder_model = None
+def build_and_load_model():
+    """Loads tokenizer + encoder and warms it. Runs off the event loop so /healthz stays live."""
+    global tokenizer, backend, model_state
+    print(f"--- Starting V6 Model Load ({MODEL_VARIANT} variant, {INFERENCE_BACKEND} backend) ---")
+    started = time.perf_counter()
+
+    try:
+        # 1. Load Tokenizer
+        phase_start = time.perf_counter()
+        try:
+            if os.path.exists(VOCAB_PATH):
+                tokenizer = FastTokenizer.load(VOCAB_PATH)
+            else:
+                # Unpickling pulls in Keras; only the conversion step depends on it
+                print(f"WARNING: {VOCAB_PATH} missing, converting {TOKENIZER_PATH} at startup.")
+                with open(TOKENIZER_PATH, 'rb') as handle:
+                    tokenizer = FastTokenizer.from_keras(pickle.load(handle))
+            print(f"Tokenizer loaded. Real Vocab Size: {len(tokenizer.word_index) + 1}")
+        except Exception as e:
+            print(f"FATAL: Could not load tokenizer. {e}")
+            model_state = "failed"
+            return
+        startup_timings["load_tokenizer_s"] = round(time.perf_counter() - phase_start, 3)
+
+        # 2. Load the Encoder through the selected inference backend
+        try:
+            backend_name, model_path = resolve_model(INFERENCE_BACKEND, MODEL_VARIANT)
+
+            phase_start = time.perf_counter()
+            importlib.import_module(RUNTIME_MODULES[backend_name])
+            startup_timings["import_runtime_s"] = round(time.perf_counter() - phase_start, 3)
+
+            phase_start = time.perf_counter()
+            loaded = load_backend(backend_name, rebuild_encoder, model_path, MAX_SEQUENCE_LENGTH - 1)
+            startup_timings["load_model_s"] = round(time.perf_counter() - phase_start, 3)
+
+            # 3. Warmup (traces the tf.function / primes ORT) before we report ready
+            phase_start = time.perf_counter()
+            loaded.predict(np.zeros((1, MAX_SEQUENCE_LENGTH - 1), dtype=np.int32))
+            startup_timings["warmup_s"] = round(time.perf_counter() - phase_start, 3)
+
+            backend = loaded
+            model_state = "ready"
+            print("Temporal Encoder Service (V6) is ready.")
+
+        except Exception as e:
+            print(f"FATAL: Model reconstruction failed: {e}")
+            backend = None
+            model_state = "failed"
+    finally:
+        startup_timings["load_total_s"] = round(time.perf_counter() - started, 3)
+        print(f"Startup phases: {startup_timings}")
+
+def _token_buffer() -> np.ndarray:
+    """This thread's reusable (1, seq_len) int32 model input."""
+    buffer = getattr(token_buffers, "padded", None)
+    if buffer is None:
+        buffer = np.zeros((1, MAX_SEQUENCE_LENGTH - 1), dtype=np.int32)
+        token_buffers.padded = buffer
+    return buffer
 
 # --- Application Startup ---
 app = FastAPI(title="TbD V6 Temporal Encoder")
+# GET /metrics, and requests carrying the worker's traceparent join the task's trace
+instrument_app(app)
+# Opt-in sampling of profiled tasks' requests (X-TbD-Profile), collected by the worker
+instrument_profiling(app)
 
 @app.on_event("startup")
 async def startup_event():
-    build_and_load_model()
+    startup_timings["server_start_s"] = round(time.perf_counter() - MODULE_LOADED_AT, 3)
+    asyncio.get_event_loop().run_in_executor(None, build_and_load_model)
 
 # --- Endpoints ---
+@app.get("/healthz")
+async def healthz():
+    """Liveness: the process is up and serving, model or not."""
+    return {"status": "alive"}
+
+@app.get("/readyz")
+async def readyz():
+    """Readiness: tokenizer and encoder are loaded and warm. Includes the startup phase breakdown."""
+    body = {
+        "state": model_state,
+        "backend": backend.name if backend else INFERENCE_BACKEND,
+        "variant": MODEL_VARIANT,
+        "startup": startup_timings,
+    }
+    if model_state != "ready":
+        return JSONResponse(status_code=503, content=body)
+    return body
+
 @app.post("/encode_sequence", response_model=VectorOutput)
 def encode_sequence(input_data: SequenceInput):
-    if encoder_model is None or tokenizer is None:
+    if model_state == "loading":
+        # 503 while warming up, so callers retry elsewhere instead of storing a zero vector
+        raise HTTPException(status_code=503, detail="Encoder is still warming up")
+    if backend is None or tokenizer is None:
         return VectorOutput(
             temporal_context_vector=[0.0] * LSTM_UNITS,
             temporal_encoding_method="FAILED_V6_INIT"
         )
 
     try:
-        # Tokenize
-        token_ids = tokenizer.texts_to_sequences(input_data.sequence)
-        flat_tokens = [item for sublist in token_ids for item in sublist]
-
-        # Pad
-        padded = pad_sequences(
-            [flat_tokens], 
-            maxlen=MAX_SEQUENCE_LENGTH - 1, 
-            padding='pre', 
-            truncating='pre'
-        )
-
-        # Predict
-        vector = encoder_model.predict(padded, verbose=0)[0]
+        # Tokenize + Pad (pre-padding/truncation, written straight into the model input)
+        padded = _token_buffer()
+        tokenizer.encode_padded(input_data.sequence, padded[0])
+
+        # Predict (timed into tbd_model_inference_seconds; the span joins the caller's trace)
+        with span("inference", backend=backend.name, variant=MODEL_VARIANT, steps=len(input_data.sequence)), \
+                MODEL_INFERENCE_SECONDS.time(model="lstm_encoder", backend=backend.name, variant=MODEL_VARIANT):
+            vector = backend.predict(padded)[0]
 
         return VectorOutput(
             temporal_context_vector=vector.tolist(),
@@ -0,0 +1,106 @@
+import json
+from itertools import repeat
+from typing import Dict, List, Optional
+import numpy as np
+
+# Keras Tokenizer defaults
+DEFAULT_FILTERS = '!"#$%&()*+,-./:;<=>?@[\\]^_`{|}~\t\n'
+VOCAB_FORMAT = "tbd-vocab-v1"
+
+class FastTokenizer:
+    """
+    Drop-in for keras Tokenizer.texts_to_sequences + pad_sequences(padding='pre', truncating='pre')
+    on the /encode_sequence hot path. Loaded from a standalone JSON vocab, so no Keras/pickle coupling.
+    The num_words / OOV rules are resolved once at load, so encoding is one dict lookup per word.
+    """
+
+    def __init__(self, word_index: Dict[str, int], oov_token: Optional[str] = None, num_words: Optional[int] = None,
+                 filters: str = DEFAULT_FILTERS, lower: bool = True, split: str = " "):
+        self.word_index = word_index
+        self.oov_token = oov_token
+        self.num_words = num_words
+        self.filters = filters
+        self.lower = lower
+        self.split = split
+        self._translate = str.maketrans(filters, split * len(filters)) if filters else None
+
+        # Keras: words at/above num_words and unknown words both become the OOV index (or are dropped)
+        self._default = word_index.get(oov_token) if oov_token is not None else None
+        self._lookup = {w: i for w, i in word_index.items() if not (num_words and i >= num_words)}
+
+    @classmethod
+    def from_keras(cls, tokenizer) -> "FastTokenizer":
+        if getattr(tokenizer, "char_level", False):
+            raise ValueError("char_level tokenizers are not supported")
+        return cls(dict(tokenizer.word_index), tokenizer.oov_token, tokenizer.num_words,
+                   tokenizer.filters, tokenizer.lower, tokenizer.split)
+
+    @classmethod
+    def load(cls, path: str) -> "FastTokenizer":
+        with open(path, encoding="utf-8") as f:
+            vocab = json.load(f)
+        if vocab.get("format") != VOCAB_FORMAT:
+            raise ValueError(f"{path} is not a {VOCAB_FORMAT} vocabulary")
+        return cls(vocab["word_index"], vocab["oov_token"], vocab["num_words"],
+                   vocab["filters"], vocab["lower"], vocab["split"])
+
+    def save(self, path: str):
+        vocab = {
+            "format": VOCAB_FORMAT,
+            "oov_token": self.oov_token,
+            "num_words": self.num_words,
+            "filters": self.filters,
+            "lower": self.lower,
+            "split": self.split,
+            "word_index": self.word_index,
+        }
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(vocab, f, ensure_ascii=False)
+
+    def _words(self, texts: List[str]) -> List[str]:
+        # One lower/translate/split over the whole batch; joining on `split` keeps word boundaries
+        text = self.split.join(texts)
+        if self.lower:
+            text = text.lower()
+        if self._translate:
+            text = text.translate(self._translate)
+        return [w for w in text.split(self.split) if w]
+
+    def texts_to_ids(self, texts: List[str]) -> np.ndarray:
+        """Flattened token IDs of all texts, as int32 (Keras texts_to_sequences, concatenated)."""
+        words = self._words(texts)
+        ids = map(self._lookup.get, words, repeat(self._default))
+        if self._default is not None:
+            return np.fromiter(ids, dtype=np.int32, count=len(words))
+        return np.fromiter((i for i in ids if i is not None), dtype=np.int32)
+
+    def encode_padded(self, texts: List[str], out: np.ndarray) -> int:
+        """
+        Writes the pre-padded, pre-truncated IDs for the concatenated texts into `out` (1-D int32).
+        Returns the number of real (non-padding) tokens.
+        """
+        ids = self.texts_to_ids(texts)
+        maxlen = out.shape[-1]
+        tail = ids[-maxlen:]
+        start = maxlen - len(tail)
+        out[:start] = 0
+        out[start:] = tail
+        return len(tail)
+
+def read_corpus(path: str, limit: Optional[int] = None) -> List[List[str]]:
+    """
+    Action sequences from a training corpus for the offline tools (parity, variant evaluation).
+    JSONL, as scripts/build_training_dataset.py writes it: one {"domain", "checksum", "sequence"} record
+    or bare array of steps per line (the same rule as scripts/train_lstm.py). A legacy .json list also works.
+    """
+    if path.endswith(".json"):
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)[:limit]
+    sequences = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if limit is not None and len(sequences) >= limit: break
+            if not line.strip(): continue
+            record = json.loads(line)
+            sequences.append(record["sequence"] if isinstance(record, dict) else record)
+    return sequences
@@ -0,0 +1,136 @@
+"""
+Accuracy-vs-latency report for the Service C model variants.
+Vector cosine drift is measured against the fp32 baseline, next to p50/p99 latency and memory.
+Each variant runs in its own subprocess so its memory numbers are not polluted by the others.
+Run from tbd-encoder/:  python evaluate_variants.py [--corpus ../scripts/v4_lstm_training_sequences.jsonl]
+"""
+import argparse
+import json
+import os
+import pickle
+import subprocess
+import sys
+import tempfile
+import time
+import numpy as np
+
+from encoder_app.backends import load_backend
+from encoder_app.tokenizer import read_corpus
+from encoder_app.main import rebuild_encoder, MODEL_VARIANTS, MAX_SEQUENCE_LENGTH, VOCAB_SIZE_WEIGHTS, TOKENIZER_PATH
+
+# (variant, backend); the first entry is the accuracy baseline
+VARIANTS = [
+    ("fp32", "tf_function"),
+    ("fp32", "onnx"),
+    ("dynamic", "onnx"),
+    ("dynamic", "tflite"),
+    ("fp16", "tflite"),
+    ("int8", "tflite"),
+]
+
+def _memory_mb() -> dict:
+    """Current and peak RSS of this process (Linux /proc; falls back to ru_maxrss)."""
+    try:
+        with open("/proc/self/status") as f:
+            fields = dict(line.split(":", 1) for line in f if ":" in line)
+        return {"rss_mb": int(fields["VmRSS"].split()[0]) / 1024, "peak_rss_mb": int(fields["VmHWM"].split()[0]) / 1024}
+    except (OSError, KeyError):
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+        return {"rss_mb": peak, "peak_rss_mb": peak}
+
+def _load_inputs(corpus_path: str, limit: int) -> np.ndarray:
+    """(limit, seq_len) int32 pre-padded token IDs: tokenized corpus sequences, else random ones."""
+    seq_len = MAX_SEQUENCE_LENGTH - 1
+    if corpus_path:
+        from tensorflow.keras.preprocessing.sequence import pad_sequences
+        with open(TOKENIZER_PATH, 'rb') as handle:
+            tokenizer = pickle.load(handle)
+        sequences = read_corpus(corpus_path, limit)
+        flat = [[t for ids in tokenizer.texts_to_sequences(seq) for t in ids] for seq in sequences]
+        return pad_sequences(flat, maxlen=seq_len, padding='pre', truncating='pre').astype(np.int32)
+
+    rng = np.random.default_rng(0)
+    inputs = np.zeros((limit, seq_len), dtype=np.int32)
+    for row in inputs:
+        n_tokens = rng.integers(5, seq_len + 1)
+        row[seq_len - n_tokens:] = rng.integers(1, VOCAB_SIZE_WEIGHTS, size=n_tokens)
+    return inputs
+
+def run_variant(variant: str, backend_name: str, corpus_path: str, limit: int, out_path: str):
+    """Child process: load one variant, encode every sequence, save vectors + latencies."""
+    before = _memory_mb()
+    backend = load_backend(backend_name, rebuild_encoder, MODEL_VARIANTS[variant][backend_name], MAX_SEQUENCE_LENGTH - 1)
+    loaded = _memory_mb()
+
+    inputs = _load_inputs(corpus_path, limit)
+    backend.predict(inputs[:1])  # warmup
+
+    vectors, latencies = [], []
+    for i in range(len(inputs)):
+        start = time.perf_counter()
+        vector = backend.predict(inputs[i:i + 1])[0]
+        latencies.append((time.perf_counter() - start) * 1000.0)
+        vectors.append(vector)
+
+    np.savez(out_path, vectors=np.array(vectors, dtype=np.float32), latencies=np.array(latencies))
+    print(json.dumps({
+        "load_rss_mb": round(loaded["rss_mb"] - before["rss_mb"], 1),
+        "peak_rss_mb": round(_memory_mb()["peak_rss_mb"], 1),
+    }))
+
+def main(corpus_path: str, limit: int, as_json: bool):
+    results, baseline = [], None
+    with tempfile.TemporaryDirectory() as tmp:
+        for variant, backend_name in VARIANTS:
+            out_path = os.path.join(tmp, f"{variant}_{backend_name}.npz")
+            cmd = [sys.executable, __file__, "--child", variant, backend_name, "--out", out_path, "--limit", str(limit)]
+            if corpus_path:
+                cmd += ["--corpus", corpus_path]
+            proc = subprocess.run(cmd, capture_output=True, text=True)
+            if proc.returncode != 0 or not os.path.exists(out_path):
+                results.append({"variant": variant, "backend": backend_name, "error": proc.stderr.strip().splitlines()[-1:]})
+                continue
+
+            memory = json.loads(proc.stdout.strip().splitlines()[-1])
+            data = np.load(out_path)
+            vectors, latencies = data["vectors"], data["latencies"]
+            if baseline is None:
+                baseline = vectors
+
+            norms = np.linalg.norm(vectors, axis=1) * np.linalg.norm(baseline, axis=1)
+            cosine = np.sum(vectors * baseline, axis=1) / np.maximum(norms, 1e-12)
+            drift = 1.0 - cosine
+            results.append({
+                "variant": variant,
+                "backend": backend_name,
+                "mean_cosine_drift": round(float(drift.mean()), 6),
+                "max_cosine_drift": round(float(drift.max()), 6),
+                "p50_ms": round(float(np.percentile(latencies, 50)), 2),
+                "p99_ms": round(float(np.percentile(latencies, 99)), 2),
+                **memory,
+            })
+
+    for r in results:
+        if as_json:
+            print(json.dumps(r))
+        elif "error" in r:
+            print(f"{r['variant']:<8} {r['backend']:<12} FAILED: {r['error']}")
+        else:
+            print(f"{r['variant']:<8} {r['backend']:<12} drift mean {r['mean_cosine_drift']:.2e} max {r['max_cosine_drift']:.2e} | "
+                  f"p50 {r['p50_ms']:>6.2f}ms p99 {r['p99_ms']:>6.2f}ms | "
+                  f"load +{r['load_rss_mb']:.0f}MB peak {r['peak_rss_mb']:.0f}MB")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--corpus", default="", help="JSONL corpus (build_training_dataset.py records) or JSON list (default: random token IDs)")
+    parser.add_argument("--limit", type=int, default=200)
+    parser.add_argument("--json", action="store_true")
+    parser.add_argument("--child", nargs=2, metavar=("VARIANT", "BACKEND"), help=argparse.SUPPRESS)
+    parser.add_argument("--out", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_variant(args.child[0], args.child[1], args.corpus, args.limit, args.out)
+    else:
+        main(args.corpus, args.limit, args.json)
@@ -0,0 +1,21 @@
+"""
+Exports the Keras tokenizer.pickle to the standalone JSON vocab Service C loads (tokenizer_vocab.json).
+Run from tbd-encoder/ after create_tokenizer.py:  python export_tokenizer_vocab.py
+"""
+import os
+import pickle
+import sys
+
+from encoder_app.main import TOKENIZER_PATH, VOCAB_PATH
+from encoder_app.tokenizer import FastTokenizer
+
+if __name__ == "__main__":
+    pickle_path = sys.argv[1] if len(sys.argv) > 1 else TOKENIZER_PATH
+    vocab_path = sys.argv[2] if len(sys.argv) > 2 else VOCAB_PATH
+
+    with open(pickle_path, 'rb') as handle:
+        keras_tokenizer = pickle.load(handle)
+
+    fast = FastTokenizer.from_keras(keras_tokenizer)
+    fast.save(vocab_path)
+    print(f"SUCCESS: Exported {len(fast.word_index)} words to '{vocab_path}' ({os.path.getsize(vocab_path)} bytes)")